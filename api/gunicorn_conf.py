@@ -0,0 +1,56 @@
+"""
+Gunicorn configuration of the api.
+
+Used by `python manage.py serve`, or directly with
+`gunicorn -c python:api.gunicorn_conf api.wsgi`.
+Every setting can be overridden with an environment variable.
+"""
+
+import os
+
+
+def default_workers():
+    """2 workers per cpu available to the process, plus one"""
+    try:
+        # respects the cpus a container is pinned to
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return cpus * 2 + 1
+
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", default_workers()))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+
+# recycle workers after this many requests to bound memory growth,
+# with jitter so that the workers don't all restart at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+# time given to workers to finish their requests on reload/shutdown
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# import the app in the master so that the workers share its memory
+# copy-on-write, and start faster when they are recycled
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# heartbeat files on a tmpfs so a slow disk doesn't get workers killed
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def pre_fork(server, worker):
+    # a connection opened while preloading would be shared by the workers
+    from django.db import connections
+
+    from core.db.pool import close_pools
+
+    connections.close_all()
+    # closing released the connections to the pools
+    close_pools()
@@ -43,6 +43,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first so that the queries of every other middleware are recorded
+    "core.middleware.SQLInstrumentationMiddleware",
+    "core.middleware.ReplicaRoutingMiddleware",
+    # before the middlewares reading or writing the response's content
+    "core.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -78,14 +83,48 @@ WSGI_APPLICATION = "api.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        # postgresql checking its connections out of a pool shared by
+        # the threads of a worker, see core.db.pool
+        # (DB_ENGINE=django.db.backends.postgresql to go without it)
+        "ENGINE": config("DB_ENGINE", default="core.db.backends.postgresql"),
         "HOST": os.environ.get("PGHOST"),
         "NAME": os.environ.get("PGDATABASE"),
         "USER": os.environ.get("PGUSER"),
         "PASSWORD": os.environ.get("PGPASSWORD"),
+        # with the pool, 0 releases the connection to the pool at the
+        # end of every request; without, the seconds a thread keeps
+        # its own connection open
+        "CONN_MAX_AGE": config("DB_CONN_MAX_AGE", default=0, cast=int),
+        "POOL": {
+            "MAX_SIZE": config("DB_POOL_MAX_SIZE", default=10, cast=int),
+            "TIMEOUT": config("DB_POOL_TIMEOUT", default=10.0, cast=float),
+            "HEALTH_CHECK_INTERVAL": config(
+                "DB_POOL_HEALTH_CHECK_INTERVAL", default=30.0, cast=float
+            ),
+            "MAX_IDLE": config("DB_POOL_MAX_IDLE", default=300.0, cast=float),
+        },
     }
 }
 
+# read replicas of the default database, eg. PGREPLICA_HOSTS=db-r1,db-r2
+for i, host in enumerate(
+    filter(None, config("PGREPLICA_HOSTS", default="").split(",")), 1
+):
+    DATABASES[f"replica{i}"] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["core.db.routers.ReplicaRouter"]
+
+# see core.db.routers.DEFAULTS
+READ_REPLICAS = {
+    "ALIASES": [alias for alias in DATABASES if alias != "default"],
+    "MAX_LAG": config("DB_REPLICA_MAX_LAG", default=5.0, cast=float),
+    "PIN_SECONDS": config("DB_REPLICA_PIN_SECONDS", default=10, cast=int),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -134,8 +173,14 @@ REST_FRAMEWORK = {
         "rest_framework.filters.OrderingFilter",
         "rest_framework.filters.SearchFilter",
     ),
+    # orjson when installed, with the same output as JSONRenderer and
+    # JSONParser, see core.renderers.FastJSONRenderer
+    "DEFAULT_RENDERER_CLASSES": (
+        "core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
     "DEFAULT_PARSER_CLASSES": (
-        "rest_framework.parsers.JSONParser",
+        "core.parsers.FastJSONParser",
         "rest_framework.parsers.FormParser",
         "core.parsers.MultiPartJSONParser",
         # "rest_framework.parsers.MultiPartParser",
@@ -143,6 +188,36 @@ REST_FRAMEWORK = {
 }
 
 
+# SQL instrumentation
+# see core.middleware.sqlinstrumentation.DEFAULTS
+SQL_INSTRUMENTATION = {
+    "ENABLED": config("SQL_INSTRUMENTATION_ENABLED", default=True, cast=bool),
+    "SAMPLE_RATE": config(
+        "SQL_INSTRUMENTATION_SAMPLE_RATE", default=1.0, cast=float
+    ),
+}
+
+
+# Compression of the responses, see core.middleware.compression.DEFAULTS
+COMPRESSION = {
+    "ENABLED": config("COMPRESSION_ENABLED", default=True, cast=bool),
+    "MIN_SIZE": config("COMPRESSION_MIN_SIZE", default=1024, cast=int),
+}
+
+
+# Endpoint benchmark (manage.py benchmark_endpoints)
+# see core.management.commands.benchmark_endpoints.DEFAULTS
+ENDPOINT_BENCHMARK = {
+    "ENDPOINT_QUERY_BUDGETS": {
+        # permissions are queried per user
+        "users list": 50,
+        "employees list": 30,
+    },
+    # designations are created through their department
+    "SKIP": ["designations create", "designations bulk_create"],
+}
+
+
 # S3 BUCKETS
 # https://django-storages.readthedocs.io/en/latest/backends/amazon-S3.html
 AWS_ACCESS_KEY_ID = os.environ.get(
@@ -157,10 +232,85 @@ AWS_DEFAULT_ACL = "public-read"
 # TODO: change to media
 AWS_LOCATION = "static"
 
-DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
+# S3Boto3Storage moving the files streamed to the bucket by the upload
+# handler, see core.storage.uploadhandlers
+DEFAULT_FILE_STORAGE = "core.storage.S3Storage"
 STATICFILES_STORAGE = "storages.backends.s3boto3.S3StaticStorage"
 STATIC_URL = "/api/static/"
 MEDIA_URL = "/api/media/"
 
 STATIC_ROOT = "/vol/web/static"
 MEDIA_ROOT = "/vol/web/media"
+
+# Replay of the create requests retried with an Idempotency-Key header,
+# see core.idempotency
+IDEMPOTENCY = {
+    "TTL": config("IDEMPOTENCY_KEY_TTL", default=24 * 3600, cast=int),
+}
+
+# Archival of the old closed documents, see core.archive
+ARCHIVE = {
+    "AFTER_DAYS": config("ARCHIVE_AFTER_DAYS", default=3 * 365, cast=int),
+    "BATCH_SIZE": config("ARCHIVE_BATCH_SIZE", default=500, cast=int),
+    # the media are public, the archives are not
+    "STORAGE": DEFAULT_FILE_STORAGE,
+    "STORAGE_OPTIONS": {"default_acl": "private", "querystring_auth": True},
+}
+
+# Statements of account of the customers, see core.statements
+STATEMENTS = {
+    # processes rendering the PDF statements, per server process, one per
+    # cpu when unset
+    "WORKERS": config(
+        "STATEMENT_WORKERS",
+        default=None,
+        cast=lambda value: None if value in (None, "") else int(value),
+    ),
+    "CHUNK_SIZE": config("STATEMENT_CHUNK_SIZE", default=2000, cast=int),
+}
+
+# Uploads of the images and resumes straight to the storage, see
+# core.storage.uploads
+PRESIGNED_UPLOADS = {
+    "EXPIRES": config("PRESIGNED_UPLOAD_EXPIRES", default=600, cast=int),
+    "MAX_SIZE": {
+        "image": config(
+            "UPLOAD_MAX_IMAGE_SIZE", default=5 * 1024 * 1024, cast=int
+        ),
+        "document": config(
+            "UPLOAD_MAX_DOCUMENT_SIZE", default=10 * 1024 * 1024, cast=int
+        ),
+    },
+}
+
+# Multipart files streamed straight to the storage as they are received,
+# see core.storage.uploadhandlers. The size caps are PRESIGNED_UPLOADS'.
+STREAMING_UPLOADS = {
+    "ENABLED": config("STREAMING_UPLOADS", default=True, cast=bool),
+}
+
+# Uploaded files stored once per content, see core.storage.dedup
+DEDUP_STORAGE = {
+    "ENABLED": config("DEDUP_STORAGE", default=True, cast=bool),
+    "GRACE_PERIOD": config(
+        "DEDUP_STORAGE_GRACE_PERIOD", default=24 * 3600, cast=int
+    ),
+}
+
+# URLs of the media files rendered by the serializers, see
+# core.storage.media
+MEDIA_URLS = {
+    "CACHE_SIZE": config("MEDIA_URL_CACHE_SIZE", default=10000, cast=int),
+    "EXPIRY_MARGIN": config("MEDIA_URL_EXPIRY_MARGIN", default=60, cast=int),
+}
+
+# Media files of a local storage served at MEDIA_URL, see
+# core.storage.serving
+MEDIA_SERVING = {
+    # serve the media files of the local storage without DEBUG
+    "ENABLED": config("MEDIA_SERVING_ENABLED", default=False, cast=bool),
+    # "x-accel-redirect" behind nginx, "x-sendfile" behind Apache
+    "SENDFILE": config("MEDIA_SENDFILE", default=None) or None,
+    "ACCEL_PREFIX": config("MEDIA_ACCEL_PREFIX", default="/internal/media/"),
+    "CACHE_CONTROL": AWS_S3_OBJECT_PARAMETERS["CacheControl"],
+}
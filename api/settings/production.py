@@ -22,5 +22,10 @@ SECURE_HSTS_SECONDS = 31536000  # 1 year
 SECURE_HSTS_PRELOAD = True
 SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 
+# only instrument a sample of the requests in production
+SQL_INSTRUMENTATION["SAMPLE_RATE"] = float(
+    os.environ.get("SQL_INSTRUMENTATION_SAMPLE_RATE", 0.05)
+)
+
 AWS_STORAGE_BUCKET_NAME = "digitalace"
 AWS_S3_CUSTOM_DOMAIN = "%s.s3.amazonaws.com" % AWS_STORAGE_BUCKET_NAME
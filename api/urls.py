@@ -15,8 +15,8 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
-from django.conf import settings
+
+from core.storage.serving import media_urlpatterns
 
 urlpatterns = [
     # TODO: find other way to append /api/
@@ -26,5 +26,6 @@ urlpatterns = [
     path("api/user/", include("user.urls")),
     path("api/", include("customer.urls")),
     path("api/", include("supplier.urls")),
-    path("api/", include("company.urls"))
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path("api/", include("company.urls")),
+    path("api/", include("core.urls")),
+] + media_urlpatterns()
@@ -18,7 +18,11 @@ from core.models import (
     Designation,
     Customer,
     PaymentMethod,
+    DocumentSequence,
 )
+from core import numbering
+from core.serializers import SparseFieldsetMixin
+from core.storage import media
 from core.utils import validate_reference_uniqueness
 from user.serializers import UserSerializer
 
@@ -26,10 +30,12 @@ from user.serializers import UserSerializer
 # TODO: create an abstract class for get_image logic
 # https://stackoverflow.com/questions/33137165/django-rest-framework-abstract-class-serializer
 class ProductCategorySerializer(
-    BulkSerializerMixin, serializers.ModelSerializer
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
 ):
     """Serializer for product category objects"""
 
+    values_file_fields = ("image",)
+
     class Meta:
         model = ProductCategory
         fields = (
@@ -56,15 +62,16 @@ class ProductCategorySerializer(
         return fields
 
     def get_image(self, obj):
-        return {
-            "src": obj.image.url if obj.image else "",
-            "title": obj.image.name if obj.image else "",
-        }
+        return media.file_data(obj.image)
 
 
-class ProductSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+class ProductSerializer(
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
+):
     """Serializer for product objects"""
 
+    values_file_fields = ("image", "thumbnail")
+
     class Meta:
         model = Product
         fields = (
@@ -104,16 +111,10 @@ class ProductSerializer(BulkSerializerMixin, serializers.ModelSerializer):
         return fields
 
     def get_image(self, obj):
-        return {
-            "src": obj.image.url if obj.image else "",
-            "title": obj.image.name if obj.image else "",
-        }
+        return media.file_data(obj.image)
 
     def get_thumbnail(self, obj):
-        return {
-            "src": obj.thumbnail.url if obj.thumbnail else "",
-            "title": obj.thumbnail.name if obj.thumbnail else "",
-        }
+        return media.file_data(obj.thumbnail)
 
     def validate_reference(self, reference):
         company = self.context["request"].user.company
@@ -136,7 +137,7 @@ class ProductSerializer(BulkSerializerMixin, serializers.ModelSerializer):
 
 
 class PaymentMethodSerializer(
-    BulkSerializerMixin, serializers.ModelSerializer
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
 ):
     """Serializer for payment method objects"""
 
@@ -149,7 +150,56 @@ class PaymentMethodSerializer(
         list_serializer_class = BulkListSerializer
 
 
-class PayslipSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+class DocumentSequenceSerializer(
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
+):
+    """Serializer for the numbering of the documents of a type"""
+
+    class Meta:
+        model = DocumentSequence
+        fields = (
+            "id",
+            "document_type",
+            "prefix",
+            "yearly",
+            "padding",
+            "next_number",
+            "year",
+        )
+        read_only_fields = (
+            "id",
+            "year",
+        )
+        extra_kwargs = {
+            "padding": {"max_value": 20},
+            "next_number": {"min_value": 1},
+        }
+        list_serializer_class = BulkListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fields["document_type"] = serializers.ChoiceField(
+            choices=sorted(numbering.get_config()["PREFIXES"])
+        )
+        return fields
+
+    def validate_document_type(self, document_type):
+        if self.instance is not None:
+            if document_type != self.instance.document_type:
+                msg = _("The document type cannot be changed")
+                raise serializers.ValidationError(msg)
+        elif DocumentSequence.objects.filter(
+            company=self.context["request"].user.company,
+            document_type=document_type,
+        ).exists():
+            msg = _("The documents of this type are already numbered")
+            raise serializers.ValidationError(msg)
+        return document_type
+
+
+class PayslipSerializer(
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
+):
     """Serializer for payslip objects"""
 
     class Meta:
@@ -177,6 +227,14 @@ class PayslipSerializer(BulkSerializerMixin, serializers.ModelSerializer):
         list_serializer_class = BulkListSerializer
 
 
+class PayrollRunSerializer(serializers.Serializer):
+    """Serializer for the month of a payroll run"""
+
+    year = serializers.IntegerField(min_value=1, max_value=9999)
+    month = serializers.IntegerField(min_value=1, max_value=12)
+    date = serializers.DateField(required=False)
+
+
 class EmployeeSerializer(UserSerializer):
     """Serializer for employee objects"""
 
@@ -301,10 +359,7 @@ class RoleSerializer(serializers.ModelSerializer):
         return fields
 
     def get_image(self, obj):
-        return {
-            "src": obj.image.url if obj.image else "",
-            "title": obj.image.name if obj.image else "",
-        }
+        return media.file_data(obj.image)
 
     def validate_name(self, name):
         company = self.context["request"].user.company
@@ -392,10 +447,7 @@ class DepartmentSerializer(serializers.ModelSerializer):
         return fields
 
     def get_image(self, obj):
-        return {
-            "src": obj.image.url if obj.image else "",
-            "title": obj.image.name if obj.image else "",
-        }
+        return media.file_data(obj.image)
 
     def _validate_multipart_designation_set(self, designation_set):
         if not isinstance(designation_set, list):
@@ -1,9 +1,11 @@
 from django.contrib.auth import get_user_model
 from django_filters import rest_framework as filters
 
-from rest_framework import viewsets, mixins
-
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
+from core import payroll
 from core.views import BaseAttrViewSet, BaseAssetAttrViewSet
 from core.models import (
     Product,
@@ -14,6 +16,7 @@ from core.models import (
     Designation,
     User,
     PaymentMethod,
+    DocumentSequence,
 )
 from core.utils import validate_bulk_reference_uniqueness
 from company import serializers
@@ -44,6 +47,7 @@ class ListUserViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
 
     ordering_fields = "__all__"
     ordering = ["-id"]
+    replica_actions = ("list",)
     filterset_class = UserFilter
     queryset = get_user_model().objects.all()
 
@@ -58,6 +62,7 @@ class ProductCategoryViewSet(BaseAssetAttrViewSet):
 
     queryset = ProductCategory.objects.all()
     serializer_class = serializers.ProductCategorySerializer
+    values_list_read = True
     search_fields = [
         "name",
     ]
@@ -80,6 +85,7 @@ class ProductViewSet(BaseAttrViewSet):
 
     queryset = Product.objects.all()
     serializer_class = serializers.ProductSerializer
+    values_list_read = True
     filterset_class = ProductFilter
     search_fields = [
         "name",
@@ -106,17 +112,30 @@ class PaymentMethodViewSet(BaseAssetAttrViewSet):
 
     queryset = PaymentMethod.objects.all()
     serializer_class = serializers.PaymentMethodSerializer
+    values_list_read = True
     search_fields = [
         "id",
         "name",
     ]
 
 
+class DocumentSequenceViewSet(BaseAssetAttrViewSet):
+    """Manage the numbering of the documents in the database"""
+
+    queryset = DocumentSequence.objects.all()
+    serializer_class = serializers.DocumentSequenceSerializer
+    search_fields = [
+        "document_type",
+        "prefix",
+    ]
+
+
 class PayslipViewSet(BaseAssetAttrViewSet):
     """Manage payslip in the database"""
 
     queryset = Payslip.objects.all()
     serializer_class = serializers.PayslipSerializer
+    values_list_read = True
     search_fields = [
         "id",
         "user__name",
@@ -128,12 +147,44 @@ class PayslipViewSet(BaseAssetAttrViewSet):
         "status",
     ]
 
+    @action(detail=False, methods=["post"])
+    def run(self, request, *args, **kwargs):
+        """
+        Generate the payslips of the employees for a month, or update
+        them when run again, see core.payroll
+        """
+        params = serializers.PayrollRunSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        result = payroll.run(
+            request.user.company,
+            params.validated_data["year"],
+            params.validated_data["month"],
+            params.validated_data.get("date"),
+        )
+        serializer = self.get_serializer(result["payslips"], many=True)
+        return Response(
+            {
+                "created": result["created"],
+                "updated": result["updated"],
+                "results": serializer.data,
+            },
+            status=(
+                status.HTTP_201_CREATED
+                if result["created"]
+                else status.HTTP_200_OK
+            ),
+        )
+
 
 class RoleViewSet(BaseAssetAttrViewSet):
     """Manage roles in the database"""
 
     queryset = Role.objects.all()
     serializer_class = serializers.RoleSerializer
+    prefetch_related_fields = {
+        "permissions": ["permissions"],
+        "user_set": ["user_set"],
+    }
     search_fields = [
         "id",
         "name",
@@ -146,6 +197,9 @@ class DepartmentViewSet(BaseAssetAttrViewSet):
 
     queryset = Department.objects.all()
     serializer_class = serializers.DepartmentSerializer
+    prefetch_related_fields = {
+        "designation_set": ["designation_set__user_set"],
+    }
     search_fields = [
         "id",
         "name",
@@ -157,6 +211,9 @@ class DesignationViewSet(BaseAttrViewSet):
 
     queryset = Designation.objects.all()
     serializer_class = serializers.DesignationSerializer
+    prefetch_related_fields = {
+        "user_set": ["user_set"],
+    }
     search_fields = [
         "id",
         "name",
@@ -184,6 +241,14 @@ class EmployeeViewSet(BaseAttrViewSet):
     queryset = get_user_model().objects.all()
     serializer_class = serializers.EmployeeSerializer
     filterset_class = EmployeeFilter
+    select_related_fields = {
+        "department": ["designation__department"],
+    }
+    prefetch_related_fields = {
+        "roles": ["roles"],
+        "customer_set": ["customer_set"],
+        "product_set": ["product_set"],
+    }
     # TODO: remove id from all search fields?
     # TODO: reduce possible search fields
     search_fields = [
@@ -43,7 +43,10 @@ admin.site.register(models.Invoice)
 admin.site.register(models.InvoiceItem)
 admin.site.register(models.SalesOrder)
 admin.site.register(models.SalesOrderItem)
+admin.site.register(models.DeliveryOrder)
+admin.site.register(models.DeliveryOrderItem)
 admin.site.register(models.Receive)
 admin.site.register(models.ReceiveItem)
 admin.site.register(models.PurchaseOrder)
 admin.site.register(models.PurchaseOrderItem)
+admin.site.register(models.DocumentSequence)
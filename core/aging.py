@@ -0,0 +1,235 @@
+"""
+Aging of the accounts receivable (unpaid invoices) and payable (unpaid
+receives) by customer and supplier.
+
+The balances by age are computed by one grouped query per company and
+ledger, and materialized in AgingBalance, so that the report reads a
+row per customer or supplier instead of every open document. The
+refresh_aging command recomputes them every night as of the new day;
+in between, the balances of the customers and suppliers whose documents
+are saved or deleted are recomputed when the transaction commits, as of
+the day of the company's other balances. The refreshes of a company
+are serialized by a lock on its row, and AgingBalance holds one row per
+company, ledger and party.
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+from functools import partial
+import threading
+
+from django.db import router, transaction
+from django.db.models import Q, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from core.db.routers import replica_reads
+from core.models import AgingBalance, Company, Invoice, Receive
+
+Ledger = namedtuple("Ledger", "model party_field amount_field open_status")
+
+LEDGERS = {
+    AgingBalance.Ledger.RECEIVABLE: Ledger(
+        Invoice, "customer", "balance_due", Invoice.Status.UNPAID
+    ),
+    AgingBalance.Ledger.PAYABLE: Ledger(
+        Receive, "supplier", "grand_total", Receive.Status.UNPAID
+    ),
+}
+
+# bucket -> (oldest, newest) age in days, None when unbounded
+BUCKETS = {
+    "current": (30, None),
+    "days_31_60": (60, 31),
+    "days_61_90": (90, 61),
+    "over_90": (None, 91),
+}
+
+_stale = threading.local()
+
+
+def compute(ledger, company_id, as_of, parties=None):
+    """
+    The balances by age of the open documents of the company in ledger,
+    by party id, in one grouped query. parties limits them to those ids.
+    """
+    model, party_field, amount_field, open_status = LEDGERS[ledger]
+    party = f"{party_field}_id"
+    queryset = model.objects.filter(company_id=company_id, status=open_status)
+    if parties is not None:
+        queryset = queryset.filter(party_filter(party, parties))
+    buckets = {}
+    for bucket, (oldest, newest) in BUCKETS.items():
+        condition = Q()
+        if oldest is not None:
+            condition &= Q(date__gte=as_of - timedelta(days=oldest))
+        if newest is not None:
+            condition &= Q(date__lte=as_of - timedelta(days=newest))
+        buckets[bucket] = Sum(amount_field, filter=condition)
+    rows = (
+        queryset.order_by()
+        .values(party)
+        .annotate(**buckets, total=Sum(amount_field))
+    )
+    return {
+        row.pop(party): {name: value or 0 for name, value in row.items()}
+        for row in rows
+    }
+
+
+def party_filter(field, parties):
+    """Filter on field being one of parties, which may include None"""
+    parties = set(parties)
+    condition = Q(**{f"{field}__in": parties - {None}})
+    if None in parties:
+        condition |= Q(**{f"{field}__isnull": True})
+    return condition
+
+
+def refresh(ledger, company_id, parties=None):
+    """
+    Recompute the balances of the company in ledger, as of today, or
+    only those of parties, as of the day of the others. Without others,
+    they are left to the first report to compute.
+    """
+    balances = AgingBalance.objects.filter(
+        company_id=company_id, ledger=ledger
+    )
+    with transaction.atomic():
+        # serializes the refreshes of the company, so that one's DELETE
+        # sees the rows another inserted
+        Company.objects.select_for_update().filter(pk=company_id).exists()
+        as_of = None
+        if parties is not None:
+            balances = balances.filter(party_filter("party_id", parties))
+            as_of = (
+                AgingBalance.objects.filter(
+                    company_id=company_id, ledger=ledger
+                )
+                .values_list("as_of", flat=True)
+                .first()
+            )
+            if as_of is None:
+                return
+        as_of = as_of or timezone.localdate()
+        balances.delete()
+        AgingBalance.objects.bulk_create(
+            AgingBalance(
+                company_id=company_id,
+                ledger=ledger,
+                party_id=party_id,
+                as_of=as_of,
+                **buckets,
+            )
+            for party_id, buckets in compute(
+                ledger, company_id, as_of, parties
+            ).items()
+            if buckets["total"]
+        )
+
+
+def mark_stale(ledger, company_id, party_id):
+    """Refresh the balance of the party when the transaction commits"""
+    stale = getattr(_stale, "parties", None)
+    if stale is None:
+        stale = _stale.parties = set()
+    stale.add((ledger, company_id, party_id))
+    # one callback per save, the first one refreshes them all; a party
+    # left over by a rolled back transaction is refreshed by the next
+    transaction.on_commit(refresh_stale)
+
+
+def refresh_stale():
+    stale = getattr(_stale, "parties", None)
+    if not stale:
+        return
+    _stale.parties = set()
+    by_company = {}
+    for ledger, company_id, party_id in stale:
+        by_company.setdefault((ledger, company_id), set()).add(party_id)
+    for (ledger, company_id), parties in by_company.items():
+        refresh(ledger, company_id, parties)
+
+
+def _party_before_save(sender, instance, ledger, **kwargs):
+    # the party the document is moved from, if any
+    if instance.pk is not None and not instance._state.adding:
+        party = f"{LEDGERS[ledger].party_field}_id"
+        instance._aging_party = (
+            sender._base_manager.filter(pk=instance.pk)
+            .values_list(party, flat=True)
+            .first()
+        )
+
+
+def _document_changed(sender, instance, ledger, **kwargs):
+    party = f"{LEDGERS[ledger].party_field}_id"
+    mark_stale(ledger, instance.company_id, getattr(instance, party))
+    before = instance.__dict__.pop("_aging_party", None)
+    if before != getattr(instance, party):
+        mark_stale(ledger, instance.company_id, before)
+
+
+def connect():
+    """Refresh the balances of the parties of the documents changed"""
+    receivers = {
+        pre_save: _party_before_save,
+        post_save: _document_changed,
+        post_delete: _document_changed,
+    }
+    for ledger, config in LEDGERS.items():
+        for signal, receiver in receivers.items():
+            signal.connect(
+                partial(receiver, ledger=ledger),
+                sender=config.model,
+                weak=False,
+                dispatch_uid=f"aging{receiver.__name__}{ledger}",
+            )
+
+
+def report(ledger, company, live=False):
+    """
+    The balances of company in ledger as of the day they were refreshed,
+    with the names of the parties. They are refreshed first when there
+    are none, or computed without being materialized when live.
+    """
+    if live:
+        as_of = timezone.localdate()
+        balances = compute(ledger, company.pk, as_of)
+    else:
+        rows = AgingBalance.objects.filter(company=company, ledger=ledger)
+        if not rows.exists():
+            # computed on the primary, and read back from it since the
+            # replicas may lag behind
+            with replica_reads(False):
+                refresh(ledger, company.pk)
+            rows = rows.using(router.db_for_write(AgingBalance))
+        rows = list(
+            rows.values("party_id", "as_of", *BUCKETS, "total").order_by(
+                "party_id"
+            )
+        )
+        as_of = rows[0]["as_of"] if rows else timezone.localdate()
+        balances = {row.pop("party_id"): row for row in rows}
+        for row in balances.values():
+            del row["as_of"]
+
+    config = LEDGERS[ledger]
+    party_model = config.model._meta.get_field(
+        config.party_field
+    ).related_model
+    names = dict(
+        party_model.objects.filter(
+            pk__in=[pk for pk in balances if pk is not None]
+        ).values_list("pk", "name")
+    )
+    totals = {name: 0 for name in (*BUCKETS, "total")}
+    results = []
+    for party_id in sorted(balances, key=lambda pk: (pk is None, pk)):
+        buckets = balances[party_id]
+        for name in totals:
+            totals[name] += buckets[name]
+        results.append(
+            {"id": party_id, "name": names.get(party_id), **buckets}
+        )
+    return {"as_of": as_of, "results": results, "totals": totals}
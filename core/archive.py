@@ -0,0 +1,327 @@
+"""
+Archival of old closed documents into compressed JSON lines files of
+the configured storage, leaving an ArchivedDocument stub behind.
+
+A document is archived with its line items (and the credits applied to
+an invoice); the references to it from other rows (eg. the receive of a
+purchase order) are nulled and restored when the document is rehydrated.
+The files of a batch whose transaction fails are deleted, so that every
+archived document is in exactly one file.
+"""
+
+from datetime import timedelta
+import gzip
+import io
+import json
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, get_storage_class
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.utils import timezone
+
+from core.models import ArchivedDocument, CreditNote, Invoice, PurchaseOrder
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULTS = {
+    # documents older than this many days are archived
+    "AFTER_DAYS": 3 * 365,
+    # documents per archive file and transaction
+    "BATCH_SIZE": 500,
+    # directory of the archive files in the storage
+    "LOCATION": "archives",
+    # "zstd" (with the zstandard package) or "gzip"
+    "CODEC": "zstd" if zstandard is not None else "gzip",
+    # dotted path of the storage class of the archives, and its keyword
+    # arguments, the default storage when None
+    "STORAGE": None,
+    "STORAGE_OPTIONS": {},
+}
+
+# document model -> (archived status, relations archived along)
+ARCHIVABLE = {
+    Invoice: (Invoice.Status.PAID, ("invoiceitem", "creditsapplication")),
+    PurchaseOrder: (PurchaseOrder.Status.COMPLETED, ("purchaseorderitem",)),
+    CreditNote: (CreditNote.Status.CLOSED, ("creditnoteitem",)),
+}
+
+EXTENSIONS = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ARCHIVE", {})}
+
+
+def get_storage(config):
+    if config["STORAGE"] is None:
+        return default_storage
+    return get_storage_class(config["STORAGE"])(**config["STORAGE_OPTIONS"])
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImproperlyConfigured("zstd archives require zstandard")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=9)
+
+
+def decompress(data, name):
+    if name.endswith(EXTENSIONS["zstd"]):
+        if zstandard is None:
+            raise ImproperlyConfigured("zstd archives require zstandard")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def get_relations(model):
+    """
+    Split the relations to model into those archived along, those
+    blocking the archival, and those nulled while it is archived
+    """
+    archived_along = ARCHIVABLE[model][1]
+    along, blocking, nulled = [], [], []
+    for relation in model._meta.related_objects:
+        if relation.many_to_many:
+            continue
+        if relation.name in archived_along:
+            along.append(relation)
+        elif relation.on_delete in (models.SET_NULL, models.DO_NOTHING):
+            nulled.append(relation)
+        else:
+            blocking.append(relation)
+    return along, blocking, nulled
+
+
+def get_archivable(model, before):
+    """The documents of model that can be archived"""
+    status = ARCHIVABLE[model][0]
+    _, blocking, _ = get_relations(model)
+    return model.objects.filter(
+        date__lt=before,
+        status=status,
+        **{f"{relation.name}__isnull": True for relation in blocking},
+    )
+
+
+def serialize_documents(model, documents):
+    """JSON line records of documents, with their related rows"""
+    along, _, nulled = get_relations(model)
+    ids = [document.pk for document in documents]
+    children = {}
+    for relation in along:
+        for obj in relation.related_model.objects.filter(
+            **{f"{relation.field.name}__in": ids}
+        ):
+            document_id = getattr(obj, relation.field.attname)
+            children.setdefault(document_id, []).append(obj)
+    references = {}
+    for relation in nulled:
+        label = (
+            f"{relation.related_model._meta.label_lower}.{relation.field.name}"
+        )
+        for pk, document_id in relation.related_model.objects.filter(
+            **{f"{relation.field.name}__in": ids}
+        ).values_list("pk", relation.field.attname):
+            references.setdefault(document_id, {}).setdefault(
+                label, []
+            ).append(pk)
+
+    for document in documents:
+        yield json.dumps(
+            {
+                "objects": serializers.serialize(
+                    "python", [document, *children.get(document.pk, [])]
+                ),
+                "references": references.get(document.pk, {}),
+            },
+            cls=DjangoJSONEncoder,
+            separators=(",", ":"),
+        )
+
+
+def archive_batch(model, ids, config):
+    """
+    Archive the documents with ids still archivable, in one transaction.
+    Returns the number of documents archived.
+    """
+    before = timezone.now().date() - timedelta(days=config["AFTER_DAYS"])
+    using = router.db_for_write(model)
+    storage = get_storage(config)
+    # the files written, deleted if the transaction is rolled back
+    written = []
+    try:
+        with transaction.atomic(using=using):
+            # skips the rows being edited instead of waiting for them
+            documents = list(
+                get_archivable(model, before)
+                .filter(pk__in=ids)
+                .select_for_update(skip_locked=True, of=("self",))
+                .order_by("company", "pk")
+            )
+            archived = 0
+            for company_id in sorted({d.company_id for d in documents}):
+                batch = [d for d in documents if d.company_id == company_id]
+                name = storage.save(
+                    f"{config['LOCATION']}/{company_id}/"
+                    f"{model._meta.model_name}/{batch[0].pk}"
+                    f"{EXTENSIONS[config['CODEC']]}",
+                    ContentFile(
+                        compress(
+                            "".join(
+                                f"{line}\n"
+                                for line in serialize_documents(model, batch)
+                            ).encode(),
+                            config["CODEC"],
+                        )
+                    ),
+                )
+                written.append(name)
+                ArchivedDocument.objects.bulk_create(
+                    [
+                        ArchivedDocument(
+                            company_id=company_id,
+                            document_type=model._meta.label_lower,
+                            document_id=document.pk,
+                            reference=document.reference,
+                            date=document.date,
+                            grand_total=document.grand_total,
+                            archive=name,
+                            position=position,
+                        )
+                        for position, document in enumerate(batch)
+                    ]
+                )
+                archived += len(batch)
+
+            along, _, _ = get_relations(model)
+            ids = [document.pk for document in documents]
+            for relation in along:
+                # the protected ones can't be deleted with the documents
+                relation.related_model.objects.filter(
+                    **{f"{relation.field.name}__in": ids}
+                ).delete()
+            model.objects.filter(pk__in=ids).delete()
+    except BaseException:
+        # the rows are kept, and archived in new files by the next run
+        for name in written:
+            storage.delete(name)
+        raise
+    return archived
+
+
+def archive_documents(model, company=None, pause=0, **overrides):
+    """
+    Archive the archivable documents of model in batches of their
+    own transaction, yielding the number archived after each batch.
+    overrides take precedence over the ARCHIVE setting.
+    """
+    config = {**get_config(), **overrides}
+    before = timezone.now().date() - timedelta(days=config["AFTER_DAYS"])
+    queryset = get_archivable(model, before).order_by("pk")
+    if company is not None:
+        queryset = queryset.filter(company=company)
+    last = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last).values_list("pk", flat=True)[
+                : config["BATCH_SIZE"]
+            ]
+        )
+        if not ids:
+            return
+        yield archive_batch(model, ids, config)
+        last = ids[-1]
+        if pause:
+            # lets the waiting writers through between the batches
+            time.sleep(pause)
+
+
+def read_record(stub, storage):
+    with storage.open(stub.archive, "rb") as f:
+        lines = io.BytesIO(decompress(f.read(), stub.archive)).readlines()
+    return json.loads(lines[stub.position])
+
+
+def target_exists(field, value):
+    return field.related_model._base_manager.filter(
+        **{field.target_field.attname: value}
+    ).exists()
+
+
+@transaction.atomic
+def rehydrate(stub):
+    """Restore an archived document and delete its stub"""
+    storage = get_storage(get_config())
+    record = read_record(stub, storage)
+    for position, deserialized in enumerate(
+        serializers.deserialize("python", record["objects"])
+    ):
+        obj = deserialized.object
+        if not position:
+            for attname, value in stub.links.items():
+                setattr(obj, attname, value)
+        restore = True
+        for field in obj._meta.concrete_fields:
+            value = getattr(obj, field.attname)
+            if not field.is_relation or value is None:
+                continue
+            if target_exists(field, value):
+                continue
+            if field.null:
+                # deleted while archived, as SET_NULL would have done
+                setattr(obj, field.attname, None)
+            elif position:
+                # as the cascade of the deletion would have done
+                restore = False
+            else:
+                raise ValueError(
+                    f"{stub.document_type} {stub.document_id} references "
+                    f"a deleted {field.related_model._meta.label_lower}"
+                )
+        if restore:
+            deserialized.save()
+
+    for label, pks in record["references"].items():
+        referencing, field_name = label.rsplit(".", 1)
+        model = apps.get_model(referencing)
+        model.objects.filter(
+            pk__in=pks, **{f"{field_name}__isnull": True}
+        ).update(**{field_name: stub.document_id})
+        # the referencing documents archived since are linked back
+        # once they are rehydrated too
+        attname = model._meta.get_field(field_name).attname
+        for referencing_stub in ArchivedDocument.objects.filter(
+            document_type=referencing, document_id__in=pks
+        ):
+            referencing_stub.links[attname] = stub.document_id
+            referencing_stub.save(update_fields=["links"])
+
+    stub.delete()
+    if not ArchivedDocument.objects.filter(archive=stub.archive).exists():
+        transaction.on_commit(lambda: storage.delete(stub.archive))
+    return apps.get_model(stub.document_type).objects.get(pk=stub.document_id)
+
+
+def rehydrate_document(model, company, pk):
+    """Rehydrate the document of company with pk if it was archived"""
+    if model not in ARCHIVABLE:
+        return None
+    try:
+        stub = ArchivedDocument.objects.get(
+            company=company,
+            document_type=model._meta.label_lower,
+            document_id=pk,
+        )
+    except (ArchivedDocument.DoesNotExist, ValueError):
+        return None
+    return rehydrate(stub)
@@ -0,0 +1,198 @@
+"""
+Conversion of documents into the documents following them, eg. sales
+orders into invoices, with a fixed number of statements: the documents
+are inserted in bulk, their line items copied by one INSERT ... SELECT,
+and their totals summed by one SELECT and saved by one UPDATE.
+"""
+
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from core import numbering
+
+TOTALS = (
+    "total_amount",
+    "discount_amount",
+    "net",
+    "gst_amount",
+    "grand_total",
+)
+
+
+def get_item_model(model):
+    """The line item model of a document model"""
+    (relation,) = [
+        relation
+        for relation in model._meta.related_objects
+        if getattr(relation.related_model, "document_field", None)
+        == relation.field.name
+    ]
+    return relation.related_model
+
+
+def copy_items(source_model, target_model, link_field, target_ids):
+    """
+    Copy the line items of the source documents to the target documents
+    with target_ids linked to them, in one INSERT ... SELECT
+    """
+    source_items = get_item_model(source_model)
+    target_items = get_item_model(target_model)
+    source_fk = source_items._meta.get_field(source_items.document_field)
+    target_fk = target_items._meta.get_field(target_items.document_field)
+    columns = [
+        field.column
+        for field in target_items._meta.concrete_fields
+        if not field.primary_key
+        and field
+        not in (target_fk, target_items._meta.get_field("document_date"))
+    ]
+    connection = connections[router.db_for_write(target_items)]
+    quote = connection.ops.quote_name
+    target_table = target_model._meta.db_table
+    sql = (
+        f"INSERT INTO {quote(target_items._meta.db_table)} "
+        f"({', '.join(quote(column) for column in columns)}, "
+        f"{quote('document_date')}, {quote(target_fk.column)}) "
+        f"SELECT {', '.join(f'i.{quote(column)}' for column in columns)}, "
+        f"d.{quote('date')}, d.{quote('id')} "
+        f"FROM {quote(source_items._meta.db_table)} i "
+        f"INNER JOIN {quote(target_table)} d ON d."
+        f"{quote(target_model._meta.get_field(link_field).column)} = "
+        f"i.{quote(source_fk.column)} "
+        f"WHERE d.{quote('id')} IN ({', '.join(['%s'] * len(target_ids))}) "
+        f"ORDER BY i.{quote('id')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, target_ids)
+
+
+def calculate_totals(total_amount, discount_rate, gst_rate):
+    """The totals of a document, as calculated by the document serializers"""
+    net = total_amount * (1 - discount_rate / 100)
+    return {
+        "total_amount": round(total_amount, 2),
+        "discount_amount": round(total_amount * discount_rate / 100, 2),
+        "net": round(net, 2),
+        "gst_amount": round(net * gst_rate / 100, 2),
+        "grand_total": round(net * (1 + gst_rate / 100), 2),
+    }
+
+
+def compute_totals(documents, **extra):
+    """
+    Compute the totals of the saved documents from their line items, by
+    one aggregate SELECT and one bulk UPDATE. extra maps other fields to
+    the name of the total they are set to.
+    """
+    model = type(documents[0])
+    items = get_item_model(model)
+    totals = dict(
+        items.objects.filter(**{f"{items.document_field}__in": documents})
+        .order_by()
+        .values_list(items.document_field)
+        .annotate(total=Sum("amount"))
+    )
+    for document in documents:
+        calculated = calculate_totals(
+            totals.get(document.pk, Decimal(0)),
+            document.discount_rate,
+            document.gst_rate,
+        )
+        calculated.update(
+            (field, calculated[name]) for field, name in extra.items()
+        )
+        for field, value in calculated.items():
+            setattr(document, field, value)
+    model.objects.bulk_update(documents, [*TOTALS, *extra])
+
+
+def convert_documents(
+    source_model,
+    target_model,
+    link_field,
+    company,
+    ids,
+    fields=(),
+    values=None,
+    closed=(),
+    converted_status=None,
+    totals=None,
+):
+    """
+    Create a target_model document linked to each of the source_model
+    documents of company with ids, with their line items. fields are
+    copied from the source documents, values set on the targets, and
+    the sources with a status in closed can't be converted. The sources
+    converted are set to converted_status.
+    Returns the ids of the targets by source id, and the errors.
+    """
+    errors = {}
+    with transaction.atomic():
+        sources = list(
+            source_model.objects.filter(company=company, pk__in=ids)
+            .select_for_update(of=("self",))
+            .order_by("pk")
+        )
+        for pk in set(ids) - {source.pk for source in sources}:
+            errors[pk] = [_("Not found.")]
+        converted = set(
+            target_model.objects.filter(
+                **{f"{link_field}__in": sources}
+            ).values_list(link_field, flat=True)
+        )
+        for source in list(sources):
+            if source.pk in converted:
+                errors[source.pk] = [_("Already converted.")]
+            elif source.status in closed:
+                errors[source.pk] = [
+                    _("Can't be converted when %(status)s.")
+                    % {"status": source.get_status_display().lower()}
+                ]
+            else:
+                continue
+            sources.remove(source)
+        if not sources:
+            return {}, errors
+
+        # the ids of the relations, without fetching them
+        attnames = [source_model._meta.get_field(f).attname for f in fields]
+        today = timezone.localdate()
+        references = numbering.allocate_references(
+            target_model, company, len(sources)
+        )
+        documents = [
+            target_model(
+                company=company,
+                reference=reference,
+                date=today,
+                **{name: getattr(source, name) for name in attnames},
+                **{link_field: source},
+                gst_rate=source.gst_rate,
+                discount_rate=source.discount_rate,
+                **dict.fromkeys(TOTALS, 0),
+                **(values or {}),
+            )
+            for source, reference in zip(sources, references)
+        ]
+        target_model.objects.bulk_create(documents)
+        # not all the backends return the ids of the rows inserted
+        targets = dict(
+            target_model.objects.filter(
+                company=company, reference__in=references
+            ).values_list(f"{link_field}_id", "pk")
+        )
+        for document in documents:
+            document.pk = targets[getattr(document, f"{link_field}_id")]
+        copy_items(
+            source_model, target_model, link_field, list(targets.values())
+        )
+        compute_totals(documents, **(totals or {}))
+        if converted_status is not None:
+            source_model.objects.filter(pk__in=targets).update(
+                status=converted_status
+            )
+    return targets, errors
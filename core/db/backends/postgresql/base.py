@@ -0,0 +1,113 @@
+"""
+PostgreSQL backend checking its connections out of a pool shared by
+the threads of the process, see core.db.pool.
+
+Configured with the POOL dict of the database settings (the keys of
+core.db.pool.DEFAULTS). Closing the connection, as Django does at the
+end of every request with CONN_MAX_AGE = 0, releases it to the pool.
+"""
+
+from django.db.backends.postgresql import base, creation
+from django.utils.asyncio import async_unsafe
+
+import psycopg2.extensions
+import psycopg2.extras
+
+from core.db import pool as connection_pool
+
+Database = base.Database
+
+
+def check_connection(connection):
+    """Health check, a round trip to the server"""
+    if connection.closed:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    if not connection.autocommit:
+        connection.rollback()
+    return True
+
+
+def reset_connection(connection):
+    """Roll back whatever the previous user left open"""
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    # the template of CREATE DATABASE and the dropped database can't
+    # have sessions open, so the idle pooled connections are closed
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        connection_pool.close_pools(self.connection.settings_dict["NAME"])
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        connection_pool.close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    pool = None
+
+    def get_pool(self, conn_params):
+        settings_dict = self.settings_dict
+        key = (
+            self.alias,
+            settings_dict["NAME"],
+            settings_dict["HOST"],
+            settings_dict["PORT"],
+            settings_dict["USER"],
+        )
+        return connection_pool.get_pool(
+            key,
+            lambda: connection_pool.ConnectionPool(
+                connect=lambda: Database.connect(**conn_params),
+                check=check_connection,
+                reset=reset_connection,
+                close=lambda connection: connection.close(),
+                **settings_dict.get("POOL", {}),
+            ),
+        )
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        try:
+            connection = self.pool.getconn()
+        except connection_pool.PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+
+        # as in the stock backend, see its get_new_connection()
+        options = self.settings_dict["OPTIONS"]
+        try:
+            self.isolation_level = options["isolation_level"]
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        return connection
+
+    @async_unsafe
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                if self.in_atomic_block:
+                    # the wrapper keeps the connection until the block
+                    # exits, so it can't be handed to another thread
+                    self.pool.discard(self.connection)
+                else:
+                    self.pool.putconn(self.connection)
@@ -0,0 +1,302 @@
+from collections import deque
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("core.db.pool")
+
+DEFAULTS = {
+    # maximum number of connections open at once, per process
+    "MAX_SIZE": 10,
+    # seconds a thread waits for a connection before giving up
+    "TIMEOUT": 10.0,
+    # connections idle for longer than this (seconds) are checked
+    # with a round trip before being handed out, 0 checks every time
+    "HEALTH_CHECK_INTERVAL": 30.0,
+    # idle connections are closed after this many seconds
+    "MAX_IDLE": 300.0,
+    # connections are replaced after this many seconds (None disables)
+    "MAX_LIFETIME": 3600.0,
+}
+
+
+class PoolTimeout(Exception):
+    """No connection was released within the timeout"""
+
+
+class PooledConnection:
+    """Bookkeeping of a connection opened by the pool"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.released = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections shared by the threads of a process.
+
+    connect() opens a connection, check(connection) is the health check
+    run before handing out a connection that was idle for a while, and
+    reset(connection) prepares a released connection for the next user;
+    either returning False discards the connection.
+    """
+
+    def __init__(self, connect, check, reset, close, **options):
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.close = close
+        self.options = {**DEFAULTS, **options}
+        self.condition = threading.Condition()
+        # most recently released last, so busy periods reuse
+        # the warm connections and the rest can expire
+        self.idle = deque()
+        self.checked_out = {}
+        self.opening = 0
+        self.closed = False
+        self.stats_since = time.time()
+        self.counters = dict.fromkeys(
+            (
+                "opened",
+                "closed",
+                "checkouts",
+                "waits",
+                "timeouts",
+                "health_checks",
+                "health_check_failures",
+            ),
+            0,
+        )
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def size(self):
+        return len(self.idle) + len(self.checked_out) + self.opening
+
+    def getconn(self):
+        """Check out a healthy connection, waiting for one if necessary"""
+        start = time.monotonic()
+        deadline = start + self.options["TIMEOUT"]
+        waited = False
+        while True:
+            with self.condition:
+                if self.closed:
+                    raise PoolTimeout("The connection pool is closed")
+                pooled = None
+                while pooled is None:
+                    if self.idle:
+                        pooled = self.idle.pop()
+                    elif self.size < self.options["MAX_SIZE"]:
+                        self.opening += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.counters["timeouts"] += 1
+                            raise PoolTimeout(
+                                f"No connection available within "
+                                f"{self.options['TIMEOUT']}s, "
+                                f"{len(self.checked_out)} checked out"
+                            )
+                        waited = True
+                        self.condition.wait(remaining)
+
+            # connecting and health checks happen outside of the lock
+            opened = pooled is None
+            if opened:
+                pooled = self._open()
+            elif not self._usable(pooled):
+                self._discard(pooled)
+                continue
+
+            with self.condition:
+                if opened:
+                    self.opening -= 1
+                self.checked_out[id(pooled.connection)] = pooled
+                wait = time.monotonic() - start
+                self.counters["checkouts"] += 1
+                if waited:
+                    self.counters["waits"] += 1
+                self.wait_time += wait
+                self.max_wait_time = max(self.max_wait_time, wait)
+            return pooled.connection
+
+    def putconn(self, connection):
+        """Release a connection checked out with getconn()"""
+        with self.condition:
+            pooled = self.checked_out.pop(id(connection), None)
+        if pooled is None:
+            # checked out before the pool was forgotten
+            return
+        try:
+            keep = not self.closed and self.reset(connection)
+        except Exception:
+            logger.exception("Resetting a pooled connection failed")
+            keep = False
+        if keep and not self._expired(pooled, time.monotonic()):
+            pooled.released = time.monotonic()
+            with self.condition:
+                self.idle.append(pooled)
+                self.condition.notify()
+        else:
+            self._discard(pooled)
+        self._close_idle()
+
+    def discard(self, connection):
+        """Close a connection checked out with getconn()"""
+        with self.condition:
+            pooled = self.checked_out.pop(id(connection), None)
+        if pooled is not None:
+            self._discard(pooled)
+
+    def closeall(self):
+        """Close the idle connections, and the others once released"""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, deque()
+            self.condition.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def forget(self):
+        """
+        Drop every connection without closing it, in a forked child:
+        closing would end the parent's sessions sharing the sockets
+        """
+        self.closed = True
+        self.idle.clear()
+        self.checked_out.clear()
+        self.opening = 0
+        self.condition = threading.Condition()
+
+    def stats(self):
+        with self.condition:
+            checkouts = self.counters["checkouts"]
+            return {
+                "size": self.size,
+                "max_size": self.options["MAX_SIZE"],
+                "idle": len(self.idle),
+                "checked_out": len(self.checked_out),
+                **self.counters,
+                "wait_ms_avg": round(
+                    self.wait_time / checkouts * 1000 if checkouts else 0, 3
+                ),
+                "wait_ms_max": round(self.max_wait_time * 1000, 3),
+                "since": self.stats_since,
+            }
+
+    def reset_stats(self):
+        with self.condition:
+            for name in self.counters:
+                self.counters[name] = 0
+            self.wait_time = self.max_wait_time = 0.0
+            self.stats_since = time.time()
+
+    def _open(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.condition:
+                self.opening -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.counters["opened"] += 1
+        return PooledConnection(connection)
+
+    def _usable(self, pooled):
+        now = time.monotonic()
+        if self._expired(pooled, now):
+            return False
+        if now - pooled.released < self.options["HEALTH_CHECK_INTERVAL"]:
+            return True
+        with self.condition:
+            self.counters["health_checks"] += 1
+        try:
+            healthy = self.check(pooled.connection)
+        except Exception:
+            healthy = False
+        if not healthy:
+            logger.warning("Discarding an unhealthy pooled connection")
+            with self.condition:
+                self.counters["health_check_failures"] += 1
+        return healthy
+
+    def _expired(self, pooled, now):
+        lifetime = self.options["MAX_LIFETIME"]
+        return lifetime is not None and now - pooled.created > lifetime
+
+    def _discard(self, pooled):
+        try:
+            self.close(pooled.connection)
+        except Exception:
+            pass
+        with self.condition:
+            self.counters["closed"] += 1
+            # a slot opened up for a waiting thread
+            self.condition.notify()
+
+    def _close_idle(self):
+        """Close the connections idle for longer than MAX_IDLE"""
+        now = time.monotonic()
+        expired = []
+        with self.condition:
+            # the least recently released are first
+            while (
+                self.idle
+                and now - self.idle[0].released > self.options["MAX_IDLE"]
+            ):
+                expired.append(self.idle.popleft())
+        for pooled in expired:
+            self._discard(pooled)
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """Get the pool registered for key, creating it with factory()"""
+    with pools_lock:
+        pool = pools.get(key)
+        if pool is None or pool.closed:
+            pool = pools[key] = factory()
+        return pool
+
+
+def close_pools(name=None):
+    """Close the pools, or those of the database named name"""
+    with pools_lock:
+        for key in list(pools):
+            if name is None or key[1] == name:
+                pools.pop(key).closeall()
+
+
+def get_pool_stats():
+    with pools_lock:
+        return [
+            {"alias": alias, "database": name, **pool.stats()}
+            for (alias, name, *_), pool in pools.items()
+        ]
+
+
+def reset_pool_stats():
+    with pools_lock:
+        for pool in pools.values():
+            pool.reset_stats()
+
+
+def _forget_pools():
+    global pools_lock
+    pools_lock = threading.Lock()
+    for pool in pools.values():
+        pool.forget()
+    pools.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    # the connections of the parent can't be shared with a child
+    os.register_at_fork(after_in_child=_forget_pools)
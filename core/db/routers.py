@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger("core.db.routers")
+
+DEFAULTS = {
+    # database aliases of the read replicas of the default database
+    "ALIASES": [],
+    # replicas lagging behind by more than this many seconds are skipped
+    "MAX_LAG": 5.0,
+    # seconds the measured lag of a replica is trusted for
+    "LAG_CHECK_INTERVAL": 5.0,
+    # seconds a client reads from the primary after writing
+    "PIN_SECONDS": 10,
+    "PIN_COOKIE": "primary_pin",
+    # for clients not keeping cookies, echoed back by them
+    "PIN_HEADER": "X-Primary-Pin",
+}
+
+POSTGRESQL_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery()
+        OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+    THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# set for the requests allowed to read from a replica
+use_replica = ContextVar("use_replica", default=False)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "READ_REPLICAS", {})}
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route the reads of the block to the replicas (or not)"""
+    token = use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        use_replica.reset(token)
+
+
+def get_lag(alias):
+    """Seconds the replica is behind its primary"""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        # sqlite copies etc. don't replicate
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRESQL_LAG_SQL)
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+class ReplicaLag:
+    """Lag of the replicas, measured at most every LAG_CHECK_INTERVAL"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # alias -> (lag, time measured), the lag is None when unreachable
+        self.measured = {}
+
+    def get(self, alias, interval):
+        now = time.monotonic()
+        with self.lock:
+            lag, measured = self.measured.get(alias, (None, None))
+            if measured is not None and now - measured < interval:
+                return lag
+            # the other threads use the previous value meanwhile
+            self.measured[alias] = (lag, now)
+        try:
+            lag = get_lag(alias)
+        except Exception:
+            logger.warning("Replica %s is unreachable", alias, exc_info=True)
+            lag = None
+        with self.lock:
+            self.measured[alias] = (lag, now)
+        return lag
+
+    def reset(self):
+        with self.lock:
+            self.measured.clear()
+
+
+replica_lag = ReplicaLag()
+
+
+class ReplicaRouter:
+    """
+    Send the reads of the requests marked by ReplicaRoutingMiddleware
+    to the replicas in READ_REPLICAS["ALIASES"], round robin, skipping
+    the replicas lagging behind by more than MAX_LAG. Everything else,
+    and every read inside of a transaction, goes to the primary.
+    """
+
+    counter = itertools.count()
+
+    def get_replica(self):
+        config = get_config()
+        aliases = config["ALIASES"]
+        start = next(self.counter)
+        for i in range(len(aliases)):
+            alias = aliases[(start + i) % len(aliases)]
+            lag = replica_lag.get(alias, config["LAG_CHECK_INTERVAL"])
+            if lag is not None and lag <= config["MAX_LAG"]:
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if not use_replica.get():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # reads of a transaction must see its writes
+            return DEFAULT_DB_ALIAS
+        return self.get_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_config()["ALIASES"]
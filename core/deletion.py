@@ -0,0 +1,135 @@
+"""
+Set-based deletion of records, for the bulk destroy of the viewsets.
+
+Records are deleted by chunks of ids, each in its own transaction: the
+ids protected from deletion (by a PROTECT foreign key to them, or to
+the records their deletion cascades to) are found with one aggregated
+query per protecting relation and reported instead of deleted, and the
+others are deleted with queryset deletes. Django cascades those with one
+DELETE per table, except that the records of the models with delete
+signals connected (the invoices and receives, for core.aging, and the
+models with uploaded files, for the blob refcounts of
+core.storage.dedup) are loaded first, to send the signals per record.
+A chunk failing in the database (eg. on a deadlock) is rolled back and
+its ids reported with the errors, the chunks before it staying deleted.
+"""
+
+import logging
+
+from django.db import DatabaseError, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.utils.translation import ugettext_lazy as _
+
+logger = logging.getLogger("core.deletion")
+
+PROTECTING = (models.PROTECT, models.RESTRICT)
+
+
+def get_protecting_lookups(model, suffix="", exclude=(), seen=()):
+    """
+    Yield the (model, lookup to the pk of the deleted record) of the
+    relations protecting the deletion of the records of model, directly
+    or through the records cascaded to. The relations named in exclude
+    are left out, they are deleted before the records.
+    """
+    seen = (*seen, model)
+    for relation in model._meta.related_objects:
+        if relation.many_to_many or (not suffix and relation.name in exclude):
+            continue
+        lookup = f"{relation.field.name}{suffix}"
+        if relation.on_delete in PROTECTING:
+            yield relation.related_model, lookup
+        elif (
+            relation.on_delete is models.CASCADE
+            and relation.related_model not in seen
+        ):
+            yield from get_protecting_lookups(
+                relation.related_model, f"__{lookup}", seen=seen
+            )
+
+
+def get_protected(model, ids, exclude=()):
+    """The ids of model that can't be deleted -> error messages"""
+    errors = {}
+    for related_model, lookup in get_protecting_lookups(
+        model, exclude=exclude
+    ):
+        counts = (
+            related_model._base_manager.filter(**{f"{lookup}__in": ids})
+            .order_by()
+            .values_list(lookup)
+            .annotate(count=Count("pk"))
+        )
+        for pk, count in counts:
+            errors.setdefault(pk, []).append(
+                _("Referenced by %(count)d %(name)s")
+                % {
+                    "count": count,
+                    "name": (
+                        related_model._meta.verbose_name_plural
+                        if count > 1
+                        else related_model._meta.verbose_name
+                    ),
+                }
+            )
+    return errors
+
+
+def adjust_totals(model, rows, key, amount, **signs):
+    """
+    Add (sign 1) or subtract (sign -1) the sums of amount of rows to
+    the fields of the model records they point to with key, in one
+    UPDATE, eg. adjust_totals(Customer, invoices, "customer",
+    "grand_total", receivables=1)
+    """
+    total = Subquery(
+        rows.filter(**{key: OuterRef("pk")})
+        .order_by()
+        .values(key)
+        .annotate(total=Sum(amount))
+        .values("total")
+    )
+    model._base_manager.filter(pk__in=rows.values(key)).update(
+        **{
+            field: F(field) + total if sign > 0 else F(field) - total
+            for field, sign in signs.items()
+        }
+    )
+
+
+def bulk_delete(model, ids, chunk_size=500, release=None, released=()):
+    """
+    Delete the records of model with ids. release(ids) is called before
+    deleting each chunk, to delete the relations named in released and
+    reverse the totals depending on the records.
+    Returns the ids deleted and the errors of those that weren't.
+    """
+    ids = sorted(ids)
+    deleted, errors = [], {}
+    for start in range(0, len(ids), chunk_size):
+        end = start + chunk_size
+        chunk = ids[start:end]
+        try:
+            with transaction.atomic():
+                # locked so that no reference to them is added meanwhile
+                chunk = list(
+                    model._base_manager.filter(pk__in=chunk)
+                    .select_for_update()
+                    .values_list("pk", flat=True)
+                )
+                protected = get_protected(model, chunk, released)
+                chunk = [pk for pk in chunk if pk not in protected]
+                if chunk:
+                    if release is not None:
+                        release(chunk)
+                    model._base_manager.filter(pk__in=chunk).delete()
+        except DatabaseError:
+            logger.exception("Deleting %s failed", model._meta.label)
+            errors.update(
+                (pk, [_("Could not be deleted, try again.")])
+                for pk in ids[start:end]
+            )
+            continue
+        deleted.extend(chunk)
+        errors.update(protected)
+    return deleted, errors
@@ -0,0 +1,80 @@
+"""
+Partial delivery of the sales orders.
+
+The quantity of a sales order line delivered so far is kept on
+SalesOrderItem.quantity_delivered: every write of delivery orders adds
+the change of the quantities of their lines, by one UPDATE, instead of
+summing the lines of every delivery order on read. The UPDATE only
+matches the lines with room for the quantities added, so that concurrent
+delivery orders can't deliver more than ordered between the validation
+of the serializer and the write.
+"""
+
+from collections import Counter
+
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+
+from core.models import SalesOrderItem
+
+
+def get_delivered(items):
+    """The quantities of the delivery order items by sales order item"""
+    return Counter(
+        dict(
+            items.exclude(sales_order_item=None)
+            .order_by()
+            .values_list("sales_order_item")
+            .annotate(Sum("quantity"))
+        )
+    )
+
+
+def get_changes(before, after):
+    """The changes of the quantities delivered from before to after"""
+    changes = Counter(after)
+    changes.subtract(before)
+    return {pk: quantity for pk, quantity in changes.items() if quantity}
+
+
+class OverDelivery(Exception):
+    """A sales order item would be delivered more than ordered"""
+
+
+def add_delivered(quantities):
+    """
+    Add the quantities to the delivered ones of the sales order items,
+    raising OverDelivery, to roll the transaction back, when a line has
+    no room for the quantity added
+    """
+    quantities = {
+        pk: quantity for pk, quantity in quantities.items() if quantity
+    }
+    if not quantities:
+        return
+    room = Q()
+    for pk, quantity in quantities.items():
+        if quantity > 0:
+            # re-evaluated on the committed row once its lock is released
+            room |= Q(pk=pk, quantity_delivered__lte=F("quantity") - quantity)
+        else:
+            room |= Q(pk=pk)
+    updated = SalesOrderItem.objects.filter(room).update(
+        quantity_delivered=F("quantity_delivered")
+        + Case(
+            *[
+                When(pk=pk, then=Value(quantity))
+                for pk, quantity in quantities.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+    if updated < len(quantities):
+        raise OverDelivery()
+
+
+def release_delivered(items):
+    """Subtract the quantities of the delivery order items being deleted"""
+    add_delivered(
+        {pk: -quantity for pk, quantity in get_delivered(items).items()}
+    )
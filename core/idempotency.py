@@ -0,0 +1,154 @@
+"""
+Idempotency keys of the create requests.
+
+The response to the first create request sent with an Idempotency-Key
+header is stored with the key, and replayed to the retries of the
+request without running the view again. A retry of a request still in
+progress waits for its response, the row of the key being locked until
+the request commits. Failed requests (4xx and 5xx) are rolled back with
+their key, so they run again when retried.
+"""
+
+from datetime import timedelta
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import IdempotencyKey
+
+DEFAULTS = {
+    "HEADER": "Idempotency-Key",
+    # seconds during which the retries of a request are replayed
+    "TTL": 24 * 3600,
+}
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "IDEMPOTENCY", {})}
+
+
+def dumps(data):
+    return json.dumps(
+        data, cls=JSONEncoder, sort_keys=True, separators=(",", ":")
+    ).encode()
+
+
+def get_fingerprint(request):
+    """sha256 of the method, path and parsed body of the request"""
+    data = request.data
+    if hasattr(data, "lists"):
+        # form data, with the names of the uploaded files
+        data = {
+            key: [str(value) for value in values]
+            for key, values in data.lists()
+        }
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), dumps(data)):
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def lock_key(user, key, fingerprint, config):
+    """
+    Get or create the locked row of the key. Returns it and whether the
+    request should run, which it shouldn't when it is a retry.
+    """
+    expires_at = timezone.now() + timedelta(seconds=config["TTL"])
+    queryset = IdempotencyKey.objects.select_for_update()
+    try:
+        with transaction.atomic():
+            return (
+                queryset.create(
+                    user=user,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=expires_at,
+                ),
+                True,
+            )
+    except IntegrityError:
+        # waits for the request with the key in progress, if any
+        record = queryset.get(user=user, key=key)
+    if record.expires_at > timezone.now():
+        return record, False
+    record.fingerprint = fingerprint
+    record.status_code = record.response = None
+    record.expires_at = expires_at
+    record.save()
+    return record, True
+
+
+def idempotent(view, request, create):
+    """Run create(), or replay its response if the request is a retry"""
+    config = get_config()
+    key = request.headers.get(config["HEADER"])
+    if key is None:
+        return create()
+    if not key or len(key) > IdempotencyKey._meta.get_field("key").max_length:
+        raise ValidationError(
+            {config["HEADER"]: _("Expected 1 to 255 characters")}
+        )
+
+    fingerprint = get_fingerprint(request)
+    with transaction.atomic():
+        record, run = lock_key(request.user, key, fingerprint, config)
+        if not run:
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {
+                        "detail": _(
+                            "This idempotency key was used by another request"
+                        )
+                    },
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            data = json.loads(zlib.decompress(record.response))
+            headers = {REPLAYED_HEADER: "true"}
+            if isinstance(data, dict):
+                headers.update(view.get_success_headers(data))
+            return Response(data, status=record.status_code, headers=headers)
+
+        response = create()
+        if response.status_code >= 400:
+            transaction.set_rollback(True)
+            return response
+        record.status_code = response.status_code
+        record.response = zlib.compress(dumps(response.data))
+        record.save(update_fields=["status_code", "response"])
+    return response
+
+
+class IdempotentCreateMixin:
+    """
+    Replay the response of the create (and bulk create) requests
+    retried with the same Idempotency-Key header
+    """
+
+    def create(self, request, *args, **kwargs):
+        create = super().create
+        return idempotent(
+            self, request, lambda: create(request, *args, **kwargs)
+        )
+
+
+def clear_expired(batch_size=1000):
+    """Delete the expired keys, returning how many were deleted"""
+    queryset = IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import archive
+
+
+class Command(BaseCommand):
+    """
+    Django command to archive the old paid invoices, completed
+    purchase orders and closed credit notes, see core.archive.
+
+    Each batch is archived in its own short transaction, skipping the
+    documents locked by a request, so it can run while serving.
+    """
+
+    help = "Move old closed documents to compressed archive files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--after-days",
+            type=int,
+            help="Archive the documents older than this many days "
+            f"(default {archive.DEFAULTS['AFTER_DAYS']})",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Documents per transaction and archive file "
+            f"(default {archive.DEFAULTS['BATCH_SIZE']})",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between the batches",
+        )
+        parser.add_argument("--company", type=int, help="Company id")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the archivable documents without archiving them",
+        )
+
+    def handle(self, *args, **options):
+        overrides = {
+            name: options[option]
+            for option, name in (
+                ("after_days", "AFTER_DAYS"),
+                ("batch_size", "BATCH_SIZE"),
+            )
+            if options[option] is not None
+        }
+        # invoices first, since archiving them releases the credit
+        # notes that were applied to them
+        for model in archive.ARCHIVABLE:
+            name = model._meta.verbose_name_plural
+            if options["dry_run"]:
+                config = {**archive.get_config(), **overrides}
+                queryset = archive.get_archivable(
+                    model,
+                    timezone.now().date()
+                    - timedelta(days=config["AFTER_DAYS"]),
+                )
+                if options["company"] is not None:
+                    queryset = queryset.filter(company=options["company"])
+                self.stdout.write(f"{queryset.count()} {name} to archive")
+                continue
+
+            total = 0
+            for archived in archive.archive_documents(
+                model,
+                company=options["company"],
+                pause=options["pause"],
+                **overrides,
+            ):
+                total += archived
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{total} {name} archived")
+            self.stdout.write(self.style.SUCCESS(f"{total} {name} archived"))
@@ -0,0 +1,395 @@
+from contextlib import ExitStack, contextmanager
+from importlib import import_module
+import json
+import math
+import platform
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework.routers import SimpleRouter
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.viewsets import ViewSetMixin
+from rest_framework_bulk.drf3.mixins import BulkCreateModelMixin
+
+DEFAULTS = {
+    # maximum number of queries per request, by action
+    "QUERY_BUDGETS": {
+        "list": 10,
+        "retrieve": 10,
+        "create": 30,
+        "update": 30,
+        # for BULK_SIZE objects
+        "bulk_create": 300,
+    },
+    # per endpoint overrides, eg. {"employees list": 40}
+    "ENDPOINT_QUERY_BUDGETS": {},
+    # endpoints not benchmarked, eg. ["designations create"]
+    "SKIP": [],
+    # fail when p50 grows by more than this fraction of the baseline
+    # (p95 is recorded too, but too noisy to gate on)
+    "LATENCY_REGRESSION": 0.25,
+    # ... and by more than this many ms, so fast endpoints don't flap
+    "LATENCY_NOISE_MS": 5.0,
+}
+
+URLCONFS = ("customer.urls", "supplier.urls", "company.urls", "user.urls")
+BULK_SIZE = 10
+BENCHMARK_PASSWORD = "benchmark-password-123"
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ENDPOINT_BENCHMARK", {})}
+
+
+def percentile(timings, fraction):
+    """Nearest rank percentile of a list of timings"""
+    timings = sorted(timings)
+    return timings[max(math.ceil(fraction * len(timings)) - 1, 0)]
+
+
+@contextmanager
+def capture_queries():
+    """
+    Capture the queries of every database, so that the reads routed to
+    the replicas count in the budgets
+    """
+    with ExitStack() as stack:
+        yield [
+            stack.enter_context(CaptureQueriesContext(db))
+            for db in connections.all()
+        ]
+
+
+def get_write_data(serializer, data, suffix):
+    """
+    Turn the representation of an object into a payload accepted
+    by its serializer, keeping unique values unique with suffix
+    """
+    payload = {}
+    for name, field in serializer.fields.items():
+        if field.read_only or name not in data:
+            continue
+        if isinstance(field, serializers.FileField):
+            continue
+        value = data[name]
+        if isinstance(field, serializers.ListSerializer):
+            value = [
+                get_write_data(field.child, item, suffix) for item in value
+            ]
+        elif name in ("reference", "name") and value:
+            value = f"{value}-{suffix}"
+        elif name == "email" and value:
+            value = f"{suffix.lower()}.{value}"
+        payload[name] = value
+
+    # write only fields can't be taken from the representation
+    for name, field in serializer.fields.items():
+        if not field.write_only or name in payload:
+            continue
+        if "password" in name:
+            payload[name] = BENCHMARK_PASSWORD
+        elif name.startswith("confirm_") and name[8:] in payload:
+            payload[name] = payload[name[8:]]
+    return payload
+
+
+class Endpoint:
+    """An action of a view benchmarked with a prepared request"""
+
+    def __init__(self, name, action, method, url, data=None):
+        self.name = f"{name} {action}"
+        self.action = action
+        self.method = method
+        self.url = url
+        self.data = data
+
+    def request(self, client):
+        return getattr(client, self.method)(self.url, self.data, format="json")
+
+
+class Command(BaseCommand):
+    """
+    Django command to benchmark the api endpoints.
+
+    Every router registered viewset (and the plain views of user.urls)
+    is exercised with list, retrieve, create, update and bulk create
+    requests as the owner of a tenant made by generate_tenant_data.
+    Writes are rolled back so the dataset is left untouched.
+    """
+
+    help = "Benchmark the api endpoints against a generated tenant"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            default="0",
+            help="Seed the tenant was generated with (default 0)",
+        )
+        parser.add_argument(
+            "--owner",
+            help="Email of the company owner to benchmark as, "
+            "instead of the generated tenant's owner",
+        )
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            help="Only benchmark endpoints starting with this name, "
+            "eg. --endpoint invoices (can be repeated)",
+        )
+        parser.add_argument(
+            "--output", help="Write the results as json to this file"
+        )
+        parser.add_argument(
+            "--baseline",
+            help="Compare the results to the json results in this file",
+        )
+
+    def handle(self, *args, **options):
+        email = (
+            options["owner"]
+            or f"owner@seed{options['seed']}-tenant0.example.com"
+        )
+        try:
+            self.owner = get_user_model().objects.get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(
+                f"{email} does not exist, run generate_tenant_data first"
+            )
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be positive")
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)["endpoints"]
+
+        self.client = APIClient(raise_request_exception=False)
+        self.client.force_authenticate(self.owner)
+        # the test client's host has to pass the host validation
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            results = {}
+            for endpoint in self.get_endpoints():
+                if endpoint.name in get_config()["SKIP"]:
+                    continue
+                if options["endpoints"] and not any(
+                    endpoint.name.startswith(prefix)
+                    for prefix in options["endpoints"]
+                ):
+                    continue
+                results[endpoint.name] = self.run(endpoint, options)
+                self.report(endpoint.name, results[endpoint.name])
+
+        output = {
+            "meta": {
+                "date": timezone.now().isoformat(),
+                "owner": self.owner.email,
+                "iterations": options["iterations"],
+                "vendor": connection.vendor,
+                "python": platform.python_version(),
+            },
+            "endpoints": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(output, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+        failures = self.check_results(results, baseline)
+        if failures:
+            for failure in failures:
+                self.stderr.write(failure)
+            raise CommandError(f"{len(failures)} benchmark check(s) failed")
+        self.stdout.write(self.style.SUCCESS("All endpoints within budget"))
+
+    def get_endpoints(self):
+        for urlconf in URLCONFS:
+            module = import_module(urlconf)
+            for router in vars(module).values():
+                if isinstance(router, SimpleRouter):
+                    yield from self.get_viewset_endpoints(module, router)
+            yield from self.get_view_endpoints(module)
+
+    def get_viewset_endpoints(self, module, router):
+        # the list route of viewsets sharing a basename can't be
+        # reversed, so the urls are built from the app's api root
+        root = reverse(f"{module.app_name}:api-root")
+        for prefix, viewset, basename in router.registry:
+            list_url = f"{root}{prefix}/"
+            yield Endpoint(prefix, "list", "get", list_url)
+
+            res = self.client.get(list_url, {"page_size": 1})
+            results = res.data.get("results", res.data)
+            if not results:
+                self.stderr.write(f"Skipping {prefix}, no objects to use")
+                continue
+            data = results[0]
+            detail_url = f"{list_url}{data['id']}/"
+            if hasattr(viewset, "retrieve"):
+                yield Endpoint(prefix, "retrieve", "get", detail_url)
+
+            serializer = self.get_serializer(viewset, "post", action="create")
+            if hasattr(viewset, "create"):
+                yield Endpoint(
+                    prefix,
+                    "create",
+                    "post",
+                    list_url,
+                    get_write_data(serializer, data, "BENCH"),
+                )
+            if issubclass(viewset, BulkCreateModelMixin):
+                yield Endpoint(
+                    prefix,
+                    "bulk_create",
+                    "post",
+                    list_url,
+                    [
+                        get_write_data(serializer, data, f"BENCH{i}")
+                        for i in range(BULK_SIZE)
+                    ],
+                )
+            if hasattr(viewset, "update"):
+                yield Endpoint(
+                    prefix,
+                    "update",
+                    "put",
+                    detail_url,
+                    get_write_data(
+                        self.get_serializer(viewset, "put", action="update"),
+                        data,
+                        "BENCH",
+                    ),
+                )
+
+    def get_view_endpoints(self, module):
+        """Endpoints of the retrieve/update views outside of routers"""
+        for pattern in module.urlpatterns:
+            view_class = getattr(pattern.callback, "view_class", None)
+            if view_class is None or issubclass(view_class, ViewSetMixin):
+                continue
+            if not hasattr(view_class, "retrieve"):
+                continue
+            url = reverse(f"{module.app_name}:{pattern.name}")
+            yield Endpoint(pattern.name, "retrieve", "get", url)
+            if hasattr(view_class, "partial_update"):
+                data = self.client.get(url).data
+                serializer = self.get_serializer(view_class, "patch")
+                yield Endpoint(
+                    pattern.name,
+                    "update",
+                    "patch",
+                    url,
+                    get_write_data(serializer, data, "BENCH"),
+                )
+
+    def get_serializer(self, view_class, method, **initkwargs):
+        """Get the serializer a view validates writes with"""
+        request = Request(getattr(APIRequestFactory(), method)("/"))
+        request.user = self.owner
+        view = view_class(
+            request=request, format_kwarg=None, kwargs={}, **initkwargs
+        )
+        return view.get_serializer()
+
+    def run(self, endpoint, options):
+        timings = []
+        queries = []
+        for i in range(options["warmup"] + options["iterations"]):
+            with transaction.atomic():
+                with capture_queries() as contexts:
+                    start = time.perf_counter()
+                    res = endpoint.request(self.client)
+                    elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+            if res.status_code >= 400:
+                return {
+                    "status": res.status_code,
+                    "error": res.content.decode()[:500],
+                }
+            if i >= options["warmup"]:
+                timings.append(elapsed * 1000)
+                queries.append(
+                    sum(len(ctx.captured_queries) for ctx in contexts)
+                )
+
+        # traced separately since tracemalloc slows everything down
+        with transaction.atomic():
+            tracemalloc.start()
+            try:
+                endpoint.request(self.client)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            transaction.set_rollback(True)
+
+        return {
+            "status": res.status_code,
+            "p50_ms": round(percentile(timings, 0.5), 3),
+            "p95_ms": round(percentile(timings, 0.95), 3),
+            "queries": max(queries),
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
+
+    def report(self, name, result):
+        if "error" in result:
+            self.stdout.write(
+                self.style.ERROR(f"{name:<36} {result['status']}")
+            )
+            return
+        self.stdout.write(
+            f"{name:<36} p50 {result['p50_ms']:>9.2f} ms  "
+            f"p95 {result['p95_ms']:>9.2f} ms  "
+            f"{result['queries']:>4} queries  "
+            f"{result['peak_memory_kb']:>9.1f} KiB"
+        )
+
+    def check_results(self, results, baseline):
+        config = get_config()
+        failures = []
+        for name, result in results.items():
+            if "error" in result:
+                failures.append(f"{name}: status {result['status']}")
+                continue
+
+            action = name.rsplit(" ", 1)[1]
+            budget = config["ENDPOINT_QUERY_BUDGETS"].get(
+                name, config["QUERY_BUDGETS"].get(action)
+            )
+            if budget is not None and result["queries"] > budget:
+                failures.append(
+                    f"{name}: {result['queries']} queries, "
+                    f"budget is {budget}"
+                )
+
+            previous = (baseline or {}).get(name)
+            if not previous or "error" in previous:
+                continue
+            if result["queries"] > previous["queries"]:
+                failures.append(
+                    f"{name}: {result['queries']} queries, "
+                    f"baseline is {previous['queries']}"
+                )
+            limit = max(
+                previous["p50_ms"] * (1 + config["LATENCY_REGRESSION"]),
+                previous["p50_ms"] + config["LATENCY_NOISE_MS"],
+            )
+            if result["p50_ms"] > limit:
+                failures.append(
+                    f"{name}: p50 {result['p50_ms']:.2f} ms, "
+                    f"baseline is {previous['p50_ms']:.2f} ms"
+                )
+        return failures
@@ -0,0 +1,113 @@
+from io import BytesIO
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+# pages benchmarked, by name
+PAGES = {
+    "invoices": "customer:invoice-list",
+    "products": "company:product-list",
+}
+
+
+class Command(BaseCommand):
+    """
+    Django command to benchmark FastJSONRenderer and FastJSONParser
+    against DRF's JSONRenderer and JSONParser on large pages of a tenant
+    made by generate_tenant_data, checking that they give the same bytes
+    and data.
+    """
+
+    help = "Benchmark the JSON renderer and parser on large pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            default="0",
+            help="Seed the tenant was generated with (default 0)",
+        )
+        parser.add_argument(
+            "--owner",
+            help="Email of the company owner to benchmark as, "
+            "instead of the generated tenant's owner",
+        )
+        parser.add_argument("--page-size", type=int, default=1000)
+        parser.add_argument("--iterations", type=int, default=20)
+
+    def handle(self, *args, **options):
+        email = (
+            options["owner"]
+            or f"owner@seed{options['seed']}-tenant0.example.com"
+        )
+        try:
+            owner = get_user_model().objects.get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(
+                f"{email} does not exist, run generate_tenant_data first"
+            )
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be positive")
+
+        client = APIClient()
+        client.force_authenticate(owner)
+        # the test client's host has to pass the host validation
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            for name, url_name in PAGES.items():
+                res = client.get(
+                    reverse(url_name), {"page_size": options["page_size"]}
+                )
+                if res.status_code != 200:
+                    raise CommandError(f"{name}: {res.status_code}")
+                self.benchmark(name, res.data, options["iterations"])
+
+    def benchmark(self, name, data, iterations):
+        body = JSONRenderer().render(data)
+        if FastJSONRenderer().render(data) != body:
+            raise CommandError(f"{name}: the rendered bytes differ")
+        if FastJSONParser().parse(BytesIO(body)) != JSONParser().parse(
+            BytesIO(body)
+        ):
+            raise CommandError(f"{name}: the parsed data differ")
+
+        results = len(data.get("results", data))
+        self.stdout.write(f"{name} ({results} objects, {len(body)} bytes)")
+        timings = {
+            "render": (
+                lambda: JSONRenderer().render(data),
+                lambda: FastJSONRenderer().render(data),
+            ),
+            "parse": (
+                lambda: JSONParser().parse(BytesIO(body)),
+                lambda: FastJSONParser().parse(BytesIO(body)),
+            ),
+        }
+        for step, (drf, fast) in timings.items():
+            drf_ms = self.time(drf, iterations)
+            fast_ms = self.time(fast, iterations)
+            self.stdout.write(
+                f"  {step:<7} json {drf_ms:8.2f} ms"
+                f"  fast {fast_ms:8.2f} ms  x{drf_ms / fast_ms:.1f}"
+            )
+
+    def time(self, function, iterations):
+        """Median of the timings of function, in ms"""
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core import idempotency
+
+
+class Command(BaseCommand):
+    """
+    Django command to delete the expired idempotency keys, see
+    core.idempotency. Meant to run regularly, eg. daily from cron.
+    """
+
+    help = "Delete the expired idempotency keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Keys deleted per query (default 1000)",
+        )
+
+    def handle(self, *args, **options):
+        deleted = idempotency.clear_expired(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"{deleted} idempotency key(s) deleted")
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from core.storage import dedup
+
+
+class Command(BaseCommand):
+    """
+    Django command to delete the blobs of the uploaded files no field
+    references anymore, see core.storage.dedup. Meant to run regularly,
+    eg. daily from cron.
+    """
+
+    help = "Recount the references to the blobs and delete the unreferenced"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Blobs deleted per transaction (default 1000)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the blobs that would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        result = dedup.collect(
+            batch_size=options["batch_size"], dry_run=options["dry_run"]
+        )
+        action = "would be deleted" if options["dry_run"] else "deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{result['recounted']} blob(s) recounted, "
+                f"{result['deleted']} blob(s) {action} "
+                f"({result['size']} bytes)"
+            )
+        )
@@ -0,0 +1,992 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+import io
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from core import conversion
+from core.models import (
+    Company,
+    CreditNote,
+    CreditNoteItem,
+    CreditsApplication,
+    Customer,
+    Department,
+    Designation,
+    Invoice,
+    InvoiceItem,
+    PaymentMethod,
+    Payslip,
+    Product,
+    ProductCategory,
+    PurchaseOrder,
+    PurchaseOrderItem,
+    Receive,
+    ReceiveItem,
+    Role,
+    SalesOrder,
+    SalesOrderItem,
+    Supplier,
+    User,
+    UserConfig,
+)
+from core.models.transaction import LineItem
+
+FIRST_NAMES = (
+    "Aaron Alice Amir Beatrice Chen Daniel Devi Elena Farid Grace Hana "
+    "Ivan Jia Kumar Lina Marcus Mei Nadia Omar Priya Rui Sara Tan Wei"
+).split()
+LAST_NAMES = (
+    "Abdullah Chua Fernandez Goh Kaur Lee Lim Mohamed Ng Ong Pillai "
+    "Rahman Santos Tan Teo Wong Yeo"
+).split()
+BUSINESS_WORDS = (
+    "Apex Blue Bright Crest Delta Eastern Golden Harbour Lion Metro "
+    "Nova Orchid Pacific Prime Summit Unity Vertex"
+).split()
+BUSINESS_SUFFIXES = (
+    "Trading",
+    "Enterprise",
+    "Holdings",
+    "Supplies",
+    "Pte Ltd",
+)
+CITIES = ("Singapore", "Johor Bahru", "Kuala Lumpur", "Penang", "Jakarta")
+CATEGORY_NAMES = (
+    "Beverages Bakery Cleaning Dairy Electrical Frozen Hardware Household "
+    "Office Packaging Personal-care Snacks Stationery Tools"
+).split()
+PRODUCT_ADJECTIVES = (
+    "Classic Compact Deluxe Eco Heavy-duty Mini Premium Standard Ultra"
+).split()
+UNITS = ("pc", "box", "carton", "kg", "pack", "set")
+DEPARTMENT_NAMES = ("Sales", "Operations", "Finance", "Warehouse", "Admin")
+DESIGNATION_NAMES = ("Executive", "Senior Executive", "Manager")
+ROLE_NAMES = (
+    "Viewer Clerk Sales Purchasing Accounts Warehouse Supervisor Admin"
+).split()
+PAYMENT_METHODS = ("Cash", "Cheque", "Bank Transfer", "Credit Card")
+GST_RATES = (Decimal("0.00"), Decimal("7.00"))
+DISCOUNT_RATES = (
+    Decimal("0.00"),
+    Decimal("0.00"),
+    Decimal("0.00"),
+    Decimal("2.50"),
+    Decimal("5.00"),
+    Decimal("10.00"),
+)
+CENT = Decimal("0.01")
+
+
+def evenly_spread(index, count, total):
+    """Whether the index is one of count indexes spread over total"""
+    return (index + 1) * count // total > index * count // total
+
+
+def calculate_totals(amounts, discount_rate, gst_rate):
+    """Calculate the totals of a document the way its serializer does"""
+    return {
+        **conversion.calculate_totals(
+            sum(amounts, Decimal("0.00")), discount_rate, gst_rate
+        ),
+        "discount_rate": discount_rate,
+        "gst_rate": gst_rate,
+    }
+
+
+class BulkWriter:
+    """
+    Write model instances in batches.
+
+    Primary keys are reserved up front so that children can
+    reference their parents without reading the rows back.
+    On PostgreSQL the rows are streamed with COPY FROM STDIN,
+    elsewhere they are written with a plain executemany().
+    """
+
+    def __init__(self, using, batch_size, use_copy=True):
+        self.connection = connections[using]
+        self.using = using
+        self.batch_size = batch_size
+        self.use_copy = use_copy and self.connection.vendor == "postgresql"
+        self._next_ids = {}
+        self._sequences = {}
+
+    def reserve_ids(self, model, objs):
+        """Assign the next primary keys of the model's table to objs"""
+        if not objs:
+            return
+        if self.connection.vendor == "postgresql":
+            ids = self._nextvals(model, len(objs))
+        else:
+            # not safe against concurrent writers, which is fine
+            # for a dataset generator running on its own
+            ids = range(self._next_id(model, len(objs)), 2**63)
+        for obj, pk in zip(objs, ids):
+            obj.pk = pk
+
+    def _nextvals(self, model, count):
+        opts = model._meta
+        with self.connection.cursor() as cursor:
+            if model not in self._sequences:
+                cursor.execute(
+                    "SELECT pg_get_serial_sequence(%s, %s)",
+                    [opts.db_table, opts.pk.column],
+                )
+                self._sequences[model] = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [self._sequences[model], count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _next_id(self, model, count):
+        if model not in self._next_ids:
+            opts = model._meta
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT MAX(%s) FROM %s"
+                    % (
+                        self.connection.ops.quote_name(opts.pk.column),
+                        self.connection.ops.quote_name(opts.db_table),
+                    )
+                )
+                self._next_ids[model] = (cursor.fetchone()[0] or 0) + 1
+        next_id = self._next_ids[model]
+        self._next_ids[model] += count
+        return next_id
+
+    def write(self, model, objs):
+        if not objs:
+            return
+        self._resolve_foreign_keys(model, objs)
+        if issubclass(model, LineItem):
+            # as LineItem.objects.bulk_create() does
+            for obj in objs:
+                obj.set_document_date()
+        if self.use_copy:
+            self._copy(model, objs)
+        elif self.connection.vendor == "postgresql":
+            model._default_manager.db_manager(self.using).bulk_create(
+                objs, batch_size=self.batch_size
+            )
+        else:
+            # skips the insert compiler, which costs more than the
+            # insert itself on a local database
+            self._executemany(model, objs)
+
+    @staticmethod
+    def _resolve_foreign_keys(model, objs):
+        # relations were assigned before their targets had a pk
+        fields = [
+            field for field in model._meta.concrete_fields if field.is_relation
+        ]
+        for obj in objs:
+            for field in fields:
+                if getattr(obj, field.attname) is None:
+                    related = field.get_cached_value(obj, default=None)
+                    if related is not None:
+                        setattr(obj, field.attname, related.pk)
+
+    def _rows(self, model, objs):
+        """Get the columns and the db values of objs"""
+        fields = [
+            field
+            for field in model._meta.concrete_fields
+            if not (field.primary_key and objs[0].pk is None)
+        ]
+        columns = ", ".join(
+            self.connection.ops.quote_name(field.column) for field in fields
+        )
+        rows = (
+            [
+                field.get_db_prep_save(
+                    getattr(obj, field.attname), self.connection
+                )
+                for field in fields
+            ]
+            for obj in objs
+        )
+        return fields, columns, rows
+
+    def _executemany(self, model, objs):
+        fields, columns, rows = self._rows(model, objs)
+        sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+            self.connection.ops.quote_name(model._meta.db_table),
+            columns,
+            ", ".join(["%s"] * len(fields)),
+        )
+        with self.connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def _copy(self, model, objs):
+        fields, columns, rows = self._rows(model, objs)
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(self._copy_value(value) for value in row))
+            buffer.write("\n")
+        buffer.seek(0)
+
+        sql = "COPY %s (%s) FROM STDIN" % (
+            self.connection.ops.quote_name(model._meta.db_table),
+            columns,
+        )
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+    @staticmethod
+    def _copy_value(value):
+        """Format a value for the text format of COPY"""
+        if value is None:
+            return "\\N"
+        if isinstance(value, bool):
+            return "t" if value else "f"
+        return (
+            str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+
+
+class TenantGenerator:
+    """Generate the data of one company from its own random stream"""
+
+    def __init__(self, command, writer, options, index):
+        self.command = command
+        self.writer = writer
+        self.options = options
+        self.rng = random.Random(f"{options['seed']}:{index}")
+        self.start_date = options["start_date"]
+        self.days = options["days"]
+        self.password = options["password_hash"]
+        self.domain = f"seed{options['seed']}-tenant{index}.example.com"
+
+    def generate(self):
+        with transaction.atomic(using=self.writer.using):
+            self.company = Company(
+                name=self._business_name(),
+                email=f"admin@{self.domain}",
+                city=self.rng.choice(CITIES),
+                country="Singapore",
+            )
+            self.writer.reserve_ids(Company, [self.company])
+            self.writer.write(Company, [self.company])
+            self._generate_employees()
+            self._generate_parties()
+            self._generate_products()
+            self._generate_payment_methods()
+
+        self._generate_sales()
+        self._generate_purchases()
+        self._generate_payslips()
+        self._update_unused_credits()
+        return self.company
+
+    def _write_all(self, *model_objs):
+        with transaction.atomic(using=self.writer.using):
+            for model, objs in model_objs:
+                self.writer.write(model, objs)
+
+    def _person_name(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def _business_name(self):
+        return "%s %s %s" % (
+            self.rng.choice(BUSINESS_WORDS),
+            self.rng.choice(BUSINESS_WORDS),
+            self.rng.choice(BUSINESS_SUFFIXES),
+        )
+
+    def _date(self, index, count):
+        """Spread count documents chronologically over the period"""
+        offset = index * self.days // max(count, 1)
+        offset += self.rng.randrange(max(self.days // max(count, 1), 1))
+        return self.start_date + timedelta(days=min(offset, self.days - 1))
+
+    def _user(self, email, **kwargs):
+        return User(
+            company=self.company,
+            email=email,
+            password=self.password,
+            name=self._person_name(),
+            **kwargs,
+        )
+
+    def _generate_employees(self):
+        options = self.options
+        departments = [
+            Department(company=self.company, name=name)
+            for name in DEPARTMENT_NAMES
+        ]
+        self.writer.reserve_ids(Department, departments)
+        designations = [
+            Designation(department=department, name=name)
+            for department in departments
+            for name in DESIGNATION_NAMES
+        ]
+        self.writer.reserve_ids(Designation, designations)
+        roles = [
+            Role(
+                company=self.company,
+                name=ROLE_NAMES[i % len(ROLE_NAMES)]
+                + ("" if i < len(ROLE_NAMES) else f" {i}"),
+            )
+            for i in range(options["roles"])
+        ]
+        self.writer.reserve_ids(Role, roles)
+        permissions = self.command.permission_ids
+        role_permissions = [
+            Role.permissions.through(role_id=role.pk, permission_id=pk)
+            for role in roles
+            for pk in sorted(
+                self.rng.sample(
+                    permissions, min(len(permissions), self.rng.randint(5, 40))
+                )
+            )
+        ]
+
+        owner = self._user(f"owner@{self.domain}", is_staff=True)
+        employees = [
+            self._user(
+                f"employee{i}@{self.domain}",
+                designation=self.rng.choice(designations),
+                gender=self.rng.choice(User.Gender.values),
+                date_of_commencement=self._date(i, options["employees"]),
+            )
+            for i in range(options["employees"])
+        ]
+        users = [owner] + employees
+        self.writer.reserve_ids(User, users)
+        user_roles = [
+            User.roles.through(user_id=employee.pk, role_id=role.pk)
+            for employee in employees
+            for role in self.rng.sample(
+                roles, min(len(roles), self.rng.randint(1, 2))
+            )
+        ]
+
+        self._write_all(
+            (Department, departments),
+            (Designation, designations),
+            (Role, roles),
+            (Role.permissions.through, role_permissions),
+            (User, users),
+            (UserConfig, [UserConfig(user=user) for user in users]),
+            (User.roles.through, user_roles),
+        )
+        # sales are made by employees, or by the owner in a one man show
+        self.salespeople = [user.pk for user in employees] or [owner.pk]
+        self.employees = employees
+        self.sales_by_month = defaultdict(Decimal)
+
+    def _generate_parties(self):
+        options = self.options
+        self.customers = [
+            self._party(Customer, "C", i, options["customers"])
+            for i in range(options["customers"])
+        ]
+        self.writer.reserve_ids(Customer, self.customers)
+        self.suppliers = [
+            self._party(Supplier, "S", i, options["suppliers"])
+            for i in range(options["suppliers"])
+        ]
+        self.writer.reserve_ids(Supplier, self.suppliers)
+
+        customer_agents = [
+            Customer.agents.through(
+                customer_id=customer.pk,
+                user_id=self.rng.choice(self.salespeople),
+            )
+            for customer in self.customers
+        ]
+        self._write_all(
+            (Customer, self.customers),
+            (Supplier, self.suppliers),
+            (Customer.agents.through, customer_agents),
+        )
+
+    def _party(self, model, prefix, index, count):
+        name = self._business_name()
+        first_seen = self._date(index, count)
+        return model(
+            company=self.company,
+            reference=f"{prefix}-{index + 1:06d}",
+            name=name,
+            attention=self._person_name(),
+            address=f"{self.rng.randint(1, 999)} {name.split()[0]} Road",
+            city=self.rng.choice(CITIES),
+            zipcode=f"{self.rng.randint(10000, 829999):06d}",
+            term=self.rng.choice(("COD", "30 days", "60 days")),
+            phone_no=f"+65 {self.rng.randint(60000000, 99999999)}",
+            email=f"{prefix.lower()}{index + 1}@{self.domain}",
+            first_seen=first_seen,
+            last_seen=first_seen,
+        )
+
+    def _generate_products(self):
+        options = self.options
+        categories = [
+            ProductCategory(
+                company=self.company,
+                name=CATEGORY_NAMES[i % len(CATEGORY_NAMES)]
+                + ("" if i < len(CATEGORY_NAMES) else f" {i}"),
+            )
+            for i in range(options["categories"])
+        ]
+        self.writer.reserve_ids(ProductCategory, categories)
+
+        products = []
+        for i in range(options["products"]):
+            category = self.rng.choice(categories)
+            cost = Decimal(self.rng.randint(50, 50000)) / 100
+            products.append(
+                Product(
+                    reference=f"P-{i + 1:06d}",
+                    category=category,
+                    supplier=self.rng.choice(self.suppliers),
+                    name="%s %s %d"
+                    % (self.rng.choice(PRODUCT_ADJECTIVES), category.name, i),
+                    unit=self.rng.choice(UNITS),
+                    cost=cost,
+                    unit_price=(
+                        cost * Decimal(self.rng.randint(110, 180)) / 100
+                    ).quantize(CENT),
+                )
+            )
+        self.writer.reserve_ids(Product, products)
+        self._write_all((ProductCategory, categories), (Product, products))
+
+        self.products = [
+            (product.pk, product.unit, product.unit_price)
+            for product in products
+        ]
+        self.products_by_supplier = {}
+        for product in products:
+            self.products_by_supplier.setdefault(
+                product.supplier.pk, []
+            ).append((product.pk, product.unit, product.cost))
+        self.suppliers_with_products = [
+            supplier
+            for supplier in self.suppliers
+            if supplier.pk in self.products_by_supplier
+        ]
+
+    def _generate_payment_methods(self):
+        self.payment_methods = [
+            PaymentMethod(company=self.company, name=name)
+            for name in PAYMENT_METHODS
+        ]
+        self.writer.reserve_ids(PaymentMethod, self.payment_methods)
+        self._write_all((PaymentMethod, self.payment_methods))
+
+    def _line_items(self, item_model, products):
+        return [
+            item_model(
+                product_id=product_id,
+                unit=unit,
+                unit_price=unit_price,
+                quantity=quantity,
+                amount=unit_price * quantity,
+            )
+            for product_id, unit, unit_price in self.rng.sample(
+                products,
+                min(
+                    len(products),
+                    self.rng.randint(1, self.options["max_line_items"]),
+                ),
+            )
+            for quantity in [self.rng.randint(1, 20)]
+        ]
+
+    def _copy_items(self, item_model, items):
+        return [
+            item_model(
+                product_id=item.product_id,
+                unit=item.unit,
+                unit_price=item.unit_price,
+                quantity=item.quantity,
+                amount=item.amount,
+            )
+            for item in items
+        ]
+
+    def _generate_sales(self):
+        """
+        Generate sales orders and invoices, where the invoice at the
+        same position as a completed sales order is converted from it,
+        and credit notes issued against earlier invoices of the customer
+        that are applied to the next invoice
+        """
+        options = self.options
+        num_orders = options["sales_orders"]
+        num_invoices = options["invoices"]
+        num_credit_notes = options["credit_notes"]
+        if not self.customers or not self.products:
+            return
+        total = max(num_orders, num_invoices)
+        last_invoices = {}
+
+        for start in range(0, total, options["batch_size"]):
+            batch = {
+                model: []
+                for model in (
+                    SalesOrder,
+                    SalesOrderItem,
+                    Invoice,
+                    InvoiceItem,
+                    CreditNote,
+                    CreditNoteItem,
+                    CreditsApplication,
+                )
+            }
+            parents = []
+            for i in range(start, min(start + options["batch_size"], total)):
+                customer = self.rng.choice(self.customers)
+                salesperson_id = self.rng.choice(self.salespeople)
+                doc_date = self._date(i, total)
+                order = order_items = None
+
+                if i < num_orders:
+                    order_items = self._line_items(
+                        SalesOrderItem, self.products
+                    )
+                    order = SalesOrder(
+                        company=self.company,
+                        reference=f"SO-{i + 1:07d}",
+                        date=doc_date,
+                        customer=customer,
+                        salesperson_id=salesperson_id,
+                        status=self.rng.choices(
+                            SalesOrder.Status.values, (1, 6, 2, 1)
+                        )[0],
+                        **calculate_totals(
+                            [item.amount for item in order_items],
+                            self.rng.choice(DISCOUNT_RATES),
+                            self.rng.choice(GST_RATES),
+                        ),
+                    )
+                    parents.append(order)
+                    batch[SalesOrder].append(order)
+                    for item in order_items:
+                        item.sales_order = order
+                    batch[SalesOrderItem].extend(order_items)
+
+                if i >= num_invoices:
+                    continue
+                if order and order.status == SalesOrder.Status.COMPLETED:
+                    # converted from the sales order
+                    customer = order.customer
+                    invoice_items = self._copy_items(InvoiceItem, order_items)
+                    rates = (order.discount_rate, order.gst_rate)
+                else:
+                    order = None
+                    invoice_items = self._line_items(
+                        InvoiceItem, self.products
+                    )
+                    rates = (
+                        self.rng.choice(DISCOUNT_RATES),
+                        self.rng.choice(GST_RATES),
+                    )
+                totals = calculate_totals(
+                    [item.amount for item in invoice_items], *rates
+                )
+                invoice = Invoice(
+                    company=self.company,
+                    reference=f"INV-{i + 1:07d}",
+                    date=doc_date,
+                    customer=customer,
+                    salesperson_id=salesperson_id,
+                    sales_order=order,
+                    status=self.rng.choices(Invoice.Status.values, (1, 6, 3))[
+                        0
+                    ],
+                    credits_applied=Decimal("0.00"),
+                    balance_due=totals["grand_total"],
+                    **totals,
+                )
+                if invoice.status == Invoice.Status.PAID:
+                    invoice.payment_date = doc_date + timedelta(
+                        days=self.rng.randint(0, 60)
+                    )
+                    invoice.payment_method = self.rng.choice(
+                        self.payment_methods
+                    )
+                parents.append(invoice)
+                self.sales_by_month[
+                    (salesperson_id, doc_date.year, doc_date.month)
+                ] += invoice.net
+                batch[Invoice].append(invoice)
+                for item in invoice_items:
+                    item.invoice = invoice
+                batch[InvoiceItem].extend(invoice_items)
+
+                if num_invoices and evenly_spread(
+                    i, num_credit_notes, num_invoices
+                ):
+                    self._credit_note(
+                        batch, parents, invoice, last_invoices.get(customer.pk)
+                    )
+                last_invoices[customer.pk] = (invoice, invoice_items)
+
+            self._reserve_parents(parents)
+            self._write_all(*batch.items())
+            self.command.progress(
+                self.company, "sales documents", i + 1, total
+            )
+
+    def _reserve_parents(self, parents):
+        by_model = {}
+        for parent in parents:
+            by_model.setdefault(type(parent), []).append(parent)
+        for model, objs in by_model.items():
+            self.writer.reserve_ids(model, objs)
+
+    def _credit_note(self, batch, parents, invoice, last_invoice):
+        """Credit part of an earlier invoice and apply it to this one"""
+        created_from, returned_items = last_invoice or (None, None)
+        if returned_items is None:
+            returned_items = self._line_items(CreditNoteItem, self.products)
+        credit_note_items = self._copy_items(
+            CreditNoteItem, returned_items[: self.rng.randint(1, 2)]
+        )
+        for item in credit_note_items:
+            item.quantity = self.rng.randint(1, item.quantity)
+            item.amount = item.unit_price * item.quantity
+
+        totals = calculate_totals(
+            [item.amount for item in credit_note_items],
+            invoice.discount_rate,
+            invoice.gst_rate,
+        )
+        # a paid invoice was settled before the credits were issued
+        credits_used = (
+            Decimal("0.00")
+            if invoice.status == Invoice.Status.PAID
+            else min(totals["grand_total"], invoice.grand_total)
+        )
+        credit_note = CreditNote(
+            company=self.company,
+            reference=invoice.reference.replace("INV", "CN", 1),
+            date=invoice.date,
+            customer=invoice.customer,
+            salesperson_id=invoice.salesperson_id,
+            created_from=created_from,
+            status=(
+                CreditNote.Status.OPEN
+                if credits_used < totals["grand_total"]
+                else CreditNote.Status.CLOSED
+            ),
+            credits_used=credits_used,
+            refund=Decimal("0.00"),
+            credits_remaining=totals["grand_total"] - credits_used,
+            **totals,
+        )
+        parents.append(credit_note)
+        batch[CreditNote].append(credit_note)
+        for item in credit_note_items:
+            item.credit_note = credit_note
+        batch[CreditNoteItem].extend(credit_note_items)
+
+        if credits_used:
+            invoice.credits_applied = credits_used
+            invoice.balance_due = invoice.grand_total - credits_used
+            batch[CreditsApplication].append(
+                CreditsApplication(
+                    invoice=invoice,
+                    credit_note=credit_note,
+                    amount_to_credit=credits_used,
+                    date=invoice.date,
+                )
+            )
+
+    def _generate_purchases(self):
+        """
+        Generate purchase orders and receives, where the receive at the
+        same position as a completed purchase order is converted from it
+        """
+        options = self.options
+        num_orders = options["purchase_orders"]
+        num_receives = options["receives"]
+        if not self.suppliers_with_products:
+            return
+        total = max(num_orders, num_receives)
+
+        for start in range(0, total, options["batch_size"]):
+            batch = {
+                model: []
+                for model in (
+                    PurchaseOrder,
+                    PurchaseOrderItem,
+                    Receive,
+                    ReceiveItem,
+                )
+            }
+            parents = []
+            for i in range(start, min(start + options["batch_size"], total)):
+                supplier = self.rng.choice(self.suppliers_with_products)
+                products = self.products_by_supplier[supplier.pk]
+                doc_date = self._date(i, total)
+                order = order_items = None
+
+                if i < num_orders:
+                    order_items = self._line_items(PurchaseOrderItem, products)
+                    order = PurchaseOrder(
+                        company=self.company,
+                        reference=f"PO-{i + 1:07d}",
+                        date=doc_date,
+                        supplier=supplier,
+                        status=self.rng.choices(
+                            PurchaseOrder.Status.values, (1, 6, 2, 1)
+                        )[0],
+                        **calculate_totals(
+                            [item.amount for item in order_items],
+                            self.rng.choice(DISCOUNT_RATES),
+                            self.rng.choice(GST_RATES),
+                        ),
+                    )
+                    parents.append(order)
+                    batch[PurchaseOrder].append(order)
+                    for item in order_items:
+                        item.purchase_order = order
+                    batch[PurchaseOrderItem].extend(order_items)
+
+                if i >= num_receives:
+                    continue
+                if order and order.status == PurchaseOrder.Status.COMPLETED:
+                    receive_items = self._copy_items(ReceiveItem, order_items)
+                    rates = (order.discount_rate, order.gst_rate)
+                else:
+                    order = None
+                    receive_items = self._line_items(ReceiveItem, products)
+                    rates = (
+                        self.rng.choice(DISCOUNT_RATES),
+                        self.rng.choice(GST_RATES),
+                    )
+                receive = Receive(
+                    company=self.company,
+                    reference=f"R-{i + 1:07d}",
+                    date=doc_date,
+                    supplier=supplier,
+                    purchase_order=order,
+                    status=self.rng.choices(Receive.Status.values, (1, 6, 3))[
+                        0
+                    ],
+                    **calculate_totals(
+                        [item.amount for item in receive_items], *rates
+                    ),
+                )
+                if receive.status == Receive.Status.PAID:
+                    receive.payment_date = doc_date + timedelta(
+                        days=self.rng.randint(0, 60)
+                    )
+                    receive.payment_method = self.rng.choice(
+                        self.payment_methods
+                    )
+                parents.append(receive)
+                batch[Receive].append(receive)
+                for item in receive_items:
+                    item.receive = receive
+                batch[ReceiveItem].extend(receive_items)
+
+            self._reserve_parents(parents)
+            self._write_all(*batch.items())
+            self.command.progress(
+                self.company, "purchase documents", i + 1, total
+            )
+
+    def _generate_payslips(self):
+        """Generate the monthly payslips of the employees"""
+        months = sorted(
+            set(
+                (day.year, day.month)
+                for day in (
+                    self.start_date + timedelta(days=offset)
+                    for offset in range(self.days)
+                )
+            )
+        )
+        payslips = []
+        for employee in self.employees:
+            basic_salary = Decimal(self.rng.randrange(2000, 8000, 100))
+            commission = Decimal(self.rng.randint(0, 10)) / 2
+            bank = self.rng.choice(("DBS", "OCBC", "UOB", "Maybank"))
+            for year, month in months:
+                sale_price = round(
+                    self.sales_by_month[(employee.pk, year, month)], 2
+                )
+                commission_amt = round(sale_price * commission / 100, 2)
+                allowances = Decimal(self.rng.randrange(0, 500, 50))
+                deductions = Decimal(self.rng.randrange(0, 200, 25))
+                next_month = date(year + month // 12, month % 12 + 1, 1)
+                payslips.append(
+                    Payslip(
+                        user=employee,
+                        company=self.company,
+                        date=next_month - timedelta(days=1),
+                        year=str(year),
+                        month=str(month),
+                        basic_salary=basic_salary,
+                        total_allowances=allowances,
+                        total_deductions=deductions,
+                        sale_price=sale_price,
+                        commission=commission,
+                        commission_amt=commission_amt,
+                        net_pay=basic_salary
+                        + allowances
+                        - deductions
+                        + commission_amt,
+                        payment_method=self.rng.choice(PAYMENT_METHODS),
+                        bank=bank,
+                        status="PD",
+                    )
+                )
+        self._write_all((Payslip, payslips))
+
+    def _update_unused_credits(self):
+        """Set the stored unused credits like the credit note api does"""
+        Customer.objects.using(self.writer.using).filter(
+            company=self.company
+        ).update(
+            unused_credits=Coalesce(
+                Subquery(
+                    CreditNote.objects.filter(customer=OuterRef("pk"))
+                    .values("customer")
+                    .annotate(total=Sum("credits_remaining"))
+                    .values("total")
+                ),
+                Decimal("0.00"),
+            )
+        )
+
+
+class Command(BaseCommand):
+    """
+    Django command to generate companies with production sized data.
+
+    The data is derived from --seed only, so two runs with the same
+    options produce the same rows (apart from their primary keys).
+    """
+
+    help = "Generate realistic tenants for performance testing"
+
+    counts = {
+        "companies": 1,
+        "customers": 200,
+        "suppliers": 50,
+        "categories": 20,
+        "products": 500,
+        "employees": 20,
+        "roles": 5,
+        "sales_orders": 2000,
+        "invoices": 5000,
+        "credit_notes": 500,
+        "purchase_orders": 500,
+        "receives": 1000,
+    }
+
+    def add_arguments(self, parser):
+        for name, default in self.counts.items():
+            parser.add_argument(
+                "--" + name.replace("_", "-"),
+                type=int,
+                default=default,
+                help=f"Number of {name.replace('_', ' ')} per company "
+                f"(default {default})",
+            )
+        parser.add_argument(
+            "--max-line-items",
+            type=int,
+            default=8,
+            help="Maximum number of line items per document (default 8)",
+        )
+        parser.add_argument("--seed", default="0")
+        parser.add_argument(
+            "--start-date",
+            type=date.fromisoformat,
+            default=date(2020, 1, 1),
+            help="Date of the first document (default 2020-01-01)",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=730,
+            help="Number of days the documents are spread over",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of documents written per transaction",
+        )
+        parser.add_argument(
+            "--password",
+            default="password123",
+            help="Password of the generated users",
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_false",
+            dest="use_copy",
+            help="Use INSERT instead of COPY on PostgreSQL",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        for name in self.counts:
+            if options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} is negative")
+        for name in ("max_line_items", "days", "batch_size"):
+            if options[name] < 1:
+                raise CommandError(
+                    f"--{name.replace('_', '-')} must be positive"
+                )
+        if options["credit_notes"] > options["invoices"]:
+            raise CommandError(
+                "There can't be more credit notes than invoices"
+            )
+
+        using = options["database"]
+        domains = [
+            f"@seed{options['seed']}-tenant{index}.example.com"
+            for index in range(options["companies"])
+        ]
+        existing = User.objects.using(using).filter(
+            email__in=[f"owner{domain}" for domain in domains]
+        )
+        if existing.exists():
+            raise CommandError(
+                f"Tenants of seed {options['seed']} were already generated, "
+                "use another --seed"
+            )
+
+        options["password_hash"] = make_password(options["password"])
+        # the permissions accepted by the role api
+        self.permission_ids = list(
+            Permission.objects.using(using)
+            .filter(pk__gte=29)
+            .order_by("content_type__app_label", "codename")
+            .values_list("pk", flat=True)
+        )
+        writer = BulkWriter(using, options["batch_size"], options["use_copy"])
+
+        for index in range(options["companies"]):
+            company = TenantGenerator(self, writer, options, index).generate()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Generated {company.name} (owner{domains[index]})"
+                )
+            )
+
+    def progress(self, company, label, done, total):
+        if self.verbosity > 1:
+            self.stdout.write(f"{company.name}: {label} {done}/{total}")
@@ -0,0 +1,351 @@
+from datetime import date
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Sum
+
+from core.models import (
+    CreditNote,
+    CreditNoteItem,
+    Invoice,
+    InvoiceItem,
+    PurchaseOrder,
+    PurchaseOrderItem,
+    Receive,
+    ReceiveItem,
+    SalesOrder,
+    SalesOrderItem,
+)
+
+# models partitioned by month of the field, the documents first
+PARTITIONED = (
+    (Invoice, "date"),
+    (SalesOrder, "date"),
+    (CreditNote, "date"),
+    (Receive, "date"),
+    (PurchaseOrder, "date"),
+    (InvoiceItem, "document_date"),
+    (SalesOrderItem, "document_date"),
+    (CreditNoteItem, "document_date"),
+    (ReceiveItem, "document_date"),
+    (PurchaseOrderItem, "document_date"),
+)
+
+UNIQUE_COLUMNS_RE = re.compile(r"^UNIQUE \((.*)\)")
+
+
+def add_months(day, months):
+    """First day of the month months after the month of day"""
+    years, month = divmod(day.month - 1 + months, 12)
+    return date(day.year + years, month + 1, 1)
+
+
+def month_ranges(start, end):
+    """[first day, first day of the next month) of the months in range"""
+    month = start.replace(day=1)
+    while month <= end:
+        yield month, add_months(month, 1)
+        month = add_months(month, 1)
+
+
+def partition_name(table, start):
+    return f"{table}_{start:%Y_%m}"
+
+
+class Command(BaseCommand):
+    """
+    Django command to partition the documents and their line items
+    by month, with PostgreSQL declarative partitioning.
+
+    Run with --convert once to move the existing rows of a table into
+    a partitioned table, then regularly (eg. daily from cron) to create
+    the partitions of the coming months ahead of the rows landing in
+    them. Rows outside of every partition go to a default partition,
+    whose rows are moved out when their month's partition is created.
+
+    Postgres requires the primary key of a partitioned table to include
+    its partition key, so it becomes (id, date), and no unique
+    constraint on id alone can exist. Hence the foreign keys *to* the
+    documents (from their line items, credits applications, credit
+    notes, invoices and receives) are dropped by --convert: Django
+    still cascades deletes, but the database no longer rejects rows
+    pointing at missing documents, and migrations altering those
+    foreign keys have to skip the constraint. For the same reason, the
+    unique constraint of Receive.purchase_order becomes unique on
+    (purchase_order_id, date): two receives of a purchase order on the
+    same day are still rejected by the database, on different days by
+    the api only, convert_documents() and the purchase order serializer
+    unlinking the previous receive first.
+    """
+
+    help = "Partition the document and line item tables by month"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Move the rows of the unpartitioned tables into "
+            "partitioned tables (locks each table while it is copied)",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Months to create partitions for after the current one "
+            "(default 3)",
+        )
+        parser.add_argument(
+            "--check-pruning",
+            action="store_true",
+            help="Fail unless the date filtered queries of the current "
+            "month only scan its partitions",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the statements instead of running them",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.connection = connections[options["database"]]
+        if self.connection.vendor != "postgresql":
+            raise CommandError("Partitioning requires PostgreSQL")
+
+        today = date.today()
+        until = add_months(today, options["months_ahead"])
+        for model, field_name in PARTITIONED:
+            table = model._meta.db_table
+            column = model._meta.get_field(field_name).column
+            if not self.is_partitioned(table):
+                if not options["convert"]:
+                    self.stderr.write(
+                        f"{table} is not partitioned, run with --convert"
+                    )
+                    continue
+                self.convert(table, column, today, until)
+            else:
+                self.create_partitions(table, column, today, until)
+
+        if options["check_pruning"]:
+            self.check_pruning(today)
+
+    def fetch(self, sql, params=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def run_sql(self, sql, params=None):
+        if self.options["dry_run"] or self.options["verbosity"] > 1:
+            with self.connection.cursor() as cursor:
+                self.stdout.write(
+                    f"{cursor.mogrify(sql, params).decode()};"
+                    if params
+                    else f"{sql};"
+                )
+        if not self.options["dry_run"]:
+            with self.connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+    def quote(self, name):
+        return self.connection.ops.quote_name(name)
+
+    def is_partitioned(self, table):
+        return bool(
+            self.fetch(
+                "SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = %s::regclass",
+                [table],
+            )
+        )
+
+    def create_partitions(self, table, column, start, end):
+        """Create the monthly partitions of start to end and the default"""
+        existing = {
+            name
+            for name, in self.fetch(
+                "SELECT inhrelid::regclass::text FROM pg_inherits "
+                "WHERE inhparent = %s::regclass",
+                [table],
+            )
+        }
+        default = f"{table}_default"
+        if default not in existing:
+            self.run_sql(
+                f"CREATE TABLE {self.quote(default)} "
+                f"PARTITION OF {self.quote(table)} DEFAULT"
+            )
+
+        created = 0
+        for lower, upper in month_ranges(start, end):
+            name = partition_name(table, lower)
+            if name in existing:
+                continue
+            with transaction.atomic(using=self.connection.alias):
+                self.run_sql(
+                    f"CREATE TABLE {self.quote(name)} (LIKE "
+                    f"{self.quote(table)} INCLUDING DEFAULTS "
+                    f"INCLUDING STORAGE)"
+                )
+                # the rows of the month written before its partition
+                self.run_sql(
+                    f"WITH moved AS (DELETE FROM {self.quote(default)} "
+                    f"WHERE {self.quote(column)} >= %s "
+                    f"AND {self.quote(column)} < %s RETURNING *) "
+                    f"INSERT INTO {self.quote(name)} SELECT * FROM moved",
+                    [lower, upper],
+                )
+                self.run_sql(
+                    f"ALTER TABLE {self.quote(table)} ATTACH PARTITION "
+                    f"{self.quote(name)} FOR VALUES FROM (%s) TO (%s)",
+                    [lower, upper],
+                )
+            created += 1
+        self.stdout.write(f"{table}: {created} partition(s) created")
+
+    def convert(self, table, column, start, end):
+        """Replace the table with a partitioned table holding its rows"""
+        with transaction.atomic(using=self.connection.alias):
+            self._convert(table, column, start, end)
+        self.stdout.write(self.style.SUCCESS(f"{table}: partitioned"))
+
+    def _convert(self, table, column, start, end):
+        table_id = self.fetch("SELECT %s::regclass::oid", [table])[0][0]
+        ((lowest, highest),) = self.fetch(
+            f"SELECT MIN({self.quote(column)}), MAX({self.quote(column)}) "
+            f"FROM {self.quote(table)}"
+        )
+        ((sequence,),) = self.fetch(
+            "SELECT pg_get_serial_sequence(%s, 'id')", [table]
+        )
+        ((primary_key,),) = self.fetch(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s AND contype = 'p'",
+            [table_id],
+        )
+        # indexes not backing a constraint, defined on the table's name
+        indexes = self.fetch(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = %s AND NOT EXISTS (SELECT 1 FROM "
+            "pg_constraint WHERE conindid = pg_index.indexrelid)",
+            [table_id],
+        )
+        constraints = self.fetch(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s AND contype IN ('c', 'f', 'u')",
+            [table_id],
+        )
+        # the foreign keys of the partitions of the tables converted
+        # before are dropped with their parent's
+        referencing = self.fetch(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE confrelid = %s AND contype = 'f' AND conparentid = 0",
+            [table_id],
+        )
+
+        for other_table, name in referencing:
+            self.stderr.write(
+                f"Dropping foreign key {name} of {other_table} to {table}"
+            )
+            self.run_sql(
+                f"ALTER TABLE {self.quote(other_table)} "
+                f"DROP CONSTRAINT {self.quote(name)}"
+            )
+
+        old = f"{table}_unpartitioned"
+        self.run_sql(
+            f"ALTER TABLE {self.quote(table)} RENAME TO {self.quote(old)}"
+        )
+        self.run_sql(
+            f"CREATE TABLE {self.quote(table)} (LIKE {self.quote(old)} "
+            f"INCLUDING DEFAULTS INCLUDING STORAGE) "
+            f"PARTITION BY RANGE ({self.quote(column)})"
+        )
+        self.run_sql(
+            f"ALTER SEQUENCE {sequence} OWNED BY {self.quote(table)}.id"
+        )
+        self.create_partitions(
+            table,
+            column,
+            min(lowest or start, start),
+            max(highest or end, end),
+        )
+        self.run_sql(
+            f"INSERT INTO {self.quote(table)} SELECT * FROM {self.quote(old)}"
+        )
+        self.run_sql(f"DROP TABLE {self.quote(old)}")
+
+        # built once the rows are in, and named as the dropped ones
+        self.run_sql(
+            f"ALTER TABLE {self.quote(table)} ADD CONSTRAINT "
+            f"{self.quote(primary_key)} PRIMARY KEY (id, {self.quote(column)})"
+        )
+        for (definition,) in indexes:
+            self.run_sql(definition)
+        for name, definition in constraints:
+            unique = UNIQUE_COLUMNS_RE.match(definition)
+            if unique and column not in unique.group(1).replace(
+                '"', ""
+            ).split(", "):
+                self.stderr.write(
+                    f"Adding the partition key {column} to the unique "
+                    f"constraint {name} of {table}"
+                )
+                definition = (
+                    f"UNIQUE ({unique.group(1)}, {self.quote(column)})"
+                )
+            self.run_sql(
+                f"ALTER TABLE {self.quote(table)} ADD CONSTRAINT "
+                f"{self.quote(name)} {definition}"
+            )
+
+    def check_pruning(self, today):
+        """EXPLAIN the list and report queries of the current month"""
+        lower, upper = add_months(today, 0), add_months(today, 1)
+        queries = []
+        for model, field_name in PARTITIONED:
+            dates = {
+                f"{field_name}__gte": lower,
+                f"{field_name}__lt": upper,
+            }
+            queries.append(
+                (
+                    model,
+                    f"{model._meta.db_table} list",
+                    model.objects.filter(**dates).order_by("-id")[:25].query,
+                )
+            )
+        queries.append(
+            (
+                Invoice,
+                "invoice sales report",
+                Invoice.objects.filter(date__gte=lower, date__lt=upper)
+                .values("customer")
+                .annotate(total=Sum("grand_total"))
+                .query,
+            )
+        )
+
+        failures = []
+        for model, label, query in queries:
+            table = model._meta.db_table
+            sql, params = query.get_compiler(self.connection.alias).as_sql()
+            plan = "\n".join(
+                row[0] for row in self.fetch(f"EXPLAIN {sql}", params)
+            )
+            scanned = set(
+                re.findall(rf"\b{table}_(\d{{4}}_\d{{2}}|default)\b", plan)
+            )
+            expected = {f"{lower:%Y_%m}"}
+            self.stdout.write(
+                f"{label}: scans {', '.join(sorted(scanned)) or 'nothing'}"
+            )
+            if scanned - expected:
+                failures.append(label)
+        if failures:
+            raise CommandError(
+                f"Partitions not pruned for {', '.join(failures)}"
+            )
+        self.stdout.write(self.style.SUCCESS("Partitions pruned"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core import aging
+from core.models import Company
+
+
+class Command(BaseCommand):
+    """
+    Django command to recompute the aging balances of the customers and
+    suppliers as of today, see core.aging. Meant to run every night,
+    eg. from cron, after midnight.
+    """
+
+    help = "Recompute the aging balances as of today"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--company", type=int, help="Company id")
+
+    def handle(self, *args, **options):
+        companies = Company.objects.order_by("pk")
+        if options["company"] is not None:
+            companies = companies.filter(pk=options["company"])
+        count = 0
+        for company_id in companies.values_list("pk", flat=True).iterator():
+            for ledger in aging.LEDGERS:
+                aging.refresh(ledger, company_id)
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Aging balances of {count} company(s) refreshed"
+            )
+        )
@@ -0,0 +1,93 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+
+CONFIG_MODULE = "api.gunicorn_conf"
+
+
+class Command(BaseCommand):
+    """
+    Django command to serve the api with gunicorn.
+
+    The defaults come from api/gunicorn_conf.py. The master process
+    reloads its workers gracefully on SIGHUP, and with --preload (the
+    default) new code is deployed by a SIGUSR2 binary upgrade instead,
+    since the app was imported before the workers were forked.
+    """
+
+    help = "Serve the api with a preforking gunicorn server"
+
+    # maps the options to gunicorn settings
+    settings = {
+        "bind": "bind",
+        "workers": "workers",
+        "threads": "threads",
+        "max_requests": "max_requests",
+        "max_requests_jitter": "max_requests_jitter",
+        "timeout": "timeout",
+        "graceful_timeout": "graceful_timeout",
+        "preload": "preload_app",
+        "reload": "reload",
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bind", help="Address to listen on")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of worker processes (default 2 per cpu + 1)",
+        )
+        parser.add_argument(
+            "--threads", type=int, help="Number of threads per worker"
+        )
+        parser.add_argument(
+            "--max-requests",
+            type=int,
+            help="Recycle a worker after this many requests (0 disables)",
+        )
+        parser.add_argument("--max-requests-jitter", type=int)
+        parser.add_argument("--timeout", type=int)
+        parser.add_argument("--graceful-timeout", type=int)
+        parser.add_argument(
+            "--no-preload",
+            action="store_false",
+            dest="preload",
+            default=None,
+            help="Import the app in every worker instead of the master",
+        )
+        parser.add_argument(
+            "--reload",
+            action="store_true",
+            default=None,
+            help="Restart the workers when the code changes (development)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise CommandError("gunicorn is required to serve the api")
+
+        config = {
+            name: value
+            for name, value in vars(import_module(CONFIG_MODULE)).items()
+            if not name.startswith("_")
+        }
+        for option, name in self.settings.items():
+            if options[option] is not None:
+                config[name] = options[option]
+        if config.get("reload"):
+            # preloaded code can't be reloaded by restarting the workers
+            config["preload_app"] = False
+
+        class Application(BaseApplication):
+            def load_config(self):
+                for name, value in config.items():
+                    if name in self.cfg.settings:
+                        self.cfg.set(name, value)
+
+            def load(self):
+                return get_wsgi_application()
+
+        Application().run()
@@ -0,0 +1,9 @@
+from .compression import CompressionMiddleware
+from .replicarouting import ReplicaRoutingMiddleware
+from .sqlinstrumentation import SQLInstrumentationMiddleware
+
+__all__ = [
+    "CompressionMiddleware",
+    "ReplicaRoutingMiddleware",
+    "SQLInstrumentationMiddleware",
+]
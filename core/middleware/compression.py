@@ -0,0 +1,175 @@
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    # only gzip is offered
+    brotli = None
+
+DEFAULTS = {
+    "ENABLED": True,
+    # responses shorter than this many bytes aren't compressed
+    "MIN_SIZE": 1024,
+    # encodings offered, preferred first when the client accepts several
+    # with the same q-value
+    "ENCODINGS": ("br", "gzip"),
+    # the content types compressed, by prefix; the others, eg. images,
+    # archives or the octet streams, are mostly compressed already
+    "CONTENT_TYPES": (
+        "application/json",
+        "application/pdf",
+        "application/javascript",
+        "application/xml",
+        "image/svg+xml",
+        "text/",
+    ),
+    # compression levels by content type prefix, and for the others; the
+    # levels of JSON trade a little ratio for time, eg. gzip 4 compresses
+    # a page of 1000 invoices 6.6 times in half the time of level 6 (7.4)
+    "LEVELS": {
+        "application/json": {"gzip": 4, "br": 4},
+        "*": {"gzip": 6, "br": 5},
+    },
+    # levels of the streaming responses, sent as they are compressed
+    "STREAMING_LEVELS": {"gzip": 4, "br": 4},
+}
+
+ACCEPT_RE = re.compile(r"^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "COMPRESSION", {})}
+
+
+def get_encodings():
+    """The encodings available, in the order of preference"""
+    return [
+        encoding
+        for encoding in get_config()["ENCODINGS"]
+        if encoding == "gzip" or (encoding == "br" and brotli is not None)
+    ]
+
+
+def negotiate(accept_encoding, encodings):
+    """The encoding of encodings the Accept-Encoding header prefers"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        match = ACCEPT_RE.match(part)
+        if match is None:
+            continue
+        try:
+            weight = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+        weights[match[1].lower()] = weight
+    best, best_weight = None, 0
+    for encoding in encodings:
+        weight = weights.get(encoding, weights.get("*", 0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class Compressor:
+    """gzip or brotli stream of a given level"""
+
+    def __init__(self, encoding, level):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=level)
+            self.compress, self.flush = compressor.process, compressor.finish
+        else:
+            # gzip, without mtime as Django's GZipMiddleware
+            compressor = zlib.compressobj(
+                level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+            self.compress, self.flush = compressor.compress, compressor.flush
+
+
+def compress_sequence(sequence, compressor):
+    for chunk in sequence:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    Compress the responses with the encoding the client prefers among
+    gzip and brotli (when the brotli package is installed), with levels
+    by content type. Short responses, those of other content types,
+    partial content and files (sent with sendfile by the server) are
+    left as they are. Streaming responses are compressed as they are
+    streamed.
+
+    Configured with the COMPRESSION setting, see DEFAULTS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        config = get_config()
+        if not config["ENABLED"] or not self.is_compressible(response, config):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate(
+            request.META.get("HTTP_ACCEPT_ENCODING", ""), get_encodings()
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            compressor = Compressor(
+                encoding, config["STREAMING_LEVELS"][encoding]
+            )
+            response.streaming_content = compress_sequence(
+                response.streaming_content, compressor
+            )
+            # unknown until streamed
+            del response["Content-Length"]
+        else:
+            compressor = Compressor(
+                encoding, self.get_level(response, config, encoding)
+            )
+            content = compressor.compress(response.content)
+            content += compressor.flush()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response["Content-Length"] = str(len(content))
+
+        # the ETag of the uncompressed content, see RFC 7232 section 2.1
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+    def is_compressible(self, response, config):
+        if response.has_header("Content-Encoding") or response.has_header(
+            "Content-Range"
+        ):
+            return False
+        if getattr(response, "file_to_stream", None) is not None:
+            return False
+        content_type = response.get("Content-Type", "").lower()
+        if not content_type.startswith(tuple(config["CONTENT_TYPES"])):
+            return False
+        if response.streaming:
+            length = response.get("Content-Length")
+            return length is None or int(length) >= config["MIN_SIZE"]
+        return len(response.content) >= config["MIN_SIZE"]
+
+    def get_level(self, response, config, encoding):
+        content_type = response.get("Content-Type", "").lower()
+        for prefix, levels in config["LEVELS"].items():
+            if prefix != "*" and content_type.startswith(prefix):
+                return levels[encoding]
+        return config["LEVELS"]["*"][encoding]
@@ -0,0 +1,83 @@
+import time
+
+from core.db.routers import get_config, use_replica
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def replica_allowed(view_func, method):
+    """
+    Whether the view declares the action answering this request as
+    safe to read from a replica, with its replica_actions: the actions
+    of viewsets (eg. "list") or the lowercase methods of other views
+    """
+    view_class = getattr(view_func, "cls", None) or getattr(
+        view_func, "view_class", None
+    )
+    replica_actions = getattr(view_class, "replica_actions", ())
+    actions = getattr(view_func, "actions", None)
+    if actions is not None:
+        action = actions.get(method.lower())
+    else:
+        action = method.lower()
+    return action in replica_actions
+
+
+def get_pin(request, config):
+    """Time until which the client reads from the primary"""
+    value = request.COOKIES.get(config["PIN_COOKIE"]) or request.headers.get(
+        config["PIN_HEADER"]
+    )
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let the reads of safe requests to views opting in with
+    replica_actions go to the read replicas, see core.db.routers.
+
+    A client that wrote is pinned to the primary for PIN_SECONDS, so it
+    reads its own writes: the end of the window is set as a cookie and
+    a response header, which clients without cookies send back.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config["ALIASES"]:
+            return self.get_response(request)
+
+        request.replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request.replica_token is not None:
+                use_replica.reset(request.replica_token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            until = time.time() + config["PIN_SECONDS"]
+            response.set_cookie(
+                config["PIN_COOKIE"],
+                f"{until:.3f}",
+                max_age=config["PIN_SECONDS"],
+                httponly=True,
+                samesite="Lax",
+            )
+            response[config["PIN_HEADER"]] = f"{until:.3f}"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not hasattr(request, "replica_token"):
+            return
+        config = get_config()
+        if (
+            request.method in SAFE_METHODS
+            and replica_allowed(view_func, request.method)
+            and get_pin(request, config) <= time.time()
+        ):
+            request.replica_token = use_replica.set(True)
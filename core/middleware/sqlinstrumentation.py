@@ -0,0 +1,222 @@
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("core.sql")
+
+DEFAULTS = {
+    "ENABLED": False,
+    # fraction of the requests to instrument
+    "SAMPLE_RATE": 1.0,
+    # number of slowest statements reported per request
+    "SLOWEST_COUNT": 3,
+    # a statement run this many times in a request is reported
+    # as a repeated (likely N+1) statement
+    "REPEATED_THRESHOLD": 5,
+    "SERVER_TIMING": True,
+    "LOG": True,
+    # number of fingerprints kept per endpoint in the summary
+    "SUMMARY_FINGERPRINTS": 10,
+}
+
+IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+NUMBER_RE = re.compile(r"\b\d+\b")
+QUOTED_RE = re.compile(r"'(?:[^']|'')*'")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# label of the requests no view labelled, eg. the 404s, aggregated under
+# one key so that scans of random paths don't grow the summary
+UNRESOLVED = "<unresolved>"
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "SQL_INSTRUMENTATION", {})}
+
+
+def fingerprint(sql):
+    """
+    Normalize a statement so that the same query run with
+    different params (eg. once per row) has the same fingerprint
+    """
+    sql = QUOTED_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    sql = IN_LIST_RE.sub("IN (...)", sql)
+    return WHITESPACE_RE.sub(" ", sql).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper recording the statements run during a request"""
+
+    def __init__(self):
+        self.label = None
+        self.queries = []
+        self.started = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def report(self, slowest_count, repeated_threshold):
+        fingerprints = Counter(fingerprint(sql) for sql, _ in self.queries)
+        slowest = sorted(self.queries, key=lambda query: -query[1])
+        return {
+            "label": self.label,
+            "count": len(self.queries),
+            "db_ms": round(sum(d for _, d in self.queries) * 1000, 3),
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "slowest": [
+                {"sql": sql, "ms": round(duration * 1000, 3)}
+                for sql, duration in slowest[:slowest_count]
+            ],
+            "repeated": [
+                {"fingerprint": fp, "count": count}
+                for fp, count in fingerprints.most_common()
+                if count >= repeated_threshold
+            ],
+        }
+
+
+class SQLSummary:
+    """In-memory per endpoint aggregate of the instrumented requests"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = defaultdict(
+                lambda: {
+                    "requests": 0,
+                    "queries": 0,
+                    "max_queries": 0,
+                    "db_ms": 0.0,
+                    "total_ms": 0.0,
+                    "repeated": Counter(),
+                }
+            )
+
+    def add(self, report, max_fingerprints):
+        with self.lock:
+            endpoint = self.endpoints[report["label"]]
+            endpoint["requests"] += 1
+            endpoint["queries"] += report["count"]
+            endpoint["max_queries"] = max(
+                endpoint["max_queries"], report["count"]
+            )
+            endpoint["db_ms"] += report["db_ms"]
+            endpoint["total_ms"] += report["total_ms"]
+            for repeated in report["repeated"]:
+                endpoint["repeated"][repeated["fingerprint"]] += repeated[
+                    "count"
+                ]
+            # keep memory bounded on long running workers
+            if len(endpoint["repeated"]) > max_fingerprints:
+                endpoint["repeated"] = Counter(
+                    dict(endpoint["repeated"].most_common(max_fingerprints))
+                )
+
+    def as_list(self):
+        with self.lock:
+            summary = [
+                {
+                    "label": label,
+                    "requests": endpoint["requests"],
+                    "avg_queries": round(
+                        endpoint["queries"] / endpoint["requests"], 2
+                    ),
+                    "max_queries": endpoint["max_queries"],
+                    "avg_db_ms": round(
+                        endpoint["db_ms"] / endpoint["requests"], 3
+                    ),
+                    "avg_total_ms": round(
+                        endpoint["total_ms"] / endpoint["requests"], 3
+                    ),
+                    "repeated": [
+                        {"fingerprint": fp, "count": count}
+                        for fp, count in endpoint["repeated"].most_common()
+                    ],
+                }
+                for label, endpoint in self.endpoints.items()
+            ]
+        return sorted(summary, key=lambda endpoint: -endpoint["avg_db_ms"])
+
+
+summary = SQLSummary()
+
+
+def label_request(request, label):
+    """Name the endpoint the queries of this request are reported under"""
+    recorder = getattr(request, "sql_recorder", None)
+    if recorder is not None:
+        recorder.label = label
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Record the number, duration and shape of the SQL statements
+    run by (a sample of) the requests. Results are added to the
+    Server-Timing header, logged as one JSON line on the core.sql
+    logger and aggregated per endpoint in memory.
+
+    Configured with the SQL_INSTRUMENTATION setting, see DEFAULTS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config["ENABLED"] or random.random() >= config["SAMPLE_RATE"]:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        request.sql_recorder = recorder
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        if recorder.label is None:
+            recorder.label = UNRESOLVED
+        report = recorder.report(
+            config["SLOWEST_COUNT"], config["REPEATED_THRESHOLD"]
+        )
+        report["status"] = response.status_code
+        report["path"] = request.path
+
+        if config["SERVER_TIMING"]:
+            self.add_server_timing(response, report)
+        if config["LOG"]:
+            logger.info(json.dumps(report))
+        summary.add(report, config["SUMMARY_FINGERPRINTS"])
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF viewsets refine this with the action in initial()
+        match = request.resolver_match
+        if match is not None:
+            label_request(
+                request, f"{request.method} {match.view_name or match.route}"
+            )
+
+    def add_server_timing(self, response, report):
+        timing = (
+            f'db;dur={report["db_ms"]};desc="{report["count"]} queries", '
+            f'app;dur={report["total_ms"]}'
+        )
+        if response.has_header("Server-Timing"):
+            timing = f'{response["Server-Timing"]}, {timing}'
+        response["Server-Timing"] = timing
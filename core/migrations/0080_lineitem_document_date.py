@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# line item model -> (foreign key, document model)
+LINE_ITEMS = {
+    "creditnoteitem": ("credit_note", "creditnote"),
+    "invoiceitem": ("invoice", "invoice"),
+    "purchaseorderitem": ("purchase_order", "purchaseorder"),
+    "receiveitem": ("receive", "receive"),
+    "salesorderitem": ("sales_order", "salesorder"),
+}
+
+
+def copy_document_dates(apps, schema_editor):
+    for item_name, (field, document_name) in LINE_ITEMS.items():
+        item_model = apps.get_model("core", item_name)
+        document_model = apps.get_model("core", document_name)
+        item_model.objects.using(schema_editor.connection.alias).update(
+            document_date=Subquery(
+                document_model.objects.filter(
+                    pk=OuterRef(f"{field}_id")
+                ).values("date")[:1]
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0079_auto_20210714_1110"),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=item_name,
+                name="document_date",
+                field=models.DateField(editable=False, null=True),
+            )
+            for item_name in LINE_ITEMS
+        ],
+        migrations.RunPython(copy_document_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0080_lineitem_document_date"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name=item_name,
+            name="document_date",
+            field=models.DateField(editable=False),
+        )
+        for item_name in (
+            "creditnoteitem",
+            "invoiceitem",
+            "purchaseorderitem",
+            "receiveitem",
+            "salesorderitem",
+        )
+    ]
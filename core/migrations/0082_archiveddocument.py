@@ -0,0 +1,38 @@
+# Generated by Django 3.2.3 on 2026-10-19 15:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0081_lineitem_document_date_not_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(max_length=100)),
+                ('document_id', models.IntegerField()),
+                ('reference', models.CharField(max_length=255)),
+                ('date', models.DateField()),
+                ('grand_total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('archive', models.CharField(max_length=255)),
+                ('position', models.IntegerField()),
+                ('links', models.JSONField(default=dict)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.company')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archiveddocument',
+            index=models.Index(fields=['company', 'document_type', 'reference'], name='core_archiv_company_e6fc73_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='archiveddocument',
+            constraint=models.UniqueConstraint(fields=('document_type', 'document_id'), name='unique_archived_document'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.3 on 2026-10-19 15:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0083_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(max_length=100)),
+                ('prefix', models.CharField(blank=True, max_length=50)),
+                ('yearly', models.BooleanField(default=False)),
+                ('padding', models.PositiveSmallIntegerField(default=5)),
+                ('next_number', models.PositiveBigIntegerField(default=1)),
+                ('year', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.company')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='documentsequence',
+            constraint=models.UniqueConstraint(fields=('company', 'document_type'), name='unique_document_sequence'),
+        ),
+    ]
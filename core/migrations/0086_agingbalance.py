@@ -0,0 +1,33 @@
+# Generated by Django 3.2.3 on 2026-10-19 15:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0085_deliveryorderitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgingBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ledger', models.CharField(choices=[('AR', 'Accounts receivable'), ('AP', 'Accounts payable')], max_length=2)),
+                ('party_id', models.IntegerField(null=True)),
+                ('as_of', models.DateField()),
+                ('current', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('days_31_60', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('days_61_90', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('over_90', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.company')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='agingbalance',
+            index=models.Index(fields=['company', 'ledger', 'party_id'], name='core_agingb_company_dd6753_idx'),
+        ),
+    ]
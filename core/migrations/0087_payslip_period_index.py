@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-19 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0086_agingbalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payslip',
+            index=models.Index(fields=['company', 'year', 'month'], name='core_paysli_company_540368_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.3 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+def clear_balances(apps, schema_editor):
+    # may hold duplicates, the first report of each company recomputes
+    # them
+    AgingBalance = apps.get_model("core", "AgingBalance")
+    AgingBalance.objects.using(schema_editor.connection.alias).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0088_storedblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_balances, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='agingbalance',
+            name='core_agingb_company_dd6753_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='agingbalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('party_id__isnull', False)), fields=('company', 'ledger', 'party_id'), name='unique_aging_balance'),
+        ),
+        migrations.AddConstraint(
+            model_name='agingbalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('party_id__isnull', True)), fields=('company', 'ledger'), name='unique_aging_balance_without_party'),
+        ),
+    ]
@@ -1,7 +1,16 @@
 # https://www.webforefront.com/django/modelsoutsidemodels.html
 # #:~:text=By%20default%2C%20Django%20models%20are,dozens%20or%20hundreds%20of%20models.
-from .maintenance import Customer, Supplier, ProductCategory, Product, Payslip
+from .maintenance import (
+    Customer,
+    Supplier,
+    ProductCategory,
+    Product,
+    Payslip,
+    StoredBlob,
+)
 from .transaction import (
+    DeliveryOrder,
+    DeliveryOrderItem,
     Invoice,
     InvoiceItem,
     SalesOrder,
@@ -14,6 +23,9 @@ from .transaction import (
     CreditNote,
     CreditNoteItem,
     CreditsApplication,
+    ArchivedDocument,
+    DocumentSequence,
+    AgingBalance,
 )
 from .user import (
     Company,
@@ -22,6 +34,7 @@ from .user import (
     Role,
     User,
     UserConfig,
+    IdempotencyKey,
 )
 from .user import user_image_file_path, user_resume_file_path
 
@@ -33,6 +46,9 @@ __all__ = [
     "ProductCategory",
     "Product",
     "Payslip",
+    "StoredBlob",
+    "DeliveryOrder",
+    "DeliveryOrderItem",
     "Invoice",
     "InvoiceItem",
     "SalesOrder",
@@ -44,12 +60,16 @@ __all__ = [
     "CreditNote",
     "CreditNoteItem",
     "CreditsApplication",
+    "ArchivedDocument",
+    "DocumentSequence",
+    "AgingBalance",
     "Company",
     "Department",
     "Designation",
     "Role",
     "User",
     "UserConfig",
+    "IdempotencyKey",
     "PaymentMethod",
     "user_image_file_path",
     "user_resume_file_path",
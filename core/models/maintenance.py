@@ -179,3 +179,31 @@ class Payslip(models.Model):
     bank = models.CharField(max_length=255)
     status = models.CharField(max_length=255)
     comment = models.TextField(blank=True)
+
+    class Meta:
+        # the payslips of a month, see core.payroll
+        indexes = [models.Index(fields=["company", "year", "month"])]
+
+
+class StoredBlob(models.Model):
+    """
+    Content of the uploaded files, stored once under its digest and
+    shared by the fields referencing it, see core.storage.dedup
+    """
+
+    # name of the blob in the storage, eg. blobs/ab/abcd...ef.png
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    # number of the file fields referencing the blob
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # last time the blob was saved, unreferenced blobs are collected a
+    # grace period after it
+    saved_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=["refcount", "saved_at"])]
+
+    def __str__(self):
+        return self.name
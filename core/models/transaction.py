@@ -31,6 +31,38 @@ class Document(models.Model):
     def __str__(self):
         return self.reference
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the date stored, unknown when deferred
+        instance._stored_date = instance.__dict__.get("date")
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "date" not in update_fields:
+            return
+        if not adding and self.date != getattr(self, "_stored_date", None):
+            # the line items follow the date of their document
+            for related in self._meta.related_objects:
+                if issubclass(related.related_model, LineItem):
+                    related.related_model.objects.filter(
+                        **{related.field.name: self}
+                    ).exclude(document_date=self.date).update(
+                        document_date=self.date
+                    )
+        self._stored_date = self.date
+
+
+class LineItemQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.set_document_date()
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class LineItem(models.Model):
     """Line item in a document"""
@@ -43,10 +75,25 @@ class LineItem(models.Model):
     quantity = models.IntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # copy of the date of the document, so that the line items can be
+    # partitioned with their document, see partition_tables
+    document_date = models.DateField(editable=False)
+
+    objects = LineItemQuerySet.as_manager()
+
+    # name of the foreign key to the document
+    document_field = None
 
     class Meta:
         abstract = True
 
+    def set_document_date(self):
+        self.document_date = getattr(self, self.document_field).date
+
+    def save(self, *args, **kwargs):
+        self.set_document_date()
+        super().save(*args, **kwargs)
+
 
 class PaymentMethod(models.Model):
     """Payment method in a company"""
@@ -139,6 +186,8 @@ class CreditNoteItem(LineItem):
 
     credit_note = models.ForeignKey("CreditNote", on_delete=models.CASCADE)
 
+    document_field = "credit_note"
+
 
 class DeliveryOrder(Document):
     """Delivery Order issued to a customer"""
@@ -158,7 +207,29 @@ class DeliveryOrder(Document):
     invoice = models.ForeignKey(
         "Invoice", on_delete=SET_NULL, null=True, blank=True
     )
-    credits_applied = models.DecimalField(max_digits=10, decimal_places=2)
+    credits_applied = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+    )
+
+
+class DeliveryOrderItem(LineItem):
+    """Line item in a delivery order"""
+
+    delivery_order = models.ForeignKey(
+        "DeliveryOrder", on_delete=models.CASCADE
+    )
+    # the sales order line delivered, see core.delivery. Without database
+    # constraint since the sales order lines may be partitioned, see
+    # partition_tables
+    sales_order_item = models.ForeignKey(
+        "SalesOrderItem",
+        on_delete=SET_NULL,
+        null=True,
+        blank=True,
+        db_constraint=False,
+    )
+
+    document_field = "delivery_order"
 
 
 class Invoice(Document):
@@ -205,6 +276,8 @@ class InvoiceItem(LineItem):
 
     invoice = models.ForeignKey("Invoice", on_delete=models.CASCADE)
 
+    document_field = "invoice"
+
 
 class SalesOrder(Document):
     """Sales order issued to a customer"""
@@ -233,6 +306,11 @@ class SalesOrderItem(LineItem):
     """Line item in a sales order"""
 
     sales_order = models.ForeignKey("SalesOrder", on_delete=models.CASCADE)
+    # sum of the quantities of the delivery order lines of this line,
+    # maintained by core.delivery
+    quantity_delivered = models.IntegerField(default=0, editable=False)
+
+    document_field = "sales_order"
 
 
 class Receive(Document):
@@ -268,6 +346,8 @@ class ReceiveItem(LineItem):
 
     receive = models.ForeignKey("Receive", on_delete=models.CASCADE)
 
+    document_field = "receive"
+
 
 class PurchaseOrder(Document):
     """Purchase order issued to a supplier"""
@@ -295,3 +375,115 @@ class PurchaseOrderItem(LineItem):
     purchase_order = models.ForeignKey(
         "PurchaseOrder", on_delete=models.CASCADE
     )
+
+    document_field = "purchase_order"
+
+
+class ArchivedDocument(models.Model):
+    """
+    Stub left in place of a document moved to the archive,
+    see core.archive
+    """
+
+    company = models.ForeignKey("Company", on_delete=models.CASCADE)
+    # label of the model, eg. core.invoice
+    document_type = models.CharField(max_length=100)
+    document_id = models.IntegerField()
+    reference = models.CharField(max_length=255)
+    date = models.DateField()
+    grand_total = models.DecimalField(max_digits=10, decimal_places=2)
+    # file of the configured storage holding the document, at line position
+    archive = models.CharField(max_length=255)
+    position = models.IntegerField()
+    # foreign keys to restore with the document, to documents that were
+    # rehydrated while it was archived: field name -> id
+    links = models.JSONField(default=dict)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["document_type", "document_id"],
+                name="unique_archived_document",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["company", "document_type", "reference"]),
+        ]
+
+    def __str__(self):
+        return self.reference
+
+
+class DocumentSequence(models.Model):
+    """
+    Numbering of the documents of a type of a company, allocating
+    the references of the documents created without one,
+    see core.numbering
+    """
+
+    company = models.ForeignKey("Company", on_delete=models.CASCADE)
+    # label of the model, eg. core.invoice
+    document_type = models.CharField(max_length=100)
+    prefix = models.CharField(max_length=50, blank=True)
+    # the year follows the prefix, and the numbers restart every year
+    yearly = models.BooleanField(default=False)
+    # minimum number of digits of the numbers, zero padded
+    padding = models.PositiveSmallIntegerField(default=5)
+    next_number = models.PositiveBigIntegerField(default=1)
+    # year of next_number, when yearly
+    year = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company", "document_type"],
+                name="unique_document_sequence",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.company} {self.document_type}"
+
+    def format(self, number, year):
+        if self.yearly:
+            return f"{self.prefix}{year}-{number:0{self.padding}d}"
+        return f"{self.prefix}{number:0{self.padding}d}"
+
+
+class AgingBalance(models.Model):
+    """
+    Balance owed by a customer, or to a supplier, by age of the unpaid
+    documents, see core.aging
+    """
+
+    class Ledger(models.TextChoices):
+        RECEIVABLE = "AR", _("Accounts receivable")
+        PAYABLE = "AP", _("Accounts payable")
+
+    company = models.ForeignKey("Company", on_delete=models.CASCADE)
+    ledger = models.CharField(max_length=2, choices=Ledger.choices)
+    # customer or supplier, null for the documents without one
+    party_id = models.IntegerField(null=True)
+    # day the ages are counted to
+    as_of = models.DateField()
+    current = models.DecimalField(max_digits=14, decimal_places=2)
+    days_31_60 = models.DecimalField(max_digits=14, decimal_places=2)
+    days_61_90 = models.DecimalField(max_digits=14, decimal_places=2)
+    over_90 = models.DecimalField(max_digits=14, decimal_places=2)
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company", "ledger", "party_id"],
+                condition=models.Q(party_id__isnull=False),
+                name="unique_aging_balance",
+            ),
+            # NULLs are distinct in the constraint above
+            models.UniqueConstraint(
+                fields=["company", "ledger"],
+                condition=models.Q(party_id__isnull=True),
+                name="unique_aging_balance_without_party",
+            ),
+        ]
@@ -262,3 +262,30 @@ class UserConfig(models.Model):
         raise AssertionError(
             "%s object can't be deleted." % (self._meta.object_name,)
         )
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response to a create request sent with an Idempotency-Key header,
+    replayed to the retries of the request, see core.idempotency
+    """
+
+    user = models.ForeignKey("User", on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # sha256 of the method, path and body of the request
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    # zlib compressed JSON of the response data
+    response = models.BinaryField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key"
+            ),
+        ]
+
+    def __str__(self):
+        return self.key
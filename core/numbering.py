@@ -0,0 +1,128 @@
+"""
+Server side numbering of the documents created without a reference.
+
+Each company has a DocumentSequence per document type. Numbers are
+allocated by a single UPDATE ... RETURNING of its row, which is locked
+until the transaction creating the documents commits: the creators of
+a company's documents of a type take turns, and a rollback gives the
+numbers back, so that no number is skipped. The documents of a bulk
+create get a block of numbers from one UPDATE.
+"""
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from core.models import ArchivedDocument, DocumentSequence
+
+DEFAULTS = {
+    # settings of the sequences created on first use
+    "PREFIXES": {
+        "core.invoice": "INV-",
+        "core.salesorder": "SO-",
+        "core.deliveryorder": "DO-",
+        "core.creditnote": "CN-",
+        "core.receive": "RCV-",
+        "core.purchaseorder": "PO-",
+    },
+    "YEARLY": False,
+    "PADDING": 5,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "DOCUMENT_NUMBERING", {})}
+
+
+def get_sequence(company, document_type):
+    config = get_config()
+    sequence, _ = DocumentSequence.objects.get_or_create(
+        company=company,
+        document_type=document_type,
+        defaults={
+            "prefix": config["PREFIXES"].get(document_type, ""),
+            "yearly": config["YEARLY"],
+            "padding": config["PADDING"],
+        },
+    )
+    return sequence
+
+
+def allocate(sequence, count, year):
+    """
+    Allocate count numbers of sequence in year, returning the first.
+    Must run in a transaction, which holds the row lock until its end.
+    """
+    using = router.db_for_write(DocumentSequence)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(DocumentSequence._meta.db_table)} SET "
+            f"{quote('next_number')} = CASE WHEN {quote('yearly')} AND "
+            f"COALESCE({quote('year')}, 0) <> %s THEN 1 "
+            f"ELSE {quote('next_number')} END + %s, {quote('year')} = %s "
+            f"WHERE {quote('id')} = %s RETURNING {quote('next_number')}",
+            [year, count, year, sequence.pk],
+        )
+        (next_number,) = cursor.fetchone()
+    sequence.next_number, sequence.year = next_number, year
+    return next_number - count
+
+
+def is_taken(model, company, references):
+    """The references already used by documents of model of company"""
+    return set(
+        model.objects.filter(
+            company=company, reference__in=references
+        ).values_list("reference", flat=True)
+    ) | set(
+        ArchivedDocument.objects.filter(
+            company=company,
+            document_type=model._meta.label_lower,
+            reference__in=references,
+        ).values_list("reference", flat=True)
+    )
+
+
+def allocate_references(model, company, count):
+    """
+    Allocate count references to documents of model of company, in the
+    current transaction. Numbers of references already used (eg. given
+    by clients) are skipped.
+    """
+    assert transaction.get_connection(
+        router.db_for_write(DocumentSequence)
+    ).in_atomic_block, "references must be allocated in a transaction"
+    sequence = get_sequence(company, model._meta.label_lower)
+    year = timezone.localdate().year
+    references = []
+    while len(references) < count:
+        needed = count - len(references)
+        first = allocate(sequence, needed, year)
+        candidates = [
+            sequence.format(number, year)
+            for number in range(first, first + needed)
+        ]
+        taken = is_taken(model, company, candidates)
+        references.extend(ref for ref in candidates if ref not in taken)
+    return references
+
+
+def number_documents(model, company, validated_data):
+    """
+    Set the references allocated to the validated data of a create
+    or bulk create missing one
+    """
+    items = (
+        validated_data
+        if isinstance(validated_data, list)
+        else [validated_data]
+    )
+    missing = [item for item in items if not item.get("reference")]
+    if not missing:
+        return
+    for item, reference in zip(
+        missing, allocate_references(model, company, len(missing))
+    ):
+        item["reference"] = reference
@@ -1,7 +1,9 @@
 # https://www.webforefront.com/django/modelsoutsidemodels.html
 # #:~:text=By%20default%2C%20Django%20models%20are,dozens%20or%20hundreds%20of%20models.
+from .fastjsonparser import FastJSONParser
 from .multipartjsonparser import MultiPartJSONParser
 
 __all__ = [
+    "FastJSONParser",
     "MultiPartJSONParser",
 ]
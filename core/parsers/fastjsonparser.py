@@ -0,0 +1,46 @@
+import codecs
+from io import BytesIO
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    # the requests are decoded by the stdlib json instead
+    orjson = None
+
+# maps the digits to b"0" and the other bytes to b" "
+DIGITS = bytes(
+    ord("0") if chr(i) in "0123456789" else ord(" ") for i in range(256)
+)
+# orjson decodes the integers beyond 64 bits to floats, json to ints
+LONG_NUMBER = b"0" * 19
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser decoding with orjson, when it is installed, to the same
+    data as the stdlib json.
+
+    The bodies orjson can't decode alike (integers of 19 digits or more,
+    encodings other than UTF-8) and those it rejects are parsed by
+    JSONParser, which reports the errors as before.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if (
+            orjson is None
+            or not self.strict
+            or codecs.lookup(encoding).name != "utf-8"
+        ):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if LONG_NUMBER not in body.translate(DIGITS):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(BytesIO(body), media_type, parser_context)
@@ -5,7 +5,9 @@ from django.http.multipartparser import (
     MultiPartParser as DjangoMultiPartParser,
     MultiPartParserError,
 )
-from rest_framework.exceptions import ParseError
+from rest_framework.exceptions import ParseError, ValidationError
+
+from core.storage.uploadhandlers import get_upload_handlers
 
 
 # https://stackoverflow.com/questions/23896441/how-can-i-send-multipart-form-data-that-contains-json-object-and-image-file-via
@@ -32,13 +34,27 @@ class MultiPartJSONParser(BaseParser):
         encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
         meta = request.META.copy()
         meta["CONTENT_TYPE"] = media_type
-        upload_handlers = request.upload_handlers
+        upload_handlers = get_upload_handlers(request)
 
         try:
             parser = DjangoMultiPartParser(
                 meta, stream, upload_handlers, encoding
             )
             data, files = parser.parse()
+            rejected = {
+                field_name: [
+                    "The file can't be larger than %s bytes." % max_size
+                ]
+                for handler in upload_handlers
+                for field_name, max_size in getattr(
+                    handler, "rejected", {}
+                ).items()
+            }
+            if rejected:
+                for _, field_files in files.lists():
+                    for file in field_files:
+                        file.close()
+                raise ValidationError(rejected)
 
             try:
                 json_data = json.loads(data.get("data", "{}"))
@@ -0,0 +1,197 @@
+"""
+Monthly payroll run, generating the payslips of the employees of a
+company for a month in one operation.
+
+The sales of each salesperson in the month are summed by one grouped
+query over the invoices, the commission is a percentage of them and the
+net pay is the basic salary, plus allowances and commission, minus
+deductions. The payslips missing are inserted in bulk, taking the pay
+terms (basic salary, allowances, deductions, commission rate, payment
+method and bank) of each employee's previous payslip, and those already
+generated are updated in bulk, keeping their terms, so that a run can be
+repeated for the same month. Paid payslips are left as they are.
+
+Payslip.month holds the name of the month, in lower case, as the
+payslips entered through the api do. The payslips stored with the number
+of the month are matched too, and renamed when updated.
+"""
+
+import calendar
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+
+from core.models import Company, Invoice, Payslip
+
+PAID, UNPAID = "PD", "UPD"
+
+CENT = Decimal("0.01")
+
+# pay terms carried over from the previous payslip, and those of the
+# first payslip of an employee
+TERMS = {
+    "basic_salary": Decimal("0.00"),
+    "total_allowances": Decimal("0.00"),
+    "total_deductions": Decimal("0.00"),
+    "commission": Decimal("0.00"),
+    "payment_method": "",
+    "bank": "",
+}
+COMPUTED = ("date", "month", "sale_price", "commission_amt", "net_pay")
+
+MONTHS = (
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+)
+
+
+def get_period(year, month):
+    """The first and last days of the month"""
+    return (
+        date(year, month, 1),
+        date(year, month, calendar.monthrange(year, month)[1]),
+    )
+
+
+def filter_month(month):
+    """The payslips of the month, stored by name or by number"""
+    return Q(month__iexact=MONTHS[month - 1]) | Q(
+        month__in=(str(month), f"{month:02}")
+    )
+
+
+def get_sales(company_id, start, end):
+    """The net of the invoices of the period by salesperson id"""
+    rows = (
+        Invoice.objects.filter(
+            company_id=company_id,
+            status__in=(Invoice.Status.UNPAID, Invoice.Status.PAID),
+            date__range=(start, end),
+        )
+        .order_by()
+        .values("salesperson_id")
+        .annotate(sale_price=Sum("net"))
+    )
+    return {
+        row["salesperson_id"]: Decimal(str(row["sale_price"])).quantize(CENT)
+        for row in rows
+    }
+
+
+def get_employees(company_id, start, end):
+    """
+    The employees of the company, not owners, employed in the period,
+    with the id of their last payslip before it
+    """
+    previous = Payslip.objects.filter(
+        company_id=company_id, user=OuterRef("pk"), date__lt=start
+    ).order_by("-date", "-id")
+    return (
+        get_user_model()
+        .objects.filter(company_id=company_id, is_staff=False)
+        .filter(
+            Q(date_of_commencement__isnull=True)
+            | Q(date_of_commencement__lte=end),
+            Q(date_of_cessation__isnull=True)
+            | Q(date_of_cessation__gte=start),
+        )
+        .annotate(previous_payslip=Subquery(previous.values("id")[:1]))
+        .order_by("id")
+        .values_list("id", "previous_payslip")
+    )
+
+
+def calculate_pay(payslip, sale_price):
+    """Set the commission and net pay of payslip for its sales"""
+    payslip.sale_price = sale_price
+    payslip.commission_amt = round(sale_price * payslip.commission / 100, 2)
+    payslip.net_pay = (
+        payslip.basic_salary
+        + payslip.total_allowances
+        - payslip.total_deductions
+        + payslip.commission_amt
+    )
+
+
+def run(company, year, month, pay_date=None):
+    """
+    Generate the payslips of the employees of company for the month, or
+    update those already generated. Return the payslips of the month,
+    by employee, and the numbers of those created and updated.
+    """
+    start, end = get_period(year, month)
+    pay_date = pay_date or end
+    with transaction.atomic():
+        # serializes the runs of the company
+        Company.objects.select_for_update().filter(pk=company.pk).exists()
+        employees = dict(get_employees(company.pk, start, end))
+        sales = get_sales(company.pk, start, end)
+        existing = {}
+        for payslip in Payslip.objects.filter(
+            filter_month(month),
+            company=company,
+            year=str(year),
+            user_id__in=employees,
+        ).order_by("id"):
+            # the latest of duplicated payslips is updated
+            existing[payslip.user_id] = payslip
+        previous = Payslip.objects.in_bulk(
+            [pk for pk in employees.values() if pk is not None]
+        )
+
+        created, updated = [], []
+        for user_id, previous_id in employees.items():
+            sale_price = sales.get(user_id, Decimal("0.00"))
+            payslip = existing.get(user_id)
+            if payslip is None:
+                terms = previous.get(previous_id)
+                payslip = Payslip(
+                    company=company,
+                    user_id=user_id,
+                    year=str(year),
+                    status=UNPAID,
+                    **{
+                        field: getattr(terms, field, default)
+                        for field, default in TERMS.items()
+                    },
+                )
+                created.append(payslip)
+            elif payslip.status == PAID:
+                continue
+            else:
+                updated.append(payslip)
+            payslip.date = pay_date
+            payslip.month = MONTHS[month - 1]
+            calculate_pay(payslip, sale_price)
+
+        Payslip.objects.bulk_create(created)
+        Payslip.objects.bulk_update(updated, COMPUTED)
+
+    # the latest payslip of each employee, the one updated above
+    payslips = {
+        payslip.user_id: payslip
+        for payslip in Payslip.objects.filter(
+            filter_month(month),
+            company=company,
+            year=str(year),
+            user_id__in=employees,
+        ).order_by("user_id", "id")
+    }
+    return {
+        "payslips": list(payslips.values()),
+        "created": len(created),
+        "updated": len(updated),
+    }
@@ -0,0 +1,105 @@
+"""
+Minimal PDF writer of text pages, written as a stream: each page is
+output as soon as it is added, and the page tree, cross-reference table
+and trailer, which need the offsets of every object, at the end.
+"""
+
+PAGE_WIDTH = 595  # A4, in points
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 9
+LEADING = 12
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+# object numbers reserved for the catalog, page tree and font
+CATALOG, PAGES, FONT = 1, 2, 3
+
+
+def escape(text):
+    text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return text.encode("latin-1", "replace")
+
+
+def page_content(lines):
+    """Content stream of a page showing lines of monospaced text"""
+    content = [
+        b"BT /F1 %d Tf %d TL %d %d Td"
+        % (FONT_SIZE, LEADING, MARGIN, PAGE_HEIGHT - MARGIN)
+    ]
+    content.extend(b"(" + escape(line) + b") '" for line in lines)
+    content.append(b"ET")
+    return b"\n".join(content)
+
+
+def paginate(lines):
+    """Content streams of the pages showing lines"""
+    return [
+        page_content(lines[start:][:LINES_PER_PAGE])
+        for start in range(0, max(len(lines), 1), LINES_PER_PAGE)
+    ]
+
+
+class PDFWriter:
+    """
+    Writes a document of the pages added, returning the bytes to output
+    from begin(), add_page() and end()
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.pages = []
+        self.next_number = FONT + 1
+
+    def _write(self, data):
+        self.offset += len(data)
+        return data
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        return self._write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+    def begin(self):
+        return self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n") + self._object(
+            FONT,
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier "
+            b"/Encoding /WinAnsiEncoding >>",
+        )
+
+    def add_page(self, content):
+        contents, page = self.next_number, self.next_number + 1
+        self.next_number += 2
+        self.pages.append(page)
+        return self._object(
+            contents,
+            b"<< /Length %d >>\nstream\n%s\nendstream"
+            % (len(content) + 1, content),
+        ) + self._object(
+            page,
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (PAGES, PAGE_WIDTH, PAGE_HEIGHT, FONT, contents),
+        )
+
+    def end(self):
+        data = self._object(
+            PAGES,
+            b"<< /Type /Pages /Kids [%s] /Count %d >>"
+            % (
+                b" ".join(b"%d 0 R" % page for page in self.pages),
+                len(self.pages),
+            ),
+        ) + self._object(
+            CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES
+        )
+        xref = self.offset
+        size = self.next_number
+        entries = [b"0000000000 65535 f \n"] + [
+            b"%010d 00000 n \n" % self.offsets[number]
+            for number in range(1, size)
+        ]
+        return data + self._write(
+            b"xref\n0 %d\n%s" % (size, b"".join(entries))
+            + b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (size, CATALOG, xref)
+        )
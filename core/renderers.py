@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    # the responses are encoded by the stdlib json instead
+    orjson = None
+
+# floats orjson writes like json does, the others it writes without the
+# exponent's sign or without exponent (1e16 instead of 1e+16, 0.00001
+# instead of 1e-05)
+FLOAT_RANGE = (1e-4, 1e16)
+
+_encoder = encoders.JSONEncoder()
+
+
+def default(obj):
+    """Encode the objects orjson doesn't as DRF's JSONEncoder does"""
+    if isinstance(obj, Decimal):
+        value = float(obj)
+        if value and not FLOAT_RANGE[0] <= abs(value) < FLOAT_RANGE[1]:
+            # not finite, or not written alike, see FastJSONRenderer
+            raise TypeError(obj)
+        return value
+    if hasattr(obj, "__iter__") and iter(obj) is obj:
+        # a generator, consumed by orjson if it falls back to json later
+        raise TypeError(obj)
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson, when it is installed, to the same
+    bytes as the stdlib json.
+
+    Decimals, datetimes and the other objects orjson doesn't encode, or
+    encodes otherwise, are passed to DRF's JSONEncoder. The responses
+    orjson can't encode (non-str keys, integers beyond 64 bits, Decimals
+    out of FLOAT_RANGE, iterators) and the indented ones are rendered by
+    JSONRenderer. Only the floats themselves aren't checked, since the
+    api has no float fields: orjson writes those out of FLOAT_RANGE in
+    its own notation, and the non-finite ones as null where json raises.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not self.is_fast(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # escaped by JSONRenderer, for JavaScript
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+    def is_fast(self, accepted_media_type, renderer_context):
+        """Whether orjson encodes the response as JSONRenderer would"""
+        return (
+            orjson is not None
+            and self.encoder_class is encoders.JSONEncoder
+            and not self.ensure_ascii
+            and self.compact
+            and self.strict
+            and self.get_indent(accepted_media_type, renderer_context) is None
+        )
+
+
+class PDFRenderer(BaseRenderer):
+    """
+    Accepts ?format=pdf and Accept: application/pdf for the views
+    streaming PDF documents themselves
+    """
+
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
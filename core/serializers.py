@@ -0,0 +1,347 @@
+from collections import OrderedDict, defaultdict
+import copy
+import threading
+
+from django.utils.functional import cached_property
+
+from rest_framework import serializers
+from rest_framework.utils.serializer_helpers import BindingDict
+
+from core.models import ArchivedDocument
+from core.storage import uploads
+from core.storage.media import media_url
+
+
+def split_query_param(value):
+    """Split a comma separated query param into a set of names"""
+    return set(name.strip() for name in value.split(",") if name.strip())
+
+
+class SparseFieldsetMixin:
+    """
+    Prune the fields rendered by a root serializer on GET requests.
+
+    ?fields=reference,date,customer,grand_total
+        only render the listed fields (id is always kept since
+        the client needs it to identify the records)
+    ?fields=reference,date&expand=invoiceitem_set
+        additionally render the listed nested fields
+
+    Without ?fields= every field is rendered as before so
+    existing clients are not affected.
+    """
+
+    always_rendered_fields = ("id",)
+
+    @cached_property
+    def fields(self):
+        # pruned here rather than in get_fields() since subclasses
+        # add their nested fields after calling super().get_fields()
+        fields = BindingDict(self)
+        requested = self.get_requested_fields()
+        for key, value in self.get_fields().items():
+            if requested is None or key in requested:
+                fields[key] = value
+        return fields
+
+    def get_requested_fields(self):
+        """
+        Return the set of field names requested by the client,
+        or None if all the fields should be rendered
+        """
+        request = self.context.get("request")
+        if request is None or request.method not in ["GET"]:
+            return None
+
+        # nested serializers share the root's context, but the
+        # query params are meant for the top level resource only
+        if not self._is_top_level():
+            return None
+
+        query_params = getattr(request, "query_params", request.GET)
+        fields = split_query_param(query_params.get("fields", ""))
+        if not fields:
+            return None
+
+        expand = split_query_param(query_params.get("expand", ""))
+        return fields | expand | set(self.always_rendered_fields)
+
+    def _is_top_level(self):
+        # for many=True the root is the ListSerializer wrapping self
+        return self.root is self or getattr(self.root, "child", None) is self
+
+
+def _none_safe(to_representation):
+    # serializers render None without calling to_representation()
+    def convert(value):
+        return None if value is None else to_representation(value)
+
+    return convert
+
+
+def _empty_if_none(value):
+    return "" if value is None else value
+
+
+def _file_converter(storage):
+    # same shape as the get_image() methods of the serializers
+    def convert(name):
+        return {
+            "src": media_url(storage, name) if name else "",
+            "title": name or "",
+        }
+
+    return convert
+
+
+def _get_reverse_relation(model, accessor_name):
+    for relation in model._meta.related_objects:
+        if relation.get_accessor_name() == accessor_name:
+            return relation
+    return None
+
+
+def _get_relation_lookup(model, source):
+    """Get the ORM lookup of a forward or reverse relation"""
+    relation = _get_reverse_relation(model, source)
+    return relation.name if relation else source
+
+
+class ValuesRowRenderer:
+    """
+    Render rows fetched with .values_list() through precompiled
+    per-serializer row functions, producing the same output as
+    serializer.data without instantiating a model, a serializer
+    and a field lookup for every row.
+
+    Nested list serializers and many related fields are fetched
+    with one extra query each for the whole page.
+
+    Serializers declare how their method fields map to values:
+    values_method_fields = {"company_name": "company__name"}
+        rendered as is ("" when null, like get_company_name())
+    values_file_fields = ("image",)
+        rendered as {src, title} like get_image()
+    """
+
+    # plain values from the db are already in their rendered form
+    identity_fields = (
+        serializers.CharField,
+        serializers.ChoiceField,
+        serializers.IntegerField,
+        serializers.BooleanField,
+        serializers.ReadOnlyField,
+        serializers.PrimaryKeyRelatedField,
+    )
+    cache_size = 256
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.lookups = [model._meta.pk.name]
+        self.row_items = []
+        self.nested = []
+
+        for key, lookup, convert in columns:
+            if callable(lookup):
+                # nested data, filled in once the page is known
+                self.nested.append((key, lookup))
+                self.row_items.append((key, None, None))
+            else:
+                self.row_items.append((key, len(self.lookups), convert))
+                self.lookups.append(lookup)
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        """
+        Get the (cached) renderer of a serializer instance,
+        or None if one of its fields can't be rendered from values
+        """
+        key = (type(serializer), tuple(serializer.fields))
+        with cls._cache_lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return cls._cache[key]
+
+        renderer = cls.compile(serializer)
+        with cls._cache_lock:
+            cls._cache[key] = renderer
+            if len(cls._cache) > cls.cache_size:
+                cls._cache.popitem(last=False)
+        return renderer
+
+    @classmethod
+    def compile(cls, serializer):
+        model = serializer.Meta.model
+        columns = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            column = cls._compile_field(model, serializer, name, field)
+            if column is None:
+                return None
+            columns.append(column)
+        return cls(model, columns)
+
+    @classmethod
+    def _compile_field(cls, model, serializer, name, field):
+        if isinstance(field, serializers.SerializerMethodField):
+            if name in getattr(serializer, "values_file_fields", ()):
+                storage = model._meta.get_field(name).storage
+                return (name, name, _file_converter(storage))
+            method_fields = getattr(serializer, "values_method_fields", {})
+            if name in method_fields:
+                return (name, method_fields[name], _empty_if_none)
+            return None
+
+        if field.source == "*":
+            return None
+
+        if isinstance(field, serializers.ManyRelatedField):
+            if not isinstance(
+                field.child_relation, serializers.PrimaryKeyRelatedField
+            ):
+                return None
+            lookup = _get_relation_lookup(model, field.source)
+            return (name, cls._many_pk_fetcher(model, lookup), None)
+
+        if isinstance(field, serializers.ListSerializer):
+            relation = _get_reverse_relation(model, field.source)
+            if relation is None or not isinstance(
+                field.child, serializers.ModelSerializer
+            ):
+                return None
+            child = cls.compile(field.child)
+            if child is None:
+                return None
+            return (name, child._child_fetcher(relation.field.name), None)
+
+        if isinstance(field, serializers.BaseSerializer):
+            return None
+
+        lookup = "__".join(field.source_attrs)
+        if isinstance(field, cls.identity_fields) and not isinstance(
+            field, serializers.MultipleChoiceField
+        ):
+            return (name, lookup, None)
+        # an unbound copy so the cache doesn't hold on to the request
+        return (
+            name,
+            lookup,
+            _none_safe(copy.deepcopy(field).to_representation),
+        )
+
+    @staticmethod
+    def _many_pk_fetcher(model, lookup):
+        def fetch(ids):
+            related = defaultdict(list)
+            rows = (
+                model._default_manager.filter(pk__in=ids)
+                .values_list("pk", lookup)
+                .order_by("pk", lookup)
+            )
+            for pk, related_pk in rows:
+                if related_pk is not None:
+                    related[pk].append(related_pk)
+            return related
+
+        return fetch
+
+    def _child_fetcher(self, parent_lookup):
+        def fetch(ids):
+            rows = list(
+                self.model._default_manager.filter(
+                    **{f"{parent_lookup}__in": ids}
+                )
+                .values_list(*self.lookups, parent_lookup)
+                .order_by(self.model._meta.pk.name)
+            )
+            related = defaultdict(list)
+            for row, data in zip(rows, self.render(rows)):
+                related[row[-1]].append(data)
+            return related
+
+        return fetch
+
+    def values(self, queryset):
+        """Narrow a queryset down to the values rendered by render()"""
+        return queryset.prefetch_related(None).values_list(*self.lookups)
+
+    def render(self, rows):
+        rows = list(rows)
+        data = [
+            {
+                key: (
+                    None
+                    if index is None
+                    else (
+                        row[index] if convert is None else convert(row[index])
+                    )
+                )
+                for key, index, convert in self.row_items
+            }
+            for row in rows
+        ]
+
+        if self.nested and rows:
+            ids = [row[0] for row in rows]
+            for key, fetch in self.nested:
+                related = fetch(ids)
+                for item, row in zip(data, rows):
+                    item[key] = related.get(row[0], [])
+
+        return data
+
+
+class ArchivedDocumentSerializer(serializers.ModelSerializer):
+    """Serializer for the stubs of the archived documents"""
+
+    class Meta:
+        model = ArchivedDocument
+        fields = (
+            "id",
+            "document_type",
+            "document_id",
+            "reference",
+            "date",
+            "grand_total",
+            "archived_at",
+        )
+        read_only_fields = fields
+
+
+class AgingBalanceSerializer(serializers.Serializer):
+    """Balance of a customer or supplier by age, see core.aging"""
+
+    id = serializers.IntegerField(allow_null=True, required=False)
+    name = serializers.CharField(allow_null=True, required=False)
+    current = serializers.DecimalField(max_digits=14, decimal_places=2)
+    days_31_60 = serializers.DecimalField(max_digits=14, decimal_places=2)
+    days_61_90 = serializers.DecimalField(max_digits=14, decimal_places=2)
+    over_90 = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class AgingReportSerializer(serializers.Serializer):
+    """Serializer for the aging reports"""
+
+    as_of = serializers.DateField()
+    results = AgingBalanceSerializer(many=True)
+    totals = AgingBalanceSerializer()
+
+
+class UploadRequestSerializer(serializers.Serializer):
+    """Serializer for the file to upload to the field of an object"""
+
+    target = serializers.ChoiceField(choices=sorted(uploads.TARGETS))
+    object_id = serializers.IntegerField()
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+
+
+class UploadCompletionSerializer(serializers.Serializer):
+    """Serializer for the token of an upload to complete"""
+
+    token = serializers.CharField()
@@ -0,0 +1,344 @@
+"""
+Statements of account of the customers of a company over a period.
+
+The opening balance, lines and closing balance of every customer are
+read by one query: the invoices, the credits applied to them from credit
+notes and their payments are unioned, and the running balance of each
+customer is a window sum over them. Only the lines of the period, and
+the last line before it carrying the opening balance, are returned, in
+the order of the customers, so that each statement is streamed once its
+lines are read. PDF statements are rendered by a pool of processes,
+forked once per server process and shared by its requests.
+
+The balance is what the customer owes on their invoices, so that the
+closing balances match the receivables of core.aging.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from itertools import islice
+import json
+import multiprocessing
+import os
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router
+from django.utils.dateparse import parse_date
+
+from core import pdf
+from core.models import CreditNote, CreditsApplication, Customer, Invoice
+
+DEFAULTS = {
+    # processes rendering the PDF statements, per server process, None
+    # for one per cpu available, and 0 or 1 to render them in the process
+    # serving the request
+    "WORKERS": None,
+    # statements sent to a process at once
+    "BATCH_SIZE": 50,
+    # rows fetched from the database at once
+    "CHUNK_SIZE": 2000,
+}
+
+INVOICE, CREDITS_APPLIED, PAYMENT = range(3)
+LINE_TYPES = {
+    INVOICE: "invoice",
+    CREDITS_APPLIED: "credits_applied",
+    PAYMENT: "payment",
+}
+
+CENT = Decimal("0.01")
+
+# pid of the process owning the pools -> pools by number of workers
+_executors = (None, {})
+_executors_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "STATEMENTS", {})}
+
+
+def get_sql(connection, customers):
+    quote = connection.ops.quote_name
+    invoice = quote(Invoice._meta.db_table)
+    application = quote(CreditsApplication._meta.db_table)
+    credit_note = quote(CreditNote._meta.db_table)
+    customer = quote(Customer._meta.db_table)
+    invoices = "i.company_id = %s AND i.status IN (%s, %s)" + (
+        f" AND i.customer_id IN ({', '.join(['%s'] * len(customers))})"
+        if customers
+        else ""
+    )
+    return f"""
+        WITH lines AS (
+            SELECT i.customer_id AS customer_id, i.date AS date,
+                {INVOICE} AS kind, i.id AS id, i.reference AS reference,
+                i.grand_total AS debit, 0 AS credit
+            FROM {invoice} i
+            WHERE {invoices} AND i.date <= %s
+            UNION ALL
+            SELECT i.customer_id, a.date, {CREDITS_APPLIED}, a.id,
+                c.reference, 0, a.amount_to_credit
+            FROM {application} a
+            INNER JOIN {invoice} i ON i.id = a.invoice_id
+            LEFT JOIN {credit_note} c ON c.id = a.credit_note_id
+            WHERE {invoices} AND a.date <= %s
+            UNION ALL
+            SELECT i.customer_id, COALESCE(i.payment_date, i.date),
+                {PAYMENT}, i.id, i.reference, 0, i.balance_due
+            FROM {invoice} i
+            WHERE {invoices} AND i.status = %s
+                AND COALESCE(i.payment_date, i.date) <= %s
+        ),
+        balances AS (
+            SELECT lines.*,
+                SUM(debit - credit) OVER (
+                    PARTITION BY customer_id ORDER BY date, kind, id
+                    ROWS UNBOUNDED PRECEDING
+                ) AS balance,
+                ROW_NUMBER() OVER (
+                    PARTITION BY customer_id,
+                        CASE WHEN date < %s THEN 0 ELSE 1 END
+                    ORDER BY date DESC, kind DESC, id DESC
+                ) AS position
+            FROM lines
+        )
+        SELECT b.customer_id, cu.name, b.date, b.kind, b.reference,
+            b.debit, b.credit, b.balance
+        FROM balances b
+        LEFT JOIN {customer} cu ON cu.id = b.customer_id
+        WHERE b.date >= %s OR b.position = 1
+        ORDER BY b.customer_id, b.date, b.kind, b.id
+    """
+
+
+def to_decimal(value):
+    return Decimal(str(value)).quantize(CENT)
+
+
+def to_date(value):
+    return parse_date(value) if isinstance(value, str) else value
+
+
+def get_statements(company, start, end, customers=None, chunk_size=None):
+    """
+    The statements of the customers of company, see read_statements,
+    read from the database routed to now: a response streaming them
+    reads them once the view returned, and its replica routing ended
+    """
+    connection = connections[router.db_for_read(Invoice)]
+    return read_statements(
+        connection, company, start, end, customers, chunk_size
+    )
+
+
+def read_statements(
+    connection, company, start, end, customers=None, chunk_size=None
+):
+    """
+    Yield the statement of each customer of company with lines in the
+    period from start to end, or a balance at its start
+    """
+    chunk_size = chunk_size or get_config()["CHUNK_SIZE"]
+    customers = list(customers or [])
+    invoices = [
+        company.pk,
+        Invoice.Status.UNPAID,
+        Invoice.Status.PAID,
+        *customers,
+    ]
+    params = [
+        *invoices,
+        end,
+        *invoices,
+        end,
+        *invoices,
+        Invoice.Status.PAID,
+        end,
+        start,
+        start,
+    ]
+    statement = None
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(get_sql(connection, customers), params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for customer_id, name, date, kind, reference, *amounts in rows:
+                debit, credit, balance = map(to_decimal, amounts)
+                if statement is None or statement["customer"] != customer_id:
+                    if statement is not None:
+                        yield statement
+                    statement = {
+                        "customer": customer_id,
+                        "name": name,
+                        "start": start,
+                        "end": end,
+                        "opening_balance": Decimal("0.00"),
+                        "lines": [],
+                        "closing_balance": Decimal("0.00"),
+                    }
+                date = to_date(date)
+                statement["closing_balance"] = balance
+                if date < start:
+                    statement["opening_balance"] = balance
+                    continue
+                statement["lines"].append(
+                    {
+                        "date": date,
+                        "type": LINE_TYPES[kind],
+                        "reference": reference,
+                        "debit": debit,
+                        "credit": credit,
+                        "balance": balance,
+                    }
+                )
+    if statement is not None:
+        yield statement
+
+
+def stream_json(statements):
+    """The statements as a JSON list, written one statement at a time"""
+    yield b"["
+    for i, statement in enumerate(statements):
+        if i:
+            yield b","
+        yield json.dumps(statement, cls=DjangoJSONEncoder).encode()
+    yield b"]"
+
+
+def render_statement(statement, company_name=""):
+    """The content streams of the pages of a PDF statement"""
+    lines = [
+        company_name,
+        "STATEMENT OF ACCOUNT",
+        "",
+        f"Customer: {statement['name'] or '-'}",
+        f"Period:   {statement['start']} to {statement['end']}",
+        "",
+        f"{'Date':<12}{'Type':<17}{'Reference':<24}"
+        f"{'Debit':>14}{'Credit':>14}{'Balance':>14}",
+        "-" * 95,
+        f"{'':<12}{'Opening balance':<41}{'':>28}"
+        f"{statement['opening_balance']:>14}",
+    ]
+    for line in statement["lines"]:
+        lines.append(
+            f"{str(line['date']):<12}"
+            f"{line['type'].replace('_', ' ').capitalize():<17}"
+            f"{(line['reference'] or '')[:23]:<24}"
+            f"{line['debit'] or '':>14}{line['credit'] or '':>14}"
+            f"{line['balance']:>14}"
+        )
+    lines.extend(
+        [
+            "-" * 95,
+            f"{'':<12}{'Closing balance':<41}{'':>28}"
+            f"{statement['closing_balance']:>14}",
+        ]
+    )
+    return pdf.paginate(lines)
+
+
+def _render(batch):
+    return [render_statement(*args) for args in batch]
+
+
+def parallel_map(function, iterable, workers, batch_size=1):
+    """
+    map() over a pool of processes, in order, with a bounded number of
+    batches in flight so that the iterable is consumed as it is streamed.
+    function is called with a list of up to batch_size items and returns
+    a list of results.
+    """
+    batches = batched(iterable, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            yield from function(batch)
+        return
+    executor = get_executor(workers)
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(executor.submit(function, batch))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        # a worker died, the next request forks a new pool
+        with _executors_lock:
+            _executors[1].pop(workers, None)
+        raise
+    finally:
+        # the batches of an interrupted stream aren't rendered
+        for future in pending:
+            future.cancel()
+
+
+def _init_worker():
+    # the connections inherited from the server process are still its
+    # own, closing them would close them for it too: they are dropped
+    for connection in connections.all():
+        connection.connection = None
+
+
+def get_executor(workers):
+    """
+    The pool of worker processes of this process, forked on first use
+    and shared by the requests, so that their number stays bounded
+    """
+    global _executors
+    with _executors_lock:
+        pid, executors = _executors
+        if pid != os.getpid():
+            # inherited from the parent of a forked server process
+            pid, executors = os.getpid(), {}
+            _executors = pid, executors
+        if workers not in executors:
+            # forked, since the workers don't set Django up
+            executors[workers] = ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+            )
+        return executors[workers]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def stream_pdf(statements, company_name="", workers=None):
+    """The statements as a PDF document, written one statement at a time"""
+    config = get_config()
+    if workers is None:
+        workers = config["WORKERS"]
+        if workers is None:
+            workers = available_cpus()
+    writer = pdf.PDFWriter()
+    yield writer.begin()
+    for pages in parallel_map(
+        _render,
+        ((statement, company_name) for statement in statements),
+        workers,
+        config["BATCH_SIZE"],
+    ):
+        yield b"".join(writer.add_page(page) for page in pages)
+    yield writer.end()
@@ -0,0 +1,13 @@
+from .backends import S3Storage
+from .dedup import DedupFileSystemStorage
+from .uploadhandlers import StagedFile, StorageUploadHandler
+from .uploads import LocalUploadBackend, S3UploadBackend
+
+__all__ = [
+    "DedupFileSystemStorage",
+    "LocalUploadBackend",
+    "S3Storage",
+    "S3UploadBackend",
+    "StagedFile",
+    "StorageUploadHandler",
+]
@@ -0,0 +1,35 @@
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from core.storage.dedup import DedupStorageMixin
+from core.storage.uploadhandlers import StagedFile
+
+
+class S3Storage(DedupStorageMixin, S3Boto3Storage):
+    """
+    S3Boto3Storage copying the files staged in the same bucket to their
+    name, within S3, rather than uploading them again, and saving the
+    uploaded files once per content (see core.storage.dedup)
+    """
+
+    def _save(self, name, content):
+        if not (
+            isinstance(content, StagedFile)
+            and getattr(content.storage, "bucket_name", None)
+            == self.bucket_name
+        ):
+            return super()._save(name, content)
+        cleaned_name = self._clean_name(name)
+        name = self._normalize_name(cleaned_name)
+        self.bucket.Object(name).copy(
+            {
+                "Bucket": self.bucket_name,
+                "Key": content.storage._normalize_name(
+                    self._clean_name(content.staged_name)
+                ),
+            },
+            ExtraArgs={
+                **self._get_write_parameters(name, content),
+                "MetadataDirective": "REPLACE",
+            },
+        )
+        return cleaned_name
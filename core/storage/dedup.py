@@ -0,0 +1,263 @@
+"""
+Content-addressed storage of the uploaded files.
+
+The upload paths give every file a random name, so the same photo
+uploaded for many products is stored, and uploaded, once per product.
+DedupStorageMixin stores the files saved under the upload prefixes once
+per content instead: the content is hashed (the sha256 computed by
+StorageUploadHandler while streaming it, when there is one) and saved
+under blobs/<2 first hex digits>/<digest><extension>, unless a
+StoredBlob of that name already records it, in which case the upload is
+skipped and the field gets the existing name. The presigned uploads
+are saved under their key by save_as_is(), as S3 stores them, since the
+token completing them names the key.
+
+The fields referencing each blob, the image, thumbnail and resume fields
+of core.storage.uploads.TARGETS, are counted in StoredBlob.refcount as
+the objects are saved and deleted. Since bulk deletes and updates don't
+send the signals, collect() first recounts the references with one
+grouped query per field, then deletes the blobs unreferenced for longer
+than the grace period (manage.py collect_blobs).
+"""
+
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+import hashlib
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from core.storage import uploads
+
+DEFAULTS = {
+    "ENABLED": True,
+    # directory of the blobs in the storage
+    "LOCATION": "blobs",
+    # the files saved under these prefixes are deduplicated, the others
+    # (eg. the archives) are saved as they are
+    "PREFIXES": ("uploads/",),
+    # seconds an unreferenced blob is kept after it was last saved, so
+    # that the objects being saved with it are committed first
+    "GRACE_PERIOD": 24 * 3600,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "DEDUP_STORAGE", {})}
+
+
+def get_blob_model():
+    # the storages are imported before the models are loaded
+    return apps.get_model("core.StoredBlob")
+
+
+def get_digest(content):
+    """The sha256 of content, read from its start"""
+    sha256 = getattr(content, "sha256", None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f"{get_config()['LOCATION']}/")
+
+
+class DedupStorageMixin:
+    """Save the uploaded files once per content, see the module"""
+
+    def save(self, name, content, max_length=None):
+        config = get_config()
+        if name is None:
+            name = content.name
+        if not config["ENABLED"] or not name.startswith(
+            tuple(config["PREFIXES"])
+        ):
+            return super().save(name, content, max_length=max_length)
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+
+        digest = get_digest(content)
+        extension = os.path.splitext(name)[1].lower()
+        blob_name = f"{config['LOCATION']}/{digest[:2]}/{digest}{extension}"
+        StoredBlob = get_blob_model()
+        now = timezone.now()
+        # protects the blob from a collection running meanwhile
+        if not StoredBlob.objects.filter(name=blob_name).update(saved_at=now):
+            saved_name = self._save(blob_name, content)
+            if saved_name != blob_name:
+                # saved concurrently, the copy is the same content
+                self.delete(saved_name)
+            StoredBlob.objects.get_or_create(
+                name=blob_name,
+                defaults={
+                    "sha256": digest,
+                    "size": content.size,
+                    "saved_at": now,
+                },
+            )
+        return blob_name
+
+    def save_as_is(self, name, content, max_length=None):
+        """Save content under name, not deduplicated"""
+        return super().save(name, content, max_length=max_length)
+
+
+class DedupFileSystemStorage(DedupStorageMixin, FileSystemStorage):
+    """FileSystemStorage saving the uploaded files once per content"""
+
+
+def get_fields():
+    """The file fields referencing the blobs, by model"""
+    fields = {}
+    for target in uploads.TARGETS.values():
+        model = apps.get_model(target.model)
+        fields.setdefault(model, []).append(
+            model._meta.get_field(target.field).attname
+        )
+    return fields
+
+
+def change_refcounts(changes):
+    StoredBlob = get_blob_model()
+    for name, change in changes.items():
+        if change:
+            StoredBlob.objects.filter(name=name).update(
+                refcount=F("refcount") + change
+            )
+
+
+def get_names(instance, attnames):
+    # the deferred fields aren't loaded, nor counted
+    names = {}
+    for attname in attnames:
+        if attname in instance.__dict__:
+            value = instance.__dict__[attname]
+            names[attname] = getattr(value, "name", value) or ""
+    return names
+
+
+def _loaded(sender, instance, attnames, **kwargs):
+    instance._blob_names = get_names(instance, attnames)
+
+
+def _saved(sender, instance, attnames, created, **kwargs):
+    before = {} if created else getattr(instance, "_blob_names", {})
+    after = get_names(instance, attnames)
+    changes = Counter()
+    for attname, name in after.items():
+        if name != before.get(attname):
+            if is_blob(before.get(attname)):
+                changes[before[attname]] -= 1
+            if is_blob(name):
+                changes[name] += 1
+    change_refcounts(changes)
+    instance._blob_names = {**before, **after}
+
+
+def _deleted(sender, instance, attnames, **kwargs):
+    changes = Counter()
+    for name in get_names(instance, attnames).values():
+        if is_blob(name):
+            changes[name] -= 1
+    change_refcounts(changes)
+
+
+def connect():
+    """Count the references to the blobs as the objects are saved"""
+    receivers = {
+        post_init: _loaded,
+        post_save: _saved,
+        post_delete: _deleted,
+    }
+    for model, attnames in get_fields().items():
+        for signal, receiver in receivers.items():
+            signal.connect(
+                partial(receiver, attnames=attnames),
+                sender=model,
+                weak=False,
+                dispatch_uid=f"dedup{receiver.__name__}{model._meta.label}",
+            )
+
+
+def recount(batch_size=1000):
+    """
+    Set the refcount of the blobs to the number of fields referencing
+    them, returning the number of blobs corrected
+    """
+    StoredBlob = get_blob_model()
+    prefix = f"{get_config()['LOCATION']}/"
+    counts = Counter()
+    for model, attnames in get_fields().items():
+        for attname in attnames:
+            counts.update(
+                dict(
+                    model._base_manager.filter(
+                        **{f"{attname}__startswith": prefix}
+                    )
+                    .order_by()
+                    .values(attname)
+                    .annotate(count=Count("pk"))
+                    .values_list(attname, "count")
+                )
+            )
+    corrected = []
+    for blob in StoredBlob.objects.only("name", "refcount").iterator(
+        chunk_size=batch_size
+    ):
+        if blob.refcount != counts[blob.name]:
+            blob.refcount = counts[blob.name]
+            corrected.append(blob)
+    StoredBlob.objects.bulk_update(
+        corrected, ["refcount"], batch_size=batch_size
+    )
+    return len(corrected)
+
+
+def collect(storage=None, batch_size=1000, dry_run=False):
+    """
+    Delete the blobs unreferenced since the grace period, once recounted.
+    Returns the numbers of blobs recounted and deleted, and the bytes
+    freed.
+    """
+    StoredBlob = get_blob_model()
+    storage = storage or default_storage
+    config = get_config()
+    result = {"recounted": recount(batch_size), "deleted": 0, "size": 0}
+    queryset = StoredBlob.objects.filter(
+        refcount__lte=0,
+        saved_at__lt=timezone.now()
+        - timedelta(seconds=config["GRACE_PERIOD"]),
+    ).order_by("pk")
+    if dry_run:
+        for size in queryset.values_list("size", flat=True).iterator():
+            result["deleted"] += 1
+            result["size"] += size
+        return result
+    while True:
+        with transaction.atomic():
+            # a blob saved again meanwhile waits for the batch, then is
+            # saved anew
+            blobs = list(
+                queryset.select_for_update(skip_locked=True)[:batch_size]
+            )
+            if not blobs:
+                return result
+            for blob in blobs:
+                storage.delete(blob.name)
+                result["deleted"] += 1
+                result["size"] += blob.size
+            StoredBlob.objects.filter(pk__in=[b.pk for b in blobs]).delete()
@@ -0,0 +1,140 @@
+"""
+URLs of the media files, as rendered by the serializers.
+
+Storage.url() is costly on S3: S3Boto3Storage normalizes the name and,
+without a custom domain, has boto3 build (and sign) the URL of every
+file. The URLs of public files served from a custom domain, or from the
+file system storage, are a fixed base followed by the name, so they are
+formatted from the base, computed once per storage. Other URLs are
+computed by the storage and memoized, signed ones until shortly before
+they expire.
+"""
+
+from collections import OrderedDict
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.test.signals import setting_changed
+from django.utils.functional import LazyObject, empty
+from storages.backends.s3boto3 import S3Boto3Storage
+
+# names of files that no cleaning, normalizing or quoting changes
+PLAIN_NAME = re.compile(r"[\w~-][\w.~-]*(/[\w~-][\w.~-]*)*", re.ASCII)
+
+DEFAULTS = {
+    # URLs memoized per storage
+    "CACHE_SIZE": 10000,
+    # seconds before their expiry signed URLs are signed again
+    "EXPIRY_MARGIN": 60,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "MEDIA_URLS", {})}
+
+
+class MediaURLResolver:
+    """Compute the URLs of the files of a storage, see media_url()"""
+
+    def __init__(self, storage):
+        config = get_config()
+        self.storage = storage
+        self.cache_size = config["CACHE_SIZE"]
+        self.expiry_margin = config["EXPIRY_MARGIN"]
+        self.base = self.get_base(storage)
+        self.prefix = self.base
+        location = getattr(storage, "location", "")
+        if isinstance(storage, S3Boto3Storage) and location:
+            self.prefix = f"{self.base}{location.strip('/')}/"
+        # name -> (url, time it's valid until, None for ever)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.lifetime = None
+        if self.base is None and self.is_signed(storage):
+            self.lifetime = max(
+                storage.querystring_expire - self.expiry_margin, 0
+            )
+
+    @staticmethod
+    def get_base(storage):
+        """The base of the URLs formatted from the names, if they are"""
+        if isinstance(storage, S3Boto3Storage):
+            signed = storage.querystring_auth and storage.cloudfront_signer
+            if not storage.custom_domain or signed:
+                return None
+            return f"{storage.url_protocol}//{storage.custom_domain}/"
+        if isinstance(storage, FileSystemStorage):
+            if storage.base_url is None:
+                return None
+            return storage.base_url
+        return None
+
+    @staticmethod
+    def is_signed(storage):
+        return isinstance(storage, S3Boto3Storage) and bool(
+            storage.querystring_auth
+        )
+
+    def url(self, name):
+        if self.base is not None and PLAIN_NAME.fullmatch(name):
+            # cleaned, normalized and quoted, the name is the same
+            return self.prefix + name
+
+        now = time.monotonic()
+        with self.lock:
+            cached = self.cache.get(name)
+            if cached is not None and (cached[1] is None or now < cached[1]):
+                self.cache.move_to_end(name)
+                return cached[0]
+
+        url = self.storage.url(name)
+        valid_until = None if self.lifetime is None else now + self.lifetime
+        with self.lock:
+            self.cache[name] = (url, valid_until)
+            self.cache.move_to_end(name)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return url
+
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_resolver(storage):
+    # default_storage is a LazyObject, keyed by the storage it wraps
+    if isinstance(storage, LazyObject):
+        if storage._wrapped is empty:
+            storage._setup()
+        storage = storage._wrapped
+    key = id(storage)
+    resolver = _resolvers.get(key)
+    if resolver is None or resolver.storage is not storage:
+        resolver = MediaURLResolver(storage)
+        with _resolvers_lock:
+            _resolvers[key] = resolver
+    return resolver
+
+
+def media_url(storage, name):
+    """The URL of the file of name in storage, as storage.url(name)"""
+    return get_resolver(storage).url(name)
+
+
+def file_data(file):
+    """The URL and name of a FieldFile, as the serializers render them"""
+    if not file:
+        return {"src": "", "title": ""}
+    return {"src": media_url(file.storage, file.name), "title": file.name}
+
+
+def _clear_resolvers(**kwargs):
+    # the storages' bases depend on the settings changed in the tests
+    with _resolvers_lock:
+        _resolvers.clear()
+
+
+setting_changed.connect(_clear_resolvers)
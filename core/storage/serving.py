@@ -0,0 +1,263 @@
+"""
+Serving of the media files of a local storage.
+
+django.views.static.serve reads the files through Python, holding a
+worker for the whole download. serve_media() authorizes the request in
+Django, then either hands the transfer over to the front proxy
+(X-Accel-Redirect for nginx, X-Sendfile for Apache or lighttpd), which
+serves the file, ranges included, from its own location, or serves it
+itself: a single byte range is answered with a 206, and the file is
+returned open, so that a WSGI server with a file wrapper (gunicorn)
+sends it with sendfile() without copying it through the worker. gunicorn
+only sends files from their start that way, the ranges starting further
+are read in blocks.
+"""
+
+import io
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+)
+from django.urls import re_path
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.storage import uploadhandlers
+
+DEFAULTS = {
+    # mount serve_media at MEDIA_URL, it is always mounted when DEBUG is
+    # on, as static() was
+    "ENABLED": False,
+    # None to serve the files in the worker, "x-accel-redirect" (nginx)
+    # or "x-sendfile" (Apache, lighttpd) to have the proxy serve them
+    "SENDFILE": None,
+    # internal location of nginx aliasing the media root
+    "ACCEL_PREFIX": "/internal/media/",
+    # dotted path of a callable(request, name) authorizing the request
+    "PERMISSION": "core.storage.serving.is_permitted",
+    "CACHE_CONTROL": "max-age=86400",
+    # bytes read at once from the files not sent with sendfile()
+    "BLOCK_SIZE": 64 * 1024,
+}
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "MEDIA_SERVING", {})}
+
+
+def allow_any(request, name):
+    return True
+
+
+def get_user(request):
+    """
+    The user of the request's API token, or of its session for the
+    admin site, None if it isn't authenticated
+    """
+    try:
+        credentials = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    if credentials is not None:
+        return credentials[0]
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user
+    return None
+
+
+def is_permitted(request, name):
+    """
+    Anyone, as with the public-read objects of S3, but the archives,
+    served to the users of their company only
+    """
+    # core.archive imports the models, loaded after the storages
+    from core import archive
+
+    location, _, rest = name.partition("/")
+    if location != archive.get_config()["LOCATION"].strip("/"):
+        return True
+    user = get_user(request)
+    if user is None:
+        return False
+    # archives/<company id>/<model>/<first pk>.jsonl.<codec>
+    company_id = rest.split("/", 1)[0]
+    return user.is_superuser or (
+        user.company_id is not None and company_id == str(user.company_id)
+    )
+
+
+def get_storage():
+    """The default storage if it is local, the media root otherwise"""
+    if uploadhandlers.is_local(default_storage):
+        return default_storage
+    return FileSystemStorage()
+
+
+def is_enabled():
+    return settings.DEBUG or get_config()["ENABLED"]
+
+
+def parse_range(header, size):
+    """
+    The first and last bytes of the range of header, None to send the
+    whole file, and ValueError if the range can't be satisfied
+    """
+    # several ranges would be sent as multipart/byteranges, the whole
+    # file is sent instead, as RFC 7233 allows
+    match = RANGE.match(header or "")
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # the suffix of the file
+        length = int(last)
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last:
+        if first < size:
+            # malformed, the range is ignored
+            return None
+        raise ValueError(header)
+    return first, last
+
+
+class RangeFile:
+    """
+    The bytes of a file from its current position to last, read by
+    FileResponse or sent by the WSGI server's file wrapper
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # gunicorn sends Content-Length bytes with sendfile(), but from
+        # the start of the file, the other ranges are read
+        if self.file.tell():
+            raise io.UnsupportedOperation("fileno")
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve the media file at path, see the module's docstring"""
+    config = get_config()
+    name = posixpath.normpath(path).lstrip("/")
+    staging = uploadhandlers.get_config()["STAGING_LOCATION"].strip("/")
+    if name in ("", ".") or name.startswith(f"{staging}/"):
+        raise Http404()
+    if not import_string(config["PERMISSION"])(request, name):
+        raise PermissionDenied()
+
+    storage = get_storage()
+    fullpath = storage.path(name)
+    try:
+        stat = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404()
+    if os.path.isdir(fullpath):
+        raise Http404()
+    if not was_modified_since(
+        request.META.get("HTTP_IF_MODIFIED_SINCE"),
+        stat.st_mtime,
+        stat.st_size,
+    ):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(name)
+    content_type = content_type or "application/octet-stream"
+    last_modified = http_date(stat.st_mtime)
+    sendfile = config["SENDFILE"]
+    if sendfile:
+        # the proxy serves the file, and its ranges
+        response = HttpResponse(content_type=content_type)
+        if sendfile == "x-accel-redirect":
+            response["X-Accel-Redirect"] = config["ACCEL_PREFIX"] + quote(name)
+        else:
+            response["X-Sendfile"] = fullpath
+    else:
+        response = respond(
+            request, fullpath, stat.st_size, content_type, last_modified
+        )
+    response["Last-Modified"] = last_modified
+    if encoding:
+        response["Content-Encoding"] = encoding
+    if config["CACHE_CONTROL"]:
+        response["Cache-Control"] = config["CACHE_CONTROL"]
+    return response
+
+
+def respond(request, fullpath, size, content_type, last_modified):
+    """The file, or the range requested of it"""
+    header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range != last_modified:
+        # changed since the client got the rest of it
+        header = None
+    try:
+        byte_range = parse_range(header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    first, last = byte_range or (0, size - 1)
+    length = last - first + 1 if size else 0
+    if request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+    else:
+        file = open(fullpath, "rb")
+        file.seek(first)
+        response = FileResponse(
+            RangeFile(file, length), content_type=content_type
+        )
+        response.block_size = get_config()["BLOCK_SIZE"]
+    if byte_range is not None:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {first}-{last}/{size}"
+    response["Content-Length"] = length
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def media_urlpatterns():
+    """The URL of serve_media at MEDIA_URL, if enabled"""
+    if not is_enabled():
+        return []
+    prefix = re.escape(settings.MEDIA_URL.lstrip("/"))
+    return [re_path(rf"^{prefix}(?P<path>.*)$", serve_media, name="media")]
@@ -0,0 +1,203 @@
+"""
+Upload handler streaming the files of multipart requests straight to
+the storage.
+
+Django's default handlers buffer each file in memory, then in a
+temporary file, which the storage reads again to upload it. Instead,
+StorageUploadHandler writes each chunk to a staging object of the
+storage as it is received (a multipart upload on S3, a file of the
+media root for the file system storage), with a size cap per field and
+the sha256 of the content, and returns a StagedFile. Saving a StagedFile
+to a field moves the staging object to its name within the storage
+(see core.storage.backends.S3Storage), and closing it at the end of the
+request deletes what's left of it.
+"""
+
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from storages.utils import clean_name
+
+from core.storage import uploads
+
+DEFAULTS = {
+    # stream the files to the storage, or use Django's upload handlers
+    "ENABLED": True,
+    # directory of the staging objects in the storage
+    "STAGING_LOCATION": "staging/uploads",
+    # bytes read from the request at once
+    "CHUNK_SIZE": 64 * 1024,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "STREAMING_UPLOADS", {})}
+
+
+def get_max_size(field_name):
+    """The largest file accepted for a field, by the kind of its targets"""
+    max_sizes = uploads.get_config()["MAX_SIZE"]
+    kinds = {
+        target.kind
+        for target in uploads.TARGETS.values()
+        if target.field == field_name
+    }
+    return max(max_sizes[kind] for kind in kinds or max_sizes)
+
+
+def open_writer(storage, name):
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        return storage.open(name, "wb")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return open(path, "wb")
+
+
+def abort_writer(storage, name, writer):
+    multipart = getattr(writer, "_multipart", None)
+    if multipart is not None:
+        # an S3Boto3StorageFile, aborted rather than completed
+        multipart.abort()
+    else:
+        writer.close()
+        storage.delete(name)
+
+
+class StagedFile(UploadedFile):
+    """A file uploaded to a staging object of the storage"""
+
+    def __init__(
+        self,
+        storage,
+        staged_name,
+        name,
+        content_type,
+        size,
+        charset,
+        sha256,
+        content_type_extra=None,
+    ):
+        self.storage = storage
+        self.staged_name = staged_name
+        self.sha256 = sha256
+        super().__init__(
+            None, name, content_type, size, charset, content_type_extra
+        )
+
+    @property
+    def file(self):
+        # the content is only read when validated, or copied to another
+        # storage
+        if self._file is None:
+            self._file = self.storage.open(self.staged_name, "rb")
+        return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
+
+    def open(self, mode=None):
+        if self._file is not None:
+            self._file.seek(0)
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        # left over when the file wasn't saved to a field
+        self.storage.delete(self.staged_name)
+
+
+class LocalStagedFile(StagedFile):
+    """
+    A file staged in a local storage, moved by FileSystemStorage like
+    Django's temporary uploaded files
+    """
+
+    def temporary_file_path(self):
+        return self.storage.path(self.staged_name)
+
+
+class StorageUploadHandler(FileUploadHandler):
+    """Stream the files of the request to staging objects of the storage"""
+
+    def __init__(self, request=None, storage=None):
+        super().__init__(request)
+        config = get_config()
+        self.chunk_size = config["CHUNK_SIZE"]
+        self.location = config["STAGING_LOCATION"]
+        self.storage = storage or default_storage
+        self.writer = None
+        # field name -> the size cap of the files skipped
+        self.rejected = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.max_size = get_max_size(self.field_name)
+        if self.content_length and self.content_length > self.max_size:
+            self.rejected[self.field_name] = self.max_size
+            raise SkipFile()
+        extension = os.path.splitext(self.file_name or "")[1]
+        self.staged_name = clean_name(
+            os.path.join(self.location, f"{uuid.uuid4().hex}{extension}")
+        )
+        self.writer = open_writer(self.storage, self.staged_name)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self.rejected[self.field_name] = self.max_size
+            self.abort()
+            raise SkipFile()
+        self.sha256.update(raw_data)
+        self.writer.write(raw_data)
+        # the chunk isn't passed to the other handlers
+
+    def file_complete(self, file_size):
+        self.writer.close()
+        self.writer = None
+        staged_file_class = (
+            LocalStagedFile if is_local(self.storage) else StagedFile
+        )
+        return staged_file_class(
+            self.storage,
+            self.staged_name,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.sha256.hexdigest(),
+            self.content_type_extra,
+        )
+
+    def abort(self):
+        if self.writer is not None:
+            abort_writer(self.storage, self.staged_name, self.writer)
+            self.writer = None
+
+    def upload_interrupted(self):
+        self.abort()
+
+
+def is_local(storage):
+    try:
+        storage.path("")
+    except NotImplementedError:
+        return False
+    return True
+
+
+def get_upload_handlers(request):
+    """The upload handlers of the multipart requests"""
+    if not get_config()["ENABLED"]:
+        return request.upload_handlers
+    return [StorageUploadHandler(request)]
@@ -0,0 +1,289 @@
+"""
+Direct uploads of the images and resumes to the storage.
+
+Instead of posting the file to the API, which then uploads it to the
+storage, the client asks for an upload (start_upload) and receives a
+short-lived presigned form to post the file to the storage directly,
+with the key, content type and size range it must have. Once uploaded,
+the client completes the upload (complete_upload) with the token it
+received, and the object is checked and attached to the field.
+
+The S3 backend presigns POST policies for S3. The local backend
+implements the same protocol for the other storages, such as the file
+system storage of the tests, posting the file to LocalUploadView.
+"""
+
+from collections import namedtuple
+import mimetypes
+
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.validators import validate_image_file_extension
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext_lazy as _
+
+DEFAULTS = {
+    # seconds the presigned forms and the tokens completing them last
+    "EXPIRES": 600,
+    # largest files accepted, in bytes, by kind of field
+    "MAX_SIZE": {"image": 5 * 1024 * 1024, "document": 10 * 1024 * 1024},
+    # dotted path of the upload backend, chosen from the default storage
+    # when None
+    "BACKEND": None,
+}
+
+SALT = "core.storage.uploads"
+
+CONTENT_TYPES = {
+    "image": ("image/jpeg", "image/png", "image/gif", "image/webp"),
+    "document": ("application/pdf", "image/jpeg", "image/png", "text/plain"),
+}
+
+Target = namedtuple("Target", "model field kind company_lookup")
+
+# the fields files are uploaded to, by "<model>.<field>"; the models are
+# given by label since the parsers, importing this module, are imported
+# before the models are loaded
+TARGETS = {
+    "customer.image": Target("core.Customer", "image", "image", "company"),
+    "supplier.image": Target("core.Supplier", "image", "image", "company"),
+    "productcategory.image": Target(
+        "core.ProductCategory", "image", "image", "company"
+    ),
+    "product.image": Target(
+        "core.Product", "image", "image", "category__company"
+    ),
+    "product.thumbnail": Target(
+        "core.Product", "thumbnail", "image", "category__company"
+    ),
+    "department.image": Target("core.Department", "image", "image", "company"),
+    "role.image": Target("core.Role", "image", "image", "company"),
+    "user.image": Target("core.User", "image", "image", "company"),
+    "user.resume": Target("core.User", "resume", "document", "company"),
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "PRESIGNED_UPLOADS", {})}
+
+
+class S3UploadBackend:
+    """Presigned POST policies of an S3Boto3Storage"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    @property
+    def client(self):
+        return self.storage.connection.meta.client
+
+    def get_key(self, name):
+        from storages.utils import clean_name
+
+        return self.storage._normalize_name(clean_name(name))
+
+    def generate_upload(self, name, content_type, max_size, expires):
+        """The URL and fields of the form posting the file of name"""
+        fields = {"Content-Type": content_type}
+        if self.storage.default_acl:
+            fields["acl"] = self.storage.default_acl
+        cache_control = self.storage.object_parameters.get("CacheControl")
+        if cache_control:
+            fields["Cache-Control"] = cache_control
+        conditions = [{field: value} for field, value in fields.items()]
+        conditions.append(["content-length-range", 1, max_size])
+        return self.client.generate_presigned_post(
+            Bucket=self.storage.bucket_name,
+            Key=self.get_key(name),
+            Fields=fields,
+            Conditions=conditions,
+            ExpiresIn=expires,
+        )
+
+    def describe(self, name):
+        """The size and content type of the file of name, None if missing"""
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(
+                Bucket=self.storage.bucket_name, Key=self.get_key(name)
+            )
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "403"):
+                return None
+            raise
+        return head["ContentLength"], head.get("ContentType")
+
+
+class LocalUploadBackend:
+    """
+    Stand-in for the other storages, the file is posted to the API and
+    saved to the storage by LocalUploadView
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def generate_upload(self, name, content_type, max_size, expires):
+        policy = signing.dumps(
+            {
+                "key": name,
+                "content_type": content_type,
+                "max_size": max_size,
+            },
+            salt=f"{SALT}.local",
+        )
+        return {
+            "url": reverse("core:upload-local"),
+            "fields": {
+                "key": name,
+                "Content-Type": content_type,
+                "policy": policy,
+            },
+        }
+
+    def describe(self, name):
+        if not self.storage.exists(name):
+            return None
+        return self.storage.size(name), mimetypes.guess_type(name)[0]
+
+    def receive(self, fields, file):
+        """Save the file posted with the fields of an upload form"""
+        try:
+            policy = signing.loads(
+                fields.get("policy", ""),
+                salt=f"{SALT}.local",
+                max_age=get_config()["EXPIRES"],
+            )
+        except signing.BadSignature:
+            raise ValidationError(_("Invalid or expired policy"))
+        if fields.get("key") != policy["key"]:
+            raise ValidationError(_("The key doesn't match the policy"))
+        if fields.get("Content-Type") != policy["content_type"]:
+            raise ValidationError(
+                _("The content type doesn't match the policy")
+            )
+        if file is None or not 1 <= file.size <= policy["max_size"]:
+            raise ValidationError(_("The file size isn't allowed"))
+        if self.storage.exists(policy["key"]):
+            raise ValidationError(_("The key is already used"))
+        # under the key the token names, rather than a blob of the
+        # deduplicating storages
+        save = getattr(self.storage, "save_as_is", self.storage.save)
+        name = save(policy["key"], file)
+        if name != policy["key"]:
+            # saved concurrently
+            self.storage.delete(name)
+            raise ValidationError(_("The key is already used"))
+
+
+def get_backend(storage=None):
+    storage = storage or default_storage
+    path = get_config()["BACKEND"]
+    if path is None:
+        from storages.backends.s3boto3 import S3Boto3Storage
+
+        path = (
+            "core.storage.S3UploadBackend"
+            if isinstance(storage, S3Boto3Storage)
+            else "core.storage.LocalUploadBackend"
+        )
+    return import_string(path)(storage)
+
+
+def get_target(name):
+    """The target of name, with its model class"""
+    try:
+        target = TARGETS[name]
+    except KeyError:
+        raise ValidationError(_("Unknown upload target"))
+    return target._replace(model=apps.get_model(target.model))
+
+
+def get_instance(target, user, object_id):
+    """The object of the target the user may upload files to"""
+    if user.company is None:
+        raise ValidationError(_("Object not found"))
+    queryset = target.model.objects.filter(
+        **{target.company_lookup: user.company}
+    )
+    if target.model is type(user) and not user.is_staff:
+        # employees only change their own profile
+        queryset = queryset.filter(pk=user.pk)
+    instance = queryset.filter(pk=object_id).first()
+    if instance is None:
+        raise ValidationError(_("Object not found"))
+    return instance
+
+
+def start_upload(user, target, object_id, filename, content_type, size):
+    """
+    The presigned form uploading a file to the field of an object, and
+    the token completing the upload
+    """
+    config = get_config()
+    target_name, target = target, get_target(target)
+    get_instance(target, user, object_id)
+    field = target.model._meta.get_field(target.field)
+    max_size = config["MAX_SIZE"][target.kind]
+    if content_type not in CONTENT_TYPES[target.kind]:
+        raise ValidationError(_("Content type not allowed"))
+    if size > max_size:
+        raise ValidationError(
+            _("The file can't be larger than %(size)s bytes")
+            % {"size": max_size}
+        )
+    validators = list(field.validators)
+    if target.kind == "image":
+        validators.append(validate_image_file_extension)
+    for validator in validators:
+        validator(File(None, name=filename))
+
+    name = field.generate_filename(None, filename)
+    upload = get_backend(field.storage).generate_upload(
+        name, content_type, max_size, config["EXPIRES"]
+    )
+    token = signing.dumps(
+        {
+            "target": target_name,
+            "object_id": object_id,
+            "company": user.company_id,
+            "name": name,
+        },
+        salt=SALT,
+    )
+    return {"upload": upload, "name": name, "token": token}
+
+
+def complete_upload(user, token):
+    """Attach the file uploaded with token to its field, once checked"""
+    config = get_config()
+    try:
+        data = signing.loads(token, salt=SALT, max_age=config["EXPIRES"])
+    except signing.BadSignature:
+        raise ValidationError(_("Invalid or expired upload token"))
+    if data["company"] != user.company_id:
+        raise ValidationError(_("Invalid or expired upload token"))
+    target = get_target(data["target"])
+    instance = get_instance(target, user, data["object_id"])
+    field = target.model._meta.get_field(target.field)
+
+    description = get_backend(field.storage).describe(data["name"])
+    if description is None:
+        raise ValidationError(_("The file wasn't uploaded"))
+    size, content_type = description
+    if size > config["MAX_SIZE"][target.kind]:
+        raise ValidationError(_("The file is too large"))
+    if content_type not in CONTENT_TYPES[target.kind]:
+        raise ValidationError(_("Content type not allowed"))
+
+    target.model.objects.filter(pk=instance.pk).update(
+        **{target.field: data["name"]}
+    )
+    setattr(instance, target.field, data["name"])
+    return getattr(instance, target.field)
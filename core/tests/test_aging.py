@@ -0,0 +1,264 @@
+from datetime import timedelta
+from io import StringIO
+import threading
+import time
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import aging
+from core.models import (
+    AgingBalance,
+    Company,
+    Customer,
+    Invoice,
+    Receive,
+    Supplier,
+)
+
+RECEIVABLES_URL = reverse("core:aging-receivables")
+PAYABLES_URL = reverse("core:aging-payables")
+
+
+class AgingTest(TestCase):
+    """Test the aging reports of the receivables and payables"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.other_customer = Customer.objects.create(
+            company=self.company, name="othercustomer"
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.today = timezone.localdate()
+        self.count = 0
+
+    def document(self, model, age, amount, status="UPD", **fields):
+        self.count += 1
+        with self.captureOnCommitCallbacks(execute=True):
+            return model.objects.create(
+                company=fields.pop("company", self.company),
+                reference=f"D-{self.count}",
+                date=self.today - timedelta(days=age),
+                status=status,
+                gst_rate="0",
+                discount_rate="0",
+                gst_amount="0",
+                discount_amount="0",
+                net=amount,
+                total_amount=amount,
+                grand_total=amount,
+                **fields,
+            )
+
+    def invoice(self, age, amount, **fields):
+        fields.setdefault("customer", self.customer)
+        return self.document(
+            Invoice,
+            age,
+            amount,
+            credits_applied="0",
+            balance_due=amount,
+            **fields,
+        )
+
+    def receivables(self, **params):
+        res = self.client.get(RECEIVABLES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_receivables(self):
+        """Test the balances of the customers by age"""
+        for age, amount in ((0, "1"), (30, "2"), (31, "4"), (61, "8")):
+            self.invoice(age, amount)
+        self.invoice(91, "16")
+        self.invoice(200, "32", customer=self.other_customer)
+        self.invoice(0, "64", status="PD")
+        self.invoice(0, "128", company=Company.objects.create(name="other"))
+
+        data = self.receivables()
+
+        self.assertEqual(data["as_of"], str(self.today))
+        self.assertEqual(
+            [dict(row) for row in data["results"]],
+            [
+                {
+                    "id": self.customer.pk,
+                    "name": "testcustomer",
+                    "current": "3.00",
+                    "days_31_60": "4.00",
+                    "days_61_90": "8.00",
+                    "over_90": "16.00",
+                    "total": "31.00",
+                },
+                {
+                    "id": self.other_customer.pk,
+                    "name": "othercustomer",
+                    "current": "0.00",
+                    "days_31_60": "0.00",
+                    "days_61_90": "0.00",
+                    "over_90": "32.00",
+                    "total": "32.00",
+                },
+            ],
+        )
+        self.assertEqual(data["totals"]["total"], "63.00")
+
+    def test_refreshed_on_changes(self):
+        """Test that the balances of the documents changed are refreshed"""
+        invoice = self.invoice(0, "10")
+        self.invoice(0, "5", customer=self.other_customer)
+        self.receivables()
+        AgingBalance.objects.update(as_of=self.today - timedelta(days=1))
+
+        self.invoice(40, "20")
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.customer = self.other_customer
+            invoice.save()
+
+        data = self.receivables()
+        # the balances stay as of the day of the last full refresh
+        self.assertEqual(data["as_of"], str(self.today - timedelta(days=1)))
+        self.assertEqual(
+            [(row["id"], row["total"]) for row in data["results"]],
+            [(self.customer.pk, "20.00"), (self.other_customer.pk, "15.00")],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Invoice.objects.filter(customer=self.other_customer).delete()
+        data = self.receivables()
+        self.assertEqual(
+            [(row["id"], row["total"]) for row in data["results"]],
+            [(self.customer.pk, "20.00")],
+        )
+
+    def test_refresh_command(self):
+        """Test that the command recomputes the balances as of today"""
+        self.invoice(29, "10")
+        self.receivables()
+        AgingBalance.objects.update(as_of=self.today - timedelta(days=5))
+        out = StringIO()
+
+        call_command("refresh_aging", stdout=out)
+
+        self.assertIn("1 company(s) refreshed", out.getvalue())
+        balance = AgingBalance.objects.get()
+        self.assertEqual(balance.as_of, self.today)
+        self.assertEqual(balance.current, 10)
+
+    def test_live(self):
+        """Test computing the balances without materializing them"""
+        self.invoice(0, "10")
+
+        data = self.receivables(live="true")
+
+        self.assertEqual(data["totals"]["current"], "10.00")
+        self.assertFalse(AgingBalance.objects.exists())
+
+    def test_payables(self):
+        """Test the balances of the suppliers by age"""
+        supplier = Supplier.objects.create(
+            company=self.company, name="testsupplier"
+        )
+        self.document(Receive, 70, "10", supplier=supplier)
+        self.document(Receive, 0, "20", supplier=supplier, status="PD")
+
+        res = self.client.get(PAYABLES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        (row,) = res.data["results"]
+        self.assertEqual(row["name"], "testsupplier")
+        self.assertEqual(row["days_61_90"], "10.00")
+        self.assertEqual(row["total"], "10.00")
+
+    def test_one_balance_per_party(self):
+        """Test that a party has one balance, refreshed in place"""
+        self.invoice(0, "10")
+        self.invoice(0, "5", customer=None)
+        self.receivables()
+
+        for parties in ({self.customer.pk}, {self.customer.pk, None}):
+            aging.refresh(AgingBalance.Ledger.RECEIVABLE, self.company.pk)
+            aging.refresh(
+                AgingBalance.Ledger.RECEIVABLE, self.company.pk, parties
+            )
+        self.assertEqual(AgingBalance.objects.count(), 2)
+
+        for balance in AgingBalance.objects.all():
+            balance.pk = None
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                balance.save()
+
+    def test_login_required(self):
+        """Test that login is required for the reports"""
+        res = APIClient().get(RECEIVABLES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@skipUnless(
+    connection.vendor == "postgresql", "Concurrent transactions of postgresql"
+)
+class ConcurrentRefreshTest(TransactionTestCase):
+    """Test refreshing the balances from concurrent transactions"""
+
+    def test_concurrent_refreshes(self):
+        """Test that concurrent refreshes of a party leave one balance"""
+        company = Company.objects.create(name="testcompany")
+        customer = Customer.objects.create(company=company, name="customer")
+        Invoice.objects.create(
+            company=company,
+            customer=customer,
+            reference="INV-1",
+            date=timezone.localdate(),
+            status="UPD",
+            gst_rate="0",
+            discount_rate="0",
+            gst_amount="0",
+            discount_amount="0",
+            net="10",
+            total_amount="10",
+            grand_total="10",
+            credits_applied="0",
+            balance_due="10",
+        )
+        ledger = AgingBalance.Ledger.RECEIVABLE
+        aging.refresh(ledger, company.pk)
+        refreshed = threading.Event()
+
+        def refresh_then_wait():
+            try:
+                with transaction.atomic():
+                    aging.refresh(ledger, company.pk, {customer.pk})
+                    refreshed.set()
+                    # the other refresh starts meanwhile
+                    time.sleep(0.5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=refresh_then_wait)
+        thread.start()
+        refreshed.wait(5)
+        aging.refresh(ledger, company.pk, {customer.pk})
+        thread.join()
+
+        self.assertEqual(
+            AgingBalance.objects.filter(party_id=customer.pk).count(), 1
+        )
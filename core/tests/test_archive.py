@@ -0,0 +1,320 @@
+from io import StringIO
+import os
+import shutil
+import tempfile
+from unittest import mock, skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import archive
+from core.models import (
+    ArchivedDocument,
+    Company,
+    CreditNote,
+    CreditsApplication,
+    Customer,
+    Invoice,
+    InvoiceItem,
+    Product,
+    ProductCategory,
+    PurchaseOrder,
+    Receive,
+    Supplier,
+)
+
+ARCHIVED_DOCUMENTS_URL = reverse("core:archived-documents")
+
+AMOUNTS = {
+    "gst_rate": "0.07",
+    "discount_rate": "0",
+    "gst_amount": "0",
+    "discount_amount": "0",
+    "net": "10",
+    "total_amount": "10",
+    "grand_total": "10",
+}
+
+
+class ArchiveTest(TestCase):
+    """Test the archival and rehydration of documents"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            ARCHIVE={
+                "STORAGE": "django.core.files.storage.FileSystemStorage",
+                "STORAGE_OPTIONS": {"location": media_root},
+                "CODEC": "gzip",
+            }
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.supplier = Supplier.objects.create(
+            company=self.company, name="testsupplier"
+        )
+        self.product = Product.objects.create(
+            reference="P-0001",
+            category=ProductCategory.objects.create(
+                company=self.company, name="testcategory"
+            ),
+            supplier=self.supplier,
+            name="testproduct",
+            unit="pc",
+            cost="1",
+            unit_price="2",
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_invoice(self, reference, date="2001-01-10", status="PD"):
+        invoice = Invoice.objects.create(
+            reference=reference,
+            date=date,
+            customer=self.customer,
+            status=status,
+            company=self.company,
+            credits_applied="0.00",
+            balance_due="0.00",
+            **AMOUNTS,
+        )
+        InvoiceItem.objects.create(
+            invoice=invoice,
+            product=self.product,
+            unit="pc",
+            unit_price="2",
+            quantity=5,
+            amount="10",
+        )
+        return invoice
+
+    def create_credit_note(self, reference, invoice=None):
+        return CreditNote.objects.create(
+            reference=reference,
+            date="2001-01-10",
+            customer=self.customer,
+            status="CL",
+            company=self.company,
+            created_from=invoice,
+            credits_used="10",
+            refund="0",
+            credits_remaining="0",
+            **AMOUNTS,
+        )
+
+    def archive_all(self):
+        call_command("archive_documents", stdout=StringIO())
+
+    def test_archive_documents(self):
+        """Test that old closed documents are replaced by stubs"""
+        old = self.create_invoice("INV-1")
+        unpaid = self.create_invoice("INV-2", status="UPD")
+        recent = self.create_invoice("INV-3", date="2099-01-10")
+
+        self.archive_all()
+
+        self.assertQuerysetEqual(
+            Invoice.objects.order_by("pk"),
+            [unpaid, recent],
+            transform=lambda invoice: invoice,
+        )
+        self.assertFalse(InvoiceItem.objects.filter(invoice=old.pk).exists())
+        stub = ArchivedDocument.objects.get()
+        self.assertEqual(
+            (stub.document_type, stub.document_id, stub.reference),
+            ("core.invoice", old.pk, "INV-1"),
+        )
+        self.assertTrue(stub.archive.endswith(".jsonl.gz"))
+        record = archive.read_record(
+            stub, archive.get_storage(archive.get_config())
+        )
+        self.assertEqual(len(record["objects"]), 2)
+
+    @skipIf(archive.zstandard is None, "zstandard isn't installed")
+    def test_zstd(self):
+        """Test archiving with zstd, the default codec"""
+        self.create_invoice("INV-1")
+
+        with override_settings(
+            ARCHIVE={**archive.get_config(), "CODEC": "zstd"}
+        ):
+            self.archive_all()
+            stub = ArchivedDocument.objects.get()
+            record = archive.read_record(
+                stub, archive.get_storage(archive.get_config())
+            )
+
+        self.assertTrue(stub.archive.endswith(".jsonl.zst"))
+        self.assertEqual(record["objects"][0]["fields"]["reference"], "INV-1")
+
+    def test_rolled_back(self):
+        """Test that the files of a failed batch are deleted"""
+        invoice = self.create_invoice("INV-1")
+        storage = archive.get_storage(archive.get_config())
+
+        with mock.patch.object(
+            ArchivedDocument.objects,
+            "bulk_create",
+            side_effect=DatabaseError,
+        ):
+            with self.assertRaises(DatabaseError):
+                self.archive_all()
+
+        self.assertTrue(Invoice.objects.filter(pk=invoice.pk).exists())
+        self.assertEqual(
+            [files for _, _, files in os.walk(storage.location) if files], []
+        )
+
+        self.archive_all()
+
+        self.assertEqual(
+            ArchivedDocument.objects.get().document_id, invoice.pk
+        )
+
+    def test_dry_run(self):
+        """Test that --dry-run only counts the documents"""
+        self.create_invoice("INV-1")
+        out = StringIO()
+
+        call_command("archive_documents", "--dry-run", stdout=out)
+
+        self.assertIn("1 invoices to archive", out.getvalue())
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertFalse(ArchivedDocument.objects.exists())
+
+    def test_retrieve_rehydrates(self):
+        """Test that retrieving an archived document restores it"""
+        invoice = self.create_invoice("INV-1")
+        credit_note = self.create_credit_note("CN-1", invoice=invoice)
+        self.archive_all()
+        self.assertFalse(CreditNote.objects.exists())
+
+        res = self.client.get(
+            reverse("customer:invoice-detail", args=[invoice.pk])
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["reference"], "INV-1")
+        self.assertEqual(
+            InvoiceItem.objects.filter(invoice=invoice).count(), 1
+        )
+        # the archived credit note is linked back once rehydrated
+        self.assertFalse(
+            ArchivedDocument.objects.filter(
+                document_id=invoice.pk, document_type="core.invoice"
+            ).exists()
+        )
+
+        res = self.client.get(
+            reverse("customer:creditnote-detail", args=[credit_note.pk])
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        credit_note.refresh_from_db()
+        self.assertEqual(credit_note.created_from, invoice)
+        self.assertFalse(ArchivedDocument.objects.exists())
+
+    def test_references_restored(self):
+        """Test that the links to an archived document are restored"""
+        purchase_order = PurchaseOrder.objects.create(
+            reference="PO-1",
+            date="2001-01-10",
+            supplier=self.supplier,
+            company=self.company,
+            status="CP",
+            **AMOUNTS,
+        )
+        receive = Receive.objects.create(
+            reference="R-1",
+            date="2001-01-10",
+            supplier=self.supplier,
+            company=self.company,
+            purchase_order=purchase_order,
+            status="UPD",
+            **AMOUNTS,
+        )
+
+        self.archive_all()
+        receive.refresh_from_db()
+        self.assertIsNone(receive.purchase_order)
+
+        res = self.client.get(
+            reverse("supplier:purchaseorder-detail", args=[purchase_order.pk])
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        receive.refresh_from_db()
+        self.assertEqual(receive.purchase_order, purchase_order)
+
+    def test_applied_credit_note_waits_for_invoice(self):
+        """Test that a credit note is archived with the invoices it paid"""
+        invoice = self.create_invoice("INV-1", date="2099-01-10")
+        credit_note = self.create_credit_note("CN-1")
+        CreditsApplication.objects.create(
+            invoice=invoice,
+            credit_note=credit_note,
+            amount_to_credit="10",
+            date="2099-01-10",
+        )
+
+        self.archive_all()
+
+        self.assertTrue(CreditNote.objects.filter(pk=credit_note.pk).exists())
+
+        Invoice.objects.filter(pk=invoice.pk).update(date="2001-01-10")
+        self.archive_all()
+
+        self.assertFalse(CreditNote.objects.exists())
+        self.assertFalse(CreditsApplication.objects.exists())
+        self.assertEqual(ArchivedDocument.objects.count(), 2)
+
+    def test_missing_document(self):
+        """Test that a document never archived is still not found"""
+        res = self.client.get(reverse("customer:invoice-detail", args=[999]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_archived_reference_is_taken(self):
+        """Test that the reference of an archived document can't be reused"""
+        self.create_invoice("INV-1")
+        self.archive_all()
+
+        res = self.client.post(
+            reverse("customer:invoice-list"),
+            {"reference": "INV-1", "date": "2001-01-10"},
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_archived_documents(self):
+        """Test looking up the archived documents by reference"""
+        self.create_invoice("INV-1")
+        self.create_invoice("INV-2")
+        self.archive_all()
+
+        res = self.client.get(ARCHIVED_DOCUMENTS_URL, {"reference": "INV-2"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [document["reference"] for document in res.data["results"]],
+            ["INV-2"],
+        )
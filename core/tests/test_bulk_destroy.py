@@ -0,0 +1,278 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import deletion
+from core.models import (
+    Company,
+    CreditNote,
+    CreditsApplication,
+    Customer,
+    Invoice,
+    InvoiceItem,
+    Product,
+    ProductCategory,
+    Supplier,
+)
+from customer.views import InvoiceViewSet
+
+INVOICE_URL = reverse("customer:invoice-list")
+CREDIT_NOTE_URL = reverse("customer:creditnote-list")
+SUPPLIER_URL = reverse("supplier:supplier-list")
+
+AMOUNTS = {
+    "gst_rate": "0.07",
+    "discount_rate": "0",
+    "gst_amount": "0",
+    "discount_amount": "0",
+    "net": "10",
+    "total_amount": "10",
+    "grand_total": "10",
+}
+
+
+class BulkDestroyTest(TestCase):
+    """Test destroying records in bulk"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer", unused_credits="5"
+        )
+        self.supplier = Supplier.objects.create(
+            company=self.company, name="testsupplier"
+        )
+        self.product = Product.objects.create(
+            reference="P-0001",
+            category=ProductCategory.objects.create(
+                company=self.company, name="testcategory"
+            ),
+            supplier=self.supplier,
+            name="testproduct",
+            unit="pc",
+            cost="1",
+            unit_price="2",
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_invoice(self, reference, company=None):
+        invoice = Invoice.objects.create(
+            reference=reference,
+            date="2001-01-10",
+            customer=self.customer,
+            status="UPD",
+            company=company or self.company,
+            credits_applied="0.00",
+            balance_due="10.00",
+            **AMOUNTS,
+        )
+        InvoiceItem.objects.create(
+            invoice=invoice,
+            product=self.product,
+            unit="pc",
+            unit_price="2",
+            quantity=5,
+            amount="10",
+        )
+        return invoice
+
+    def create_credit_note(self, reference, used="0", remaining="10"):
+        return CreditNote.objects.create(
+            reference=reference,
+            date="2001-01-10",
+            customer=self.customer,
+            status="OP",
+            company=self.company,
+            credits_used=used,
+            refund="0",
+            credits_remaining=remaining,
+            **AMOUNTS,
+        )
+
+    def delete(self, url, ids):
+        return self.client.delete(url, ids, format="json")
+
+    def test_bulk_destroy_invoices(self):
+        """Test deleting invoices with their line items"""
+        invoices = [self.create_invoice(f"INV-{i}") for i in range(3)]
+
+        res = self.delete(
+            INVOICE_URL, [invoices[0].pk, {"id": invoices[1].pk}]
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Invoice.objects.all()), [invoices[2]])
+        self.assertEqual(InvoiceItem.objects.count(), 1)
+
+    def test_queries_independent_of_count(self):
+        """Test that the records are deleted by sets, not one by one"""
+        counts = []
+        for size in (2, 10):
+            ids = [
+                self.create_invoice(f"INV-{size}-{i}").pk for i in range(size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                res = self.delete(INVOICE_URL, ids)
+            self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_chunks(self):
+        """Test that the records are deleted by chunks"""
+        ids = [self.create_invoice(f"INV-{i}").pk for i in range(5)]
+
+        with mock.patch.object(
+            InvoiceViewSet, "bulk_destroy_chunk_size", 2
+        ), mock.patch(
+            "core.deletion.get_protected", wraps=deletion.get_protected
+        ) as get_protected:
+            res = self.delete(INVOICE_URL, ids)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Invoice.objects.exists())
+        self.assertEqual(get_protected.call_count, 3)
+
+    def test_failed_chunk(self):
+        """Test that the ids of a chunk failing are reported"""
+        ids = [self.create_invoice(f"INV-{i}").pk for i in range(5)]
+
+        with mock.patch.object(
+            InvoiceViewSet, "bulk_destroy_chunk_size", 2
+        ), mock.patch(
+            "core.deletion.get_protected",
+            side_effect=[{}, DatabaseError("deadlock detected"), {}],
+        ), self.assertLogs("core.deletion", "ERROR"):
+            res = self.delete(INVOICE_URL, ids)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["deleted"], [*ids[:2], ids[4]])
+        self.assertEqual(
+            res.data["errors"],
+            dict.fromkeys(ids[2:4], ["Could not be deleted, try again."]),
+        )
+        self.assertEqual(
+            list(Invoice.objects.values_list("pk", flat=True).order_by("pk")),
+            ids[2:4],
+        )
+
+    def test_invoice_credits_released(self):
+        """Test that the credits applied to invoices are given back"""
+        credit_note = self.create_credit_note("CN-1", used="8", remaining="2")
+        invoices = [self.create_invoice(f"INV-{i}") for i in range(2)]
+        for invoice in invoices:
+            CreditsApplication.objects.create(
+                invoice=invoice,
+                credit_note=credit_note,
+                amount_to_credit="4",
+                date="2001-01-10",
+            )
+
+        res = self.delete(INVOICE_URL, [invoice.pk for invoice in invoices])
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(CreditsApplication.objects.exists())
+        credit_note.refresh_from_db()
+        self.assertEqual(credit_note.credits_used, Decimal("0"))
+        self.assertEqual(credit_note.credits_remaining, Decimal("10"))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.unused_credits, Decimal("13"))
+
+    def test_single_delete_releases_credits(self):
+        """Test that deleting one record releases as the bulk delete does"""
+        credit_note = self.create_credit_note("CN-1", used="4", remaining="6")
+        invoice = self.create_invoice("INV-1")
+        CreditsApplication.objects.create(
+            invoice=invoice,
+            credit_note=credit_note,
+            amount_to_credit="4",
+            date="2001-01-10",
+        )
+
+        res = self.client.delete(f"{INVOICE_URL}{invoice.pk}/")
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Invoice.objects.exists())
+        credit_note.refresh_from_db()
+        self.assertEqual(credit_note.credits_remaining, Decimal("10"))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.unused_credits, Decimal("9"))
+
+        res = self.client.delete(f"{CREDIT_NOTE_URL}{credit_note.pk}/")
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.unused_credits, Decimal("-1"))
+
+    def test_protected_credit_note(self):
+        """Test that credit notes applied to invoices are reported"""
+        applied = self.create_credit_note("CN-1")
+        unused = self.create_credit_note("CN-2", remaining="3")
+        CreditsApplication.objects.create(
+            invoice=self.create_invoice("INV-1"),
+            credit_note=applied,
+            amount_to_credit="4",
+            date="2001-01-10",
+        )
+
+        res = self.delete(CREDIT_NOTE_URL, [applied.pk, unused.pk, 999])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["deleted"], [unused.pk])
+        self.assertEqual(
+            res.data["errors"],
+            {
+                applied.pk: ["Referenced by 1 credits application"],
+                999: ["Not found."],
+            },
+        )
+        self.assertEqual(list(CreditNote.objects.all()), [applied])
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.unused_credits, Decimal("2"))
+
+    def test_other_company(self):
+        """Test that the records of other companies are not deleted"""
+        other = self.create_invoice(
+            "INV-1", company=Company.objects.create(name="othercompany")
+        )
+
+        res = self.delete(INVOICE_URL, [other.pk])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["errors"], {other.pk: ["Not found."]})
+        self.assertTrue(Invoice.objects.filter(pk=other.pk).exists())
+
+    def test_cascade(self):
+        """Test that deleting master data cascades in bulk"""
+        self.create_invoice("INV-1")
+
+        res = self.delete(SUPPLIER_URL, [self.supplier.pk])
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(InvoiceItem.objects.exists())
+
+    def test_ids_required(self):
+        """Test that a bulk destroy without ids is rejected"""
+        self.create_invoice("INV-1")
+
+        for data in (None, [], {"id": 1}, ["a"], [{}]):
+            res = self.delete(INVOICE_URL, data)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertTrue(Invoice.objects.exists())
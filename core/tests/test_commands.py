@@ -1,9 +1,36 @@
+from datetime import date
+from io import StringIO
+import json
+import os
+import shutil
+import tempfile
+from unittest import skipIf, skipUnless
 from unittest.mock import patch
 
+from django.core.handlers.wsgi import WSGIHandler
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from api import gunicorn_conf
+from core.management.commands import partition_tables
+from core.models import (
+    Company,
+    CreditNote,
+    CreditsApplication,
+    Customer,
+    Invoice,
+    InvoiceItem,
+    Product,
+    PurchaseOrder,
+    Receive,
+    SalesOrder,
+    User,
+    UserConfig,
+)
+
 
 class MockConnection:
     # TODO: review this
@@ -27,3 +54,344 @@ class CommandTests(TestCase):
             call_command("wait_for_db")
 
             self.assertEqual(gi.call_count, 6)
+
+
+class GenerateTenantDataTests(TestCase):
+    """Test generating tenants for performance testing"""
+
+    options = {
+        "companies": 2,
+        "customers": 5,
+        "suppliers": 3,
+        "categories": 2,
+        "products": 10,
+        "employees": 3,
+        "roles": 2,
+        "sales_orders": 20,
+        "invoices": 30,
+        "credit_notes": 6,
+        "purchase_orders": 8,
+        "receives": 10,
+        "batch_size": 7,
+        "seed": "test",
+        "stdout": StringIO(),
+    }
+
+    def _snapshot(self):
+        return {
+            model.__name__: list(
+                model.objects.order_by("pk").values_list(*fields)
+            )
+            for model, fields in [
+                (Company, ("name", "city")),
+                (User, ("email", "name", "designation__name")),
+                (Customer, ("reference", "name", "unused_credits")),
+                (Product, ("reference", "name", "unit_price")),
+                (
+                    Invoice,
+                    (
+                        "reference",
+                        "customer__reference",
+                        "sales_order__reference",
+                        "grand_total",
+                        "balance_due",
+                    ),
+                ),
+                (InvoiceItem, ("invoice__reference", "product__reference")),
+                (CreditNote, ("reference", "created_from__reference")),
+                (Receive, ("reference", "purchase_order__reference")),
+            ]
+        }
+
+    def test_generate_tenant_data(self):
+        """Test that the counts and stored totals are consistent"""
+        call_command("generate_tenant_data", **self.options)
+
+        self.assertEqual(Company.objects.count(), 2)
+        company = Company.objects.order_by("pk").first()
+        self.assertEqual(Customer.objects.filter(company=company).count(), 5)
+        self.assertEqual(User.objects.filter(company=company).count(), 4)
+        self.assertEqual(UserConfig.objects.count(), 8)
+        self.assertEqual(Invoice.objects.filter(company=company).count(), 30)
+        self.assertEqual(
+            SalesOrder.objects.filter(company=company).count(), 20
+        )
+        self.assertEqual(CreditNote.objects.filter(company=company).count(), 6)
+        self.assertEqual(Receive.objects.filter(company=company).count(), 10)
+        self.assertEqual(
+            PurchaseOrder.objects.filter(company=company).count(), 8
+        )
+        self.assertTrue(
+            Invoice.objects.filter(sales_order__isnull=False).exists()
+        )
+        self.assertTrue(CreditsApplication.objects.exists())
+
+        for invoice in Invoice.objects.prefetch_related(
+            "invoiceitem_set", "creditsapplication_set"
+        ):
+            amounts = [item.amount for item in invoice.invoiceitem_set.all()]
+            self.assertTrue(amounts)
+            self.assertEqual(
+                {item.document_date for item in invoice.invoiceitem_set.all()},
+                {invoice.date},
+            )
+            self.assertEqual(invoice.total_amount, sum(amounts))
+            self.assertEqual(
+                invoice.credits_applied,
+                sum(
+                    application.amount_to_credit
+                    for application in invoice.creditsapplication_set.all()
+                ),
+            )
+            self.assertEqual(
+                invoice.balance_due,
+                invoice.grand_total - invoice.credits_applied,
+            )
+
+        for customer in Customer.objects.all():
+            self.assertEqual(
+                customer.unused_credits,
+                sum(
+                    credit_note.credits_remaining
+                    for credit_note in customer.creditnote_set.all()
+                ),
+            )
+
+    def test_generate_tenant_data_is_deterministic(self):
+        """Test that the same seed generates the same data"""
+        call_command("generate_tenant_data", **self.options)
+        snapshot = self._snapshot()
+
+        CreditsApplication.objects.all().delete()
+        Company.objects.all().delete()
+        User.objects.all().delete()
+        call_command("generate_tenant_data", **self.options)
+
+        self.assertEqual(self._snapshot(), snapshot)
+
+    def test_generate_tenant_data_twice_with_same_seed(self):
+        """Test that a seed can't be generated twice"""
+        call_command("generate_tenant_data", **self.options)
+
+        with self.assertRaises(CommandError):
+            call_command("generate_tenant_data", **self.options)
+
+
+class BenchmarkEndpointsTests(TestCase):
+    """Test benchmarking the api endpoints"""
+
+    def setUp(self):
+        call_command(
+            "generate_tenant_data",
+            customers=3,
+            suppliers=2,
+            categories=1,
+            products=3,
+            employees=1,
+            roles=1,
+            sales_orders=2,
+            invoices=2,
+            credit_notes=0,
+            purchase_orders=1,
+            receives=1,
+            seed="bench",
+            stdout=StringIO(),
+        )
+        self.output = os.path.join(tempfile.mkdtemp(), "benchmark.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.output))
+
+    def _benchmark(self, **options):
+        call_command(
+            "benchmark_endpoints",
+            seed="bench",
+            iterations=2,
+            warmup=0,
+            endpoints=["customers"],
+            output=self.output,
+            stdout=StringIO(),
+            stderr=StringIO(),
+            **options,
+        )
+        with open(self.output) as f:
+            return json.load(f)
+
+    def test_benchmark_endpoints(self):
+        """Test that the results of every action are recorded"""
+        results = self._benchmark()
+
+        self.assertEqual(
+            set(results["endpoints"]),
+            {
+                "customers list",
+                "customers retrieve",
+                "customers create",
+                "customers bulk_create",
+                "customers update",
+            },
+        )
+        for result in results["endpoints"].values():
+            self.assertLess(result["status"], 300)
+            self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+            self.assertGreater(result["queries"], 0)
+            self.assertGreater(result["peak_memory_kb"], 0)
+        # writes are rolled back
+        self.assertFalse(Customer.objects.filter(reference__contains="BENCH"))
+
+    def test_benchmark_endpoints_query_budget(self):
+        """Test that exceeding a query budget fails the benchmark"""
+        with self.settings(
+            ENDPOINT_BENCHMARK={
+                "ENDPOINT_QUERY_BUDGETS": {"customers list": 0}
+            }
+        ):
+            with self.assertRaisesRegex(CommandError, "1 benchmark check"):
+                self._benchmark()
+
+    def test_benchmark_endpoints_replicas(self):
+        """Test that the queries of every database are counted"""
+        queries = self._benchmark()["endpoints"]["customers list"]["queries"]
+
+        # a replica standing for the default database
+        with patch(
+            "core.management.commands.benchmark_endpoints.connections"
+        ) as connections:
+            connections.all.return_value = [connection, connection]
+            results = self._benchmark()
+
+        self.assertEqual(
+            results["endpoints"]["customers list"]["queries"], queries * 2
+        )
+
+    def test_benchmark_endpoints_baseline(self):
+        """Test that regressions from the baseline fail the benchmark"""
+        baseline = self._benchmark()
+        baseline["endpoints"]["customers list"]["queries"] -= 1
+        baseline["endpoints"]["customers update"]["p50_ms"] = 0
+        with open(self.output, "w") as f:
+            json.dump(baseline, f)
+
+        # only the zeroed p50 can exceed such a threshold
+        with self.settings(
+            ENDPOINT_BENCHMARK={
+                "LATENCY_REGRESSION": 1000,
+                "LATENCY_NOISE_MS": 0,
+            }
+        ):
+            with self.assertRaisesRegex(CommandError, "2 benchmark check"):
+                self._benchmark(baseline=self.output)
+
+
+@patch("gunicorn.app.base.BaseApplication.run", autospec=True)
+class ServeTests(TestCase):
+    """Test serving the api with gunicorn"""
+
+    def test_serve_defaults(self, run):
+        """Test that the defaults of the gunicorn config are used"""
+        call_command("serve")
+
+        cfg = run.call_args[0][0].cfg
+        self.assertEqual(cfg.workers, gunicorn_conf.default_workers())
+        self.assertEqual(cfg.max_requests, 1000)
+        self.assertTrue(cfg.preload_app)
+        self.assertEqual(cfg.pre_fork, gunicorn_conf.pre_fork)
+
+    def test_serve_options(self, run):
+        """Test that the options override the gunicorn config"""
+        call_command(
+            "serve",
+            bind="127.0.0.1:8000",
+            workers=2,
+            max_requests=10,
+            preload=False,
+        )
+
+        cfg = run.call_args[0][0].cfg
+        self.assertEqual(cfg.bind, ["127.0.0.1:8000"])
+        self.assertEqual(cfg.workers, 2)
+        self.assertEqual(cfg.max_requests, 10)
+        self.assertFalse(cfg.preload_app)
+
+    def test_serve_reload_disables_preload(self, run):
+        """Test that the preloaded app isn't kept when reloading code"""
+        call_command("serve", reload=True)
+
+        cfg = run.call_args[0][0].cfg
+        self.assertTrue(cfg.reload)
+        self.assertFalse(cfg.preload_app)
+
+    def test_serve_loads_the_wsgi_application(self, run):
+        """Test that the workers serve the django application"""
+        call_command("serve")
+
+        self.assertIsInstance(run.call_args[0][0].load(), WSGIHandler)
+
+
+class PartitionTablesTests(TestCase):
+    """Test partitioning the document tables"""
+
+    def test_month_ranges(self):
+        """Test that the partition bounds cover whole months"""
+        self.assertEqual(
+            list(
+                partition_tables.month_ranges(
+                    date(2020, 11, 15), date(2021, 1, 1)
+                )
+            ),
+            [
+                (date(2020, 11, 1), date(2020, 12, 1)),
+                (date(2020, 12, 1), date(2021, 1, 1)),
+                (date(2021, 1, 1), date(2021, 2, 1)),
+            ],
+        )
+        self.assertEqual(
+            partition_tables.partition_name("core_invoice", date(2021, 1, 1)),
+            "core_invoice_2021_01",
+        )
+
+    @skipIf(connection.vendor == "postgresql", "Partitions postgresql")
+    def test_requires_postgresql(self):
+        """Test that other databases are refused"""
+        with self.assertRaises(CommandError):
+            call_command("partition_tables", stdout=StringIO())
+
+    @skipUnless(connection.vendor == "postgresql", "Partitions postgresql")
+    def test_convert(self):
+        """Test converting seeded tables, then pruning their partitions"""
+        call_command(
+            "generate_tenant_data",
+            **{**GenerateTenantDataTests.options, "days": 60},
+        )
+        counts = {
+            model: model.objects.count()
+            for model, _ in partition_tables.PARTITIONED
+        }
+        receive = Receive.objects.exclude(purchase_order=None).first()
+        with connection.cursor() as cursor:
+            # ALTER TABLE refuses the tables with deferred checks pending
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        call_command(
+            "partition_tables",
+            convert=True,
+            check_pruning=True,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT partrelid::regclass::text FROM pg_partitioned_table"
+            )
+            partitioned = {table for table, in cursor.fetchall()}
+        for model, _ in partition_tables.PARTITIONED:
+            self.assertIn(model._meta.db_table, partitioned)
+            self.assertEqual(model.objects.count(), counts[model])
+        # the same receive and purchase order on the same day
+        receive.pk = None
+        receive.reference = "RE-DUPLICATE"
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            receive.save()
+
+        out = StringIO()
+        call_command("partition_tables", stdout=out, stderr=StringIO())
+        self.assertIn("core_invoice: 0 partition(s) created", out.getvalue())
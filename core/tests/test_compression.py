@@ -0,0 +1,191 @@
+import gzip
+import json
+from unittest import mock, skipIf
+
+from django.contrib.auth import get_user_model
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.middleware import CompressionMiddleware
+from core.middleware import compression
+from core.models import Company, Customer
+
+CONTENT = json.dumps([{"id": i, "name": f"customer {i}"} for i in range(200)])
+
+
+def respond(response, accept_encoding="gzip, deflate, br"):
+    request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+    return CompressionMiddleware(lambda request: response)(request)
+
+
+def json_response(content=CONTENT):
+    return HttpResponse(content, content_type="application/json")
+
+
+class CompressionMiddlewareTest(SimpleTestCase):
+    """Test compressing the responses"""
+
+    def test_compress(self):
+        """Test compressing a response with gzip"""
+        response = json_response()
+        response["ETag"] = '"abc"'
+
+        response = respond(response, "gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), CONTENT.encode())
+        self.assertEqual(
+            response["Content-Length"], str(len(response.content))
+        )
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    def test_negotiate(self):
+        """Test choosing the encoding the client prefers"""
+        encodings = ["br", "gzip"]
+        for accept_encoding, encoding in (
+            ("gzip, deflate, br", "br"),
+            ("gzip;q=1.0, br;q=0.5", "gzip"),
+            ("GZIP", "gzip"),
+            ("*", "br"),
+            ("br;q=0, *;q=0.1", "gzip"),
+            ("gzip;q=0", None),
+            ("identity", None),
+            ("", None),
+            ("gzip;q=x, br", "br"),
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(
+                    compression.negotiate(accept_encoding, encodings),
+                    encoding,
+                )
+
+    @mock.patch.object(compression, "brotli", None)
+    def test_without_brotli(self):
+        """Test that brotli isn't offered when it isn't installed"""
+        response = respond(json_response(), "br, gzip;q=0.5")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIsNone(
+            respond(json_response(), "br").get("Content-Encoding")
+        )
+
+    @skipIf(compression.brotli is None, "brotli isn't installed")
+    def test_brotli(self):
+        """Test compressing a response with brotli"""
+        response = respond(json_response(), "gzip, br")
+
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(
+            compression.brotli.decompress(response.content), CONTENT.encode()
+        )
+
+    def test_not_compressed(self):
+        """Test the responses left as they are"""
+        partial = json_response()
+        partial["Content-Range"] = "bytes 0-99/200"
+        encoded = json_response()
+        encoded["Content-Encoding"] = "identity"
+        for response in (
+            json_response(CONTENT[:1000]),
+            HttpResponse(b"\x89PNG" * 1000, content_type="image/png"),
+            HttpResponse(b"x" * 4000, content_type="application/zip"),
+            partial,
+            encoded,
+        ):
+            with self.subTest(response=response):
+                content = response.content
+
+                response = respond(response)
+
+                self.assertNotEqual(response.get("Content-Encoding"), "gzip")
+                self.assertEqual(response.content, content)
+
+        response = respond(json_response(), "identity")
+
+        self.assertIsNone(response.get("Content-Encoding"))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+    def test_file(self):
+        """Test that the files sent with sendfile aren't compressed"""
+        response = FileResponse(
+            open(__file__, "rb"), content_type="text/plain"
+        )
+
+        response = respond(response)
+
+        self.assertIsNone(response.get("Content-Encoding"))
+        response.close()
+
+    def test_streaming(self):
+        """Test compressing a streaming response as it is streamed"""
+        chunks = [CONTENT[i:][:500].encode() for i in range(0, 5000, 500)]
+        response = StreamingHttpResponse(
+            iter(chunks), content_type="application/json"
+        )
+        response["Content-Length"] = "5000"
+
+        response = respond(response, "gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertFalse(response.has_header("Content-Length"))
+        self.assertEqual(
+            gzip.decompress(b"".join(response.streaming_content)),
+            b"".join(chunks),
+        )
+
+    @override_settings(
+        COMPRESSION={
+            "LEVELS": {
+                "application/json": {"gzip": 1, "br": 1},
+                "*": {"gzip": 6, "br": 5},
+            }
+        }
+    )
+    def test_levels(self):
+        """Test the levels by content type"""
+        with mock.patch.object(
+            compression.zlib, "compressobj", wraps=compression.zlib.compressobj
+        ) as compressobj:
+            respond(json_response(), "gzip")
+            respond(HttpResponse(CONTENT, content_type="text/csv"), "gzip")
+
+        self.assertEqual(
+            [call.args[0] for call in compressobj.call_args_list], [1, 6]
+        )
+
+    @override_settings(COMPRESSION={"ENABLED": False})
+    def test_disabled(self):
+        """Test that the responses aren't compressed when disabled"""
+        self.assertIsNone(respond(json_response()).get("Content-Encoding"))
+
+
+class CompressionAPITest(TestCase):
+    """Test compressing the responses of the api"""
+
+    def test_list(self):
+        """Test that a page of customers is compressed"""
+        company = Company.objects.create(name="testcompany")
+        user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=company,
+        )
+        Customer.objects.bulk_create(
+            Customer(company=company, reference=f"C-{i}", name=f"name {i}")
+            for i in range(50)
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.get(
+            reverse("customer:customer-list"), HTTP_ACCEPT_ENCODING="gzip"
+        )
+
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(res.content))["count"], 50)
@@ -0,0 +1,236 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Company,
+    Customer,
+    Invoice,
+    Product,
+    ProductCategory,
+    PurchaseOrder,
+    PurchaseOrderItem,
+    Receive,
+    SalesOrder,
+    SalesOrderItem,
+    Supplier,
+)
+
+SALES_ORDER_CONVERT_URL = reverse("customer:salesorder-bulk-convert")
+PURCHASE_ORDER_CONVERT_URL = reverse("supplier:purchaseorder-bulk-convert")
+
+
+def convert_url(pk):
+    return reverse("customer:salesorder-convert", args=[pk])
+
+
+class ConversionTest(TestCase):
+    """Test the conversion of the orders into invoices and receives"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.supplier = Supplier.objects.create(
+            company=self.company, name="testsupplier"
+        )
+        self.product = Product.objects.create(
+            reference="P-0001",
+            category=ProductCategory.objects.create(
+                company=self.company, name="testcategory"
+            ),
+            supplier=self.supplier,
+            name="testproduct",
+            unit="pc",
+            cost="1",
+            unit_price="2",
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_document(self, model, item_model, number, **fields):
+        document = model.objects.create(
+            company=self.company,
+            reference=f"{model.__name__}-{number}",
+            date="2001-01-10",
+            description="testdescription",
+            gst_rate="7",
+            discount_rate="10",
+            gst_amount="0",
+            discount_amount="0",
+            net="0",
+            total_amount="0",
+            grand_total="0",
+            **fields,
+        )
+        item_model.objects.bulk_create(
+            item_model(
+                product=self.product,
+                unit="pc",
+                unit_price="2.5",
+                quantity=quantity,
+                amount=Decimal("2.5") * quantity,
+                **{item_model.document_field: document},
+            )
+            for quantity in (3, 5)
+        )
+        return document
+
+    def create_sales_order(self, number=1, **fields):
+        return self.create_document(
+            SalesOrder,
+            SalesOrderItem,
+            number,
+            customer=self.customer,
+            salesperson=self.user,
+            **fields,
+        )
+
+    def test_convert_sales_order(self):
+        """Test creating an invoice from a sales order"""
+        sales_order = self.create_sales_order()
+
+        res = self.client.post(convert_url(sales_order.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        invoice = Invoice.objects.get(pk=res.data["id"])
+        self.assertEqual(invoice.sales_order, sales_order)
+        self.assertEqual(invoice.customer, self.customer)
+        self.assertEqual(invoice.salesperson, self.user)
+        self.assertEqual(invoice.description, "testdescription")
+        self.assertEqual(invoice.reference, "INV-00001")
+        self.assertEqual(
+            [
+                (item.quantity, item.amount, item.document_date)
+                for item in invoice.invoiceitem_set.order_by("pk")
+            ],
+            [
+                (3, Decimal("7.50"), invoice.date),
+                (5, Decimal("12.50"), invoice.date),
+            ],
+        )
+        # 20 less 10% discount, plus 7% gst
+        self.assertEqual(invoice.total_amount, Decimal("20"))
+        self.assertEqual(invoice.discount_amount, Decimal("2"))
+        self.assertEqual(invoice.net, Decimal("18"))
+        self.assertEqual(invoice.gst_amount, Decimal("1.26"))
+        self.assertEqual(invoice.grand_total, Decimal("19.26"))
+        self.assertEqual(invoice.balance_due, Decimal("19.26"))
+        self.assertEqual(res.data["grand_total"], "19.26")
+        sales_order.refresh_from_db()
+        self.assertEqual(sales_order.status, SalesOrder.Status.COMPLETED)
+
+    def test_convert_twice(self):
+        """Test that a sales order is only converted once"""
+        sales_order = self.create_sales_order()
+        self.client.post(convert_url(sales_order.pk))
+
+        res = self.client.post(convert_url(sales_order.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_convert_cancelled(self):
+        """Test that cancelled sales orders can't be converted"""
+        sales_order = self.create_sales_order(
+            status=SalesOrder.Status.CANCELLED
+        )
+
+        res = self.client.post(convert_url(sales_order.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_convert_other_company(self):
+        """Test that the sales orders of other companies are not found"""
+        sales_order = self.create_sales_order()
+        self.user.company = Company.objects.create(name="othercompany")
+        self.user.save()
+
+        res = self.client.post(convert_url(sales_order.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_convert(self):
+        """Test converting sales orders in a fixed number of queries"""
+        sales_orders = [self.create_sales_order(n) for n in range(10)]
+        converted = self.create_sales_order(10)
+        self.client.post(convert_url(converted.pk))
+        ids = [sales_order.pk for sales_order in sales_orders]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(
+                SALES_ORDER_CONVERT_URL,
+                ids + [converted.pk, 0],
+                format="json",
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(sorted(res.data["converted"]), ids)
+        self.assertEqual(
+            sorted(res.data["errors"]), [0, converted.pk], res.data
+        )
+        self.assertEqual(
+            Invoice.objects.filter(sales_order__in=ids).count(), 10
+        )
+        self.assertEqual(
+            set(
+                Invoice.objects.filter(sales_order__in=ids).values_list(
+                    "grand_total", flat=True
+                )
+            ),
+            {Decimal("19.26")},
+        )
+        self.assertLessEqual(len(queries), 15)
+
+    def test_bulk_convert_invalid(self):
+        """Test that the body must be a list of ids"""
+        res = self.client.post(
+            SALES_ORDER_CONVERT_URL, {"id": 1}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_convert_purchase_orders(self):
+        """Test receiving purchase orders"""
+        purchase_orders = [
+            self.create_document(
+                PurchaseOrder, PurchaseOrderItem, n, supplier=self.supplier
+            )
+            for n in range(2)
+        ]
+        ids = [purchase_order.pk for purchase_order in purchase_orders]
+
+        res = self.client.post(PURCHASE_ORDER_CONVERT_URL, ids, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        for purchase_order in purchase_orders:
+            purchase_order.refresh_from_db()
+            receive = purchase_order.receive
+            self.assertEqual(
+                receive.pk, res.data["converted"][purchase_order.pk]
+            )
+            self.assertEqual(receive.supplier, self.supplier)
+            self.assertEqual(receive.grand_total, Decimal("19.26"))
+            self.assertEqual(receive.receiveitem_set.count(), 2)
+            self.assertEqual(
+                purchase_order.status, PurchaseOrder.Status.COMPLETED
+            )
+        self.assertEqual(
+            sorted(Receive.objects.values_list("reference", flat=True)),
+            ["RCV-00001", "RCV-00002"],
+        )
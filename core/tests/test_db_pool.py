@@ -0,0 +1,225 @@
+import threading
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.db import pool as connection_pool
+
+DB_POOL_URL = reverse("core:db-pool")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**options):
+    return connection_pool.ConnectionPool(
+        connect=FakeConnection,
+        check=lambda connection: connection.healthy,
+        reset=lambda connection: not connection.closed,
+        close=FakeConnection.close,
+        **options,
+    )
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """Test the bounded connection pool"""
+
+    def test_released_connections_are_reused(self):
+        """Test that a released connection is handed out again"""
+        pool = make_pool()
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        self.assertIs(pool.getconn(), connection)
+        self.assertEqual(pool.stats()["opened"], 1)
+        self.assertEqual(pool.stats()["checked_out"], 1)
+
+    def test_size_is_bounded(self):
+        """Test that checking out past MAX_SIZE times out"""
+        pool = make_pool(MAX_SIZE=2, TIMEOUT=0.01)
+        pool.getconn()
+        pool.getconn()
+
+        with self.assertRaises(connection_pool.PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+        self.assertEqual(pool.stats()["size"], 2)
+
+    def test_waiting_thread_gets_released_connection(self):
+        """Test that a thread waits for a connection to be released"""
+        pool = make_pool(MAX_SIZE=1, TIMEOUT=5)
+        connection = pool.getconn()
+        checked_out = []
+        thread = threading.Thread(
+            target=lambda: checked_out.append(pool.getconn())
+        )
+        thread.start()
+        pool.putconn(connection)
+        thread.join()
+
+        self.assertEqual(checked_out, [connection])
+        self.assertGreater(pool.stats()["wait_ms_max"], 0)
+
+    def test_unhealthy_connections_are_replaced(self):
+        """Test that a connection failing its health check is discarded"""
+        pool = make_pool(HEALTH_CHECK_INTERVAL=0)
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.healthy = False
+
+        with self.assertLogs("core.db.pool", "WARNING"):
+            replacement = pool.getconn()
+
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["health_check_failures"], 1)
+
+    def test_recently_used_connections_are_not_checked(self):
+        """Test that the health check is skipped within its interval"""
+        pool = make_pool(HEALTH_CHECK_INTERVAL=60)
+        pool.putconn(pool.getconn())
+        pool.getconn()
+
+        self.assertEqual(pool.stats()["health_checks"], 0)
+
+    def test_broken_connections_are_not_kept(self):
+        """Test that a connection failing its reset is discarded"""
+        pool = make_pool()
+        connection = pool.getconn()
+        connection.closed = True
+        pool.putconn(connection)
+
+        self.assertEqual(pool.stats()["idle"], 0)
+        self.assertEqual(pool.stats()["size"], 0)
+
+    def test_idle_connections_expire(self):
+        """Test that connections idle for longer than MAX_IDLE are closed"""
+        pool = make_pool(MAX_IDLE=60)
+        first, second = pool.getconn(), pool.getconn()
+        pool.putconn(first)
+        pool.idle[0].released -= 120
+        pool.putconn(second)
+
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats()["idle"], 1)
+
+    def test_closeall(self):
+        """Test that closing the pool closes released connections too"""
+        pool = make_pool()
+        idle, checked_out = pool.getconn(), pool.getconn()
+        pool.putconn(idle)
+
+        pool.closeall()
+        pool.putconn(checked_out)
+
+        self.assertTrue(idle.closed)
+        self.assertTrue(checked_out.closed)
+        with self.assertRaises(connection_pool.PoolTimeout):
+            pool.getconn()
+
+    def test_concurrent_checkouts(self):
+        """Test that the threads never share a connection"""
+        pool = make_pool(MAX_SIZE=3, TIMEOUT=5)
+        in_use = set()
+        shared = []
+        lock = threading.Lock()
+
+        def work():
+            for _ in range(200):
+                connection = pool.getconn()
+                with lock:
+                    if connection in in_use:
+                        shared.append(connection)
+                    in_use.add(connection)
+                with lock:
+                    in_use.discard(connection)
+                pool.putconn(connection)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(shared, [])
+        stats = pool.stats()
+        self.assertLessEqual(stats["opened"], 3)
+        self.assertEqual(stats["checkouts"], 1600)
+        self.assertEqual(stats["checked_out"], 0)
+
+
+class DBPoolStatsViewTest(TestCase):
+    """Test the pool metrics endpoint"""
+
+    def test_requires_superuser(self):
+        """Test that company owners can't read the pool metrics"""
+        user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com", "password123", is_staff=True
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.get(DB_POOL_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_lists_pools(self):
+        """Test that the registered pools are listed with their metrics"""
+        superuser = get_user_model().objects.create_superuser(
+            "admin@crownkiraappdev.com", "password123"
+        )
+        client = APIClient()
+        client.force_authenticate(superuser)
+        key = ("test-pool", "testdb", "", "", "")
+        connection_pool.get_pool(key, make_pool)
+        self.addCleanup(connection_pool.pools.pop, key)
+
+        res = client.get(DB_POOL_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("test-pool", [stats["alias"] for stats in res.data])
+
+
+@skipUnless(
+    connection.settings_dict["ENGINE"] == "core.db.backends.postgresql",
+    "Requires the pooled postgresql backend",
+)
+class PooledBackendTest(TransactionTestCase):
+    """Test the postgresql backend using the pool"""
+
+    def test_connection_is_released_on_close(self):
+        """Test that closing the connection releases it to the pool"""
+        connection.ensure_connection()
+        raw = connection.connection
+        checked_out = connection.pool.stats()["checked_out"]
+
+        connection.close()
+        connection.ensure_connection()
+
+        self.assertIs(connection.connection, raw)
+        self.assertEqual(connection.pool.stats()["checked_out"], checked_out)
+
+    def test_connection_closed_in_atomic_block_is_discarded(self):
+        """Test that a connection still held by the wrapper isn't reused"""
+        with self.assertRaises(Exception):
+            with transaction.atomic():
+                raw = connection.connection
+                connection.close()
+                raise Exception
+
+        connection.ensure_connection()
+
+        self.assertIsNot(connection.connection, raw)
+        self.assertTrue(raw.closed)
@@ -0,0 +1,274 @@
+from datetime import timedelta
+import hashlib
+from io import BytesIO, StringIO
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Company,
+    Customer,
+    Product,
+    ProductCategory,
+    StoredBlob,
+    Supplier,
+)
+from core.storage import S3Storage, StagedFile, dedup
+
+
+def detail_url(pk):
+    return reverse("customer:customer-detail", args=[pk])
+
+
+def png(color):
+    image = BytesIO()
+    Image.new("RGB", (8, 8), color).save(image, "PNG")
+    return image.getvalue()
+
+
+def blob_name(content, extension=".png"):
+    digest = hashlib.sha256(content).hexdigest()
+    return f"blobs/{digest[:2]}/{digest}{extension}"
+
+
+class DedupStorageTest(TestCase):
+    """Test storing the uploaded files once per content"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DEFAULT_FILE_STORAGE="core.storage.DedupFileSystemStorage",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.company = Company.objects.create(name="testcompany")
+        self.red = png("red")
+        self.blue = png("blue")
+
+    def create_customer(self, content, name="testcustomer"):
+        return Customer.objects.create(
+            company=self.company,
+            name=name,
+            image=SimpleUploadedFile("logo.PNG", content),
+        )
+
+    def blobs(self):
+        return dict(StoredBlob.objects.values_list("name", "refcount"))
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root)
+            for name in names
+        )
+
+    def test_store_once(self):
+        """Test that the same content is stored once, and counted"""
+        first = self.create_customer(self.red)
+        second = self.create_customer(self.red, "other")
+
+        name = blob_name(self.red)
+        self.assertEqual(first.image.name, name)
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(self.files(), [name])
+        self.assertEqual(self.blobs(), {name: 2})
+        blob = StoredBlob.objects.get()
+        self.assertEqual(blob.size, len(self.red))
+        with first.image.open("rb") as f:
+            self.assertEqual(f.read(), self.red)
+
+    def test_count_across_fields(self):
+        """Test counting the references of every file field"""
+        self.create_customer(self.red)
+        product = Product.objects.create(
+            reference="P-0001",
+            category=ProductCategory.objects.create(
+                company=self.company, name="testcategory"
+            ),
+            supplier=Supplier.objects.create(
+                company=self.company, name="testsupplier"
+            ),
+            name="testproduct",
+            unit="pc",
+            cost="1",
+            unit_price="2",
+            image=SimpleUploadedFile("image.png", self.red),
+            thumbnail=SimpleUploadedFile("thumbnail.png", self.red),
+        )
+
+        self.assertEqual(self.blobs(), {blob_name(self.red): 3})
+
+        product.thumbnail = SimpleUploadedFile("thumbnail.png", self.blue)
+        product.save()
+
+        self.assertEqual(
+            self.blobs(), {blob_name(self.red): 2, blob_name(self.blue): 1}
+        )
+
+        Product.objects.get(pk=product.pk).delete()
+
+        self.assertEqual(
+            self.blobs(), {blob_name(self.red): 1, blob_name(self.blue): 0}
+        )
+
+    def test_streamed_upload(self):
+        """Test that a streamed upload of a stored content isn't kept"""
+        user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        self.create_customer(self.red)
+        customer = Customer.objects.create(company=self.company, name="x")
+
+        res = client.patch(
+            detail_url(customer.pk),
+            {"image": SimpleUploadedFile("logo.png", self.red)},
+            format="multipart",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        customer.refresh_from_db()
+        self.assertEqual(customer.image.name, blob_name(self.red))
+        self.assertEqual(self.files(), [blob_name(self.red)])
+        self.assertEqual(self.blobs(), {blob_name(self.red): 2})
+
+    def test_presigned_upload(self):
+        """Test that the local presigned uploads are kept under their key"""
+        user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        res = client.post(
+            reverse("core:upload"),
+            {
+                "target": "customer.image",
+                "object_id": customer.pk,
+                "filename": "logo.png",
+                "content_type": "image/png",
+                "size": len(self.red),
+            },
+            format="json",
+        )
+        upload, token = res.data["upload"], res.data["token"]
+
+        res = APIClient().post(
+            upload["url"],
+            {
+                **upload["fields"],
+                "file": SimpleUploadedFile("logo.png", self.red),
+            },
+            format="multipart",
+        )
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        res = client.post(
+            reverse("core:upload-complete"), {"token": token}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        customer.refresh_from_db()
+        self.assertEqual(customer.image.name, upload["fields"]["key"])
+        self.assertEqual(self.files(), [upload["fields"]["key"]])
+        self.assertEqual(self.blobs(), {})
+        with customer.image.open("rb") as f:
+            self.assertEqual(f.read(), self.red)
+
+    def test_other_files(self):
+        """Test that the files saved out of the upload paths are kept"""
+        name = default_storage.save("archives/1/a.jsonl", ContentFile(b"x"))
+
+        self.assertEqual(name, "archives/1/a.jsonl")
+        self.assertEqual(self.blobs(), {})
+
+    @override_settings(DEDUP_STORAGE={"GRACE_PERIOD": 3600})
+    def test_collect(self):
+        """Test deleting the blobs no field references"""
+        first = self.create_customer(self.red)
+        self.create_customer(self.blue, "other")
+        # deleted without the signals
+        Customer.objects.filter(pk=first.pk).update(image="")
+        StoredBlob.objects.update(saved_at=timezone.now() - timedelta(hours=2))
+        # saved again recently
+        self.create_customer(self.blue, "another")
+
+        out = StringIO()
+        call_command("collect_blobs", "--dry-run", stdout=out)
+
+        self.assertIn(
+            "1 blob(s) recounted, 1 blob(s) would be", out.getvalue()
+        )
+        self.assertEqual(len(self.files()), 2)
+
+        call_command("collect_blobs", stdout=StringIO())
+
+        self.assertEqual(self.files(), [blob_name(self.blue)])
+        self.assertEqual(self.blobs(), {blob_name(self.blue): 2})
+
+    @override_settings(DEDUP_STORAGE={"GRACE_PERIOD": 0})
+    def test_collect_recently_referenced(self):
+        """Test that the blobs referenced again are kept"""
+        customer = self.create_customer(self.red)
+        customer.image = ""
+        customer.save()
+        self.create_customer(self.red, "other")
+
+        result = dedup.collect()
+
+        self.assertEqual(result["deleted"], 0)
+        self.assertEqual(self.files(), [blob_name(self.red)])
+
+    def test_s3_staged_file(self):
+        """Test that files staged in the bucket are copied once in S3"""
+        storage = S3Storage(
+            access_key="AKIDEXAMPLE",
+            secret_key="secret",
+            bucket_name="bucket",
+            location="media",
+            region_name="us-east-1",
+        )
+        storage._bucket = mock.Mock()
+        digest = "ab" * 32
+
+        for _ in range(2):
+            file = StagedFile(
+                storage,
+                "staging/uploads/a.png",
+                "a.png",
+                "image/png",
+                4,
+                None,
+                digest,
+            )
+            name = storage.save("uploads/customer/images/b.png", file)
+
+            self.assertEqual(name, f"blobs/ab/{digest}.png")
+        storage._bucket.Object.assert_called_once_with(
+            f"media/blobs/ab/{digest}.png"
+        )
@@ -0,0 +1,289 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Company,
+    Customer,
+    DeliveryOrder,
+    Product,
+    ProductCategory,
+    SalesOrder,
+    SalesOrderItem,
+    Supplier,
+)
+from customer.serializers import DeliveryOrderSerializer
+
+DELIVERY_ORDER_URL = reverse("customer:deliveryorder-list")
+
+
+def detail_url(pk):
+    return reverse("customer:deliveryorder-detail", args=[pk])
+
+
+class PublicDeliveryOrderApiTest(TestCase):
+    """Test the publicly available delivery order API"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_login_required(self):
+        """Test that login is required for retrieving delivery orders"""
+        res = self.client.get(DELIVERY_ORDER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateDeliveryOrderApiTest(TestCase):
+    """Test authorized user delivery order API"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.product = Product.objects.create(
+            reference="P-0001",
+            category=ProductCategory.objects.create(
+                company=self.company, name="testcategory"
+            ),
+            supplier=Supplier.objects.create(
+                company=self.company, name="testsupplier"
+            ),
+            name="testproduct",
+            unit="pc",
+            cost="1",
+            unit_price="2",
+        )
+        self.sales_order = SalesOrder.objects.create(
+            company=self.company,
+            reference="SO-1",
+            customer=self.customer,
+            date="2001-01-10",
+            gst_rate="0",
+            discount_rate="0",
+            gst_amount="0",
+            discount_amount="0",
+            net="20",
+            total_amount="20",
+            grand_total="20",
+        )
+        self.line = SalesOrderItem.objects.create(
+            sales_order=self.sales_order,
+            product=self.product,
+            unit="pc",
+            unit_price="2",
+            quantity=10,
+            amount="20",
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def payload(self, *quantities, **fields):
+        return {
+            "date": "2001-01-11",
+            "gst_rate": "7",
+            "discount_rate": "0",
+            "customer": self.customer.pk,
+            "sales_order": self.sales_order.pk,
+            "deliveryorderitem_set": [
+                {
+                    "product": self.product.pk,
+                    "sales_order_item": self.line.pk,
+                    "unit": "pc",
+                    "unit_price": "2",
+                    "quantity": quantity,
+                    "amount": "0",
+                }
+                for quantity in quantities
+            ],
+            **fields,
+        }
+
+    def assertDelivered(self, quantity):
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.quantity_delivered, quantity)
+
+    def test_create_delivery_order(self):
+        """Test creating a delivery order of part of a sales order"""
+        res = self.client.post(
+            DELIVERY_ORDER_URL, self.payload(3, 1), format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        delivery_order = DeliveryOrder.objects.get(pk=res.data["id"])
+        self.assertEqual(delivery_order.reference, "DO-00001")
+        self.assertEqual(delivery_order.deliveryorderitem_set.count(), 2)
+        self.assertEqual(delivery_order.total_amount, Decimal("8"))
+        self.assertEqual(delivery_order.grand_total, Decimal("8.56"))
+        self.assertDelivered(4)
+        res = self.client.get(reverse("customer:salesorder-list"))
+        (line,) = res.data["results"][0]["salesorderitem_set"]
+        self.assertEqual(line["quantity_delivered"], 4)
+
+    def test_update_delivery_order(self):
+        """Test that updates add the change of the quantities delivered"""
+        res = self.client.post(
+            DELIVERY_ORDER_URL, self.payload(3, 1), format="json"
+        )
+        self.client.post(DELIVERY_ORDER_URL, self.payload(2), format="json")
+        self.assertDelivered(6)
+
+        res = self.client.put(
+            detail_url(res.data["id"]), self.payload(5), format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["deliveryorderitem_set"]), 1)
+        self.assertDelivered(7)
+
+    def test_over_delivery(self):
+        """Test that no more than the quantity ordered is delivered"""
+        self.client.post(DELIVERY_ORDER_URL, self.payload(8), format="json")
+        res = self.client.post(
+            DELIVERY_ORDER_URL, self.payload(3), format="json"
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        first = DeliveryOrder.objects.get()
+        res = self.client.put(
+            detail_url(first.pk), self.payload(10), format="json"
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertDelivered(10)
+
+    def test_concurrent_over_delivery(self):
+        """Test that lines delivered since the validation aren't exceeded"""
+        validate = DeliveryOrderSerializer.validate
+
+        def validate_then_deliver(serializer, attrs):
+            attrs = validate(serializer, attrs)
+            # committed by another delivery order meanwhile
+            SalesOrderItem.objects.filter(pk=self.line.pk).update(
+                quantity_delivered=8
+            )
+            return attrs
+
+        with mock.patch.object(
+            DeliveryOrderSerializer, "validate", validate_then_deliver
+        ):
+            res = self.client.post(
+                DELIVERY_ORDER_URL, self.payload(3), format="json"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DeliveryOrder.objects.exists())
+        self.assertDelivered(8)
+
+    def test_line_of_another_sales_order(self):
+        """Test that the lines delivered must be of the sales order"""
+        res = self.client.post(
+            DELIVERY_ORDER_URL,
+            self.payload(1, sales_order=None),
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertDelivered(0)
+
+    def test_delete_delivery_orders(self):
+        """Test that deletes take the quantities delivered back"""
+        ids = [
+            self.client.post(
+                DELIVERY_ORDER_URL, self.payload(quantity), format="json"
+            ).data["id"]
+            for quantity in (1, 2, 3)
+        ]
+
+        self.client.delete(detail_url(ids[0]))
+        self.assertDelivered(5)
+
+        res = self.client.delete(DELIVERY_ORDER_URL, ids[1:], format="json")
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertDelivered(0)
+
+    def test_list_delivery_orders(self):
+        """Test listing the delivery orders of a sales order"""
+        self.client.post(DELIVERY_ORDER_URL, self.payload(1), format="json")
+        self.client.post(
+            DELIVERY_ORDER_URL,
+            self.payload(sales_order=None),
+            format="json",
+        )
+
+        res = self.client.get(
+            DELIVERY_ORDER_URL, {"sales_order": self.sales_order.pk}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 1)
+        (delivery_order,) = res.data["results"]
+        self.assertEqual(
+            delivery_order["deliveryorderitem_set"][0]["sales_order_item"],
+            self.line.pk,
+        )
+
+    def test_edit_delivered_sales_order(self):
+        """Test that sales order edits keep the lines delivered"""
+        self.client.post(DELIVERY_ORDER_URL, self.payload(4), format="json")
+        url = reverse("customer:salesorder-detail", args=[self.sales_order.pk])
+        line = {
+            "product": self.product.pk,
+            "unit": "pc",
+            "unit_price": "2",
+            "amount": "0",
+        }
+
+        def put(*lines):
+            return self.client.put(
+                url,
+                {
+                    "reference": "SO-1",
+                    "date": "2001-01-10",
+                    "gst_rate": "0",
+                    "discount_rate": "0",
+                    "customer": self.customer.pk,
+                    "invoice_set": [],
+                    "salesorderitem_set": list(lines),
+                },
+                format="json",
+            )
+
+        # a line inserted before the line delivered
+        res = put(
+            {**line, "quantity": 1},
+            {**line, "id": self.line.pk, "quantity": 12},
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertDelivered(4)
+        self.assertEqual(self.line.quantity, 12)
+        self.assertEqual(
+            self.sales_order.salesorderitem_set.filter(
+                quantity_delivered=0
+            ).count(),
+            1,
+        )
+
+        for lines in (
+            [{**line, "id": self.line.pk, "quantity": 3}],
+            [{**line, "quantity": 12}],
+            [{**line, "id": self.line.pk + 100, "quantity": 12}],
+        ):
+            with self.subTest(lines=lines):
+                res = put(*lines)
+
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertDelivered(4)
+                self.assertEqual(self.line.quantity, 12)
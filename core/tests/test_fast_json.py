@@ -0,0 +1,190 @@
+from collections import OrderedDict
+import datetime
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Company, Customer
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+DATA = OrderedDict(
+    [
+        ("id", 1),
+        ("name", "Caf\u00e9 \u2028\u2029 \x00 \x7f \u4e2d\u6587 \U0001f600"),
+        ("amounts", [Decimal("17969.71"), Decimal("0.00"), Decimal("-1")]),
+        (
+            "dates",
+            [
+                datetime.date(2021, 12, 30),
+                datetime.datetime(2021, 12, 30, 8, 0, tzinfo=timezone.utc),
+                datetime.datetime(2021, 12, 30, 8, 0, 0, 1234),
+                timezone.make_aware(
+                    datetime.datetime(2021, 12, 30, 8, 0),
+                    timezone.get_fixed_timezone(480),
+                ),
+                datetime.time(8, 30, 15, 120),
+                datetime.timedelta(days=1, seconds=1),
+            ],
+        ),
+        ("uuid", uuid.UUID("12345678-1234-5678-1234-567812345678")),
+        ("lazy", gettext_lazy("Object not found")),
+        ("nested", {"empty": {}, "list": [], "none": None, "bool": False}),
+        ("tuple", (1, "2", 3.5)),
+        ("set", {1}),
+        ("generator", (i for i in range(3))),
+        ("bytes", b"abc"),
+        ("float", 0.1),
+        ("big", 2**70),
+    ]
+)
+
+
+def render(renderer, data, media_type=None):
+    # the generators are consumed by rendering
+    data = OrderedDict(data, generator=(i for i in range(3)))
+    return renderer.render(data, media_type, {})
+
+
+class FastJSONRendererTest(SimpleTestCase):
+    """Test rendering the responses with orjson"""
+
+    def test_same_bytes(self):
+        """Test that the bytes rendered are JSONRenderer's"""
+        expected = render(JSONRenderer(), DATA)
+
+        self.assertEqual(render(FastJSONRenderer(), DATA), expected)
+        for key in ("big", "set", "generator"):
+            # rendered without falling back
+            data = OrderedDict(
+                (name, value) for name, value in DATA.items() if name != key
+            )
+            self.assertEqual(
+                render(FastJSONRenderer(), data),
+                render(JSONRenderer(), data),
+            )
+
+    def test_decimals(self):
+        """Test that Decimals are rendered as JSONRenderer renders them"""
+        for value in ("1E+20", "0.00001", "-12345678901234567", "1E-400"):
+            with self.subTest(value=value):
+                data = {"value": Decimal(value)}
+                self.assertEqual(
+                    FastJSONRenderer().render(data),
+                    JSONRenderer().render(data),
+                )
+        for value in ("NaN", "Infinity"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    FastJSONRenderer().render({"value": Decimal(value)})
+
+    def test_fallbacks(self):
+        """Test the responses rendered by JSONRenderer"""
+        for data in ({1: "non str key"}, [2**64], None):
+            with self.subTest(data=data):
+                self.assertEqual(
+                    FastJSONRenderer().render(data),
+                    JSONRenderer().render(data),
+                )
+        self.assertEqual(
+            render(FastJSONRenderer(), DATA, "application/json; indent=4"),
+            render(JSONRenderer(), DATA, "application/json; indent=4"),
+        )
+        with mock.patch("core.renderers.orjson", None):
+            self.assertEqual(
+                render(FastJSONRenderer(), DATA),
+                render(JSONRenderer(), DATA),
+            )
+
+
+class FastJSONParserTest(SimpleTestCase):
+    """Test parsing the requests with orjson"""
+
+    def parse(self, parser, body, **context):
+        return parser.parse(BytesIO(body), None, context)
+
+    def test_same_data(self):
+        """Test that the data parsed are JSONParser's"""
+        for body in (
+            render(JSONRenderer(), DATA),
+            b'{"a": 1, "a": 2, "b": [1.0, -0, 1E2, "\\u00e9"]}',
+            b"[18446744073709551615, -9223372036854775808]",
+            b"[123456789012345678901234567890, 1e400]",
+            b'"12345678901234567890"',
+        ):
+            with self.subTest(body=body):
+                expected = self.parse(JSONParser(), body)
+                parsed = self.parse(FastJSONParser(), body)
+                self.assertEqual(parsed, expected)
+                self.assertEqual(
+                    [type(value) for value in parsed],
+                    [type(value) for value in expected],
+                )
+
+    def test_errors(self):
+        """Test that the invalid bodies are reported as by JSONParser"""
+        for body in (b"", b"[1,", b"NaN", b'{"a": Infinity}'):
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as expected:
+                    self.parse(JSONParser(), body)
+                with self.assertRaises(ParseError) as raised:
+                    self.parse(FastJSONParser(), body)
+                self.assertEqual(
+                    str(raised.exception), str(expected.exception)
+                )
+
+    def test_encoding(self):
+        """Test parsing bodies of other encodings"""
+        body = '{"name": "Café"}'.encode("latin-1")
+
+        self.assertEqual(
+            self.parse(FastJSONParser(), body, encoding="latin-1"),
+            {"name": "Café"},
+        )
+
+
+class FastJSONAPITest(TestCase):
+    """Test the api rendering and parsing JSON with orjson"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_round_trip(self):
+        """Test creating and listing objects"""
+        url = reverse("customer:customer-list")
+        res = self.client.post(
+            url,
+            {
+                "reference": "C-0001",
+                "name": "Caf\u00e9 \u2028 Ltd",
+                "agents": [self.user.pk],
+            },
+            format="json",
+        )
+        self.assertEqual(res.status_code, 201, res.data)
+
+        res = self.client.get(url)
+
+        self.assertIsInstance(res.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(res.content, JSONRenderer().render(res.data))
+        self.assertEqual(Customer.objects.get().name, "Caf\u00e9 \u2028 Ltd")
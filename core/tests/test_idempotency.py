@@ -0,0 +1,216 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Company,
+    CreditNote,
+    Customer,
+    IdempotencyKey,
+    Invoice,
+    PaymentMethod,
+    Product,
+    ProductCategory,
+    Supplier,
+)
+
+INVOICE_URL = reverse("customer:invoice-list")
+PAYMENT_METHOD_URL = reverse("company:paymentmethod-list")
+
+
+class IdempotencyTest(TestCase):
+    """Test the replay of the create requests with an idempotency key"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer", unused_credits="10"
+        )
+        self.product = Product.objects.create(
+            reference="P-0001",
+            category=ProductCategory.objects.create(
+                company=self.company, name="testcategory"
+            ),
+            supplier=Supplier.objects.create(
+                company=self.company, name="testsupplier"
+            ),
+            name="testproduct",
+            unit="pc",
+            cost="1",
+            unit_price="2",
+        )
+        self.credit_note = CreditNote.objects.create(
+            reference="CN-1",
+            date="2001-01-10",
+            customer=self.customer,
+            status="OP",
+            company=self.company,
+            gst_rate="0",
+            discount_rate="0",
+            gst_amount="0",
+            discount_amount="0",
+            net="10",
+            total_amount="10",
+            grand_total="10",
+            credits_used="0",
+            refund="0",
+            credits_remaining="10",
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def invoice_payload(self, reference="INV-1"):
+        return {
+            "reference": reference,
+            "date": "2001-01-10",
+            "gst_rate": "0",
+            "discount_rate": "0",
+            "customer": self.customer.pk,
+            "status": "UPD",
+            "invoiceitem_set": [
+                {
+                    "product": self.product.pk,
+                    "unit": "pc",
+                    "unit_price": "2",
+                    "quantity": 5,
+                    "amount": "10",
+                }
+            ],
+            "creditsapplication_set": [
+                {"credit_note": self.credit_note.pk, "amount_to_credit": "4"}
+            ],
+        }
+
+    def post(self, url, data, key):
+        return self.client.post(
+            url, data, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_is_replayed(self):
+        """Test that a retried create is not run again"""
+        payload = self.invoice_payload()
+
+        first = self.post(INVOICE_URL, payload, "key-1")
+        retry = self.post(INVOICE_URL, payload, "key-1")
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertNotIn("Idempotent-Replayed", first)
+        self.assertEqual(Invoice.objects.count(), 1)
+        # the credits were only applied once
+        self.credit_note.refresh_from_db()
+        self.assertEqual(self.credit_note.credits_remaining, Decimal("6"))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.unused_credits, Decimal("6"))
+
+    def test_bulk_create(self):
+        """Test that a retried bulk create is not run again"""
+        payload = [
+            self.invoice_payload("INV-1"),
+            {**self.invoice_payload("INV-2"), "creditsapplication_set": []},
+        ]
+
+        first = self.post(INVOICE_URL, payload, "key-1")
+        retry = self.post(INVOICE_URL, payload, "key-1")
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_key_reused_for_another_request(self):
+        """Test that a key can't be reused with another body"""
+        self.post(PAYMENT_METHOD_URL, {"name": "cash"}, "key-1")
+
+        res = self.post(PAYMENT_METHOD_URL, {"name": "cheque"}, "key-1")
+
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertFalse(PaymentMethod.objects.filter(name="cheque").exists())
+
+    def test_keys_of_other_users(self):
+        """Test that the keys of each user are distinct"""
+        other = get_user_model().objects.create_user(
+            "other@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.post(PAYMENT_METHOD_URL, {"name": "cash"}, "key-1")
+        self.client.force_authenticate(other)
+
+        res = self.post(PAYMENT_METHOD_URL, {"name": "cash"}, "key-1")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", res)
+        self.assertEqual(PaymentMethod.objects.filter(name="cash").count(), 2)
+
+    def test_failed_request_is_not_stored(self):
+        """Test that a failed request runs again when retried"""
+        payload = self.invoice_payload()
+        invalid = {**payload, "invoiceitem_set": "invalid"}
+
+        res = self.post(INVOICE_URL, invalid, "key-1")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        res = self.post(INVOICE_URL, invalid, "key-1")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_key(self):
+        """Test that a request is run again once its key expired"""
+        self.post(PAYMENT_METHOD_URL, {"name": "cash"}, "key-1")
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+
+        res = self.post(PAYMENT_METHOD_URL, {"name": "cash"}, "key-1")
+
+        self.assertNotIn("Idempotent-Replayed", res)
+        self.assertEqual(PaymentMethod.objects.filter(name="cash").count(), 2)
+
+    def test_without_key(self):
+        """Test that requests without a key are not stored"""
+        self.client.post(PAYMENT_METHOD_URL, {"name": "cash"})
+        self.client.post(PAYMENT_METHOD_URL, {"name": "cash"})
+
+        self.assertEqual(PaymentMethod.objects.filter(name="cash").count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_invalid_key(self):
+        """Test that empty and too long keys are rejected"""
+        for key in ("", "k" * 256):
+            res = self.post(PAYMENT_METHOD_URL, {"name": "cash"}, key)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertFalse(PaymentMethod.objects.exists())
+
+    def test_clear_expired_keys(self):
+        """Test that the expired keys are deleted by the command"""
+        self.post(PAYMENT_METHOD_URL, {"name": "cash"}, "key-1")
+        self.post(PAYMENT_METHOD_URL, {"name": "cheque"}, "key-2")
+        IdempotencyKey.objects.filter(key="key-1").update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        out = StringIO()
+
+        call_command("clear_idempotency_keys", stdout=out)
+
+        self.assertIn("1 idempotency key(s) deleted", out.getvalue())
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)),
+            ["key-2"],
+        )
@@ -1,7 +1,20 @@
-from core.models import Company, Customer, Invoice, SalesOrder
+from datetime import date
+
+from core.models import (
+    Company,
+    Customer,
+    Invoice,
+    InvoiceItem,
+    Product,
+    ProductCategory,
+    SalesOrder,
+    Supplier,
+)
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -125,6 +138,93 @@ class PrivateInvoiceApiTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data.get("results", None), serializer.data)
 
+    def create_invoice(self, reference, date):
+        return Invoice.objects.create(
+            reference=reference,
+            date=date,
+            gst_rate="0.07",
+            discount_rate="0",
+            gst_amount="0",
+            discount_amount="0",
+            net="0",
+            total_amount="0",
+            grand_total="0",
+            customer=self.customer,
+            status="UPD",
+            company=self.company,
+            credits_applied="0.00",
+            balance_due="0.00",
+        )
+
+    def test_filter_invoices_by_date(self):
+        """Test that invoices can be filtered by a date range"""
+        self.create_invoice("INV-1", "2001-01-10")
+        self.create_invoice("INV-2", "2001-02-10")
+        self.create_invoice("INV-3", "2001-03-10")
+
+        res = self.client.get(
+            INVOICE_URL,
+            {"date__gte": "2001-02-01", "date__lt": "2001-03-01"},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [invoice["reference"] for invoice in res.data["results"]],
+            ["INV-2"],
+        )
+
+    def test_line_items_follow_invoice_date(self):
+        """Test that the line items keep the date of their invoice"""
+        supplier = Supplier.objects.create(
+            company=self.company, name="testsupplier"
+        )
+        product = Product.objects.create(
+            reference="P-0001",
+            category=ProductCategory.objects.create(
+                company=self.company, name="testcategory"
+            ),
+            supplier=supplier,
+            name="testproduct",
+            unit="pc",
+            cost="1",
+            unit_price="2",
+        )
+        item = {"product": product, "unit": "pc", "unit_price": "2"}
+        invoice = self.create_invoice("INV-1", "2001-01-10")
+        InvoiceItem.objects.create(
+            invoice=invoice, quantity=1, amount="2", **item
+        )
+        InvoiceItem.objects.bulk_create(
+            [InvoiceItem(invoice=invoice, quantity=2, amount="4", **item)]
+        )
+
+        self.assertEqual(
+            set(InvoiceItem.objects.values_list("document_date", flat=True)),
+            {date(2001, 1, 10)},
+        )
+
+        invoice.date = date(2001, 2, 1)
+        invoice.save()
+
+        self.assertEqual(
+            set(InvoiceItem.objects.values_list("document_date", flat=True)),
+            {date(2001, 2, 1)},
+        )
+
+        # the line items aren't written when the date is unchanged
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        invoice.description = "changed"
+        with CaptureQueriesContext(connection) as queries:
+            invoice.save()
+
+        self.assertFalse(
+            [
+                query
+                for query in queries.captured_queries
+                if query["sql"].startswith('UPDATE "core_invoiceitem"')
+            ]
+        )
+
     # Deprecated
     # def test_invoice_not_limited_to_user(self):
     #     """Test that invoices returned are visible by every user"""
@@ -0,0 +1,250 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import re_path
+from django.utils.http import http_date
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core.models import Company
+from core.storage import serving
+
+CONTENT = bytes(range(256)) * 40
+
+MEDIA_URL = "/api/media/uploads/product/images/test.png"
+
+# serve_media is only mounted by api.urls with DEBUG or when enabled
+urlpatterns = [re_path(r"^api/media/(?P<path>.*)$", serving.serve_media)]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class MediaServingTest(TestCase):
+    """Test serving the media files of the local storage"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com", "password123", company=self.company
+        )
+        # the clients authenticate with the API token, not a session
+        self.token = Token.objects.create(user=self.user)
+
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        for name in (
+            "uploads/product/images/test.png",
+            "staging/uploads/x",
+            f"archives/{self.company.id}/invoice/1.jsonl.gz",
+            f"archives/{self.company.id + 1}/invoice/2.jsonl.gz",
+        ):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(CONTENT)
+
+    def get(self, url=MEDIA_URL, **headers):
+        return self.client.get(url, **headers)
+
+    def test_serve_file(self):
+        """Test serving a whole file"""
+        res = self.get()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(res.streaming_content), CONTENT)
+        self.assertEqual(res["Content-Type"], "image/png")
+        self.assertEqual(res["Content-Length"], str(len(CONTENT)))
+        self.assertEqual(res["Accept-Ranges"], "bytes")
+
+    def test_serve_range(self):
+        """Test serving the ranges of a file"""
+        size = len(CONTENT)
+        for header, first, end in (
+            ("bytes=100-299", 100, 300),
+            ("bytes=10000-", 10000, size),
+            ("bytes=-24", size - 24, size),
+            ("bytes=10000-99999", 10000, size),
+        ):
+            with self.subTest(header=header):
+                res = self.get(HTTP_RANGE=header)
+
+                self.assertEqual(
+                    res.status_code, status.HTTP_206_PARTIAL_CONTENT
+                )
+                self.assertEqual(
+                    b"".join(res.streaming_content), CONTENT[first:end]
+                )
+                self.assertEqual(
+                    res["Content-Range"], f"bytes {first}-{end - 1}/{size}"
+                )
+                self.assertEqual(res["Content-Length"], str(end - first))
+
+    def test_unsatisfiable_range(self):
+        """Test that ranges past the end of the file are refused"""
+        res = self.get(HTTP_RANGE="bytes=20000-")
+
+        self.assertEqual(
+            res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(res["Content-Range"], f"bytes */{len(CONTENT)}")
+
+    def test_ignored_ranges(self):
+        """Test that the whole file is sent for the ranges not served"""
+        for headers in (
+            {"HTTP_RANGE": "bytes=0-1,5-6"},
+            {"HTTP_RANGE": "lines=1-2"},
+            {"HTTP_RANGE": "bytes=0-1", "HTTP_IF_RANGE": http_date(0)},
+        ):
+            with self.subTest(headers=headers):
+                res = self.get(**headers)
+
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                self.assertEqual(b"".join(res.streaming_content), CONTENT)
+
+    def test_not_modified(self):
+        """Test that the files not modified since are not sent again"""
+        res = self.get()
+
+        res = self.get(HTTP_IF_MODIFIED_SINCE=res["Last-Modified"])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_not_found(self):
+        """Test that only the files of the media root are served"""
+        for url in (
+            "/api/media/uploads/missing.png",
+            "/api/media/uploads/product/images/test.png/x",
+            "/api/media/uploads/",
+            "/api/media/staging/uploads/x",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.get(url).status_code, status.HTTP_404_NOT_FOUND
+                )
+
+    def test_outside_media_root(self):
+        """Test that the paths out of the media root are refused"""
+        res = self.get("/api/media/../../etc/passwd")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(MEDIA_SERVING={"SENDFILE": "x-accel-redirect"})
+    def test_accel_redirect(self):
+        """Test handing the transfer over to nginx"""
+        res = self.get()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.content, b"")
+        self.assertEqual(
+            res["X-Accel-Redirect"],
+            "/internal/media/uploads/product/images/test.png",
+        )
+        self.assertEqual(res["Content-Type"], "image/png")
+
+    @override_settings(MEDIA_SERVING={"SENDFILE": "x-sendfile"})
+    def test_sendfile(self):
+        """Test handing the transfer over to Apache or lighttpd"""
+        res = self.get()
+
+        self.assertEqual(res.content, b"")
+        self.assertEqual(
+            res["X-Sendfile"],
+            os.path.join(self.media_root, "uploads/product/images/test.png"),
+        )
+
+    def get_archive(self, url, token=None):
+        token = token or self.token.key
+        return self.get(url, HTTP_AUTHORIZATION=f"Token {token}")
+
+    def test_public_uploads(self):
+        """Test that the uploads are served without authentication"""
+        for url in (MEDIA_URL, "/api/media/blobs/ab/abcd.png"):
+            name = url.replace("/api/media/", "", 1)
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(CONTENT)
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url).status_code, status.HTTP_200_OK)
+
+    def test_permission(self):
+        """Test that the requests are authorized before serving the file"""
+        url = f"/api/media/archives/{self.company.id}/invoice/1.jsonl.gz"
+
+        self.assertEqual(self.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(
+            self.get_archive(url, token="invalid").status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+
+        with override_settings(
+            MEDIA_SERVING={"PERMISSION": "core.storage.serving.allow_any"}
+        ):
+            self.assertEqual(self.get(url).status_code, status.HTTP_200_OK)
+
+    def test_archives(self):
+        """Test that only the archives of the user's company are served"""
+        own = f"/api/media/archives/{self.company.id}/invoice/1.jsonl.gz"
+        other = f"/api/media/archives/{self.company.id + 1}/invoice/2.jsonl.gz"
+
+        self.assertEqual(self.get_archive(own).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get_archive(other).status_code, status.HTTP_403_FORBIDDEN
+        )
+
+        self.user.company = None
+        self.user.save()
+
+        self.assertEqual(
+            self.get_archive(own).status_code, status.HTTP_403_FORBIDDEN
+        )
+
+    def test_archives_session(self):
+        """Test that the archives are served to the admin site's session"""
+        self.client.force_login(self.user)
+        own = f"/api/media/archives/{self.company.id}/invoice/1.jsonl.gz"
+
+        self.assertEqual(self.get(own).status_code, status.HTTP_200_OK)
+
+    def test_enabled(self):
+        """Test that the view is mounted only with DEBUG or when enabled"""
+        for debug, enabled, mounted in (
+            (False, False, False),
+            (False, True, True),
+            (True, False, True),
+        ):
+            with self.subTest(debug=debug, enabled=enabled):
+                with override_settings(
+                    DEBUG=debug, MEDIA_SERVING={"ENABLED": enabled}
+                ):
+                    self.assertEqual(
+                        bool(serving.media_urlpatterns()), mounted
+                    )
+
+    def test_range_file(self):
+        """Test that the file read, or sent, stops at the range"""
+        with open(
+            os.path.join(self.media_root, "uploads/product/images/test.png"),
+            "rb",
+        ) as file:
+            file.seek(100)
+            range_file = serving.RangeFile(file, 50)
+
+            with self.assertRaises(io.UnsupportedOperation):
+                range_file.fileno()
+            self.assertEqual(range_file.read(30), CONTENT[100:130])
+            self.assertEqual(range_file.read(), CONTENT[130:150])
+            self.assertEqual(range_file.read(), b"")
+
+            file.seek(0)
+            self.assertEqual(
+                serving.RangeFile(file, 50).fileno(), file.fileno()
+            )
@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase, override_settings
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from core.storage import media
+
+NAMES = (
+    "uploads/product/images/0f8fad5b-d9cb-469f-a165-70867728950e.png",
+    "uploads/a b(1).png",
+    "uploads/x/../ä.png",
+)
+
+
+def s3_storage(**options):
+    return S3Boto3Storage(
+        **{
+            "access_key": "AKIDEXAMPLE",
+            "secret_key": "secret",
+            "bucket_name": "bucket",
+            "location": "media",
+            "region_name": "us-east-1",
+            "custom_domain": "bucket.s3.amazonaws.com",
+            "querystring_auth": False,
+            **options,
+        }
+    )
+
+
+class MediaURLTest(SimpleTestCase):
+    """Test resolving the URLs of the media files"""
+
+    def test_public_urls(self):
+        """Test that public URLs are the storages' own"""
+        for storage in (
+            s3_storage(),
+            s3_storage(location=""),
+            FileSystemStorage(base_url="/api/media/"),
+        ):
+            resolver = media.MediaURLResolver(storage)
+            self.assertIsNotNone(resolver.base)
+            for name in NAMES:
+                with self.subTest(storage=storage, name=name):
+                    self.assertEqual(resolver.url(name), storage.url(name))
+
+    def test_formatted_from_base(self):
+        """Test that public URLs don't go through the storage"""
+        storage = s3_storage()
+        resolver = media.MediaURLResolver(storage)
+
+        with mock.patch.object(storage, "url") as url:
+            self.assertEqual(
+                resolver.url(NAMES[0]),
+                f"https://bucket.s3.amazonaws.com/media/{NAMES[0]}",
+            )
+        url.assert_not_called()
+
+    def test_signed_urls_memoized(self):
+        """Test that signed URLs are reused until shortly before expiry"""
+        storage = s3_storage(
+            custom_domain=None, querystring_auth=True, querystring_expire=600
+        )
+        resolver = media.MediaURLResolver(storage)
+        self.assertIsNone(resolver.base)
+
+        with mock.patch.object(
+            storage, "url", side_effect=["signed-1", "signed-2"]
+        ) as url, mock.patch("core.storage.media.time.monotonic") as now:
+            now.return_value = 1000
+            self.assertEqual(resolver.url(NAMES[0]), "signed-1")
+            now.return_value = 1539
+            self.assertEqual(resolver.url(NAMES[0]), "signed-1")
+            now.return_value = 1541
+            self.assertEqual(resolver.url(NAMES[0]), "signed-2")
+        self.assertEqual(url.call_count, 2)
+
+    @override_settings(MEDIA_URLS={"CACHE_SIZE": 2})
+    def test_cache_size(self):
+        """Test that the URLs memoized are bounded"""
+        resolver = media.MediaURLResolver(
+            s3_storage(custom_domain=None, querystring_auth=True)
+        )
+
+        for name in NAMES:
+            resolver.url(name)
+
+        self.assertEqual(list(resolver.cache), list(NAMES[1:]))
+
+    @override_settings(MEDIA_URL="/api/media/")
+    def test_file_data(self):
+        """Test the {src, title} rendered for the file fields"""
+        file = mock.Mock(storage=FileSystemStorage(), name=NAMES[0])
+        file.name = NAMES[0]
+
+        self.assertEqual(
+            media.file_data(file),
+            {"src": f"/api/media/{NAMES[0]}", "title": NAMES[0]},
+        )
+        self.assertEqual(media.file_data(None), {"src": "", "title": ""})
@@ -0,0 +1,161 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import numbering
+from core.models import (
+    Company,
+    Customer,
+    DocumentSequence,
+    Invoice,
+    PurchaseOrder,
+)
+
+INVOICE_URL = reverse("customer:invoice-list")
+DOCUMENT_SEQUENCE_URL = reverse("company:documentsequence-list")
+
+
+class NumberingTest(TestCase):
+    """Test the numbering of the documents created without reference"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def invoice_payload(self, **fields):
+        return {
+            "date": "2001-01-10",
+            "gst_rate": "0",
+            "discount_rate": "0",
+            "customer": self.customer.pk,
+            "status": "UPD",
+            "invoiceitem_set": [],
+            "creditsapplication_set": [],
+            **fields,
+        }
+
+    def allocate(self, model, count, company=None):
+        with transaction.atomic():
+            return numbering.allocate_references(
+                model, company or self.company, count
+            )
+
+    def test_create_without_reference(self):
+        """Test that invoices created without reference are numbered"""
+        first = self.client.post(
+            INVOICE_URL, self.invoice_payload(), format="json"
+        )
+        second = self.client.post(
+            INVOICE_URL, self.invoice_payload(), format="json"
+        )
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(first.data["reference"], "INV-00001")
+        self.assertEqual(second.data["reference"], "INV-00002")
+
+    def test_bulk_create_allocates_a_block(self):
+        """Test that a bulk create allocates its numbers at once"""
+        payload = [
+            self.invoice_payload(),
+            self.invoice_payload(reference="MANUAL-1"),
+            self.invoice_payload(),
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(INVOICE_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [invoice["reference"] for invoice in res.data],
+            ["INV-00001", "MANUAL-1", "INV-00002"],
+        )
+        updates = [
+            query
+            for query in queries
+            if query["sql"].startswith("UPDATE")
+            and "documentsequence" in query["sql"]
+        ]
+        self.assertEqual(len(updates), 1)
+
+    def test_used_references_are_skipped(self):
+        """Test that the numbers of references given by clients are skipped"""
+        self.client.post(
+            INVOICE_URL,
+            self.invoice_payload(reference="INV-00002"),
+            format="json",
+        )
+
+        self.assertEqual(self.allocate(Invoice, 2), ["INV-00001", "INV-00003"])
+
+    def test_rollback_gives_numbers_back(self):
+        """Test that no number is skipped when a create fails"""
+        with self.assertRaises(ValueError), transaction.atomic():
+            numbering.allocate_references(Invoice, self.company, 1)
+            raise ValueError
+
+        self.assertEqual(self.allocate(Invoice, 1), ["INV-00001"])
+
+    def test_sequences_per_company_and_type(self):
+        """Test that each company numbers each type of documents"""
+        other = Company.objects.create(name="othercompany")
+
+        self.assertEqual(self.allocate(Invoice, 1), ["INV-00001"])
+        self.assertEqual(self.allocate(Invoice, 1, other), ["INV-00001"])
+        self.assertEqual(self.allocate(PurchaseOrder, 1), ["PO-00001"])
+
+    def test_yearly_numbers(self):
+        """Test that yearly numbers include the year and restart"""
+        DocumentSequence.objects.create(
+            company=self.company,
+            document_type="core.invoice",
+            prefix="F",
+            yearly=True,
+            padding=3,
+            next_number=7,
+            year=2000,
+        )
+        with mock.patch(
+            "django.utils.timezone.localdate",
+            return_value=mock.Mock(year=2001),
+        ):
+            references = self.allocate(Invoice, 2)
+
+        self.assertEqual(references, ["F2001-001", "F2001-002"])
+
+    def test_configure_sequence(self):
+        """Test setting the format of the numbers with the api"""
+        res = self.client.post(
+            DOCUMENT_SEQUENCE_URL,
+            {"document_type": "core.invoice", "prefix": "IV", "padding": 3},
+            format="json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.post(
+            INVOICE_URL, self.invoice_payload(), format="json"
+        )
+        self.assertEqual(res.data["reference"], "IV001")
+
+        res = self.client.post(
+            DOCUMENT_SEQUENCE_URL,
+            {"document_type": "core.invoice"},
+            format="json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,229 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import payroll
+from core.models import Company, Customer, Invoice, Payslip
+
+RUN_URL = reverse("company:payslip-run")
+
+
+class PayrollRunTest(TestCase):
+    """Test generating the payslips of a month"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.owner = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.employee = self.create_employee("employee@crownkiraappdev.com")
+        self.other_employee = self.create_employee("other@crownkiraappdev.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.count = 0
+
+    def create_employee(self, email, **fields):
+        return get_user_model().objects.create_user(
+            email, "password123", company=self.company, **fields
+        )
+
+    def invoice(self, date, net, salesperson, status="UPD", **fields):
+        self.count += 1
+        return Invoice.objects.create(
+            company=fields.pop("company", self.company),
+            customer=self.customer,
+            salesperson=salesperson,
+            reference=f"INV-{self.count}",
+            date=date,
+            status=status,
+            gst_rate="0",
+            discount_rate="0",
+            gst_amount="0",
+            discount_amount="0",
+            net=net,
+            total_amount=net,
+            grand_total=net,
+            credits_applied="0",
+            balance_due=net,
+        )
+
+    def payslip(self, user, year, month, **fields):
+        return Payslip.objects.create(
+            company=self.company,
+            user=user,
+            date=f"{year}-{month:02}-28",
+            year=str(year),
+            month=payroll.MONTHS[month - 1],
+            **{
+                "basic_salary": "3000",
+                "total_allowances": "200",
+                "total_deductions": "50",
+                "sale_price": "0",
+                "commission": "5",
+                "commission_amt": "0",
+                "net_pay": "3150",
+                "payment_method": "GIRO",
+                "bank": "DBS",
+                "status": "PD",
+                **fields,
+            },
+        )
+
+    def run_payroll(self, **params):
+        return self.client.post(
+            RUN_URL, {"year": 2001, "month": 2, **params}, format="json"
+        )
+
+    def test_run(self):
+        """Test computing the commission and net pay of the employees"""
+        self.payslip(self.employee, 2001, 1)
+        self.invoice("2001-02-01", "1000", self.employee)
+        self.invoice("2001-02-28", "234.60", self.employee, status="PD")
+        self.invoice("2001-02-10", "5000", self.employee, status="DFT")
+        self.invoice("2001-03-01", "5000", self.employee)
+        self.invoice("2001-02-10", "5000", self.owner)
+        self.invoice(
+            "2001-02-10",
+            "5000",
+            self.employee,
+            company=Company.objects.create(name="other"),
+        )
+
+        res = self.run_payroll()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data["created"], 2)
+        self.assertEqual(res.data["updated"], 0)
+        payslip = Payslip.objects.get(
+            user=self.employee, month="february"
+        )
+        self.assertEqual(str(payslip.date), "2001-02-28")
+        self.assertEqual(payslip.year, "2001")
+        self.assertEqual(payslip.sale_price, Decimal("1234.60"))
+        self.assertEqual(payslip.commission, Decimal("5"))
+        self.assertEqual(payslip.commission_amt, Decimal("61.73"))
+        self.assertEqual(payslip.net_pay, Decimal("3211.73"))
+        self.assertEqual(payslip.bank, "DBS")
+        self.assertEqual(payslip.status, "UPD")
+        # without a previous payslip
+        other = Payslip.objects.get(user=self.other_employee)
+        self.assertEqual(other.sale_price, 0)
+        self.assertEqual(other.net_pay, 0)
+        self.assertEqual(
+            [row["user"] for row in res.data["results"]],
+            [self.employee.pk, self.other_employee.pk],
+        )
+
+    def test_run_again(self):
+        """Test that running the same month again updates the payslips"""
+        self.invoice("2001-02-01", "100", self.employee)
+        self.run_payroll()
+        payslip = Payslip.objects.get(user=self.employee)
+        payslip.basic_salary = "1000"
+        payslip.commission = "10"
+        payslip.save()
+        self.invoice("2001-02-02", "100", self.employee)
+
+        res = self.run_payroll(date="2001-03-05")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["created"], 0)
+        self.assertEqual(res.data["updated"], 2)
+        self.assertEqual(Payslip.objects.count(), 2)
+        payslip.refresh_from_db()
+        self.assertEqual(str(payslip.date), "2001-03-05")
+        self.assertEqual(payslip.sale_price, 200)
+        self.assertEqual(payslip.commission_amt, 20)
+        self.assertEqual(payslip.net_pay, 1020)
+
+    def test_duplicated_payslips(self):
+        """Test that the latest of duplicated payslips is updated"""
+        oldest = self.payslip(self.employee, 2001, 2, status="UPD")
+        latest = self.payslip(self.employee, 2001, 2, status="UPD")
+        self.invoice("2001-02-01", "100", self.employee)
+
+        res = self.run_payroll()
+
+        oldest.refresh_from_db()
+        latest.refresh_from_db()
+        self.assertEqual(oldest.sale_price, 0)
+        self.assertEqual(latest.sale_price, 100)
+        (result,) = (
+            row
+            for row in res.data["results"]
+            if row["user"] == self.employee.pk
+        )
+        self.assertEqual(result["id"], latest.pk)
+        self.assertEqual(Decimal(result["sale_price"]), 100)
+        self.assertEqual(Decimal(result["net_pay"]), latest.net_pay)
+
+    def test_month_formats(self):
+        """Test that the payslips are matched by month name or number"""
+        named = self.payslip(self.employee, 2001, 2, status="UPD")
+        numbered = self.payslip(self.other_employee, 2001, 2, status="UPD")
+        # entered through the api, and stored by earlier runs
+        Payslip.objects.filter(pk=named.pk).update(month="February")
+        Payslip.objects.filter(pk=numbered.pk).update(month="2")
+        self.invoice("2001-02-01", "100", self.employee)
+
+        res = self.run_payroll()
+
+        self.assertEqual(res.data["created"], 0)
+        self.assertEqual(res.data["updated"], 2)
+        self.assertEqual(Payslip.objects.count(), 2)
+        named.refresh_from_db()
+        numbered.refresh_from_db()
+        self.assertEqual(named.sale_price, 100)
+        self.assertEqual(named.month, "february")
+        self.assertEqual(numbered.month, "february")
+
+    def test_paid_payslips_kept(self):
+        """Test that paid payslips are not recomputed"""
+        self.payslip(self.employee, 2001, 2, net_pay="1")
+        self.invoice("2001-02-01", "100", self.employee)
+
+        res = self.run_payroll()
+
+        self.assertEqual(res.data["created"], 1)
+        self.assertEqual(res.data["updated"], 0)
+        self.assertEqual(
+            Payslip.objects.get(user=self.employee).net_pay, Decimal("1")
+        )
+
+    def test_employment_period(self):
+        """Test that only the employees of the month are paid"""
+        self.employee.date_of_cessation = "2001-01-31"
+        self.employee.save()
+        self.other_employee.date_of_commencement = "2001-02-28"
+        self.other_employee.save()
+
+        self.run_payroll()
+
+        self.assertEqual(
+            list(Payslip.objects.values_list("user", flat=True)),
+            [self.other_employee.pk],
+        )
+
+    def test_invalid_month(self):
+        """Test that the month must be valid"""
+        res = self.run_payroll(month=13)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Payslip.objects.exists())
+
+    def test_login_required(self):
+        """Test that login is required for payroll runs"""
+        res = APIClient().post(RUN_URL, {"year": 2001, "month": 2})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,176 @@
+import time
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.db import routers
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import AgingBalance, Customer
+from core.views import AgingReportView
+from customer.views import CustomerViewSet, StatementView
+from user.views import ManageProfileView
+
+REPLICAS = {"ALIASES": ["replica1", "replica2"], "MAX_LAG": 5.0}
+
+
+@override_settings(READ_REPLICAS=REPLICAS)
+class ReplicaRouterTest(SimpleTestCase):
+    """Test the routing of reads to the replicas"""
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        routers.replica_lag.reset()
+        self.addCleanup(routers.replica_lag.reset)
+        self.lags = {"replica1": 0.0, "replica2": 0.0}
+        patcher = mock.patch(
+            "core.db.routers.get_lag", side_effect=self.get_lag
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_lag(self, alias):
+        lag = self.lags[alias]
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+
+    def read_db(self):
+        return self.router.db_for_read(Customer)
+
+    def test_reads_use_default_routing_outside_of_requests(self):
+        """Test that reads are not routed unless marked"""
+        self.assertIsNone(self.read_db())
+
+    def test_round_robin(self):
+        """Test that the reads are spread over the replicas"""
+        with routers.replica_reads():
+            dbs = {self.read_db() for _ in range(4)}
+
+        self.assertEqual(dbs, {"replica1", "replica2"})
+
+    def test_lagging_replica_is_skipped(self):
+        """Test that a replica lagging behind MAX_LAG is not read from"""
+        self.lags["replica1"] = 60.0
+
+        with routers.replica_reads():
+            dbs = {self.read_db() for _ in range(4)}
+
+        self.assertEqual(dbs, {"replica2"})
+
+    def test_fallback_to_primary(self):
+        """Test that the primary is read when no replica is usable"""
+        self.lags["replica1"] = 60.0
+        self.lags["replica2"] = ConnectionError("down")
+
+        with routers.replica_reads(), self.assertLogs("core.db.routers"):
+            self.assertEqual(self.read_db(), "default")
+
+    def test_lag_is_cached(self):
+        """Test that the lag is not measured for every read"""
+        with routers.replica_reads():
+            for _ in range(10):
+                self.read_db()
+
+        self.assertEqual(routers.get_lag.call_count, 2)
+
+    def test_writes_go_to_primary(self):
+        """Test that writes are never routed to a replica"""
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_write(Customer), "default")
+
+    def test_no_migrations_on_replicas(self):
+        """Test that the replicas are not migrated"""
+        self.assertTrue(self.router.allow_migrate("default", "customer"))
+        self.assertFalse(self.router.allow_migrate("replica1", "customer"))
+
+
+@override_settings(READ_REPLICAS=REPLICAS)
+class ReplicaRoutingMiddlewareTest(SimpleTestCase):
+    """Test the requests marked as safe to read from a replica"""
+
+    factory = RequestFactory()
+
+    def process(self, request, view, status=200):
+        """Run the middleware, returning the routing seen by the view"""
+        seen = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen.append(routers.use_replica.get())
+            return HttpResponse(status=status)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        # the routing doesn't outlive the request
+        self.assertFalse(routers.use_replica.get())
+        return seen[0], response
+
+    def test_list_reads_from_replica(self):
+        """Test that the list action of a viewset reads from a replica"""
+        view = CustomerViewSet.as_view({"get": "list", "post": "create"})
+
+        self.assertTrue(self.process(self.factory.get("/"), view)[0])
+        self.assertFalse(self.process(self.factory.post("/"), view)[0])
+
+    def test_reports_read_from_replica(self):
+        """Test that the statements and aging reports read from a replica"""
+        for view in (
+            StatementView.as_view(),
+            AgingReportView.as_view(ledger=AgingBalance.Ledger.RECEIVABLE),
+        ):
+            with self.subTest(view=view):
+                self.assertTrue(self.process(self.factory.get("/"), view)[0])
+
+    def test_views_opt_in(self):
+        """Test that views without replica_actions read the primary"""
+        view = ManageProfileView.as_view()
+
+        self.assertFalse(self.process(self.factory.get("/"), view)[0])
+
+    def test_write_pins_client_to_primary(self):
+        """Test that a client reads from the primary after writing"""
+        view = CustomerViewSet.as_view({"get": "list", "post": "create"})
+        _, response = self.process(self.factory.post("/"), view, 201)
+        pin = response.cookies["primary_pin"].value
+
+        self.assertEqual(response["X-Primary-Pin"], pin)
+        self.assertGreater(float(pin), time.time())
+
+        request = self.factory.get("/")
+        request.COOKIES["primary_pin"] = pin
+        self.assertFalse(self.process(request, view)[0])
+
+        request = self.factory.get("/", HTTP_X_PRIMARY_PIN=pin)
+        self.assertFalse(self.process(request, view)[0])
+
+    def test_failed_write_does_not_pin(self):
+        """Test that a rejected write doesn't pin the client"""
+        view = CustomerViewSet.as_view({"get": "list", "post": "create"})
+        _, response = self.process(self.factory.post("/"), view, 400)
+
+        self.assertNotIn("primary_pin", response.cookies)
+
+    def test_expired_pin(self):
+        """Test that the replicas are read again once the pin expired"""
+        view = CustomerViewSet.as_view({"get": "list"})
+        request = self.factory.get(
+            "/", HTTP_X_PRIMARY_PIN=str(time.time() - 1)
+        )
+
+        self.assertTrue(self.process(request, view)[0])
+
+    def test_disabled_without_replicas(self):
+        """Test that nothing is routed when there are no replicas"""
+        view = CustomerViewSet.as_view({"get": "list"})
+        with self.settings(READ_REPLICAS={"ALIASES": []}):
+            response = ReplicaRoutingMiddleware(
+                lambda request: HttpResponse()
+            )(self.factory.post("/"))
+
+        self.assertNotIn("primary_pin", response.cookies)
+        self.assertIsNone(
+            ReplicaRoutingMiddleware(None).process_view(
+                self.factory.get("/"), view, (), {}
+            )
+        )
@@ -0,0 +1,168 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Company,
+    Customer,
+    Invoice,
+    InvoiceItem,
+    Product,
+    ProductCategory,
+    Supplier,
+)
+
+INVOICE_URL = reverse("customer:invoice-list")
+
+
+class SparseFieldsetApiTest(TestCase):
+    """Test the ?fields= and ?expand= query params on list endpoints"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        supplier = Supplier.objects.create(
+            company=self.company, name="testsupplier"
+        )
+        category = ProductCategory.objects.create(
+            company=self.company, name="testcategory"
+        )
+        self.product = Product.objects.create(
+            category=category,
+            supplier=supplier,
+            name="testproduct",
+            unit="pc",
+            cost="1.00",
+            unit_price="2.00",
+        )
+        for i in range(3):
+            self._create_invoice(f"INV-{i}")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_invoice(self, reference):
+        invoice = Invoice.objects.create(
+            company=self.company,
+            customer=self.customer,
+            reference=reference,
+            date="2001-01-10",
+            gst_rate="0",
+            discount_rate="0",
+            gst_amount="0",
+            discount_amount="0",
+            net="4.00",
+            total_amount="4.00",
+            grand_total="4.00",
+            credits_applied="0.00",
+            balance_due="4.00",
+        )
+        InvoiceItem.objects.create(
+            invoice=invoice,
+            product=self.product,
+            unit="pc",
+            unit_price=Decimal("2.00"),
+            quantity=2,
+            amount=Decimal("4.00"),
+        )
+        return invoice
+
+    def test_list_without_fields_renders_everything(self):
+        """Test that the default representation is unchanged"""
+        res = self.client.get(INVOICE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        invoice = res.data["results"][0]
+        self.assertIn("invoiceitem_set", invoice)
+        self.assertIn("creditsapplication_set", invoice)
+        self.assertEqual(invoice["company_name"], "testcompany")
+        self.assertEqual(len(invoice["invoiceitem_set"]), 1)
+
+    def test_list_with_fields(self):
+        """Test that only the requested fields (and id) are rendered"""
+        res = self.client.get(
+            INVOICE_URL, {"fields": "reference,date,customer,grand_total"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(res.data["results"][0]),
+            {"id", "reference", "date", "customer", "grand_total"},
+        )
+        self.assertEqual(res.data["results"][0]["grand_total"], "4.00")
+
+    def test_list_with_fields_and_expand(self):
+        """Test that expanded nested fields are added to the fieldset"""
+        res = self.client.get(
+            INVOICE_URL,
+            {"fields": "reference", "expand": "invoiceitem_set"},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        invoice = res.data["results"][0]
+        self.assertEqual(set(invoice), {"id", "reference", "invoiceitem_set"})
+        # the nested serializer is not pruned by the root's query params
+        self.assertEqual(
+            set(invoice["invoiceitem_set"][0]),
+            {
+                "id",
+                "product",
+                "invoice",
+                "unit",
+                "unit_price",
+                "quantity",
+                "amount",
+            },
+        )
+
+    def test_sparse_list_is_a_single_narrow_query(self):
+        """Test that unrendered relations are neither joined nor prefetched"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(
+                INVOICE_URL, {"fields": "reference,customer,grand_total"}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # count query for the paginator + the page itself
+        self.assertEqual(len(ctx.captured_queries), 2)
+        page_sql = ctx.captured_queries[-1]["sql"]
+        self.assertNotIn("JOIN", page_sql)
+        self.assertNotIn("description", page_sql)
+
+    def test_full_list_query_count_does_not_grow_with_rows(self):
+        """Test that nested sets are prefetched instead of queried per row"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(INVOICE_URL)
+        num_queries = len(ctx.captured_queries)
+
+        for i in range(3, 10):
+            self._create_invoice(f"INV-{i}")
+
+        with self.assertNumQueries(num_queries):
+            res = self.client.get(INVOICE_URL)
+        self.assertEqual(len(res.data["results"]), 10)
+
+    def test_retrieve_with_fields(self):
+        """Test that ?fields= also applies to the detail endpoint"""
+        invoice = Invoice.objects.first()
+        url = reverse("customer:invoice-detail", args=[invoice.id])
+
+        res = self.client.get(url, {"fields": "reference"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(res.data), {"id", "reference"})
@@ -0,0 +1,151 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.middleware import sqlinstrumentation
+from core.models import Company, Role
+
+
+# employees and users share the "user" basename
+EMPLOYEE_URL = "/api/employees/"
+SQL_SUMMARY_URL = reverse("core:sql-summary")
+
+
+class FingerprintTest(TestCase):
+    """Test the normalization of statements into fingerprints"""
+
+    def test_params_and_literals_are_normalized(self):
+        """Test that the same query with other params matches"""
+        self.assertEqual(
+            sqlinstrumentation.fingerprint(
+                "SELECT * FROM t WHERE a = %s AND b IN (%s, %s) LIMIT 21"
+            ),
+            sqlinstrumentation.fingerprint(
+                "SELECT *  FROM t\nWHERE a = %s AND b IN (%s) LIMIT 1"
+            ),
+        )
+
+    def test_quoted_literals_are_normalized(self):
+        """Test that inlined string literals are stripped"""
+        self.assertEqual(
+            sqlinstrumentation.fingerprint("SELECT 'it''s' FROM t"),
+            "SELECT ? FROM t",
+        )
+
+
+@override_settings(
+    SQL_INSTRUMENTATION={
+        "ENABLED": True,
+        "SAMPLE_RATE": 1.0,
+        "REPEATED_THRESHOLD": 3,
+    }
+)
+class SQLInstrumentationMiddlewareTest(TestCase):
+    """Test the per request SQL instrumentation"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        role = Role.objects.create(company=self.company, name="testrole")
+        for i in range(4):
+            employee = get_user_model().objects.create_user(
+                f"employee{i}@crownkiraappdev.com",
+                "password123",
+                company=self.company,
+            )
+            employee.roles.set([role])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        sqlinstrumentation.summary.reset()
+
+    def test_server_timing_header(self):
+        """Test that the query count and db time are in Server-Timing"""
+        res = self.client.get(EMPLOYEE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertRegex(
+            res["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$',
+        )
+
+    def test_log_line_reports_repeated_statements(self):
+        """Test that per row queries are reported as repeated statements"""
+        with self.assertLogs("core.sql", level="INFO") as logs:
+            self.client.get(EMPLOYEE_URL)
+
+        report = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(report["label"], "EmployeeViewSet.list")
+        self.assertEqual(report["status"], status.HTTP_200_OK)
+        self.assertGreater(report["count"], 4)
+        self.assertTrue(report["slowest"])
+        # get_role_permissions() runs once per employee
+        self.assertTrue(
+            any(
+                repeated["count"] >= 4
+                and "auth_permission" in repeated["fingerprint"]
+                for repeated in report["repeated"]
+            )
+        )
+
+    def test_summary_aggregates_per_endpoint(self):
+        """Test that the summary aggregates the instrumented requests"""
+        superuser = get_user_model().objects.create_superuser(
+            "admin@crownkiraappdev.com", "password123"
+        )
+        self.client.get(EMPLOYEE_URL)
+        self.client.get(EMPLOYEE_URL)
+
+        self.client.force_authenticate(superuser)
+        res = self.client.get(SQL_SUMMARY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        endpoint = next(
+            endpoint
+            for endpoint in res.data
+            if endpoint["label"] == "EmployeeViewSet.list"
+        )
+        self.assertEqual(endpoint["requests"], 2)
+        self.assertTrue(endpoint["repeated"])
+
+    def test_unresolved_requests(self):
+        """Test that the requests of no endpoint share one summary entry"""
+        with self.assertLogs("core.sql", level="INFO") as logs:
+            self.client.get("/api/missing/1/")
+            self.client.get("/api/missing/2/")
+
+        report = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(report["label"], sqlinstrumentation.UNRESOLVED)
+        self.assertEqual(report["path"], "/api/missing/2/")
+        self.assertEqual(
+            [
+                (endpoint["label"], endpoint["requests"])
+                for endpoint in sqlinstrumentation.summary.as_list()
+            ],
+            [(sqlinstrumentation.UNRESOLVED, 2)],
+        )
+
+    def test_summary_requires_superuser(self):
+        """Test that company owners can't read the summary"""
+        res = self.client.get(SQL_SUMMARY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_sampling(self):
+        """Test that requests outside the sample are not instrumented"""
+        with self.settings(
+            SQL_INSTRUMENTATION={"ENABLED": True, "SAMPLE_RATE": 0}
+        ):
+            res = self.client.get(EMPLOYEE_URL)
+
+        self.assertFalse(res.has_header("Server-Timing"))
+        self.assertEqual(sqlinstrumentation.summary.as_list(), [])
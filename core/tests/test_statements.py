@@ -0,0 +1,247 @@
+from datetime import date
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import statements
+from core.models import (
+    Company,
+    CreditNote,
+    CreditsApplication,
+    Customer,
+    Invoice,
+)
+
+
+def inherited_connections():
+    return [
+        connection.alias
+        for connection in connections.all()
+        if connection.connection is not None
+    ]
+
+
+STATEMENTS_URL = reverse("customer:statements")
+
+
+class StatementTest(TestCase):
+    """Test the statements of account of the customers"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.other_customer = Customer.objects.create(
+            company=self.company, name="othercustomer"
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.count = 0
+
+    def document(self, model, date, amount, **fields):
+        self.count += 1
+        return model.objects.create(
+            company=fields.pop("company", self.company),
+            customer=fields.pop("customer", self.customer),
+            reference=f"D-{self.count}",
+            date=date,
+            gst_rate="0",
+            discount_rate="0",
+            gst_amount="0",
+            discount_amount="0",
+            net=amount,
+            total_amount=amount,
+            grand_total=amount,
+            **fields,
+        )
+
+    def invoice(self, date, amount, status="UPD", **fields):
+        return self.document(
+            Invoice,
+            date,
+            amount,
+            status=status,
+            credits_applied="0",
+            balance_due=amount,
+            **fields,
+        )
+
+    def params(self, **params):
+        return {"start": "2001-02-01", "end": "2001-02-28", **params}
+
+    def get(self, **params):
+        res = self.client.get(STATEMENTS_URL, self.params(**params))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return b"".join(res.streaming_content)
+
+    def test_statements(self):
+        """Test the balances and lines of the statements"""
+        self.invoice("2001-01-10", "100")
+        paid = self.invoice(
+            "2001-01-20", "50", status="PD", payment_date="2001-02-03"
+        )
+        invoice = self.invoice("2001-02-05", "30")
+        credit_note = self.document(
+            CreditNote,
+            "2001-02-06",
+            "10",
+            status="OP",
+            credits_used="10",
+            credits_remaining="0",
+            refund="0",
+        )
+        CreditsApplication.objects.create(
+            invoice=invoice,
+            credit_note=credit_note,
+            amount_to_credit="10",
+            date="2001-02-07",
+        )
+        self.invoice("2001-03-01", "1000")
+        self.invoice("2001-02-10", "1000", status="DFT")
+        self.invoice(
+            "2001-02-10",
+            "1000",
+            company=Company.objects.create(name="other"),
+            customer=None,
+        )
+        self.invoice("2001-01-01", "5", customer=self.other_customer)
+
+        data = json.loads(self.get())
+
+        self.assertEqual(len(data), 2)
+        statement, other = data
+        self.assertEqual(statement["customer"], self.customer.pk)
+        self.assertEqual(statement["name"], "testcustomer")
+        self.assertEqual(statement["opening_balance"], "150.00")
+        self.assertEqual(
+            [
+                (line["date"], line["type"], line["reference"])
+                for line in statement["lines"]
+            ],
+            [
+                ("2001-02-03", "payment", paid.reference),
+                ("2001-02-05", "invoice", invoice.reference),
+                ("2001-02-07", "credits_applied", credit_note.reference),
+            ],
+        )
+        self.assertEqual(
+            [line["balance"] for line in statement["lines"]],
+            ["100.00", "130.00", "120.00"],
+        )
+        self.assertEqual(statement["closing_balance"], "120.00")
+        # without lines in the period
+        self.assertEqual(other["lines"], [])
+        self.assertEqual(other["opening_balance"], "5.00")
+        self.assertEqual(other["closing_balance"], "5.00")
+
+    def test_customers(self):
+        """Test limiting the statements to some customers"""
+        self.invoice("2001-02-05", "30")
+        self.invoice("2001-02-05", "40", customer=self.other_customer)
+
+        data = json.loads(self.get(customer=[self.other_customer.pk]))
+
+        self.assertEqual(
+            [statement["customer"] for statement in data],
+            [self.other_customer.pk],
+        )
+
+    def test_chunks(self):
+        """Test that statements are split correctly across fetches"""
+        for day in range(1, 6):
+            self.invoice(f"2001-02-0{day}", "1")
+            self.invoice(f"2001-02-0{day}", "2", customer=self.other_customer)
+
+        statement, other = statements.get_statements(
+            self.company, date(2001, 2, 1), date(2001, 2, 28), chunk_size=3
+        )
+
+        self.assertEqual(len(statement["lines"]), 5)
+        self.assertEqual(statement["closing_balance"], 5)
+        self.assertEqual(len(other["lines"]), 5)
+        self.assertEqual(other["closing_balance"], 10)
+
+    def test_pdf(self):
+        """Test rendering the statements as a PDF document"""
+        self.invoice("2001-02-05", "30")
+        self.invoice("2001-02-05", "40", customer=self.other_customer)
+
+        res = self.client.get(STATEMENTS_URL, self.params(format="pdf"))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "application/pdf")
+        self.assertIn(
+            "statements-2001-02-01-2001-02-28.pdf", res["Content-Disposition"]
+        )
+        content = b"".join(res.streaming_content)
+        self.assertTrue(content.startswith(b"%PDF-1.4"))
+        self.assertTrue(content.endswith(b"%%EOF\n"))
+        self.assertIn(b"/Count 2", content)
+        self.assertIn(b"(Customer: othercustomer)", content)
+
+    @override_settings(STATEMENTS={"BATCH_SIZE": 1})
+    def test_parallel_rendering(self):
+        """Test rendering the statements across processes"""
+        self.invoice("2001-02-05", "30")
+        self.invoice("2001-02-05", "40", customer=self.other_customer)
+        rows = list(
+            statements.get_statements(
+                self.company, date(2001, 2, 1), date(2001, 2, 28)
+            )
+        )
+
+        self.assertEqual(
+            b"".join(statements.stream_pdf(rows, "testcompany", workers=2)),
+            b"".join(statements.stream_pdf(rows, "testcompany", workers=0)),
+        )
+
+    def test_shared_pool(self):
+        """Test that the requests share one pool, without the connections"""
+        Customer.objects.exists()
+
+        executor = statements.get_executor(2)
+
+        self.assertIs(statements.get_executor(2), executor)
+        self.assertIsNotNone(connections["default"].connection)
+        self.assertEqual(executor.submit(inherited_connections).result(), [])
+
+    def test_database_chosen_on_call(self):
+        """Test that a stream reads the database routed to when created"""
+        self.invoice("2001-02-05", "30")
+        with mock.patch.object(
+            statements.router, "db_for_read", return_value="default"
+        ) as db_for_read:
+            rows = statements.get_statements(
+                self.company, date(2001, 2, 1), date(2001, 2, 28)
+            )
+
+        db_for_read.assert_called_once_with(Invoice)
+        self.assertEqual(len(list(rows)), 1)
+
+    def test_invalid_period(self):
+        """Test that the period must start before it ends"""
+        res = self.client.get(
+            STATEMENTS_URL, {"start": "2001-02-28", "end": "2001-02-01"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_login_required(self):
+        """Test that login is required for the statements"""
+        res = APIClient().get(STATEMENTS_URL, self.params())
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,184 @@
+import hashlib
+from io import BytesIO
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import SkipFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Company, Customer
+from core.storage import S3Storage, StagedFile, StorageUploadHandler
+
+
+def detail_url(pk):
+    return reverse("customer:customer-detail", args=[pk])
+
+
+def png(size=(32, 32)):
+    image = BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(image, "PNG")
+    return image.getvalue()
+
+
+def s3_storage():
+    """An S3 storage with a stubbed bucket"""
+    storage = S3Storage(
+        access_key="AKIDEXAMPLE",
+        secret_key="secret",
+        bucket_name="bucket",
+        location="media",
+        default_acl="public-read",
+        region_name="us-east-1",
+    )
+    storage._bucket = mock.Mock()
+    return storage
+
+
+class StorageUploadHandlerTest(TestCase):
+    """Test streaming the files uploaded to the storage"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+            PRESIGNED_UPLOADS={
+                "MAX_SIZE": {"image": 10000, "document": 20000},
+            },
+            STREAMING_UPLOADS={"CHUNK_SIZE": 1024},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def staged(self):
+        staging = os.path.join(self.media_root, "staging", "uploads")
+        return os.listdir(staging) if os.path.isdir(staging) else []
+
+    def upload(self, content, **data):
+        return self.client.patch(
+            detail_url(self.customer.pk),
+            {"image": SimpleUploadedFile("logo.png", content), **data},
+            format="multipart",
+        )
+
+    def test_upload_image(self):
+        """Test that the image streamed is moved to its field"""
+        content = png()
+        self.assertGreater(len(content), 1024)
+
+        res = self.upload(content)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.customer.refresh_from_db()
+        self.assertTrue(
+            self.customer.image.name.startswith("uploads/customer/images/")
+        )
+        with self.customer.image.open("rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(self.staged(), [])
+
+    def test_size_cap(self):
+        """Test that files larger than the cap of their field are rejected"""
+        res = self.upload(png((128, 128)))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", res.data)
+        self.customer.refresh_from_db()
+        self.assertFalse(self.customer.image)
+        self.assertEqual(self.staged(), [])
+
+    def test_invalid_request(self):
+        """Test that the staged files of rejected requests are deleted"""
+        res = self.upload(png(), email="not an email")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.staged(), [])
+
+    def test_staged_file(self):
+        """Test the staged file returned by the handler"""
+        storage = FileSystemStorage(location=self.media_root)
+        handler = StorageUploadHandler(storage=storage)
+        content = b"x" * 2500
+
+        handler.new_file("resume", "resume.pdf", "application/pdf", None)
+        for start in range(0, len(content), 1000):
+            handler.receive_data_chunk(content[start:][:1000], start)
+        file = handler.file_complete(len(content))
+
+        self.assertEqual(file.name, "resume.pdf")
+        self.assertEqual(file.size, 2500)
+        self.assertEqual(file.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(file.read(), content)
+        self.assertTrue(storage.exists(file.staged_name))
+        file.close()
+        self.assertFalse(storage.exists(file.staged_name))
+
+    def test_s3_abort(self):
+        """Test that the multipart uploads of rejected files are aborted"""
+        storage = s3_storage()
+        obj = storage._bucket.Object.return_value
+        obj.key = "media/staging/uploads/logo.png"
+        handler = StorageUploadHandler(storage=storage)
+
+        handler.new_file("image", "logo.png", "image/png", None)
+        handler.receive_data_chunk(b"x" * 1000, 0)
+        with self.assertRaises(SkipFile):
+            handler.receive_data_chunk(b"x" * 10000, 1000)
+
+        multipart = obj.initiate_multipart_upload.return_value
+        multipart.abort.assert_called_once_with()
+        multipart.complete.assert_not_called()
+        self.assertIsNone(handler.writer)
+
+    @override_settings(DEDUP_STORAGE={"ENABLED": False})
+    def test_s3_copy(self):
+        """Test that files staged in the bucket are copied within S3"""
+        storage = s3_storage()
+        file = StagedFile(
+            storage,
+            "staging/uploads/a.png",
+            "a.png",
+            "image/png",
+            4,
+            None,
+            "digest",
+        )
+
+        name = storage.save("uploads/customer/images/b.png", file)
+
+        self.assertEqual(name, "uploads/customer/images/b.png")
+        storage._bucket.Object.assert_called_with(
+            "media/uploads/customer/images/b.png"
+        )
+        copy = storage._bucket.Object.return_value.copy
+        (source,) = copy.call_args.args
+        self.assertEqual(
+            source, {"Bucket": "bucket", "Key": "media/staging/uploads/a.png"}
+        )
+        extra_args = copy.call_args.kwargs["ExtraArgs"]
+        self.assertEqual(extra_args["ContentType"], "image/png")
+        self.assertEqual(extra_args["ACL"], "public-read")
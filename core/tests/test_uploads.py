@@ -0,0 +1,235 @@
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from botocore.stub import Stubber
+from rest_framework import status
+from rest_framework.test import APIClient
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from core.models import Company, Customer, ProductCategory
+from core.storage import LocalUploadBackend, S3UploadBackend, uploads
+
+UPLOAD_URL = reverse("core:upload")
+COMPLETE_URL = reverse("core:upload-complete")
+
+
+class UploadTest(TestCase):
+    """Test uploading files straight to the storage"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        # DEFAULT_FILE_STORAGE resets default_storage on enter and exit
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+            PRESIGNED_UPLOADS={
+                "EXPIRES": 60,
+                "MAX_SIZE": {"image": 10, "document": 20},
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.company = Company.objects.create(name="testcompany")
+        self.customer = Customer.objects.create(
+            company=self.company, name="testcustomer"
+        )
+        self.owner = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+        )
+        self.employee = get_user_model().objects.create_user(
+            "employee@crownkiraappdev.com",
+            "password123",
+            company=self.company,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def start(self, **fields):
+        return self.client.post(
+            UPLOAD_URL,
+            {
+                "target": "customer.image",
+                "object_id": self.customer.pk,
+                "filename": "logo.png",
+                "content_type": "image/png",
+                "size": 4,
+                **fields,
+            },
+            format="json",
+        )
+
+    def post_file(self, upload, content=b"\x89PNG", **fields):
+        return APIClient().post(
+            upload["url"],
+            {
+                **upload["fields"],
+                "file": SimpleUploadedFile("logo.png", content),
+                **fields,
+            },
+            format="multipart",
+        )
+
+    def complete(self, token):
+        return self.client.post(COMPLETE_URL, {"token": token}, format="json")
+
+    def test_upload(self):
+        """Test uploading an image and attaching it to its object"""
+        self.assertIsInstance(uploads.get_backend(), LocalUploadBackend)
+
+        res = self.start()
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        name = res.data["name"]
+        self.assertTrue(name.startswith("uploads/customer/images/"))
+        self.assertTrue(name.endswith(".png"))
+
+        upload = self.post_file(res.data["upload"])
+        self.assertEqual(upload.status_code, status.HTTP_204_NO_CONTENT)
+        res = self.complete(res.data["token"])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["title"], name)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.image.name, name)
+        self.assertEqual(self.customer.image.read(), b"\x89PNG")
+
+    def test_complete_before_upload(self):
+        """Test that uploads are only completed once the file is stored"""
+        res = self.complete(self.start().data["token"])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.customer.refresh_from_db()
+        self.assertFalse(self.customer.image)
+
+    def test_invalid_uploads(self):
+        """Test the checks of the files to upload"""
+        for fields in (
+            {"size": 11},
+            {"content_type": "application/pdf"},
+            {"filename": "logo.exe"},
+            {"target": "customer.resume"},
+        ):
+            with self.subTest(fields=fields):
+                res = self.start(**fields)
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(
+            UPLOAD_URL,
+            {
+                "target": "user.resume",
+                "object_id": self.employee.pk,
+                "filename": "resume.pdf",
+                "content_type": "application/pdf",
+                "size": 20,
+            },
+            format="json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_policy_enforced(self):
+        """Test that the file posted must match the presigned form"""
+        upload = self.start().data["upload"]
+
+        for fields in (
+            {"file": SimpleUploadedFile("logo.png", b"x" * 11)},
+            {"key": "uploads/customer/images/other.png"},
+            {"Content-Type": "text/html"},
+            {"policy": "forged"},
+        ):
+            with self.subTest(fields=list(fields)):
+                res = self.post_file(upload, **fields)
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_objects_of_other_companies(self):
+        """Test that files are only uploaded to objects of the company"""
+        other = Customer.objects.create(
+            company=Company.objects.create(name="other"), name="other"
+        )
+        res = self.start(object_id=other.pk)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # nor completed by another company
+        token = self.start().data["token"]
+        intruder = get_user_model().objects.create_user(
+            "intruder@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=other.company,
+        )
+        self.client.force_authenticate(intruder)
+        res = self.complete(token)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_employee_profile(self):
+        """Test that employees only upload to their own profile"""
+        self.client.force_authenticate(self.employee)
+
+        res = self.start(target="user.image", object_id=self.owner.pk)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.start(target="user.image", object_id=self.employee.pk)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.start(
+            target="productcategory.image",
+            object_id=ProductCategory.objects.create(
+                company=self.company, name="category"
+            ).pk,
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def s3_storage(self):
+        return S3Boto3Storage(
+            access_key="AKIDEXAMPLE",
+            secret_key="secret",
+            bucket_name="bucket",
+            location="media",
+            default_acl="public-read",
+            region_name="us-east-1",
+        )
+
+    def test_s3_presigned_post(self):
+        """Test the POST policy presigned for S3"""
+        storage = self.s3_storage()
+
+        upload = S3UploadBackend(storage).generate_upload(
+            "uploads/a.png", "image/png", 10, 60
+        )
+
+        self.assertIn("bucket", upload["url"])
+        self.assertEqual(upload["fields"]["key"], "media/uploads/a.png")
+        self.assertEqual(upload["fields"]["Content-Type"], "image/png")
+        self.assertEqual(upload["fields"]["acl"], "public-read")
+        self.assertIn("policy", upload["fields"])
+
+    def test_s3_describe(self):
+        """Test checking the objects uploaded to S3"""
+        backend = S3UploadBackend(self.s3_storage())
+        key = {"Bucket": "bucket", "Key": "media/uploads/a.png"}
+
+        with Stubber(backend.client) as stubber:
+            stubber.add_response(
+                "head_object",
+                {"ContentLength": 4, "ContentType": "image/png"},
+                key,
+            )
+            stubber.add_client_error(
+                "head_object", "404", http_status_code=404
+            )
+            self.assertEqual(
+                backend.describe("uploads/a.png"), (4, "image/png")
+            )
+            self.assertIsNone(backend.describe("uploads/a.png"))
+
+    def test_login_required(self):
+        """Test that login is required for uploads"""
+        res = APIClient().post(UPLOAD_URL, {})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
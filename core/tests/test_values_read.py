@@ -0,0 +1,322 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import (
+    Company,
+    CreditNote,
+    CreditNoteItem,
+    CreditsApplication,
+    Customer,
+    DeliveryOrder,
+    DeliveryOrderItem,
+    Invoice,
+    InvoiceItem,
+    PaymentMethod,
+    Payslip,
+    Product,
+    ProductCategory,
+    PurchaseOrder,
+    PurchaseOrderItem,
+    Receive,
+    ReceiveItem,
+    SalesOrder,
+    SalesOrderItem,
+    Supplier,
+)
+from core.serializers import ValuesRowRenderer
+from core.views import BaseAttrViewSet
+
+DOCUMENT_TOTALS = {
+    "date": "2001-01-10",
+    "description": "test document",
+    "gst_rate": Decimal("7.00"),
+    "discount_rate": Decimal("0.00"),
+    "gst_amount": Decimal("0.28"),
+    "discount_amount": Decimal("0.00"),
+    "net": Decimal("4.00"),
+    "total_amount": Decimal("4.00"),
+    "grand_total": Decimal("4.28"),
+}
+LINE_ITEM = {
+    "unit": "pc",
+    "unit_price": Decimal("2.00"),
+    "quantity": 2,
+    "amount": Decimal("4.00"),
+}
+
+
+class ValuesReadParityTest(TestCase):
+    """Test that values based list pages match the serializers' output"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="testcompany")
+        self.user = get_user_model().objects.create_user(
+            "test@crownkiraappdev.com",
+            "password123",
+            is_staff=True,
+            company=self.company,
+            name="testuser",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.customer = Customer.objects.create(
+            company=self.company,
+            reference="C-0001",
+            name="testcustomer",
+            image="uploads/customer/images/customer.png",
+        )
+        self.customer.agents.set([self.user])
+        Customer.objects.create(
+            company=self.company, reference="C-0002", name="noimage"
+        )
+        self.supplier = Supplier.objects.create(
+            company=self.company,
+            reference="S-0001",
+            name="testsupplier",
+            image="uploads/supplier/images/supplier.png",
+        )
+        category = ProductCategory.objects.create(
+            company=self.company, name="testcategory"
+        )
+        self.product = Product.objects.create(
+            reference="P-0001",
+            category=category,
+            supplier=self.supplier,
+            name="testproduct",
+            unit="pc",
+            cost=Decimal("1.50"),
+            unit_price=Decimal("2.00"),
+            image="uploads/product/images/product.png",
+        )
+        PaymentMethod.objects.create(company=self.company, name="cash")
+        Payslip.objects.create(
+            user=self.user,
+            company=self.company,
+            date="2001-01-31",
+            year="2001",
+            month="1",
+            basic_salary=Decimal("1000"),
+            total_allowances=Decimal("10.5"),
+            total_deductions=Decimal("0"),
+            sale_price=Decimal("0"),
+            commission=Decimal("0"),
+            commission_amt=Decimal("0"),
+            net_pay=Decimal("1010.50"),
+            payment_method="cash",
+            bank="testbank",
+            status="PD",
+        )
+
+        sales_order = SalesOrder.objects.create(
+            company=self.company,
+            reference="SO-0001",
+            customer=self.customer,
+            salesperson=self.user,
+            status="CP",
+            **DOCUMENT_TOTALS,
+        )
+        sales_order_item = SalesOrderItem.objects.create(
+            sales_order=sales_order, product=self.product, **LINE_ITEM
+        )
+        SalesOrder.objects.create(
+            company=self.company,
+            reference="SO-0002",
+            customer=self.customer,
+            **DOCUMENT_TOTALS,
+        )
+        invoice = Invoice.objects.create(
+            company=self.company,
+            reference="INV-0001",
+            customer=self.customer,
+            salesperson=self.user,
+            sales_order=sales_order,
+            status="UPD",
+            credits_applied=Decimal("1.00"),
+            balance_due=Decimal("3.28"),
+            **DOCUMENT_TOTALS,
+        )
+        for _ in range(2):
+            InvoiceItem.objects.create(
+                invoice=invoice, product=self.product, **LINE_ITEM
+            )
+        delivery_order = DeliveryOrder.objects.create(
+            company=self.company,
+            reference="DO-0001",
+            customer=self.customer,
+            salesperson=self.user,
+            sales_order=sales_order,
+            invoice=invoice,
+            **DOCUMENT_TOTALS,
+        )
+        DeliveryOrderItem.objects.create(
+            delivery_order=delivery_order,
+            product=self.product,
+            sales_order_item=sales_order_item,
+            **LINE_ITEM,
+        )
+        DeliveryOrder.objects.create(
+            company=self.company,
+            reference="DO-0002",
+            customer=self.customer,
+            **DOCUMENT_TOTALS,
+        )
+        credit_note = CreditNote.objects.create(
+            company=self.company,
+            reference="CN-0001",
+            customer=self.customer,
+            created_from=invoice,
+            credits_used=Decimal("1.00"),
+            refund=Decimal("0.00"),
+            credits_remaining=Decimal("3.28"),
+            **DOCUMENT_TOTALS,
+        )
+        CreditNoteItem.objects.create(
+            credit_note=credit_note, product=self.product, **LINE_ITEM
+        )
+        CreditsApplication.objects.create(
+            invoice=invoice,
+            credit_note=credit_note,
+            amount_to_credit=Decimal("1.00"),
+            date="2001-01-11",
+        )
+        purchase_order = PurchaseOrder.objects.create(
+            company=self.company,
+            reference="PO-0001",
+            supplier=self.supplier,
+            **DOCUMENT_TOTALS,
+        )
+        PurchaseOrderItem.objects.create(
+            purchase_order=purchase_order, product=self.product, **LINE_ITEM
+        )
+        PurchaseOrder.objects.create(
+            company=self.company,
+            reference="PO-0002",
+            supplier=self.supplier,
+            **DOCUMENT_TOTALS,
+        )
+        receive = Receive.objects.create(
+            company=self.company,
+            reference="R-0001",
+            supplier=self.supplier,
+            purchase_order=purchase_order,
+            payment_date="2001-01-12",
+            **DOCUMENT_TOTALS,
+        )
+        ReceiveItem.objects.create(
+            receive=receive, product=self.product, **LINE_ITEM
+        )
+
+    def assertParity(self, url_name, params=None):
+        url = reverse(url_name)
+        with patch.object(
+            ValuesRowRenderer,
+            "render",
+            autospec=True,
+            side_effect=ValuesRowRenderer.render,
+        ) as render:
+            res = self.client.get(url, params)
+        self.assertTrue(render.called)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.data["results"])
+
+        with patch.object(BaseAttrViewSet, "get_values_renderer") as gvr:
+            gvr.return_value = None
+            expected = self.client.get(url, params)
+
+        self.assertEqual(res.content, expected.content)
+
+    def test_customer_list_parity(self):
+        """Test the customer list renders the same from values"""
+        self.assertParity("customer:customer-list")
+
+    def test_supplier_list_parity(self):
+        """Test the supplier list renders the same from values"""
+        self.assertParity("supplier:supplier-list")
+
+    def test_category_list_parity(self):
+        """Test the category list renders the same from values"""
+        self.assertParity("company:productcategory-list")
+
+    def test_product_list_parity(self):
+        """Test the product list renders the same from values"""
+        self.assertParity("company:product-list")
+
+    def test_payment_method_list_parity(self):
+        """Test the payment method list renders the same from values"""
+        self.assertParity("company:paymentmethod-list")
+
+    def test_payslip_list_parity(self):
+        """Test the payslip list renders the same from values"""
+        self.assertParity("company:payslip-list")
+
+    def test_invoice_list_parity(self):
+        """Test the invoice list renders the same from values"""
+        self.assertParity("customer:invoice-list")
+
+    def test_sales_order_list_parity(self):
+        """Test the sales order list renders the same from values"""
+        self.assertParity("customer:salesorder-list")
+
+    def test_credit_note_list_parity(self):
+        """Test the credit note list renders the same from values"""
+        self.assertParity("customer:creditnote-list")
+
+    def test_delivery_order_list_parity(self):
+        """Test the delivery order list renders the same from values"""
+        self.assertParity("customer:deliveryorder-list")
+
+    def test_receive_list_parity(self):
+        """Test the receive list renders the same from values"""
+        self.assertParity("supplier:receive-list")
+
+    def test_purchase_order_list_parity(self):
+        """Test the purchase order list renders the same from values"""
+        self.assertParity("supplier:purchaseorder-list")
+
+    def test_sparse_list_parity(self):
+        """Test the sparse list renders the same from values"""
+        self.assertParity(
+            "customer:invoice-list",
+            {"fields": "reference,grand_total", "expand": "invoiceitem_set"},
+        )
+
+    def test_sparse_delivery_order_list_parity(self):
+        """Test the sparse delivery order list renders the same from values"""
+        self.assertParity(
+            "customer:deliveryorder-list",
+            {
+                "fields": "reference,company_name,sales_order,invoice",
+                "expand": "deliveryorderitem_set",
+            },
+        )
+
+    def test_filtered_ordered_list_parity(self):
+        """Test the filtered ordered list renders the same from values"""
+        self.assertParity(
+            "customer:invoice-list",
+            {"reference": "INV-0001", "ordering": "customer__name"},
+        )
+
+    def test_invoice_list_query_count(self):
+        """Test that nested sets cost one query per page, not per row"""
+        for i in range(2, 12):
+            Invoice.objects.create(
+                company=self.company,
+                reference=f"INV-{i:04}",
+                customer=self.customer,
+                credits_applied=Decimal("0.00"),
+                balance_due=Decimal("4.28"),
+                **DOCUMENT_TOTALS,
+            )
+
+        # count, page, invoiceitem_set and creditsapplication_set
+        with self.assertNumQueries(4):
+            res = self.client.get(reverse("customer:invoice-list"))
+        self.assertEqual(len(res.data["results"]), 11)
@@ -0,0 +1,37 @@
+from django.urls import path
+
+from core import views
+from core.models import AgingBalance
+
+app_name = "core"
+
+urlpatterns = [
+    path("sql_summary/", views.SQLSummaryView.as_view(), name="sql-summary"),
+    path("db_pool/", views.DBPoolStatsView.as_view(), name="db-pool"),
+    path(
+        "archived_documents/",
+        views.ArchivedDocumentListView.as_view(),
+        name="archived-documents",
+    ),
+    path(
+        "aging/receivables/",
+        views.AgingReportView.as_view(ledger=AgingBalance.Ledger.RECEIVABLE),
+        name="aging-receivables",
+    ),
+    path(
+        "aging/payables/",
+        views.AgingReportView.as_view(ledger=AgingBalance.Ledger.PAYABLE),
+        name="aging-payables",
+    ),
+    path("uploads/", views.UploadView.as_view(), name="upload"),
+    path(
+        "uploads/complete/",
+        views.UploadCompletionView.as_view(),
+        name="upload-complete",
+    ),
+    path(
+        "uploads/local/",
+        views.LocalUploadView.as_view(),
+        name="upload-local",
+    ),
+]
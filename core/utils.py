@@ -2,9 +2,14 @@ from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
 
+from core.models import ArchivedDocument
+
 
 def validate_reference_uniqueness(serializer, model, reference, id):
     # TODO: handle no both pk=id and serializer.instance.id
+    if not reference:
+        # left out, to be allocated by core.numbering
+        return
     company = serializer.context["request"].user.company
 
     if serializer.context["request"].method in ["POST"]:
@@ -23,6 +28,17 @@ def validate_reference_uniqueness(serializer, model, reference, id):
         )
         raise serializers.ValidationError(msg)
 
+    # the references of the archived documents stay taken
+    if ArchivedDocument.objects.filter(
+        company=company,
+        document_type=model._meta.label_lower,
+        reference=reference,
+    ).exists():
+        msg = _(
+            f"A/an {model._meta.model_name} with this reference is archived"
+        )
+        raise serializers.ValidationError(msg)
+
 
 def all_unique(x):
     seen = set()
@@ -31,7 +47,9 @@ def all_unique(x):
 
 def validate_bulk_reference_uniqueness(data):
     bulk = isinstance(data, list)
-    if bulk and not all_unique([item.get("reference") for item in data]):
+    if bulk and not all_unique(
+        [item.get("reference") for item in data if item.get("reference")]
+    ):
         msg = _("Duplicate reference not allowed")
         raise serializers.ValidationError(msg)
     return data
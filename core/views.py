@@ -1,16 +1,40 @@
-from rest_framework import viewsets
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import Http404
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import generics, viewsets, status
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework_bulk import BulkModelViewSet
 
 
+from core import aging, archive, conversion, deletion, numbering
+from core.db import pool
+from core.db.routers import replica_reads
+from core.idempotency import IdempotentCreateMixin, idempotent
+from core.middleware import sqlinstrumentation
+from core.models import ArchivedDocument
+from core.serializers import (
+    AgingReportSerializer,
+    ArchivedDocumentSerializer,
+    UploadCompletionSerializer,
+    UploadRequestSerializer,
+    ValuesRowRenderer,
+)
+from core.storage import media, uploads
 from core.utils import validate_bulk_reference_uniqueness
 from .pagination import StandardResultsSetPagination
 
 
 class BaseAttrViewSet(
     # ListBulkCreateUpdateDestroyAPIView, viewsets.ModelViewSet
-    BulkModelViewSet
+    IdempotentCreateMixin,
+    BulkModelViewSet,
 ):
     """Base attr viewset for all viewsets"""
 
@@ -19,11 +43,159 @@ class BaseAttrViewSet(
     pagination_class = StandardResultsSetPagination
     ordering_fields = "__all__"
     ordering = ["-id"]
+    # serializer field name -> lookups to join or prefetch
+    # only when the field is going to be rendered
+    select_related_fields = {}
+    prefetch_related_fields = {}
+    # render list pages from .values_list() rows instead of
+    # model instances when the serializer supports it
+    values_list_read = False
+    # actions whose reads may be served by a replica,
+    # see core.middleware.ReplicaRoutingMiddleware
+    replica_actions = ("list", "retrieve")
+    # records deleted per transaction by bulk destroy, and the
+    # relations protecting them which release_dependents deletes
+    bulk_destroy_chunk_size = 500
+    released_relations = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        sqlinstrumentation.label_request(
+            request, f"{type(self).__name__}.{self.action}"
+        )
+
+    def list(self, request, *args, **kwargs):
+        renderer = self.get_values_renderer()
+        if renderer is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = renderer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(renderer.render(page))
+
+        return Response(renderer.render(queryset))
+
+    def get_values_renderer(self):
+        """Return the values renderer of the list serializer, if any"""
+        if not self.values_list_read:
+            return None
+        return ValuesRowRenderer.for_serializer(self.get_serializer())
 
     def allow_bulk_destroy(self, qs, filtered):
-        """Don't forget to fine-grain this method"""
-        # TODO: write implementation for bulk destroy
-        return False
+        """Only the records listed in the request are destroyed"""
+        return qs is not filtered
+
+    def get_request_ids(self):
+        """The ids of the request body, a list of ids or of records"""
+        data = self.request.data
+        if not isinstance(data, list) or not data:
+            raise ValidationError(_("Expected a list of ids"))
+        try:
+            return {
+                int(item["id"] if isinstance(item, dict) else item)
+                for item in data
+            }
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(_("Expected a list of ids"))
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        ids = self.get_request_ids()
+        qs = self.get_queryset()
+        filtered = self.filter_queryset(qs).filter(pk__in=ids)
+        if not self.allow_bulk_destroy(qs, filtered):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        found = set(filtered.values_list("pk", flat=True))
+        deleted, errors = self.perform_bulk_destroy(found)
+        for pk in ids - found:
+            errors[pk] = [_("Not found.")]
+        if errors:
+            return Response(
+                {
+                    "deleted": sorted(deleted),
+                    "errors": {pk: errors[pk] for pk in sorted(errors)},
+                }
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def perform_bulk_destroy(self, ids):
+        """Delete the records with ids, see core.deletion"""
+        return deletion.bulk_delete(
+            self.queryset.model,
+            ids,
+            chunk_size=self.bulk_destroy_chunk_size,
+            release=self.release_dependents,
+            released=self.released_relations,
+        )
+
+    def perform_destroy(self, instance):
+        """Delete the record as the bulk destroy does"""
+        with transaction.atomic():
+            self.release_dependents([instance.pk])
+            instance.delete()
+
+    def release_dependents(self, ids):
+        """
+        Hook deleting the released_relations of the records with ids
+        and reversing the totals depending on them, before their deletion
+        """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        # writes reuse the instances after saving them, so
+        # prefetched caches would be stale in the response
+        if self.request.method in ["GET"]:
+            queryset = self.optimize_queryset(queryset)
+
+        return queryset
+
+    def optimize_queryset(self, queryset):
+        """
+        Join and prefetch the relations of the fields being rendered.
+        When the client asks for a sparse fieldset (?fields=),
+        only the columns backing those fields are selected.
+        """
+        rendered_fields = set(self.get_serializer().fields)
+        select_related = self._get_related_lookups(
+            self.select_related_fields, rendered_fields
+        )
+        prefetch_related = self._get_related_lookups(
+            self.prefetch_related_fields, rendered_fields
+        )
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if self.request.query_params.get("fields"):
+            queryset = queryset.only(
+                *self._get_only_fields(
+                    queryset.model, rendered_fields, select_related
+                )
+            )
+
+        return queryset
+
+    def _get_related_lookups(self, related_fields, rendered_fields):
+        lookups = []
+        for field_name, field_lookups in related_fields.items():
+            if field_name in rendered_fields:
+                lookups.extend(
+                    lookup for lookup in field_lookups if lookup not in lookups
+                )
+        return lookups
+
+    def _get_only_fields(self, model, rendered_fields, select_related):
+        concrete_fields = set(
+            field.name for field in model._meta.concrete_fields
+        )
+        only_fields = {model._meta.pk.name}
+        only_fields.update(rendered_fields & concrete_fields)
+        # a relation traversed by select_related can't be deferred
+        only_fields.update(lookup.split("__")[0] for lookup in select_related)
+        return only_fields
 
 
 class BaseAssetAttrViewSet(BaseAttrViewSet):
@@ -41,6 +213,25 @@ class BaseAssetAttrViewSet(BaseAttrViewSet):
 class BaseDocumentViewSet(BaseAssetAttrViewSet):
     """Base viewset for documents"""
 
+    select_related_fields = {
+        "company_name": ["company"],
+    }
+    values_list_read = True
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            # archived documents are restored when accessed
+            with replica_reads(False):
+                if not archive.rehydrate_document(
+                    self.queryset.model,
+                    self.request.user.company,
+                    self.kwargs[self.lookup_url_kwarg or self.lookup_field],
+                ):
+                    raise
+                return super().get_object()
+
     def perform_bulk_create(self, serializer):
         validate_bulk_reference_uniqueness(serializer.validated_data)
         return self.perform_create(serializer)
@@ -51,10 +242,211 @@ class BaseDocumentViewSet(BaseAssetAttrViewSet):
 
     def perform_create(self, serializer):
         company = self.request.user.company
-        serializer.save(
-            company=company,
-            # **self._get_calculated_fields(serializer)
-        )
+        with transaction.atomic():
+            numbering.number_documents(
+                self.queryset.model, company, serializer.validated_data
+            )
+            serializer.save(
+                company=company,
+                # **self._get_calculated_fields(serializer)
+            )
 
     # def perform_update(self, serializer):
     #     serializer.save(**self._get_calculated_fields(serializer))
+
+
+class DocumentConversionMixin:
+    """
+    Convert documents, one or a list of them, into the documents
+    following them, see core.conversion
+    """
+
+    # keyword arguments of conversion.convert_documents
+    conversion = {}
+    converted_serializer_class = None
+
+    @action(detail=True, methods=["post"])
+    def convert(self, request, *args, **kwargs):
+        def create():
+            source = self.get_object()
+            targets, errors = self.perform_convert([source.pk])
+            if errors:
+                raise ValidationError(errors[source.pk])
+            target = self.conversion["target_model"].objects.get(
+                pk=targets[source.pk]
+            )
+            serializer = self.converted_serializer_class(
+                target, context=self.get_serializer_context()
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        return idempotent(self, request, create)
+
+    @action(detail=False, methods=["post"], url_path="convert")
+    def bulk_convert(self, request, *args, **kwargs):
+        def create():
+            targets, errors = self.perform_convert(self.get_request_ids())
+            return Response(
+                {
+                    "converted": {pk: targets[pk] for pk in sorted(targets)},
+                    "errors": {pk: errors[pk] for pk in sorted(errors)},
+                },
+                status=(
+                    status.HTTP_201_CREATED
+                    if targets
+                    else status.HTTP_400_BAD_REQUEST
+                ),
+            )
+
+        return idempotent(self, request, create)
+
+    def perform_convert(self, ids):
+        return conversion.convert_documents(
+            self.queryset.model,
+            company=self.request.user.company,
+            ids=ids,
+            **self.conversion,
+        )
+
+
+class IsSuperUser(IsAuthenticated):
+    def has_permission(self, request, view):
+        return super().has_permission(request, view) and bool(
+            request.user.is_superuser
+        )
+
+
+class SQLSummaryView(APIView):
+    """
+    Per endpoint summary of the SQL run by the instrumented requests
+    of this worker process, see SQLInstrumentationMiddleware
+    """
+
+    authentication_classes = (TokenAuthentication,)
+    # is_staff marks company owners, the summary spans all companies
+    permission_classes = (IsSuperUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(sqlinstrumentation.summary.as_list())
+
+    def delete(self, request, *args, **kwargs):
+        sqlinstrumentation.summary.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class DBPoolStatsView(APIView):
+    """
+    Metrics of the database connection pools of this worker process,
+    see core.db.pool
+    """
+
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsSuperUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(pool.get_pool_stats())
+
+    def delete(self, request, *args, **kwargs):
+        pool.reset_pool_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ArchivedDocumentListView(generics.ListAPIView):
+    """
+    The archived documents of the company, to look them up by
+    reference; retrieving one from its own endpoint restores it
+    """
+
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    pagination_class = StandardResultsSetPagination
+    serializer_class = ArchivedDocumentSerializer
+
+    def get_queryset(self):
+        queryset = ArchivedDocument.objects.filter(
+            company=self.request.user.company
+        ).order_by("-date", "-id")
+        for param in ("document_type", "reference"):
+            value = self.request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(**{param: value})
+        return queryset
+
+
+class AgingReportView(APIView):
+    """
+    Balances of the customers (receivables) or suppliers (payables) of
+    the company by age of their unpaid documents, as of the day they
+    were last refreshed, see core.aging. ?live=true computes them now.
+    """
+
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    replica_actions = ("get",)
+    ledger = None
+
+    def get(self, request, *args, **kwargs):
+        live = request.query_params.get("live", "").lower() in ("1", "true")
+        report = aging.report(self.ledger, request.user.company, live=live)
+        return Response(AgingReportSerializer(report).data)
+
+
+class UploadView(APIView):
+    """
+    Presigned form uploading a file straight to the storage, for the
+    field of an object of the company, see core.storage.uploads
+    """
+
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = UploadRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = uploads.start_upload(
+                request.user, **serializer.validated_data
+            )
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.messages)
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+
+class UploadCompletionView(APIView):
+    """Attach a file uploaded to the storage to its field"""
+
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = UploadCompletionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            file = uploads.complete_upload(
+                request.user, serializer.validated_data["token"]
+            )
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.messages)
+        return Response(media.file_data(file))
+
+
+class LocalUploadView(APIView):
+    """
+    Receives the files uploaded with the forms of the local upload
+    backend, standing in for the storage service. The signed policy of
+    the form authorizes the upload.
+    """
+
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request, *args, **kwargs):
+        backend = uploads.get_backend()
+        if not isinstance(backend, uploads.LocalUploadBackend):
+            raise Http404
+        try:
+            backend.receive(request.data, request.data.get("file"))
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.messages)
+        return Response(status=status.HTTP_204_NO_CONTENT)
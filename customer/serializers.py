@@ -1,6 +1,8 @@
+from collections import Counter
 from decimal import Decimal
 from datetime import datetime
 
+from django.db import transaction
 from django.utils import formats
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth import get_user_model
@@ -11,9 +13,13 @@ from rest_framework_bulk import (
     BulkSerializerMixin,
 )
 
+from core import delivery
+from core.conversion import calculate_totals
 from core.models import (
     Invoice,
     Customer,
+    DeliveryOrder,
+    DeliveryOrderItem,
     SalesOrder,
     InvoiceItem,
     SalesOrderItem,
@@ -21,11 +27,15 @@ from core.models import (
     CreditNoteItem,
     CreditsApplication,
 )
+from core.serializers import SparseFieldsetMixin
+from core.storage import media
 from core.utils import validate_reference_uniqueness, all_unique
 
 
 # TODO: refactor
-class LineItemSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+class LineItemSerializer(
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         list_serializer_class = BulkListSerializer
         abstract = True
@@ -49,10 +59,16 @@ class LineItemSerializer(BulkSerializerMixin, serializers.ModelSerializer):
         return unit_price
 
 
-class DocumentSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+class DocumentSerializer(
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
+):
+    values_method_fields = {"company_name": "company__name"}
+
     class Meta:
         list_serializer_class = BulkListSerializer
         abstract = True
+        # allocated by core.numbering when left out on create
+        extra_kwargs = {"reference": {"required": False}}
 
     def validate_gst_rate(self, gst_rate):
         if gst_rate < 0:
@@ -67,9 +83,13 @@ class DocumentSerializer(BulkSerializerMixin, serializers.ModelSerializer):
         return discount_rate
 
 
-class CustomerSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+class CustomerSerializer(
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
+):
     """Serializer for customer objects"""
 
+    values_file_fields = ("image",)
+
     class Meta:
         model = Customer
         fields = (
@@ -114,10 +134,7 @@ class CustomerSerializer(BulkSerializerMixin, serializers.ModelSerializer):
         return fields
 
     def get_image(self, obj):
-        return {
-            "src": obj.image.url if obj.image else "",
-            "title": obj.image.name if obj.image else "",
-        }
+        return media.file_data(obj.image)
 
     def validate(self, attrs):
         validate_reference_uniqueness(
@@ -670,6 +687,9 @@ class InvoiceSerializer(DocumentSerializer):
 class SalesOrderItemSerializer(LineItemSerializer):
     """Serializer for sales order item objects"""
 
+    # identifies the lines edited once delivered
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = SalesOrderItem
         fields = (
@@ -680,10 +700,11 @@ class SalesOrderItemSerializer(LineItemSerializer):
             "unit_price",
             "quantity",
             "amount",
+            "quantity_delivered",
         )
         read_only_fields = (
-            "id",
             "sales_order",
+            "quantity_delivered",
         )
 
 
@@ -720,6 +741,7 @@ class SalesOrderSerializer(DocumentSerializer):
         )
 
         extra_kwargs = {
+            **DocumentSerializer.Meta.extra_kwargs,
             "invoice": {"allow_null": True},
         }
 
@@ -752,20 +774,62 @@ class SalesOrderSerializer(DocumentSerializer):
         validate_reference_uniqueness(
             self, SalesOrder, attrs.get("reference"), attrs.get("id")
         )
+        items = attrs.get("salesorderitem_set")
+        if items is None or self.context["request"].method not in [
+            "PUT",
+            "PATCH",
+        ]:
+            return attrs
+
+        delivered = dict(
+            SalesOrderItem.objects.filter(
+                sales_order=attrs.get("id") or self.instance.id
+            ).values_list("pk", "quantity_delivered")
+        )
+        if not any(delivered.values()):
+            return attrs
+        # the delivery order items reference the lines, so they are
+        # matched by id once delivered
+        quantities = {}
+        for item in items:
+            if item.get("id") is None:
+                continue
+            if item["id"] not in delivered or item["id"] in quantities:
+                msg = _("The lines must be of the sales order")
+                raise serializers.ValidationError(msg)
+            quantities[item["id"]] = item["quantity"]
+        for pk, quantity_delivered in delivered.items():
+            if not quantity_delivered:
+                continue
+            if pk not in quantities:
+                msg = _("Lines already delivered cannot be removed")
+                raise serializers.ValidationError(msg)
+            if quantities[pk] < quantity_delivered:
+                msg = _("Quantity cannot be less than delivered")
+                raise serializers.ValidationError(msg)
         return attrs
 
     def _update_destroy_or_create(self, instance, salesorderitems_data):
-        salesorderitem_instances = instance.salesorderitem_set.all()
-        salesorderitem_set_count = salesorderitem_instances.count()
+        salesorderitem_instances = list(instance.salesorderitem_set.all())
+        if any(line.quantity_delivered for line in salesorderitem_instances):
+            # by id, see validate()
+            lines = {line.pk: line for line in salesorderitem_instances}
+            matches = [
+                lines.get(salesorderitem_data.get("id"))
+                for salesorderitem_data in salesorderitems_data
+            ]
+        else:
+            # by position
+            matches = salesorderitem_instances[: len(salesorderitems_data)]
         bulk_updates = []
         bulk_creates = []
 
         for i, salesorderitem_data in enumerate(salesorderitems_data):
             salesorderitem_data.pop("id", None)
             salesorderitem_data.pop("pk", None)
-            if i < salesorderitem_set_count:
+            if i < len(matches) and matches[i] is not None:
                 # update
-                salesorderitem_instance = salesorderitem_instances[i]
+                salesorderitem_instance = matches[i]
                 for attr, value in salesorderitem_data.items():
                     setattr(salesorderitem_instance, attr, value)
                 bulk_updates.append(salesorderitem_instance)
@@ -850,16 +914,13 @@ class SalesOrderSerializer(DocumentSerializer):
         salesorderitems_data = validated_data.pop("salesorderitem_set", [])
         sales_order = SalesOrder.objects.create(**validated_data)
         for salesorderitem_data in salesorderitems_data:
+            salesorderitem_data.pop("id", None)
             SalesOrderItem.objects.create(
                 **salesorderitem_data, sales_order=sales_order
             )
 
-        # TODO: create invoice from sales order, can't assign
-        # https://code.djangoproject.com/ticket/18638
-        # assignment for one-to-one doesn't work as expected
-        # if invoice:
-        #     invoice.sales_order = sales_order
-        #     invoice.save()
+        # invoices are created from sales orders by converting them,
+        # see SalesOrderViewSet.convert
 
         return sales_order
 
@@ -873,3 +934,262 @@ class SalesOrderSerializer(DocumentSerializer):
 
         self._update_destroy_or_create(instance, salesorderitems_data)
         return super().update(instance, validated_data)
+
+
+class DeliveryOrderItemSerializer(LineItemSerializer):
+    """Serializer for delivery order item objects"""
+
+    class Meta:
+        model = DeliveryOrderItem
+        fields = (
+            "id",
+            "product",
+            "delivery_order",
+            "sales_order_item",
+            "unit",
+            "unit_price",
+            "quantity",
+            "amount",
+        )
+        read_only_fields = (
+            "id",
+            "delivery_order",
+        )
+        extra_kwargs = {"sales_order_item": {"allow_null": True}}
+
+
+class DeliveryOrderSerializer(DocumentSerializer):
+    """Serializer for delivery order objects"""
+
+    class Meta(DocumentSerializer.Meta):
+        model = DeliveryOrder
+        fields = (
+            "id",
+            "company",
+            "reference",
+            "date",
+            "description",
+            "gst_rate",
+            "discount_rate",
+            "gst_amount",
+            "discount_amount",
+            "net",
+            "total_amount",
+            "grand_total",
+            "customer",
+            "salesperson",
+            "sales_order",
+            "invoice",
+            "credits_applied",
+        )
+        read_only_fields = (
+            "id",
+            "company",
+            "gst_amount",
+            "discount_amount",
+            "net",
+            "total_amount",
+            "grand_total",
+            "credits_applied",
+        )
+        extra_kwargs = {
+            **DocumentSerializer.Meta.extra_kwargs,
+            "sales_order": {"allow_null": True},
+            "invoice": {"allow_null": True},
+        }
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        fields["deliveryorderitem_set"] = DeliveryOrderItemSerializer(
+            many=True,
+        )
+        fields["company_name"] = serializers.SerializerMethodField()
+
+        return fields
+
+    def get_company_name(self, obj):
+        return obj.company.name if obj.company else ""
+
+    def validate(self, attrs):
+        validate_reference_uniqueness(
+            self, DeliveryOrder, attrs.get("reference"), attrs.get("id")
+        )
+        company = self.context["request"].user.company
+        sales_order = attrs.get("sales_order")
+        invoice = attrs.get("invoice")
+        if (sales_order and sales_order.company_id != company.id) or (
+            invoice and invoice.company_id != company.id
+        ):
+            msg = _("The sales order and invoice must be of this company")
+            raise serializers.ValidationError(msg)
+
+        items = attrs.get("deliveryorderitem_set", [])
+        lines = {
+            item["sales_order_item"].pk: item["sales_order_item"]
+            for item in items
+            if item.get("sales_order_item")
+        }
+        if any(
+            sales_order is None or line.sales_order_id != sales_order.pk
+            for line in lines.values()
+        ):
+            msg = _("The lines delivered must be of the sales order")
+            raise serializers.ValidationError(msg)
+
+        before = {}
+        if self.context["request"].method in ["PUT", "PATCH"]:
+            before = delivery.get_delivered(
+                DeliveryOrderItem.objects.filter(
+                    delivery_order=attrs.get("id") or self.instance.id
+                )
+            )
+        changes = delivery.get_changes(before, self._get_delivered(items))
+        if any(
+            lines[pk].quantity_delivered + change > lines[pk].quantity
+            for pk, change in changes.items()
+            if pk in lines
+        ):
+            msg = _("Quantity delivered cannot be more than ordered")
+            raise serializers.ValidationError(msg)
+        return attrs
+
+    def _get_delivered(self, deliveryorderitems_data):
+        delivered = Counter()
+        for deliveryorderitem_data in deliveryorderitems_data:
+            line = deliveryorderitem_data.get("sales_order_item")
+            if line is not None:
+                delivered[line.pk] += deliveryorderitem_data["quantity"]
+        return delivered
+
+    def _add_delivered(self, quantities):
+        try:
+            delivery.add_delivered(quantities)
+        except delivery.OverDelivery:
+            # delivered meanwhile by another delivery order
+            msg = _("Quantity delivered cannot be more than ordered")
+            raise serializers.ValidationError(msg)
+
+    def _update_destroy_or_create(self, instance, deliveryorderitems_data):
+        deliveryorderitem_instances = list(
+            instance.deliveryorderitem_set.order_by("pk")
+        )
+        bulk_updates = []
+        bulk_creates = []
+
+        for i, deliveryorderitem_data in enumerate(deliveryorderitems_data):
+            deliveryorderitem_data.pop("id", None)
+            deliveryorderitem_data.pop("pk", None)
+            if i < len(deliveryorderitem_instances):
+                # update
+                deliveryorderitem_instance = deliveryorderitem_instances[i]
+                for attr, value in deliveryorderitem_data.items():
+                    setattr(deliveryorderitem_instance, attr, value)
+                bulk_updates.append(deliveryorderitem_instance)
+            else:
+                # create
+                bulk_creates.append(
+                    # unpack first to prevent overriding
+                    DeliveryOrderItem(
+                        **deliveryorderitem_data,
+                        delivery_order=instance,
+                    )
+                )
+
+        DeliveryOrderItem.objects.bulk_update(
+            bulk_updates,
+            [
+                "product",
+                "sales_order_item",
+                "unit",
+                "unit_price",
+                "quantity",
+                "amount",
+            ],
+        )
+        # delete
+        DeliveryOrderItem.objects.filter(delivery_order=instance).exclude(
+            pk__in=[obj.pk for obj in bulk_updates]
+        ).delete()
+        DeliveryOrderItem.objects.bulk_create(bulk_creates)
+
+    def _get_calculated_fields(self, validated_data):
+        discount_rate = round(validated_data.pop("discount_rate"), 2)
+        gst_rate = round(validated_data.pop("gst_rate"), 2)
+        deliveryorderitem_set = validated_data.pop("deliveryorderitem_set")
+        # amounts rounded as the other documents do
+        deliveryorderitem_set = [
+            {
+                **deliveryorderitem,
+                "amount": round(
+                    round(deliveryorderitem.get("quantity"))
+                    * round(deliveryorderitem.get("unit_price"), 2),
+                    2,
+                ),
+            }
+            for deliveryorderitem in deliveryorderitem_set
+        ]
+        total_amount = sum(
+            round(deliveryorderitem.get("quantity"))
+            * round(deliveryorderitem.get("unit_price"), 2)
+            for deliveryorderitem in deliveryorderitem_set
+        )
+
+        return {
+            **calculate_totals(total_amount, discount_rate, gst_rate),
+            "discount_rate": discount_rate,
+            "gst_rate": gst_rate,
+            "deliveryorderitem_set": deliveryorderitem_set,
+        }
+
+    def create(self, validated_data):
+        validated_data = {
+            **validated_data,
+            **self._get_calculated_fields(validated_data),
+        }
+
+        deliveryorderitems_data = validated_data.pop(
+            "deliveryorderitem_set", []
+        )
+        with transaction.atomic():
+            delivery_order = DeliveryOrder.objects.create(**validated_data)
+            DeliveryOrderItem.objects.bulk_create(
+                DeliveryOrderItem(
+                    **deliveryorderitem_data, delivery_order=delivery_order
+                )
+                for deliveryorderitem_data in deliveryorderitems_data
+            )
+            self._add_delivered(self._get_delivered(deliveryorderitems_data))
+        return delivery_order
+
+    def update(self, instance, validated_data):
+        validated_data = {
+            **validated_data,
+            **self._get_calculated_fields(validated_data),
+        }
+
+        deliveryorderitems_data = validated_data.pop(
+            "deliveryorderitem_set", []
+        )
+        with transaction.atomic():
+            before = delivery.get_delivered(instance.deliveryorderitem_set)
+            after = self._get_delivered(deliveryorderitems_data)
+            self._update_destroy_or_create(instance, deliveryorderitems_data)
+            self._add_delivered(delivery.get_changes(before, after))
+            return super().update(instance, validated_data)
+
+
+class StatementParamsSerializer(serializers.Serializer):
+    """Query params of the customer statements"""
+
+    start = serializers.DateField()
+    end = serializers.DateField()
+    customer = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+
+    def validate(self, attrs):
+        if attrs["start"] > attrs["end"]:
+            msg = _("The start of the period must be before its end")
+            raise serializers.ValidationError(msg)
+        return attrs
@@ -11,6 +11,7 @@ bulk_router.register("invoices", views.InvoiceViewSet)
 bulk_router.register("credit_notes", views.CreditNoteViewSet)
 bulk_router.register("customers", views.CustomerViewSet)
 bulk_router.register("sales_orders", views.SalesOrderViewSet)
+bulk_router.register("delivery_orders", views.DeliveryOrderViewSet)
 
 
 router = DefaultRouter()
@@ -21,4 +22,5 @@ app_name = "customer"
 urlpatterns = [
     path("", include(router.urls)),
     path("", include(bulk_router.urls)),
+    path("statements/", views.StatementView.as_view(), name="statements"),
 ]
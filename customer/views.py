@@ -2,14 +2,24 @@ from core.utils import validate_reference_uniqueness
 
 from django.utils.translation import ugettext_lazy as _
 
+from django.http import StreamingHttpResponse
 from django_filters import rest_framework as filters
 from rest_framework import viewsets, mixins
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
 
+from core import deletion, delivery, statements
 from core.utils import validate_bulk_reference_uniqueness
-from core.views import BaseAssetAttrViewSet, BaseDocumentViewSet
+from core.views import (
+    BaseAssetAttrViewSet,
+    BaseDocumentViewSet,
+    DocumentConversionMixin,
+)
 from core.models import (
+    DeliveryOrder,
+    DeliveryOrderItem,
     Invoice,
     Customer,
     SalesOrder,
@@ -17,12 +27,15 @@ from core.models import (
     CreditsApplication,
 )
 from core.pagination import StandardResultsSetPagination
+from core.renderers import PDFRenderer
 from customer.serializers import (
     CustomerSerializer,
     CreditsApplicationSerializer,
     InvoiceSerializer,
     SalesOrderSerializer,
     CreditNoteSerializer,
+    DeliveryOrderSerializer,
+    StatementParamsSerializer,
 )
 
 
@@ -42,7 +55,11 @@ class CustomerViewSet(BaseAssetAttrViewSet):
 
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    values_list_read = True
     filterset_class = CustomerFilter
+    prefetch_related_fields = {
+        "agents": ["agents"],
+    }
     search_fields = [
         "name",
         "attention",
@@ -80,6 +97,7 @@ class CreditsApplicationViewSet(
     pagination_class = StandardResultsSetPagination
     ordering_fields = "__all__"
     ordering = ["-id"]
+    replica_actions = ("list",)
     queryset = CreditsApplication.objects.all()
     serializer_class = CreditsApplicationSerializer
     filterset_class = CreditsApplicationFilter
@@ -120,6 +138,7 @@ class CreditNoteFilter(filters.FilterSet):
         model = CreditNote
         fields = {
             "reference": ["icontains", "exact"],
+            "date": ["lt", "gt", "lte", "gte", "exact"],
             "customer": ["exact"],
             "created_from": ["exact"],
         }
@@ -131,6 +150,9 @@ class CreditNoteViewSet(BaseDocumentViewSet):
     queryset = CreditNote.objects.all()
     serializer_class = CreditNoteSerializer
     filterset_class = CreditNoteFilter
+    prefetch_related_fields = {
+        "creditnoteitem_set": ["creditnoteitem_set"],
+    }
     search_fields = [
         "reference",
         "date",
@@ -141,6 +163,16 @@ class CreditNoteViewSet(BaseDocumentViewSet):
         "grand_total",
     ]
 
+    def release_dependents(self, ids):
+        """Withdraw the remaining credits from the customers"""
+        deletion.adjust_totals(
+            Customer,
+            CreditNote.objects.filter(pk__in=ids),
+            "customer",
+            "credits_remaining",
+            unused_credits=-1,
+        )
+
 
 class InvoiceFilter(filters.FilterSet):
     class Meta:
@@ -151,6 +183,7 @@ class InvoiceFilter(filters.FilterSet):
             # reference__icontains=
             # there is no reference__exact=, just reference= will do
             "reference": ["icontains", "exact"],
+            "date": ["lt", "gt", "lte", "gte", "exact"],
             "sales_order": ["exact"],
         }
 
@@ -161,6 +194,10 @@ class InvoiceViewSet(BaseDocumentViewSet):
     queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
     filterset_class = InvoiceFilter
+    prefetch_related_fields = {
+        "invoiceitem_set": ["invoiceitem_set"],
+        "creditsapplication_set": ["creditsapplication_set"],
+    }
     search_fields = [
         "reference",
         "date",
@@ -170,6 +207,27 @@ class InvoiceViewSet(BaseDocumentViewSet):
         "status",
         "grand_total",
     ]
+    released_relations = ("creditsapplication",)
+
+    def release_dependents(self, ids):
+        """Give the credits applied back to the credit notes"""
+        applications = CreditsApplication.objects.filter(invoice__in=ids)
+        deletion.adjust_totals(
+            CreditNote,
+            applications,
+            "credit_note",
+            "amount_to_credit",
+            credits_used=-1,
+            credits_remaining=1,
+        )
+        deletion.adjust_totals(
+            Customer,
+            applications,
+            "invoice__customer",
+            "amount_to_credit",
+            unused_credits=1,
+        )
+        applications.delete()
 
 
 class SalesOrderFilter(filters.FilterSet):
@@ -177,15 +235,20 @@ class SalesOrderFilter(filters.FilterSet):
         model = SalesOrder
         fields = {
             "reference": ["icontains", "exact"],
+            "date": ["lt", "gt", "lte", "gte", "exact"],
         }
 
 
-class SalesOrderViewSet(BaseDocumentViewSet):
+class SalesOrderViewSet(DocumentConversionMixin, BaseDocumentViewSet):
     """Manage customer in the database"""
 
     queryset = SalesOrder.objects.all()
     serializer_class = SalesOrderSerializer
     filterset_class = SalesOrderFilter
+    prefetch_related_fields = {
+        "salesorderitem_set": ["salesorderitem_set"],
+        "invoice_set": ["invoice_set"],
+    }
     search_fields = [
         "reference",
         "date",
@@ -194,3 +257,91 @@ class SalesOrderViewSet(BaseDocumentViewSet):
         "status",
         "grand_total",
     ]
+    # sales orders are invoiced by converting them
+    conversion = {
+        "target_model": Invoice,
+        "link_field": "sales_order",
+        "fields": ("customer", "salesperson", "description"),
+        "values": {"credits_applied": 0, "balance_due": 0},
+        "totals": {"balance_due": "grand_total"},
+        "closed": (SalesOrder.Status.CANCELLED,),
+        "converted_status": SalesOrder.Status.COMPLETED,
+    }
+    converted_serializer_class = InvoiceSerializer
+
+
+class DeliveryOrderFilter(filters.FilterSet):
+    class Meta:
+        model = DeliveryOrder
+        fields = {
+            "reference": ["icontains", "exact"],
+            "date": ["lt", "gt", "lte", "gte", "exact"],
+            "customer": ["exact"],
+            "sales_order": ["exact"],
+            "invoice": ["exact"],
+        }
+
+
+class DeliveryOrderViewSet(BaseDocumentViewSet):
+    """Manage delivery order in the database"""
+
+    queryset = DeliveryOrder.objects.all()
+    serializer_class = DeliveryOrderSerializer
+    filterset_class = DeliveryOrderFilter
+    prefetch_related_fields = {
+        "deliveryorderitem_set": ["deliveryorderitem_set"],
+    }
+    search_fields = [
+        "reference",
+        "date",
+        "customer__name",
+        "customer__address",
+        "sales_order__reference",
+        "invoice__reference",
+        "grand_total",
+    ]
+
+    def release_dependents(self, ids):
+        """Take the quantities back from the sales order lines delivered"""
+        delivery.release_delivered(
+            DeliveryOrderItem.objects.filter(delivery_order__in=ids)
+        )
+
+
+class StatementView(APIView):
+    """
+    Statements of account of the customers over a period, streamed as
+    JSON or as a PDF document (?format=pdf), see core.statements.
+    ?customer= limits them to some customers.
+    """
+
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (JSONRenderer, PDFRenderer)
+    replica_actions = ("get",)
+
+    def get(self, request, *args, **kwargs):
+        params = StatementParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        start, end = (
+            params.validated_data["start"],
+            params.validated_data["end"],
+        )
+        company = request.user.company
+        customers = params.validated_data.get("customer")
+        rows = statements.get_statements(company, start, end, customers)
+
+        if request.accepted_renderer.format == "pdf":
+            # a pool is not worth starting for a few statements
+            workers = 0 if customers else None
+            response = StreamingHttpResponse(
+                statements.stream_pdf(rows, company.name, workers),
+                content_type="application/pdf",
+            )
+            response["Content-Disposition"] = (
+                f'attachment; filename="statements-{start}-{end}.pdf"'
+            )
+            return response
+        return StreamingHttpResponse(
+            statements.stream_json(rows), content_type="application/json"
+        )
@@ -13,13 +13,19 @@ from core.models import (
     ReceiveItem,
     PurchaseOrderItem,
 )
+from core.serializers import SparseFieldsetMixin
+from core.storage import media
 from core.utils import validate_reference_uniqueness
 from customer.serializers import LineItemSerializer, DocumentSerializer
 
 
-class SupplierSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+class SupplierSerializer(
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
+):
     """Serializer for Supplier objects"""
 
+    values_file_fields = ("image",)
+
     class Meta:
         model = Supplier
         fields = (
@@ -54,10 +60,7 @@ class SupplierSerializer(BulkSerializerMixin, serializers.ModelSerializer):
         return fields
 
     def get_image(self, obj):
-        return {
-            "src": obj.image.url if obj.image else "",
-            "title": obj.image.name if obj.image else "",
-        }
+        return media.file_data(obj.image)
 
     def validate(self, attrs):
         validate_reference_uniqueness(
@@ -306,6 +309,7 @@ class PurchaseOrderSerializer(DocumentSerializer):
         )
 
         extra_kwargs = {
+            **DocumentSerializer.Meta.extra_kwargs,
             "receive": {"allow_null": True},
         }
 
@@ -1,6 +1,10 @@
 from django_filters import rest_framework as filters
 
-from core.views import BaseAssetAttrViewSet, BaseDocumentViewSet
+from core.views import (
+    BaseAssetAttrViewSet,
+    BaseDocumentViewSet,
+    DocumentConversionMixin,
+)
 from core.models import Receive, Supplier, PurchaseOrder
 from core.utils import validate_bulk_reference_uniqueness
 from supplier import serializers
@@ -21,6 +25,7 @@ class SupplierViewSet(BaseAssetAttrViewSet):
 
     queryset = Supplier.objects.all()
     serializer_class = serializers.SupplierSerializer
+    values_list_read = True
     filterset_class = SupplierFilter
     search_fields = [
         "name",
@@ -44,6 +49,7 @@ class ReceiveFilter(filters.FilterSet):
         model = Receive
         fields = {
             "reference": ["icontains", "exact"],
+            "date": ["lt", "gt", "lte", "gte", "exact"],
         }
 
 
@@ -53,6 +59,9 @@ class ReceiveViewSet(BaseDocumentViewSet):
     queryset = Receive.objects.all()
     serializer_class = serializers.ReceiveSerializer
     filterset_class = ReceiveFilter
+    prefetch_related_fields = {
+        "receiveitem_set": ["receiveitem_set"],
+    }
     search_fields = [
         "reference",
         "date",
@@ -69,16 +78,23 @@ class PurchaseOrderFilter(filters.FilterSet):
         model = PurchaseOrder
         fields = {
             "reference": ["icontains", "exact"],
+            "date": ["lt", "gt", "lte", "gte", "exact"],
         }
 
 
-class PurchaseOrderViewSet(BaseDocumentViewSet):
+class PurchaseOrderViewSet(DocumentConversionMixin, BaseDocumentViewSet):
     """Manage Supplier in the database"""
 
     queryset = PurchaseOrder.objects.all()
     serializer_class = serializers.PurchaseOrderSerializer
-
     filterset_class = PurchaseOrderFilter
+    select_related_fields = {
+        **BaseDocumentViewSet.select_related_fields,
+        "receive": ["receive"],
+    }
+    prefetch_related_fields = {
+        "purchaseorderitem_set": ["purchaseorderitem_set"],
+    }
     search_fields = [
         "reference",
         "date",
@@ -88,3 +104,12 @@ class PurchaseOrderViewSet(BaseDocumentViewSet):
         "status",
         "grand_total",
     ]
+    # purchase orders are received by converting them
+    conversion = {
+        "target_model": Receive,
+        "link_field": "purchase_order",
+        "fields": ("supplier", "description"),
+        "closed": (PurchaseOrder.Status.CANCELLED,),
+        "converted_status": PurchaseOrder.Status.COMPLETED,
+    }
+    converted_serializer_class = serializers.ReceiveSerializer
@@ -10,6 +10,8 @@ from rest_framework_bulk import (
 
 
 from core.models import UserConfig
+from core.serializers import SparseFieldsetMixin
+from core.storage import media
 
 # use the following command to easily
 # retrieve all fields of User:
@@ -17,7 +19,9 @@ from core.models import UserConfig
 
 
 # TODO: refactor user serializer
-class UserSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+class UserSerializer(
+    SparseFieldsetMixin, BulkSerializerMixin, serializers.ModelSerializer
+):
     """Abstract serialier for user objects"""
 
     class Meta:
@@ -97,16 +101,10 @@ class UserSerializer(BulkSerializerMixin, serializers.ModelSerializer):
         return attrs
 
     def get_image(self, obj):
-        return {
-            "src": obj.image.url if obj.image else "",
-            "title": obj.image.name if obj.image else "",
-        }
+        return media.file_data(obj.image)
 
     def get_resume(self, obj):
-        return {
-            "src": obj.resume.url if obj.resume else "",
-            "title": obj.resume.name if obj.resume else "",
-        }
+        return media.file_data(obj.resume)
 
     def get_permissions(self, obj):
         return obj.get_role_permissions()